@@ -0,0 +1,14 @@
+"""
+Synthetic GB-scale benchmarks for the land use pipeline.
+
+generators builds seeded, realistically shaped stand-ins for the inputs
+the pipeline reads from the I:// drive. runners times and memory profiles
+the pipeline steps against them, and stores the results as JSON so runs
+from different commits can be compared.
+
+Run all the benchmarks at GB scale with:
+    python -m benchmarks.runners
+
+Or a quick run at a twentieth of GB scale with:
+    python -m benchmarks.runners --scale 0.05
+"""
@@ -0,0 +1,442 @@
+# -*- coding: utf-8 -*-
+"""Compare single pass and per extract warehouse extraction on a synthetic ABP schema.
+
+Builds a seeded synthetic copy of the ABP tables the warehousing module
+reads in the 'data_common' schema of a scratch database. Then times
+extracting the warehouse floorspace by LSOA:
+
+- once per extract, using `warehousing.warehouse_by_lsoa`;
+- in a single pass, using `warehousing.warehouses_by_lsoa_single_pass`.
+
+It also times `voa_code_count` against the three separate count queries
+it replaced. The outputs of each pair are checked to be the same.
+
+The database must not already contain a 'data_common' schema. The schema
+is dropped when the comparison finishes. If PostGIS isn't installed,
+geometries are stored as WKT text and a text `public.ST_AsText` is
+created for the duration.
+
+Usage:
+    python -m benchmarks.abp_warehousing --database scratch --user postgres
+        --password ... --host localhost --port 5432
+"""
+
+##### IMPORTS #####
+# Standard imports
+from __future__ import annotations
+
+import argparse
+import logging
+import pathlib
+import tempfile
+import time
+from typing import Any, Callable
+
+# Third party imports
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from psycopg2 import errors
+from shapely import geometry
+
+# Local imports
+from land_use.abp_processing import database, warehousing
+
+##### CONSTANTS #####
+LOG = logging.getLogger(__name__)
+SCHEMA = "data_common"
+GB_BOUNDS = (0, 0, 700_000, 1_250_000)
+DEFAULT_SEED = 42
+DEFAULT_UPRNS = 500_000
+
+ABP_SCHEME = "AddressBase Premium Classification Scheme"
+VOA_SCHEME = "VOA Special Category"
+# Classification codes, with their share of rows
+ABP_CODES = {"RD04": 0.45, "RD06": 0.3, "CR08": 0.1, "CO01": 0.13, "CI04PL": 0.005, "CI04": 0.015}
+VOA_CODES = {"203": 0.4, "249": 0.4, "217": 0.01, "267": 0.01, "095": 0.18}
+ORGANISATIONS = ("Amazon UK Services Ltd", "Tesco Stores Ltd", "Royal Mail Group", "DHL")
+
+TABLES = """
+CREATE TABLE {schema}.abp_classification (
+    uprn bigint, class_scheme text, classification_code text,
+    start_date date, end_date date, last_update_date date, entry_date date
+);
+CREATE TABLE {schema}.abp_organisation (uprn bigint, organisation text);
+CREATE TABLE {schema}.abp_blpu (uprn bigint PRIMARY KEY, x_coordinate float8, y_coordinate float8);
+CREATE TABLE {schema}.abp_crossref (uprn bigint, cross_reference text, "version" int4);
+CREATE TABLE {schema}.mm_topographicarea (
+    fid text, descriptiveterm text, wkb_geometry {geometry}, calculatedareavalue float8
+);
+"""
+INDEXES = """
+CREATE INDEX ON {schema}.abp_classification (classification_code);
+CREATE INDEX ON {schema}.abp_classification (uprn);
+CREATE INDEX ON {schema}.abp_organisation (uprn);
+CREATE INDEX ON {schema}.abp_crossref (uprn);
+CREATE INDEX ON {schema}.mm_topographicarea (fid);
+ANALYZE;
+"""
+
+
+##### CLASSES #####
+class _TimedDatabase(database.Database):
+    """Database which keeps a total of the time spent running queries."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.query_time = 0.0
+        self._depth = 0
+
+    def _timed(self, method: Callable, *args, **kwargs) -> Any:
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self.query_time += time.perf_counter() - start
+
+    def execute(self, *args, **kwargs) -> None:
+        return self._timed(super().execute, *args, **kwargs)
+
+    def query_to_dataframe(self, *args, **kwargs) -> pd.DataFrame:
+        return self._timed(super().query_to_dataframe, *args, **kwargs)
+
+
+##### FUNCTIONS #####
+def _choice(rng: np.random.Generator, shares: dict[str, float], size: int) -> np.ndarray:
+    return rng.choice(list(shares), size, p=list(shares.values()))
+
+
+def _random_dates(
+    rng: np.random.Generator, size: int, start: int, end: int, null_share: float
+) -> pd.Series:
+    days = rng.integers(0, (end - start) * 365, size)
+    dates = pd.Series(pd.Timestamp(f"{start}-01-01") + pd.to_timedelta(days, "D"))
+    dates[rng.random(size) < null_share] = pd.NaT
+    return dates
+
+
+def synthetic_tables(
+    n_uprns: int = DEFAULT_UPRNS, seed: int = DEFAULT_SEED
+) -> dict[str, pd.DataFrame]:
+    """Build seeded synthetic ABP tables.
+
+    Parameters
+    ----------
+    n_uprns : int, default DEFAULT_UPRNS
+        Number of addresses to build.
+    seed : int, default DEFAULT_SEED
+        Seed for the random generator, the same seed always builds
+        the same tables.
+
+    Returns
+    -------
+    dict[str, pd.DataFrame]
+        Data for each table, keyed by table name.
+    """
+    rng = np.random.default_rng(seed)
+    uprn = np.arange(1, n_uprns + 1, dtype=np.int64)
+    x = rng.uniform(GB_BOUNDS[0], GB_BOUNDS[2], n_uprns)
+    y = rng.uniform(GB_BOUNDS[1], GB_BOUNDS[3], n_uprns)
+    blpu = pd.DataFrame({"uprn": uprn, "x_coordinate": x, "y_coordinate": y})
+
+    # Every address has an ABP class, some also have a VOA special category
+    voa_uprn = uprn[rng.random(n_uprns) < 0.3]
+    class_uprn = np.concatenate([uprn, voa_uprn])
+    n_class = len(class_uprn)
+    classification = pd.DataFrame(
+        {
+            "uprn": class_uprn,
+            "class_scheme": np.repeat([ABP_SCHEME, VOA_SCHEME], [n_uprns, len(voa_uprn)]),
+            "classification_code": np.concatenate(
+                [_choice(rng, ABP_CODES, n_uprns), _choice(rng, VOA_CODES, len(voa_uprn))]
+            ),
+            "start_date": _random_dates(rng, n_class, 1995, 2015, 0.1),
+            "end_date": _random_dates(rng, n_class, 2015, 2025, 0.8),
+            "last_update_date": _random_dates(rng, n_class, 2015, 2022, 0),
+            "entry_date": _random_dates(rng, n_class, 1995, 2015, 0),
+        }
+    )
+
+    org_uprn = uprn[rng.random(n_uprns) < 0.1]
+    organisation = pd.DataFrame(
+        {
+            "uprn": org_uprn,
+            "organisation": rng.choice(
+                ORGANISATIONS, len(org_uprn), p=[0.05, 0.35, 0.3, 0.3]
+            ),
+        }
+    )
+
+    # Addresses have up to 3 cross references, most to a floorspace polygon
+    n_refs = rng.integers(0, 4, n_uprns)
+    ref_uprn = np.repeat(uprn, n_refs)
+    n_crossref = len(ref_uprn)
+    fids = np.array([f"osgb{i:013d}" for i in range(n_crossref)])
+    version = rng.integers(1, 5, n_crossref).astype(float)
+    version[rng.random(n_crossref) < 0.1] = np.nan
+    crossref = pd.DataFrame(
+        {"uprn": ref_uprn, "cross_reference": fids, "version": pd.array(version, "Int32")}
+    )
+
+    polygons = rng.random(n_crossref) < 0.8
+    px = np.repeat(x, n_refs)[polygons]
+    py = np.repeat(y, n_refs)[polygons]
+    width = rng.uniform(5, 200, len(px))
+    height = rng.uniform(5, 200, len(px))
+    topographic_area = pd.DataFrame(
+        {
+            "fid": fids[polygons],
+            "descriptiveterm": rng.choice(["Building", "Structure", "Glasshouse"], len(px)),
+            "wkb_geometry": [
+                f"POLYGON (({x0} {y0}, {x1} {y0}, {x1} {y1}, {x0} {y1}, {x0} {y0}))"
+                for x0, y0, x1, y1 in zip(px, py, px + width, py + height)
+            ],
+            "calculatedareavalue": width * height,
+        }
+    )
+
+    return {
+        "abp_blpu": blpu,
+        "abp_classification": classification,
+        "abp_organisation": organisation,
+        "abp_crossref": crossref,
+        "mm_topographicarea": topographic_area,
+    }
+
+
+def synthetic_lsoas(n_side: int = 60) -> gpd.GeoDataFrame:
+    """Square grid of LSOA polygons covering `GB_BOUNDS`."""
+    xs = np.linspace(GB_BOUNDS[0], GB_BOUNDS[2], n_side + 1)
+    ys = np.linspace(GB_BOUNDS[1], GB_BOUNDS[3], n_side + 1)
+    boxes = [
+        geometry.box(xs[i], ys[j], xs[i + 1], ys[j + 1])
+        for i in range(n_side)
+        for j in range(n_side)
+    ]
+    return gpd.GeoDataFrame(
+        {"lsoa_id": [f"E01{i:06d}" for i in range(len(boxes))]},
+        geometry=boxes,
+        crs=warehousing.CRS_BRITISH_GRID,
+    ).set_index("lsoa_id")
+
+
+def create_schema(connected_db: database.Database, tables: dict[str, pd.DataFrame]) -> bool:
+    """Create the synthetic schema, returns True if PostGIS is missing."""
+    exists = connected_db.query_fetch(
+        "SELECT count(*) FROM information_schema.schemata WHERE schema_name = %s",
+        (SCHEMA,),
+    )[0][0]
+    if exists:
+        raise ValueError(
+            f"database already contains a '{SCHEMA}' schema, use a scratch database"
+        )
+
+    try:
+        connected_db.execute("CREATE EXTENSION IF NOT EXISTS postgis")
+        connected_db.connection.commit()
+        geometry_type = "public.geometry"
+        text_geometry = False
+    except (errors.FeatureNotSupported, errors.UndefinedFile):
+        connected_db.connection.rollback()
+        LOG.warning("PostGIS isn't available, storing geometries as WKT text")
+        connected_db.execute(
+            "CREATE FUNCTION public.ST_AsText(text) RETURNS text"
+            " AS 'SELECT $1' LANGUAGE SQL IMMUTABLE"
+        )
+        geometry_type = "text"
+        text_geometry = True
+
+    connected_db.execute(f"CREATE SCHEMA {SCHEMA}")
+    connected_db.execute(TABLES.format(schema=SCHEMA, geometry=geometry_type))
+    for name, data in tables.items():
+        connected_db.copy_from_dataframe(data, f"{SCHEMA}.{name}", commit=False)
+    connected_db.connection.commit()
+
+    # ANALYZE can't run in a transaction
+    connected_db.connection.autocommit = True
+    connected_db.execute(INDEXES.format(schema=SCHEMA))
+    connected_db.connection.autocommit = False
+
+    return text_geometry
+
+
+def drop_schema(connected_db: database.Database, text_geometry: bool) -> None:
+    """Drop the synthetic schema."""
+    connected_db.connection.rollback()
+    connected_db.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    if text_geometry:
+        connected_db.execute("DROP FUNCTION IF EXISTS public.ST_AsText(text)")
+    connected_db.connection.commit()
+
+
+def _legacy_voa_counts(connected_db: database.Database) -> list[pd.DataFrame]:
+    """The three count queries `voa_code_count` ran before it used a single scan."""
+    class_counts = connected_db.query_to_dataframe(
+        """
+        SELECT class_scheme, count(*) AS "count"
+        FROM data_common.abp_classification
+        GROUP BY class_scheme;
+        """
+    )
+    scat_counts = connected_db.query_to_dataframe(
+        """
+        SELECT classification_code AS voa_scat_code, count(*) AS "count"
+        FROM data_common.abp_classification
+        WHERE class_scheme = 'VOA Special Category'
+        GROUP BY classification_code;
+        """
+    )
+    filtered = connected_db.query_to_dataframe(
+        warehousing.sql.SQL(
+            """
+            SELECT cl.class_scheme, cl.classification_code, count(*) AS "count"
+            FROM ({abp_classification}) cl
+            GROUP BY cl.class_scheme, cl.classification_code
+            """
+        ).format(abp_classification=warehousing.classification_codes_query())
+    )
+    return [class_counts, scat_counts, filtered]
+
+
+def _sorted(data: pd.DataFrame) -> pd.DataFrame:
+    data = pd.DataFrame(data).reset_index(drop=True)
+    return data.sort_values(list(data.columns)).reset_index(drop=True)
+
+
+def compare(
+    parameters: database.ConnectionParameters,
+    n_uprns: int = DEFAULT_UPRNS,
+    seed: int = DEFAULT_SEED,
+    year: int | None = None,
+) -> pd.DataFrame:
+    """Time single pass and per extract warehouse extraction on a synthetic schema.
+
+    Parameters
+    ----------
+    parameters : database.ConnectionParameters
+        Parameters for connecting to a scratch database.
+    n_uprns : int, default DEFAULT_UPRNS
+        Number of addresses in the synthetic schema.
+    seed : int, default DEFAULT_SEED
+        Seed for the synthetic schema.
+    year : int, optional
+        Year to filter the warehouses with.
+
+    Returns
+    -------
+    pd.DataFrame
+        Total and database time in seconds for each method.
+    """
+    LOG.info("Building synthetic ABP tables for %s addresses", f"{n_uprns:,}")
+    tables = synthetic_tables(n_uprns, seed)
+    lsoas = synthetic_lsoas()
+
+    timings = []
+    with _TimedDatabase(parameters) as connected_db:
+        text_geometry = create_schema(connected_db, tables)
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                tmp_dir = pathlib.Path(tmp_dir)
+                (tmp_dir / "legacy").mkdir()
+                (tmp_dir / "single").mkdir()
+
+                # voa_code_count
+                connected_db.query_time = 0
+                start = time.perf_counter()
+                legacy_counts = _legacy_voa_counts(connected_db)
+                timings.append(
+                    ("voa counts, three queries", time.perf_counter() - start, connected_db.query_time)
+                )
+
+                connected_db.query_time = 0
+                start = time.perf_counter()
+                warehousing.voa_code_count(connected_db, tmp_dir)
+                timings.append(
+                    ("voa counts, single scan", time.perf_counter() - start, connected_db.query_time)
+                )
+
+                single_counts = pd.read_excel(
+                    tmp_dir / "ABP_SCAT_counts.xlsx",
+                    sheet_name=None,
+                    dtype={"voa_scat_code": str, "classification_code": str},
+                )
+                for legacy, single in zip(legacy_counts, single_counts.values()):
+                    legacy = legacy.loc[:, legacy.columns != "perc_count"]
+                    single = single.loc[:, legacy.columns]
+                    pd.testing.assert_frame_equal(_sorted(legacy), _sorted(single), check_dtype=False)
+
+                # Warehouse floorspace by LSOA
+                extracts = {None: "warehouses"}
+                extracts.update({i: f"warehouses_{i}" for i in warehousing.WAREHOUSE_ORGANISATIONS})
+
+                connected_db.query_time = 0
+                start = time.perf_counter()
+                legacy_floorspace = []
+                for organisation, name in extracts.items():
+                    if organisation is None:
+                        query = warehousing.classification_codes_query(year=year)
+                    else:
+                        query = warehousing.warehouse_organisations_query(organisation, year=year)
+                    legacy_floorspace.append(
+                        warehousing.warehouse_by_lsoa(
+                            connected_db, query, lsoas, "lsoa_id", tmp_dir / "legacy" / name
+                        )
+                    )
+                timings.append(
+                    ("warehouses, query per extract", time.perf_counter() - start, connected_db.query_time)
+                )
+
+                connected_db.query_time = 0
+                start = time.perf_counter()
+                single_floorspace = warehousing.warehouses_by_lsoa_single_pass(
+                    connected_db,
+                    lsoas,
+                    "lsoa_id",
+                    {k: tmp_dir / "single" / v for k, v in extracts.items()},
+                    year,
+                )
+                timings.append(
+                    ("warehouses, single pass", time.perf_counter() - start, connected_db.query_time)
+                )
+
+                for legacy, single in zip(legacy_floorspace, single_floorspace):
+                    pd.testing.assert_frame_equal(_sorted(legacy), _sorted(single))
+                LOG.info("Single pass outputs match the per extract outputs")
+        finally:
+            drop_schema(connected_db, text_geometry)
+
+    return pd.DataFrame(
+        timings, columns=["method", "total_seconds", "database_seconds"]
+    ).set_index("method")
+
+
+def _run() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database", required=True)
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--password", default="")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5432)
+    parser.add_argument("--uprns", type=int, default=DEFAULT_UPRNS)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--year", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="[{levelname:^8.8}] {message}", style="{")
+    parameters = database.ConnectionParameters(
+        database=args.database,
+        user=args.user,
+        password=args.password,
+        host=args.host,
+        port=args.port,
+    )
+    timings = compare(parameters, args.uprns, args.seed, args.year)
+    with pd.option_context("display.float_format", "{:.3f}".format):
+        print(timings)
+
+
+if __name__ == "__main__":
+    _run()
@@ -0,0 +1,507 @@
+"""
+Seeded generators of synthetic land use inputs.
+
+Each generator builds a stand-in for one of the inputs the pipeline reads
+from the I:// drive, with the same columns and a realistic shape: a GB
+sized zone system, lumpy district sizes, sparse segmentation and controls
+that are consistent with each other, so ipf converges as it would on the
+real data.
+
+Every generator takes a np.random.Generator, so the same seed always
+builds the same inputs. build_inputs() builds the full set.
+"""
+# Builtins
+import itertools
+
+from typing import Dict
+from typing import List
+
+# Third party
+import numpy as np
+import pandas as pd
+
+# GB scale
+N_MSOA = 8480
+N_LAD = 363
+N_NTEM_TT = 88
+N_TFN_TT = 760
+N_CA_SECTORS = 73
+N_MODEL_ZONES = 2770
+N_AREA_TYPES = 8
+
+# Household property types, t. t=8 is communal establishments
+PROPERTY_TYPES = [1, 2, 3, 4]
+# Employment to e+, as in pop_with_full_dimensions()
+EPLUS = {1: 1, 2: 2, 3: 34, 4: 34, 5: 5}
+
+BASE_YEAR = 2018
+DDG_YEARS = list(range(BASE_YEAR, 2051))
+MEAN_MSOA_POP = 7800
+
+DEFAULT_SEED = 2018
+
+
+def tfn_tt_segments() -> pd.DataFrame:
+    """
+    Builds the 760 TfN traveller types from the NorMITs segments.
+
+    Returns a dataframe with the same columns as
+    normits_segs_to_tfn_tt.csv: ['tfn_tt', 'a', 'g', 'h', 'e', 'n', 's'].
+    Only 16-74 year olds work, and only workers have a soc, s=4 is none.
+    """
+    rows = list()
+    for h in range(1, 9):
+        # Children
+        rows += [(1, 1, h, 5, n, 4) for n in range(1, 6)]
+        # 16-74
+        for g, n in itertools.product((2, 3), range(1, 6)):
+            rows += [(2, g, h, e, n, s) for e in (1, 2) for s in (1, 2, 3)]
+            rows += [(2, g, h, e, n, 4) for e in (3, 4)]
+        # 75 and over
+        rows += [(3, g, h, 5, n, 4) for g in (2, 3) for n in range(1, 6)]
+
+    segs = pd.DataFrame(rows, columns=['a', 'g', 'h', 'e', 'n', 's'])
+    segs = segs.sort_values(list(segs)).reset_index(drop=True)
+    segs.insert(0, 'tfn_tt', np.arange(1, len(segs) + 1))
+    return segs
+
+
+def ntem_tt_index() -> pd.DataFrame:
+    """
+    Builds the 88 NTEM traveller types: 11 person types by 8 household
+    types. Returns a dataframe of ['ntem_tt', 'a', 'g', 'h', 'e'].
+    """
+    segs = tfn_tt_segments()[['a', 'g', 'h', 'e']].drop_duplicates()
+    segs = segs.sort_values(['h', 'a', 'g', 'e']).reset_index(drop=True)
+    segs.insert(0, 'ntem_tt', np.arange(1, len(segs) + 1))
+    return segs
+
+
+def zones(rng: np.random.Generator,
+          n_msoa: int = N_MSOA,
+          n_lad: int = N_LAD,
+          ) -> pd.DataFrame:
+    """
+    Builds an MSOA zone system nested in districts of lumpy sizes.
+
+    Parameters
+    ----------
+    rng:
+        The random generator to draw from.
+
+    n_msoa:
+        The number of MSOAs to build.
+
+    n_lad:
+        The number of districts to split the MSOAs between. Every
+        district gets at least one MSOA.
+
+    Returns
+    -------
+    zones:
+        A dataframe of ['msoa_zone_id', 'msoa11cd', 'LA', 'lad_code',
+        'lad_name', 'area_type'], one row per MSOA.
+    """
+    n_lad = min(n_lad, n_msoa)
+    lad_weights = rng.lognormal(0, 0.6, n_lad)
+    lad_sizes = 1 + rng.multinomial(n_msoa - n_lad, lad_weights / lad_weights.sum())
+    la = np.repeat(np.arange(1, n_lad + 1), lad_sizes)
+
+    # Mostly suburban and rural, with a few dense cores
+    at_probs = np.array([0.02, 0.08, 0.15, 0.2, 0.2, 0.15, 0.12, 0.08])
+
+    return pd.DataFrame({
+        'msoa_zone_id': np.arange(1, n_msoa + 1),
+        'msoa11cd': ['E02%06d' % x for x in range(1, n_msoa + 1)],
+        'LA': la,
+        'lad_code': ['E06%06d' % x for x in la],
+        'lad_name': ['District %d' % x for x in la],
+        'area_type': rng.choice(np.arange(1, N_AREA_TYPES + 1), n_msoa, p=at_probs),
+    })
+
+
+def household_population(rng: np.random.Generator,
+                         zone_df: pd.DataFrame,
+                         segs: pd.DataFrame,
+                         density: float = 0.25,
+                         chunk_size: int = 500,
+                         ) -> pd.DataFrame:
+    """
+    Builds household population by zone, TfN traveller type and property
+    type, in the format of output_5_gb_msoa_tfntt_t_2018_tot_pop.
+
+    Parameters
+    ----------
+    rng:
+        The random generator to draw from.
+
+    zone_df:
+        The zones to build population for. Output of zones().
+
+    segs:
+        The traveller types to build population for. Output of
+        tfn_tt_segments().
+
+    density:
+        The share of traveller type and property type cells each zone has
+        population in. Real zones only contain some of the segments.
+
+    chunk_size:
+        The number of zones to draw at once, to limit memory.
+
+    Returns
+    -------
+    population:
+        A dataframe of ['z', 'MSOA', 'tfn_tt', 't', 'people'], sorted by
+        z, tfn_tt and t.
+    """
+    n_t = len(PROPERTY_TYPES)
+    n_cells = len(segs) * n_t
+    # A national profile of which cells are big, shared by every zone
+    profile = rng.gamma(0.6, 1, n_cells)
+
+    frames = list()
+    for start in range(0, len(zone_df), chunk_size):
+        chunk = zone_df.iloc[start:start + chunk_size]
+        present = rng.random((len(chunk), n_cells), dtype=np.float32) < density
+        zone_idx, cell_idx = np.nonzero(present)
+
+        people = profile[cell_idx] * rng.gamma(2, 0.5, len(cell_idx))
+        zone_pop = rng.lognormal(np.log(MEAN_MSOA_POP), 0.2, len(chunk))
+        zone_sum = np.bincount(zone_idx, weights=people, minlength=len(chunk))
+        people *= (zone_pop / np.where(zone_sum > 0, zone_sum, 1))[zone_idx]
+
+        frames.append(pd.DataFrame({
+            'z': chunk['msoa_zone_id'].values[zone_idx],
+            'MSOA': chunk['msoa11cd'].values[zone_idx],
+            'tfn_tt': segs['tfn_tt'].values[cell_idx // n_t],
+            't': np.array(PROPERTY_TYPES)[cell_idx % n_t],
+            'people': people,
+        }))
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def land_use_vector(zone_df: pd.DataFrame,
+                    population: pd.DataFrame,
+                    segs: pd.DataFrame,
+                    ) -> pd.DataFrame:
+    """
+    Expands population to the full segmentation used in the land use
+    outputs: ['msoa_zone_id', 'area_type', 'a', 'g', 'h', 'e', 'n', 's',
+    't', 'people'].
+    """
+    lu = population.rename(columns={'z': 'msoa_zone_id'})
+    lu = lu.merge(zone_df[['msoa_zone_id', 'area_type']], how='left', on='msoa_zone_id')
+    lu = lu.merge(segs, how='left', on='tfn_tt')
+    return lu[['msoa_zone_id', 'area_type', 'a', 'g', 'h', 'e', 'n', 's', 't', 'people']]
+
+
+def normalised_vector(zone_df: pd.DataFrame,
+                      population: pd.DataFrame,
+                      ) -> pd.DataFrame:
+    """
+    Builds a land use output in the normalised format read by the
+    sector reports: ['msoa_zone_id', 'area_type', 'tfn_traveller_type',
+    'people'].
+    """
+    lu = population.groupby(['z', 'tfn_tt'], as_index=False)['people'].sum()
+    lu = lu.rename(columns={'z': 'msoa_zone_id', 'tfn_tt': 'tfn_traveller_type'})
+    lu = lu.merge(zone_df[['msoa_zone_id', 'area_type']], how='left', on='msoa_zone_id')
+    return lu[['msoa_zone_id', 'area_type', 'tfn_traveller_type', 'people']]
+
+
+def zone_la_lookup(zone_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Builds a stand-in for Lookups/MSOA_1991LA_2011LA_2013LA_2021LA_LAgroups.csv.
+    """
+    return pd.DataFrame({
+        'NorMITs Zone': zone_df['msoa_zone_id'],
+        'MSOA': zone_df['msoa11cd'],
+        '2013 LA': zone_df['lad_code'],
+        '2013 LA Name': zone_df['lad_name'],
+        '2021 LA': zone_df['lad_code'],
+        '2021 LA Name': zone_df['lad_name'],
+        '2021 LA ID': zone_df['LA'],
+    })
+
+
+def zone_translation(rng: np.random.Generator,
+                     zone_df: pd.DataFrame,
+                     n_model_zones: int = N_MODEL_ZONES,
+                     split_share: float = 0.1,
+                     ) -> pd.DataFrame:
+    """
+    Builds an MSOA to model zone correspondence. Most MSOAs sit in a
+    single model zone, split_share of them are split between two.
+
+    Returns a dataframe of ['model_zone_id', 'msoa_zone_id',
+    'msoa_to_model_zone'], where the last column is the share of the
+    MSOA in that model zone.
+    """
+    n_msoa = len(zone_df)
+    n_model_zones = max(1, min(n_model_zones, n_msoa))
+    # Neighbouring MSOAs make up each model zone
+    model_zone = np.sort(rng.integers(1, n_model_zones + 1, n_msoa))
+
+    trans = pd.DataFrame({
+        'model_zone_id': model_zone,
+        'msoa_zone_id': zone_df['msoa_zone_id'].values,
+        'msoa_to_model_zone': 1.0,
+    })
+
+    split = rng.random(n_msoa) < split_share
+    factor = rng.uniform(0.2, 0.8, split.sum())
+    other = trans[split].copy()
+    other['model_zone_id'] = np.minimum(other['model_zone_id'] + 1, n_model_zones)
+    other['msoa_to_model_zone'] = 1 - factor
+    trans.loc[split, 'msoa_to_model_zone'] = factor
+
+    trans = pd.concat([trans, other], ignore_index=True)
+    return trans.sort_values(['model_zone_id', 'msoa_zone_id']).reset_index(drop=True)
+
+
+def sector_correspondence(zone_df: pd.DataFrame,
+                          n_ca_sectors: int = N_CA_SECTORS,
+                          ) -> pd.DataFrame:
+    """
+    Builds a stand-in for msoa_sector_correspondence.csv, grouping whole
+    districts into sectors: ['msoa_zone_id', 'ca_sector_2020_zone_id',
+    '3_sector_id', 'ie_id'].
+    """
+    n_lad = zone_df['LA'].max()
+    lad_frac = (zone_df['LA'].values - 1) / n_lad
+    return pd.DataFrame({
+        'msoa_zone_id': zone_df['msoa_zone_id'],
+        'ca_sector_2020_zone_id': 1 + (lad_frac * n_ca_sectors).astype(int),
+        # North, Scotland and the South
+        '3_sector_id': np.digitize(lad_frac, [0.35, 0.45]) + 1,
+        # Internal to the North, or external
+        'ie_id': np.where(lad_frac < 0.35, 1, 2),
+    })
+
+
+def furness_inputs(rng: np.random.Generator,
+                   zone_df: pd.DataFrame,
+                   population: pd.DataFrame,
+                   segs: pd.DataFrame,
+                   noise: float = 0.1,
+                   ) -> Dict[str, pd.DataFrame]:
+    """
+    Builds the seed and control values used by furness_hhr().
+
+    The controls are the marginals of the seed with noise applied to
+    every cell, so they are consistent with each other and ipf converges.
+
+    Returns
+    -------
+    furness_inputs:
+        A dictionary of the dataframes furness_hhr() builds before
+        slicing by district. Keys are 'seed', 'z_hhr_ag_control',
+        'z_hhr_h_control', 'z_hhr_t_control', 'LA_hhr_s_control' and
+        'LA_hhr_ageplus_control'.
+    """
+    seed = population.merge(segs, how='left', on='tfn_tt')
+    seed = seed.merge(zone_df[['msoa_zone_id', 'LA']], how='left',
+                      left_on='z', right_on='msoa_zone_id')
+    seed['e+'] = seed['e'].map(EPLUS)
+    seed = seed[['z', 'LA', 'a', 'g', 'h', 'e', 't', 'n', 's', 'e+', 'people']]
+
+    truth = seed.copy()
+    truth['people'] *= rng.lognormal(0, noise, len(truth))
+
+    def control(cols: List[str]) -> pd.DataFrame:
+        return truth.groupby(cols, as_index=False)['people'].sum()
+
+    return {
+        'seed': seed,
+        'z_hhr_ag_control': control(['LA', 'z', 'a', 'g']),
+        'z_hhr_h_control': control(['LA', 'z', 'h']),
+        'z_hhr_t_control': control(['LA', 'z', 't']),
+        'LA_hhr_s_control': control(['LA', 's']),
+        'LA_hhr_ageplus_control': control(['LA', 'a', 'g', 'e+']),
+    }
+
+
+def mye_controls(rng: np.random.Generator,
+                 zone_df: pd.DataFrame,
+                 population: pd.DataFrame,
+                 cer_share: float = 0.017,
+                 ) -> pd.DataFrame:
+    """
+    Builds MYE zone totals, in the format of gb_msoa_2018_pop+hh_pop.csv:
+    ['MSOA', 'Total_Pop', 'Total_HHR'].
+
+    Communal establishments are lumpy, so most zones have few residents
+    in them and some have many.
+    """
+    hhr = population.groupby('z')['people'].sum().reindex(zone_df['msoa_zone_id'], fill_value=0)
+    cer = hhr.values * rng.exponential(cer_share, len(hhr))
+    return pd.DataFrame({
+        'MSOA': zone_df['msoa11cd'].values,
+        'Total_Pop': hhr.values + cer,
+        'Total_HHR': hhr.values,
+    })
+
+
+def cer_controls(zone_df: pd.DataFrame,
+                 mye: pd.DataFrame,
+                 ) -> pd.DataFrame:
+    """
+    Builds communal establishment residents by zone, age and gender from
+    MYE totals: ['z', 'MSOA', 'a', 'g', 'people'].
+
+    Communal establishments are mostly students and the elderly.
+    """
+    ag_shares = pd.DataFrame({
+        'a': [1, 2, 2, 3, 3],
+        'g': [1, 2, 3, 2, 3],
+        'share': [0.05, 0.3, 0.25, 0.15, 0.25],
+    })
+    cer = pd.DataFrame({
+        'z': zone_df['msoa_zone_id'].values,
+        'MSOA': mye['MSOA'].values,
+        'cer': mye['Total_Pop'].values - mye['Total_HHR'].values,
+    })
+    cer = cer.merge(ag_shares, how='cross')
+    cer['people'] = cer['cer'] * cer['share']
+    return cer[['z', 'MSOA', 'a', 'g', 'people']]
+
+
+def ddg_controls(rng: np.random.Generator,
+                 zone_df: pd.DataFrame,
+                 population: pd.DataFrame,
+                 years: List[int] = None,
+                 ) -> Dict[str, pd.DataFrame]:
+    """
+    Builds DDG district controls for every year, in the format of the
+    DD_Nov21_CASReg_*_LA.csv files: 'LAD13CD' and a column of values for
+    each year.
+
+    Returns
+    -------
+    ddg_controls:
+        A dictionary of 'pop', 'wkrfrac' and 'emp' dataframes, holding
+        total population, the share of working age population in work,
+        and employment.
+    """
+    years = DDG_YEARS if years is None else years
+    year_cols = [str(x) for x in years]
+    n_years = len(years)
+
+    lad = zone_df[['msoa_zone_id', 'lad_code']].drop_duplicates('lad_code')
+    pop = population.merge(zone_df[['msoa_zone_id', 'lad_code']],
+                           how='left', left_on='z', right_on='msoa_zone_id')
+    pop = pop.groupby('lad_code')['people'].sum().reindex(lad['lad_code'], fill_value=0)
+    n_lad = len(pop)
+
+    # DDG disagrees with MYE a little in the base year, then grows steadily
+    base_pop = pop.values * rng.normal(1.02, 0.02, n_lad)
+    growth = rng.normal(0.004, 0.003, (n_lad, n_years))
+    growth[:, 0] = 0
+    pop_values = base_pop[:, None] * np.cumprod(1 + growth, axis=1)
+
+    wkrfrac = rng.uniform(0.68, 0.8, n_lad)[:, None] + rng.normal(0, 0.002, (n_lad, n_years)).cumsum(axis=1)
+    emp = pop_values * rng.uniform(0.4, 0.55, n_lad)[:, None]
+
+    def ddg_frame(values: np.ndarray) -> pd.DataFrame:
+        df = pd.DataFrame(values, columns=year_cols)
+        df.insert(0, 'LAD13CD', pop.index.values)
+        return df
+
+    return {
+        'pop': ddg_frame(pop_values),
+        'wkrfrac': ddg_frame(wkrfrac),
+        'emp': ddg_frame(emp),
+    }
+
+
+def build_inputs(scale: float = 1.0,
+                 seed: int = DEFAULT_SEED,
+                 density: float = 0.25,
+                 ) -> Dict[str, pd.DataFrame]:
+    """
+    Builds the full set of synthetic inputs for the benchmarks.
+
+    Parameters
+    ----------
+    scale:
+        The share of GB to build. 1.0 builds 8,480 MSOAs in 363
+        districts, smaller values shrink both in proportion.
+
+    seed:
+        Seed for the random generator. The same seed and scale always
+        build the same inputs.
+
+    density:
+        The share of traveller type and property type cells each zone has
+        population in. See household_population().
+
+    Returns
+    -------
+    inputs:
+        A dictionary of every synthetic input, keyed by name.
+    """
+    rng = np.random.default_rng(seed)
+    n_msoa = max(1, int(round(N_MSOA * scale)))
+    n_lad = max(1, int(round(N_LAD * scale)))
+
+    segs = tfn_tt_segments()
+    zone_df = zones(rng, n_msoa, n_lad)
+    population = household_population(rng, zone_df, segs, density=density)
+    mye = mye_controls(rng, zone_df, population)
+
+    inputs = {
+        'tfn_tt_segments': segs,
+        'ntem_tt_index': ntem_tt_index(),
+        'zones': zone_df,
+        'population': population,
+        'land_use_vector': land_use_vector(zone_df, population, segs),
+        'normalised_vector': normalised_vector(zone_df, population),
+        'zone_la_lookup': zone_la_lookup(zone_df),
+        'zone_translation': zone_translation(
+            rng, zone_df, max(1, int(round(N_MODEL_ZONES * scale)))),
+        'sector_correspondence': sector_correspondence(
+            zone_df, max(1, int(round(N_CA_SECTORS * scale)))),
+        'mye_controls': mye,
+        'cer_controls': cer_controls(zone_df, mye),
+    }
+    inputs.update({'furness_%s' % k: v for k, v in furness_inputs(rng, zone_df, population, segs).items()})
+    inputs.update({'ddg_%s' % k: v for k, v in ddg_controls(rng, zone_df, population).items()})
+    return inputs
+
+
+def generator_tests() -> None:
+    """
+    Checks the generators are reproducible and build the documented shapes.
+    """
+    print("Running generator tests...")
+    segs = tfn_tt_segments()
+    assert len(segs) == N_TFN_TT
+    assert len(ntem_tt_index()) == N_NTEM_TT
+    assert segs['tfn_tt'].is_unique
+
+    inputs = build_inputs(scale=0.02)
+    again = build_inputs(scale=0.02)
+    for name, df in inputs.items():
+        pd.testing.assert_frame_equal(df, again[name])
+
+    zone_df = inputs['zones']
+    assert len(zone_df) == int(round(N_MSOA * 0.02))
+    assert zone_df['LA'].nunique() == int(round(N_LAD * 0.02))
+
+    # Zone totals are realistic, and every control sums to the same total
+    zone_pop = inputs['population'].groupby('z')['people'].sum()
+    assert 0.5 * MEAN_MSOA_POP < zone_pop.mean() < 1.5 * MEAN_MSOA_POP
+    totals = [inputs[x]['people'].sum() for x in inputs if x.startswith('furness_') and x != 'furness_seed']
+    np.testing.assert_allclose(totals, totals[0])
+
+    # Translation shares add back up to each msoa
+    shares = inputs['zone_translation'].groupby('msoa_zone_id')['msoa_to_model_zone'].sum()
+    np.testing.assert_allclose(shares, 1)
+
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    generator_tests()
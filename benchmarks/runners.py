@@ -0,0 +1,557 @@
+"""
+Times and memory profiles land use pipeline steps on synthetic inputs.
+
+Each benchmark is set up outside of the timings, then run `repeats` times
+to time it, and once more under tracemalloc to find its peak memory.
+Results are written as JSON, named after the commit they were run on, so
+runs can be compared across commits with compare_results().
+
+furness_hhr() and DDGaligned_pop_process() read their inputs from the
+I:// drive. furness_hhr is benchmarked from the point its seed and
+controls are built: slicing by district, ipf by district and joining the
+results back up. DDGaligned_pop_process is run in full, with its files
+written to a temporary folder and the module paths pointed at them.
+"""
+# Builtins
+import os
+import gc
+import json
+import time
+import types
+import pathlib
+import argparse
+import datetime
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+import contextlib
+
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Callable
+
+# Third party
+import numpy as np
+import pandas as pd
+
+# Local imports
+from land_use.utils import compress
+from land_use.utils import normalise_tts
+from land_use.utils import translate
+from land_use.utils import segment_keys
+from land_use.reports import sector_report
+from land_use.base_land_use import DDG_process
+from land_use.base_land_use import base_year_population_process as bypp
+
+from benchmarks import generators
+
+RESULTS_FOLDER = pathlib.Path(__file__).parent / 'results'
+DEFAULT_REPEATS = 3
+
+
+def _furness_hhr(inputs: Dict[str, pd.DataFrame],
+                 tmp_dir: pathlib.Path,
+                 process_count: int,
+                 ) -> Callable[[], Any]:
+    seed = inputs['furness_seed']
+    controls = [
+        inputs['furness_z_hhr_ag_control'],
+        inputs['furness_z_hhr_h_control'],
+        inputs['furness_z_hhr_t_control'],
+        inputs['furness_LA_hhr_s_control'],
+        inputs['furness_LA_hhr_ageplus_control'],
+    ]
+    district_upper_limit = seed['LA'].max() + 1
+
+    def run():
+        # As furness_hhr(), from slicing by district onwards
+        district_seed, kwarg_list = bypp._district_ipf_kwargs(seed, *controls, district_upper_limit)
+        furnessed_by_d = bypp._ipf_districts(district_seed, kwarg_list, process_count=process_count)
+        for district, furnessed_df in zip(range(1, district_upper_limit), furnessed_by_d):
+            furnessed_df['LA'] = district
+        return pd.concat(furnessed_by_d, axis=0, ignore_index=True)
+
+    return run
+
+
+def _expanded_to_normalised(inputs: Dict[str, pd.DataFrame],
+                            tmp_dir: pathlib.Path,
+                            process_count: int,
+                            ) -> Callable[[], Any]:
+    lu = inputs['land_use_vector'].drop(columns='t')
+    norm_index = inputs['tfn_tt_segments'].rename(columns={'tfn_tt': 'tfn_traveller_type'})
+
+    def run():
+        return normalise_tts.expanded_to_normalised(lu, norm_index=norm_index, verbose=False)
+
+    return run
+
+
+def _vector_join_translation(inputs: Dict[str, pd.DataFrame],
+                             tmp_dir: pathlib.Path,
+                             process_count: int,
+                             ) -> Callable[[], Any]:
+    lu = inputs['land_use_vector']
+    trans = inputs['zone_translation']
+
+    def run():
+        return translate.vector_join_translation(
+            lu.copy(),
+            trans,
+            retain_cols=['a', 'g', 'h', 'e', 'n', 's', 't'],
+            join_id='msoa_zone_id',
+            zone_id='model_zone_id',
+            var_col='people',
+            weight_col='msoa_to_model_zone',
+            verbose=False,
+        )
+
+    return run
+
+
+def _sector_reporter(inputs: Dict[str, pd.DataFrame],
+                     tmp_dir: pathlib.Path,
+                     ) -> sector_report.SectorReporter:
+    target_folder = tmp_dir / 'sector_report'
+    target_folder.mkdir()
+    compress.write_out(inputs['normalised_vector'], target_folder / 'land_use_2018_pop')
+    sectors_path = tmp_dir / 'msoa_sector_correspondence.csv'
+    inputs['sector_correspondence'].to_csv(sectors_path, index=False)
+
+    return sector_report.SectorReporter(
+        target_folder=str(target_folder),
+        retain_cols=['area_type', 'tfn_traveller_type'],
+        model_schema=str(tmp_dir),
+        model_sectors=str(sectors_path),
+    )
+
+
+def _sector_report(inputs: Dict[str, pd.DataFrame],
+                   tmp_dir: pathlib.Path,
+                   process_count: int,
+                   ) -> Callable[[], Any]:
+    reporter = _sector_reporter(inputs, tmp_dir)
+
+    def run():
+        return reporter.sector_report(
+            ca_report=True,
+            three_sector_report=True,
+            ie_sector_report=True,
+        )
+
+    return run
+
+
+def _sector_report_batch(inputs: Dict[str, pd.DataFrame],
+                         tmp_dir: pathlib.Path,
+                         process_count: int,
+                         ) -> Callable[[], Any]:
+    reporter = _sector_reporter(inputs, tmp_dir)
+
+    def run():
+        return reporter.batch_sector_report(
+            ca_report=True,
+            three_sector_report=True,
+            ie_sector_report=True,
+            process_count=process_count,
+        )
+
+    return run
+
+
+def _compress_write_out(inputs: Dict[str, pd.DataFrame],
+                        tmp_dir: pathlib.Path,
+                        process_count: int,
+                        ) -> Callable[[], Any]:
+    df = inputs['population']
+
+    def run():
+        return compress.write_out(df, tmp_dir / 'write_out')
+
+    return run
+
+
+def _compress_read_in(inputs: Dict[str, pd.DataFrame],
+                      tmp_dir: pathlib.Path,
+                      process_count: int,
+                      ) -> Callable[[], Any]:
+    path = compress.write_out(inputs['population'], tmp_dir / 'read_in')
+
+    def run():
+        return compress.read_in(path)
+
+    return run
+
+
+def _ddg_aligned_pop_process(inputs: Dict[str, pd.DataFrame],
+                             tmp_dir: pathlib.Path,
+                             process_count: int,
+                             ) -> Callable[[], Any]:
+    # Lay the inputs out as DDGaligned_pop_process() expects to find them
+    home_folder = tmp_dir / 'ddg'
+    import_folder = home_folder / 'import'
+    ddg_folder = import_folder / 'DDG'
+    (home_folder / DDG_process.output_dir).mkdir(parents=True)
+    (home_folder / DDG_process.audit_dir / DDG_process.DDG_process_dir).mkdir(parents=True)
+    (import_folder / 'Lookups').mkdir(parents=True)
+    ddg_folder.mkdir()
+
+    compress.write_out(
+        inputs['population'],
+        home_folder / DDG_process.output_dir / '_'.join(
+            ['output_5_gb_msoa_tfntt_t', DDG_process.ModelYear, 'tot_pop']),
+    )
+    inputs['zone_la_lookup'].to_csv(import_folder / DDG_process._Zone_LA_path, index=False)
+    segs_path = import_folder / 'Lookups' / 'normits_segs_to_tfn_tt.csv'
+    inputs['tfn_tt_segments'].to_csv(segs_path, index=False)
+    inputs['ddg_pop'].to_csv(ddg_folder / DDG_process.DDG_pop_path, index=False)
+    inputs['ddg_wkrfrac'].to_csv(ddg_folder / DDG_process.DDG_wkrfrac_path, index=False)
+
+    by_lu_obj = types.SimpleNamespace(
+        home_folder=str(home_folder),
+        import_folder=str(import_folder),
+        base_year=DDG_process.ModelYear,
+        out_paths={'write_folder': str(home_folder)},
+    )
+
+    def run():
+        with _patched(DDG_process,
+                      DDG_directory=str(ddg_folder),
+                      normits_seg_to_tfn_tt_file=str(segs_path)):
+            return DDG_process.DDGaligned_pop_process(by_lu_obj)
+
+    return run
+
+
+def _segment_merge_inputs(inputs: Dict[str, pd.DataFrame]) -> List[pd.DataFrame]:
+    # Population by NorMITs segment, and the segment to traveller type lookup,
+    # as merged in furness_hhr()
+    segs = inputs['tfn_tt_segments']
+    pop = inputs['population'].merge(segs, on='tfn_tt').drop(columns='tfn_tt')
+    return [pop, segs]
+
+
+def _segment_merge_string_keys(inputs: Dict[str, pd.DataFrame],
+                               tmp_dir: pathlib.Path,
+                               process_count: int,
+                               ) -> Callable[[], Any]:
+    pop, segs = _segment_merge_inputs(inputs)
+    cols = ['a', 'g', 'h', 'e', 'n', 's']
+
+    def run():
+        left = pop.assign(aghens=['_'.join([str(x) for x in row])
+                                  for row in zip(*[pop[c] for c in cols])])
+        right = segs.assign(aghens=['_'.join([str(x) for x in row])
+                                    for row in zip(*[segs[c] for c in cols])])
+        return left.merge(right, on='aghens')
+
+    return run
+
+
+def _segment_merge_packed_keys(inputs: Dict[str, pd.DataFrame],
+                               tmp_dir: pathlib.Path,
+                               process_count: int,
+                               ) -> Callable[[], Any]:
+    pop, segs = _segment_merge_inputs(inputs)
+
+    def run():
+        return segment_keys.merge_on_segments(pop, segs, ['a', 'g', 'h', 'e', 'n', 's'])
+
+    return run
+
+
+# Benchmark name to a function that sets the benchmark up and returns a
+# callable that runs it
+BENCHMARKS = {
+    'furness_hhr': _furness_hhr,
+    'expanded_to_normalised': _expanded_to_normalised,
+    'vector_join_translation': _vector_join_translation,
+    'sector_report': _sector_report,
+    'sector_report.batch': _sector_report_batch,
+    'compress.write_out': _compress_write_out,
+    'compress.read_in': _compress_read_in,
+    'DDGaligned_pop_process': _ddg_aligned_pop_process,
+    'segment_merge.string_keys': _segment_merge_string_keys,
+    'segment_merge.packed_keys': _segment_merge_packed_keys,
+}
+
+
+@contextlib.contextmanager
+def _patched(module: types.ModuleType, **attributes):
+    """
+    Temporarily sets attributes on module, restoring them on exit.
+    """
+    originals = {k: getattr(module, k) for k in attributes}
+    for k, v in attributes.items():
+        setattr(module, k, v)
+    try:
+        yield module
+    finally:
+        for k, v in originals.items():
+            setattr(module, k, v)
+
+
+def measure(fn: Callable[[], Any],
+            repeats: int = DEFAULT_REPEATS,
+            ) -> Dict[str, Any]:
+    """
+    Times fn over a number of repeats, then finds its peak memory.
+
+    Memory is measured on a separate run, as tracemalloc slows down
+    anything that allocates lots of small python objects.
+
+    Parameters
+    ----------
+    fn:
+        The function to measure. Called with no arguments.
+
+    repeats:
+        The number of times to call fn when timing it.
+
+    Returns
+    -------
+    result:
+        A dictionary of the run times in seconds, their min and mean,
+        and the peak memory allocated during a run in MB.
+    """
+    times = list()
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'times': times,
+        'min': min(times),
+        'mean': float(np.mean(times)),
+        'peak_memory_mb': peak / 1e6,
+    }
+
+
+def _git_commit() -> Dict[str, Any]:
+    """
+    Returns the current commit, and whether the tree has uncommitted changes.
+    """
+    repo_dir = pathlib.Path(__file__).parents[1]
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=repo_dir, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        status = subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'],
+            cwd=repo_dir, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': 'unknown', 'dirty': None}
+    return {'commit': commit, 'dirty': bool(status)}
+
+
+def run_benchmarks(names: List[str] = None,
+                   scale: float = 1.0,
+                   seed: int = generators.DEFAULT_SEED,
+                   repeats: int = DEFAULT_REPEATS,
+                   process_count: int = 0,
+                   results_folder: pathlib.Path = RESULTS_FOLDER,
+                   verbose: bool = True,
+                   ) -> pathlib.Path:
+    """
+    Runs the benchmarks on synthetic inputs and writes the results out.
+
+    Parameters
+    ----------
+    names:
+        The names of the benchmarks to run. Must be keys of BENCHMARKS.
+        If None, all of them are run.
+
+    scale:
+        The share of GB to build synthetic inputs for. See
+        generators.build_inputs().
+
+    seed:
+        The seed for the synthetic inputs.
+
+    repeats:
+        The number of times to time each benchmark.
+
+    process_count:
+        The number of processes to run the ipf in furness_hhr with. 0
+        runs it in this process, which gives the most stable timings.
+
+    results_folder:
+        The folder to write the results out to.
+
+    verbose:
+        Whether to print each result as it is measured.
+
+    Returns
+    -------
+    results_path:
+        The path the results were written to. The file is named after
+        the commit the benchmarks were run on.
+    """
+    names = list(BENCHMARKS) if names is None else names
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        raise ValueError(
+            "Unknown benchmarks %s. Available benchmarks are: %s"
+            % (sorted(unknown), list(BENCHMARKS))
+        )
+
+    start = time.perf_counter()
+    inputs = generators.build_inputs(scale=scale, seed=seed)
+    if verbose:
+        print("Built synthetic inputs at scale %s in %.1fs" % (scale, time.perf_counter() - start))
+
+    git = _git_commit()
+    results = {
+        'commit': git['commit'],
+        'dirty': git['dirty'],
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'scale': scale,
+        'seed': seed,
+        'repeats': repeats,
+        'process_count': process_count,
+        'n_zones': len(inputs['zones']),
+        'n_population_rows': len(inputs['population']),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'benchmarks': dict(),
+    }
+
+    for name in names:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fn = BENCHMARKS[name](inputs, pathlib.Path(tmp_dir), process_count)
+            result = measure(fn, repeats)
+        results['benchmarks'][name] = result
+        if verbose:
+            print("%s: %.3fs min, %.3fs mean, %.1fMB peak"
+                  % (name, result['min'], result['mean'], result['peak_memory_mb']))
+
+    results_folder = pathlib.Path(results_folder)
+    results_folder.mkdir(parents=True, exist_ok=True)
+    file_name = '%s_%s.json' % (
+        results['commit'][:10],
+        datetime.datetime.now().strftime('%Y%m%d_%H%M%S'),
+    )
+    results_path = results_folder / file_name
+    with open(results_path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if verbose:
+        print("Results written to %s" % results_path)
+    return results_path
+
+
+def compare_results(base_path: os.PathLike,
+                    new_path: os.PathLike,
+                    ) -> pd.DataFrame:
+    """
+    Compares two sets of benchmark results.
+
+    Parameters
+    ----------
+    base_path:
+        Path to the results to compare against, written by run_benchmarks().
+
+    new_path:
+        Path to the new results, written by run_benchmarks().
+
+    Returns
+    -------
+    comparison:
+        A dataframe indexed by benchmark of the min time and peak memory
+        of each run, and the ratio of new to base. Ratios below 1 are
+        improvements. Only benchmarks in both runs are compared.
+    """
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    if base['scale'] != new['scale'] or base['seed'] != new['seed']:
+        print("WARNING: Comparing runs on different inputs. "
+              "Base scale %s seed %s, new scale %s seed %s."
+              % (base['scale'], base['seed'], new['scale'], new['seed']))
+
+    rows = list()
+    for name in [x for x in base['benchmarks'] if x in new['benchmarks']]:
+        base_bench = base['benchmarks'][name]
+        new_bench = new['benchmarks'][name]
+        rows.append({
+            'benchmark': name,
+            'base_time': base_bench['min'],
+            'new_time': new_bench['min'],
+            'time_ratio': new_bench['min'] / base_bench['min'],
+            'base_memory_mb': base_bench['peak_memory_mb'],
+            'new_memory_mb': new_bench['peak_memory_mb'],
+            'memory_ratio': new_bench['peak_memory_mb'] / base_bench['peak_memory_mb'],
+        })
+
+    return pd.DataFrame(rows).set_index('benchmark')
+
+
+def runner_tests() -> None:
+    """
+    Runs every benchmark at a small scale, and checks the results write
+    out and compare.
+    """
+    print("Running runner tests...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        kwargs = {'scale': 0.01, 'repeats': 1, 'results_folder': tmp_dir, 'verbose': False}
+        first = run_benchmarks(**kwargs)
+        second = run_benchmarks(**kwargs)
+
+        comparison = compare_results(first, second)
+        assert list(comparison.index) == list(BENCHMARKS)
+        assert (comparison[['base_time', 'new_time', 'base_memory_mb']] > 0).all().all()
+        print(comparison)
+
+    print("All tests passed!")
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='share of GB to build synthetic inputs for')
+    parser.add_argument('--seed', type=int, default=generators.DEFAULT_SEED)
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS)
+    parser.add_argument('--process-count', type=int, default=0,
+                        help='processes to run the furness_hhr ipf with')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS),
+                        help='benchmarks to run, all if not given')
+    parser.add_argument('--results-folder', default=str(RESULTS_FOLDER))
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'),
+                        help='compare two results files instead of running')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _parse_args()
+    if args.compare is not None:
+        with pd.option_context('display.width', 200, 'display.max_columns', None,
+                               'display.float_format', '{:.3f}'.format):
+            print(compare_results(*args.compare))
+    else:
+        run_benchmarks(
+            names=args.only,
+            scale=args.scale,
+            seed=args.seed,
+            repeats=args.repeats,
+            process_count=args.process_count,
+            results_folder=args.results_folder,
+        )
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""Compare row-wise and vectorised assignment of points to zone polygons.
+
+Builds seeded synthetic LSOA-like zones, as Voronoi polygons covering GB,
+and synthetic address points, some of which are placed on zone boundaries.
+Then times assigning the points to zones:
+
+- as the code used to, building a shapely `Point` per row with
+  `DataFrame.apply` and joining zones with `gpd.sjoin(predicate="within")`;
+- with `spatial.points_geodata` and `spatial.ZoneTree.join`.
+
+Points assigned to exactly one zone by `sjoin` are checked to be assigned
+to the same zone by the `ZoneTree`. Points on boundaries aren't within any
+zone, so `sjoin` leaves them unassigned while the `ZoneTree` assigns them
+to the first zone they touch.
+
+Usage:
+    python -m benchmarks.spatial_assignment --points 5000000
+"""
+
+##### IMPORTS #####
+# Standard imports
+from __future__ import annotations
+
+import argparse
+import logging
+import time
+
+# Third party imports
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from shapely import geometry
+
+# Local imports
+from land_use.abp_processing import spatial
+
+##### CONSTANTS #####
+LOG = logging.getLogger(__name__)
+CRS_BRITISH_GRID = "EPSG:27700"
+GB_BOUNDS = (0, 0, 700_000, 1_250_000)
+DEFAULT_SEED = 42
+DEFAULT_POINTS = 5_000_000
+# Number of LSOAs and data zones in GB
+DEFAULT_ZONES = 41_729
+BOUNDARY_SHARE = 0.001
+
+##### FUNCTIONS #####
+def synthetic_zones(n_zones: int = DEFAULT_ZONES, seed: int = DEFAULT_SEED) -> gpd.GeoDataFrame:
+    """Voronoi polygons of random seed points covering `GB_BOUNDS`, indexed by zone ID."""
+    rng = np.random.default_rng(seed)
+    seeds = shapely.points(
+        rng.uniform(GB_BOUNDS[0], GB_BOUNDS[2], n_zones),
+        rng.uniform(GB_BOUNDS[1], GB_BOUNDS[3], n_zones),
+    )
+    bounds = geometry.box(*GB_BOUNDS)
+    polygons = shapely.get_parts(
+        shapely.voronoi_polygons(shapely.multipoints(seeds), extend_to=bounds)
+    )
+    polygons = shapely.intersection(polygons, bounds)
+
+    return gpd.GeoDataFrame(
+        {"lsoa_id": [f"E01{i:06d}" for i in range(len(polygons))]},
+        geometry=polygons,
+        crs=CRS_BRITISH_GRID,
+    ).set_index("lsoa_id")
+
+
+def synthetic_points(
+    zones: gpd.GeoDataFrame, n_points: int = DEFAULT_POINTS, seed: int = DEFAULT_SEED
+) -> pd.DataFrame:
+    """Random address coordinates, with `BOUNDARY_SHARE` placed on zone vertices."""
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(GB_BOUNDS[0], GB_BOUNDS[2], n_points)
+    y = rng.uniform(GB_BOUNDS[1], GB_BOUNDS[3], n_points)
+
+    vertices = shapely.get_coordinates(zones.geometry.values)
+    on_boundary = rng.random(n_points) < BOUNDARY_SHARE
+    chosen = rng.integers(0, len(vertices), on_boundary.sum())
+    x[on_boundary] = vertices[chosen, 0]
+    y[on_boundary] = vertices[chosen, 1]
+
+    return pd.DataFrame(
+        {"uprn": np.arange(1, n_points + 1), "x_coordinate": x, "y_coordinate": y}
+    )
+
+
+def _legacy_assign(data: pd.DataFrame, zones: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    data = data.copy()
+    data.loc[:, "geometry"] = data.apply(
+        lambda row: geometry.Point(row["x_coordinate"], row["y_coordinate"]), axis=1
+    )
+    geodata = gpd.GeoDataFrame(data, geometry="geometry", crs=CRS_BRITISH_GRID)
+    return gpd.sjoin(geodata, zones.reset_index(), how="left", predicate="within")
+
+
+def _vectorised_assign(data: pd.DataFrame, zones: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    geodata = spatial.points_geodata(
+        data.copy(), "x_coordinate", "y_coordinate", crs=CRS_BRITISH_GRID
+    )
+    return spatial.ZoneTree(zones).join(geodata, how="left")
+
+
+def compare(
+    n_points: int = DEFAULT_POINTS, n_zones: int = DEFAULT_ZONES, seed: int = DEFAULT_SEED
+) -> pd.DataFrame:
+    """Time row-wise and vectorised point in polygon assignment.
+
+    Parameters
+    ----------
+    n_points : int, default DEFAULT_POINTS
+        Number of address points to assign.
+    n_zones : int, default DEFAULT_ZONES
+        Number of zone polygons.
+    seed : int, default DEFAULT_SEED
+        Seed for the synthetic zones and points.
+
+    Returns
+    -------
+    pd.DataFrame
+        Seconds taken by each method, and the number of points
+        assigned to no zone or more than one zone.
+
+    Raises
+    ------
+    AssertionError
+        If the methods assign any point to different zones.
+    """
+    zones = synthetic_zones(n_zones, seed)
+    data = synthetic_points(zones, n_points, seed)
+    LOG.info("Built %s zones and %s points", f"{len(zones):,}", f"{len(data):,}")
+
+    timings = []
+    outputs = {}
+    methods = {
+        "Point per row and sjoin": _legacy_assign,
+        "vectorised points and ZoneTree": _vectorised_assign,
+    }
+    for name, method in methods.items():
+        LOG.info("Assigning points with %s", name)
+        start = time.perf_counter()
+        outputs[name] = method(data, zones)
+        seconds = time.perf_counter() - start
+
+        counts = outputs[name].groupby("uprn")["lsoa_id"].count()
+        timings.append((name, seconds, (counts == 0).sum(), (counts > 1).sum()))
+
+    legacy, vectorised = outputs.values()
+    single = legacy.loc[~legacy["uprn"].duplicated(keep=False)].set_index("uprn")
+    single = single.loc[single["lsoa_id"].notna(), "lsoa_id"]
+    assigned = vectorised.set_index("uprn").loc[single.index, "lsoa_id"]
+    mismatched = (assigned != single).sum()
+    if mismatched > 0:
+        raise AssertionError(f"{mismatched} points assigned to different zones")
+    LOG.info("ZoneTree assignments match sjoin for %s points", f"{len(single):,}")
+
+    return pd.DataFrame(
+        timings, columns=["method", "seconds", "unassigned", "multiple_zones"]
+    ).set_index("method")
+
+
+def _run() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--points", type=int, default=DEFAULT_POINTS)
+    parser.add_argument("--zones", type=int, default=DEFAULT_ZONES)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="[{levelname:^8.8}] {message}", style="{")
+    timings = compare(args.points, args.zones, args.seed)
+    with pd.option_context("display.float_format", "{:.3f}".format):
+        print(timings)
+
+
+if __name__ == "__main__":
+    _run()
@@ -43,6 +43,7 @@ class WarehouseConfig(config_base.BaseConfig):
     output_folder: pydantic.DirectoryPath  # pylint: disable=no-member
     lsoa_shapefile: ShapefileParameters
     year_filter: Optional[int] = None
+    single_pass: bool = True
 
 
 ##### FUNCTIONS #####
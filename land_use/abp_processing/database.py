@@ -4,19 +4,50 @@
 ##### IMPORTS #####
 # Standard imports
 from __future__ import annotations
+import decimal
+import io
 import logging
-from typing import Any, Mapping, Optional, Sequence, Union
+import tempfile
+import uuid
+from typing import Any, Iterator, Mapping, Optional, Sequence, Union
 
 # Third party imports
 import pandas as pd
 import psycopg2
-from psycopg2 import sql
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+from psycopg2 import pool, sql
 from pydantic import dataclasses
 
 # Local imports
 
 ##### CONSTANTS #####
 LOG = logging.getLogger(__name__)
+DEFAULT_CHUNK_SIZE = 100_000
+# Bytes of COPY output held in memory before spilling to a temporary file
+COPY_SPOOL_SIZE = 256 * 1024**2
+# PostgreSQL type OIDs to the arrow types used when reading COPY output,
+# any other types are read as text
+PG_NUMERIC_OID = 1700
+PG_ARROW_TYPES = {
+    16: pa.bool_(),  # bool
+    20: pa.int64(),  # int8
+    21: pa.int16(),  # int2
+    23: pa.int32(),  # int4
+    26: pa.int64(),  # oid
+    700: pa.float32(),  # float4
+    701: pa.float64(),  # float8
+    1082: pa.date32(),  # date
+    1114: pa.timestamp("us"),  # timestamp
+    1184: pa.timestamp("us", tz="UTC"),  # timestamptz
+}
+# Any column can contain NULLs, so nullable pandas dtypes are used
+_NULLABLE_DTYPES = {
+    pa.bool_(): pd.BooleanDtype(),
+    pa.int16(): pd.Int16Dtype(),
+    pa.int32(): pd.Int32Dtype(),
+    pa.int64(): pd.Int64Dtype(),
+}
 
 ##### CLASSES #####
 _Query = Union[str, sql.SQL]
@@ -35,28 +66,94 @@ class ConnectionParameters:
     application_name: Optional[str] = None
 
 
+class ConnectionPool:
+    """Small thread-safe pool of connections to a PostgreSQL database.
+
+    Connections are opened when first needed, up to `max_connections`,
+    and reused afterwards. Each thread should use its own `Database`,
+    from `ConnectionPool.database`.
+
+    Parameters
+    ----------
+    parameters : ConnectionParameters
+        Parameters for connecting to the database.
+    min_connections : int, default 1
+        Number of connections to open on creation and keep open.
+    max_connections : int, default 4
+        Maximum number of connections open at once, requesting
+        another raises `psycopg2.pool.PoolError`.
+    """
+
+    def __init__(
+        self,
+        parameters: ConnectionParameters,
+        min_connections: int = 1,
+        max_connections: int = 4,
+    ) -> None:
+        self._parameters = parameters
+        self._pool = pool.ThreadedConnectionPool(
+            min_connections, max_connections, **_connect_kwargs(parameters)
+        )
+        LOG.info(
+            "Created pool of up to %s connections to database: %s",
+            max_connections,
+            parameters.database,
+        )
+
+    def __enter__(self) -> ConnectionPool:
+        """Initialise ConnectionPool."""
+        return self
+
+    def __exit__(self, excepType, excepVal, traceback) -> None:
+        """Close all pooled connections."""
+        self.close()
+
+    def get_connection(self) -> psycopg2.connection:
+        """Take a connection from the pool, must be returned with `put_connection`."""
+        return self._pool.getconn()
+
+    def put_connection(self, connection: psycopg2.connection) -> None:
+        """Return `connection` to the pool, rolling back any open transaction."""
+        self._pool.putconn(connection)
+
+    def database(self) -> Database:
+        """`Database` using a pooled connection, returned to the pool on exit."""
+        return Database(self._parameters, connection_pool=self)
+
+    def close(self) -> None:
+        """Close all connections in the pool."""
+        if not self._pool.closed:
+            self._pool.closeall()
+            LOG.info("Connection pool closed")
+
+
 class Database:
-    """Manage connection and access to a PostgreSQL database."""
+    """Manage connection and access to a PostgreSQL database.
+
+    Parameters
+    ----------
+    parameters : ConnectionParameters
+        Parameters for connecting to the database.
+    connection_pool : ConnectionPool, optional
+        Pool to take the connection from, instead of opening a new one.
+        The connection is returned to the pool, rather than closed, on exit.
+    """
 
-    def __init__(self, parameters: ConnectionParameters) -> None:
+    def __init__(
+        self,
+        parameters: ConnectionParameters,
+        connection_pool: Optional[ConnectionPool] = None,
+    ) -> None:
         self._parameters = parameters
-        self._connection = self._connect(parameters)
+        self._pool = connection_pool
+        if connection_pool is None:
+            self._connection = self._connect(parameters)
+        else:
+            self._connection = connection_pool.get_connection()
         self._cursor = self._connection.cursor()
 
     def _connect(self, parameters: ConnectionParameters) -> psycopg2.connection:
-        app_name = parameters.application_name
-        if app_name is None:
-            app_name = __name__
-
-        connection = psycopg2.connect(
-            database=parameters.database,
-            user=parameters.user,
-            password=parameters.password,
-            host=parameters.host,
-            port=parameters.port,
-            options="-c search_path=dbo,data_common",
-            application_name=app_name,
-        )
+        connection = psycopg2.connect(**_connect_kwargs(parameters))
         LOG.info("Connected to database: %s", parameters.database)
 
         return connection
@@ -71,8 +168,12 @@ class Database:
             LOG.critical("Oh no a critical error occurred", exc_info=True)
 
         self._cursor.close()
-        self._connection.close()
-        LOG.info("Database connection closed")
+        if self._pool is None:
+            self._connection.close()
+            LOG.info("Database connection closed")
+        else:
+            self._pool.put_connection(self._connection)
+            LOG.debug("Database connection returned to pool")
 
     @property
     def connection(self) -> psycopg2.connection:
@@ -102,5 +203,462 @@ class Database:
             columns=[desc[0] for desc in self._cursor.description],
         )
 
+    def query_chunks(
+        self,
+        query: _Query,
+        query_vars: _Vars = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> Iterator[pd.DataFrame]:
+        """Query database and iterate through the rows in DataFrame chunks.
+
+        Uses a server-side cursor, so only `chunk_size` rows are
+        transferred from the database, and held in memory, at once.
+
+        Parameters
+        ----------
+        query : _Query
+            Query to run.
+        query_vars : _Vars, optional
+            Variables to pass into `query`.
+        chunk_size : int, default DEFAULT_CHUNK_SIZE
+            Maximum number of rows in each DataFrame.
+
+        Yields
+        ------
+        pd.DataFrame
+            The next `chunk_size` rows of the query results.
+        """
+        # Named cursors are created on the server
+        cursor = self._connection.cursor(name=f"lu_{uuid.uuid4().hex}")
+        cursor.itersize = chunk_size
+        LOG.debug(
+            "Executing chunked query on %s:\n%s",
+            self._parameters.database,
+            cursor.mogrify(query, vars=query_vars).decode(),
+        )
+
+        try:
+            cursor.execute(query, query_vars)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield pd.DataFrame(
+                    rows, columns=[desc[0] for desc in cursor.description]
+                )
+        finally:
+            cursor.close()
+
+    def copy_to_dataframe(
+        self,
+        query: _Query,
+        query_vars: _Vars = None,
+        numeric_as_float: bool = False,
+    ) -> pd.DataFrame:
+        """Query database using COPY and read the results into a DataFrame.
+
+        Faster, and uses less memory, than `query_to_dataframe` for
+        large queries. Results are streamed from the database as CSV
+        and parsed straight into columns, with dtypes from the column
+        types in the database, without building Python objects for
+        each row.
+
+        Parameters
+        ----------
+        query : _Query
+            SELECT query to run.
+        query_vars : _Vars, optional
+            Variables to pass into `query`.
+        numeric_as_float : bool, default False
+            Whether to read numeric columns as float64, which is faster
+            but can lose precision.
+
+        Returns
+        -------
+        pd.DataFrame
+            Results of `query`. Integer and boolean columns use the
+            nullable pandas dtypes, dates and timestamps are datetimes
+            and empty text is read as missing. Numeric columns are
+            `decimal.Decimal` objects, as from `query_to_dataframe`,
+            unless `numeric_as_float`. Any types not in `PG_ARROW_TYPES`
+            are read as text.
+        """
+        copy_out = self._copy_out(query, query_vars, numeric_as_float)
+        with copy_out as batches:
+            table = pa.Table.from_batches(list(batches), schema=copy_out.schema)
+        return _arrow_to_pandas(table, copy_out.decimal_columns)
+
+    def copy_chunks(
+        self,
+        query: _Query,
+        query_vars: _Vars = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        numeric_as_float: bool = False,
+    ) -> Iterator[pd.DataFrame]:
+        """Query database using COPY and iterate through the results in chunks.
+
+        See `copy_to_dataframe` for details on the DataFrame dtypes.
+        The COPY output is spooled to a temporary file once it reaches
+        `COPY_SPOOL_SIZE`, and parsed a block at a time, so memory use
+        stays bounded.
+
+        Parameters
+        ----------
+        query : _Query
+            SELECT query to run.
+        query_vars : _Vars, optional
+            Variables to pass into `query`.
+        chunk_size : int, default DEFAULT_CHUNK_SIZE
+            Maximum number of rows in each DataFrame.
+        numeric_as_float : bool, default False
+            See `copy_to_dataframe`.
+
+        Yields
+        ------
+        pd.DataFrame
+            The next `chunk_size` rows of the query results.
+        """
+        copy_out = self._copy_out(query, query_vars, numeric_as_float)
+        with copy_out as batches:
+            # Batches parsed but not yet yielded, fewer than `chunk_size` rows
+            # are carried over to the next batch
+            buffer: list[pa.RecordBatch] = []
+            buffered = 0
+            for batch in batches:
+                buffer.append(batch)
+                buffered += batch.num_rows
+                if buffered < chunk_size:
+                    continue
+
+                pending = pa.Table.from_batches(buffer, schema=copy_out.schema)
+                start = 0
+                while buffered - start >= chunk_size:
+                    yield _arrow_to_pandas(
+                        pending.slice(start, chunk_size), copy_out.decimal_columns
+                    )
+                    start += chunk_size
+                buffer = pending.slice(start).to_batches()
+                buffered -= start
+
+            if buffered > 0:
+                yield _arrow_to_pandas(
+                    pa.Table.from_batches(buffer, schema=copy_out.schema),
+                    copy_out.decimal_columns,
+                )
+
+    def _bind(self, query: _Query, query_vars: _Vars) -> str:
+        """Merge `query_vars` into `query`, so it can be used as a sub-query."""
+        bound = self._cursor.mogrify(query, vars=query_vars).decode()
+        return bound.strip().rstrip(";")
+
+    def _copy_out(
+        self, query: _Query, query_vars: _Vars, numeric_as_float: bool = False
+    ) -> _CopyOut:
+        """COPY the results of `query` to a temporary file, see `_CopyOut`.
+
+        Numeric columns are read as float64 if `numeric_as_float`,
+        otherwise as text to be converted to `decimal.Decimal`.
+        """
+        bound = self._bind(query, query_vars)
+
+        # Find the column names and types without running the full query
+        self._cursor.execute(f"SELECT * FROM ({bound}) q LIMIT 0")
+        fields = []
+        decimal_columns = []
+        for desc in self._cursor.description:
+            if desc.type_code == PG_NUMERIC_OID and numeric_as_float:
+                fields.append((desc.name, pa.float64()))
+                continue
+            if desc.type_code == PG_NUMERIC_OID:
+                decimal_columns.append(desc.name)
+            fields.append((desc.name, PG_ARROW_TYPES.get(desc.type_code, pa.string())))
+
+        statement = f"COPY ({bound}) TO STDOUT WITH (FORMAT csv)"
+        return _CopyOut(
+            self._cursor, statement, pa.schema(fields), self._parameters, decimal_columns
+        )
+
+    def copy_from_dataframe(
+        self,
+        data: pd.DataFrame,
+        table: str,
+        columns: Optional[Sequence[str]] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        commit: bool = True,
+    ) -> int:
+        """Bulk write `data` into an existing table using COPY.
+
+        Parameters
+        ----------
+        data : pd.DataFrame
+            Data to write, the index isn't written.
+        table : str
+            Name of the table to write to, can include the schema
+            e.g. "data_common.warehouses".
+        columns : Sequence[str], optional
+            Columns of `data` to write, the table columns must have the
+            same names. Defaults to all columns in `data`.
+        chunk_size : int, default DEFAULT_CHUNK_SIZE
+            Number of rows converted to CSV and sent at once.
+        commit : bool, default True
+            Whether to commit the transaction once all the rows are
+            written.
+
+        Returns
+        -------
+        int
+            Number of rows written.
+        """
+        columns = list(data.columns) if columns is None else list(columns)
+        statement = sql.SQL("COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)")
+        statement = statement.format(
+            table=sql.Identifier(*table.split(".")),
+            columns=sql.SQL(", ").join(sql.Identifier(c) for c in columns),
+        )
+
+        LOG.info("Copying %s rows into %s", f"{len(data):,}", table)
+        for start in range(0, len(data), chunk_size):
+            buffer = io.StringIO()
+            data.iloc[start : start + chunk_size].to_csv(
+                buffer, columns=columns, index=False, header=False
+            )
+            buffer.seek(0)
+            self._cursor.copy_expert(statement, buffer)
+
+        if commit:
+            self._connection.commit()
+
+        return len(data)
+
+
+class _CopyOut:
+    """Context manager to run a COPY TO STDOUT statement into a temporary file.
+
+    Returns an iterator of the record batches parsed from the file, with
+    types from `schema`. The file is closed, and deleted if it was spilled
+    to disk, on exit. `decimal_columns` are the text columns holding
+    numeric values, see `_arrow_to_pandas`.
+    """
+
+    def __init__(
+        self,
+        cursor: psycopg2.cursor,
+        statement: str,
+        schema: pa.Schema,
+        parameters: ConnectionParameters,
+        decimal_columns: Sequence[str] = (),
+    ) -> None:
+        self._cursor = cursor
+        self._statement = statement
+        self.schema = schema
+        self._parameters = parameters
+        self.decimal_columns = list(decimal_columns)
+        self._file: Optional[tempfile.SpooledTemporaryFile] = None
+
+    def __enter__(self) -> Iterator[pa.RecordBatch]:
+        """Run the COPY."""
+        LOG.debug(
+            "Executing COPY on %s:\n%s", self._parameters.database, self._statement
+        )
+        self._file = tempfile.SpooledTemporaryFile(max_size=COPY_SPOOL_SIZE)
+        self._cursor.copy_expert(self._statement, self._file)
+
+        if self._file.tell() == 0:
+            return iter(())
+
+        self._file.seek(0)
+        return pa_csv.open_csv(
+            self._file,
+            read_options=pa_csv.ReadOptions(column_names=self.schema.names),
+            parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+            convert_options=pa_csv.ConvertOptions(
+                column_types=dict(zip(self.schema.names, self.schema.types)),
+                true_values=["t"],
+                false_values=["f"],
+                strings_can_be_null=True,
+            ),
+        )
+
+    def __exit__(self, excepType, excepVal, traceback) -> None:
+        """Close and remove the temporary file."""
+        if self._file is not None:
+            self._file.close()
+
 
 ##### FUNCTIONS #####
+def _arrow_to_pandas(
+    table: pa.Table, decimal_columns: Sequence[str] = ()
+) -> pd.DataFrame:
+    """Convert `table` to a DataFrame, keeping integers with NULLs as integers.
+
+    `decimal_columns` are text columns converted to `decimal.Decimal`
+    objects, so numeric values keep their full precision.
+    """
+    data = table.to_pandas(types_mapper=_NULLABLE_DTYPES.get, date_as_object=False)
+    for column in decimal_columns:
+        data[column] = data[column].map(decimal.Decimal, na_action="ignore")
+    return data
+
+
+def _connect_kwargs(parameters: ConnectionParameters) -> dict[str, Any]:
+    """Keyword arguments for `psycopg2.connect` from `parameters`."""
+    app_name = parameters.application_name
+    if app_name is None:
+        app_name = __name__
+
+    return dict(
+        database=parameters.database,
+        user=parameters.user,
+        password=parameters.password,
+        host=parameters.host,
+        port=parameters.port,
+        options="-c search_path=dbo,data_common",
+        application_name=app_name,
+    )
+
+
+def database_tests(n_rows: int = 25_000, chunk_size: int = 4_000) -> None:
+    """Check reads and writes against a temporary PostgreSQL server.
+
+    The server is created with `initdb` and `pg_ctl`, and the tests are
+    skipped if those aren't on PATH.
+    """
+    # pylint: disable=import-outside-toplevel
+    import pathlib
+    import shutil
+    import socket
+    import subprocess
+
+    print("Running database.py tests...")
+    if shutil.which("initdb") is None or shutil.which("pg_ctl") is None:
+        print("Skipping database tests, initdb and pg_ctl aren't on PATH")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = pathlib.Path(tmp)
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+
+        subprocess.run(
+            ["initdb", "-D", str(folder / "data"), "-U", "lu_test", "-A", "trust"],
+            check=True,
+            capture_output=True,
+        )
+        server = ["pg_ctl", "-D", str(folder / "data"), "-l", str(folder / "log")]
+        options = f"-p {port} -k {folder} -c listen_addresses=127.0.0.1"
+        subprocess.run(server + ["-o", options, "-w", "start"], check=True)
+        try:
+            _database_tests(
+                ConnectionParameters(
+                    database="postgres",
+                    user="lu_test",
+                    password="",
+                    host="127.0.0.1",
+                    port=port,
+                ),
+                n_rows,
+                chunk_size,
+            )
+        finally:
+            subprocess.run(server + ["-m", "fast", "-w", "stop"], check=True)
+
+    print("All tests passed!")
+
+
+def _database_tests(
+    parameters: ConnectionParameters, n_rows: int, chunk_size: int
+) -> None:
+    """Tests for `database_tests`, run against the server at `parameters`."""
+    data = pd.DataFrame(
+        {
+            "id": pd.array(range(n_rows), dtype="Int32"),
+            "count": pd.array(
+                [None if i % 7 == 0 else i * 3_000_000_000 for i in range(n_rows)],
+                dtype="Int64",
+            ),
+            "flag": pd.array(
+                [None if i % 5 == 0 else i % 2 == 0 for i in range(n_rows)],
+                dtype="boolean",
+            ),
+            "value": [i / 8 for i in range(n_rows)],
+            "amount": [decimal.Decimal(i) / 10_000 for i in range(n_rows)],
+            "name": [None if i % 3 == 0 else f"Unit {i}" for i in range(n_rows)],
+            "day": pd.to_datetime("2018-01-01") + pd.to_timedelta(
+                [i % 365 for i in range(n_rows)], unit="D"
+            ),
+        }
+    )
+    # More digits than a float64 can hold
+    data.loc[1, "amount"] = decimal.Decimal("12345678.9012")
+    select = "SELECT * FROM data_common.lu_test WHERE id >= %s ORDER BY id"
+
+    def assert_matches_data(read: pd.DataFrame) -> None:
+        # Dates are read at the resolution pyarrow gives them
+        assert read["day"].dtype.kind == "M"
+        pd.testing.assert_frame_equal(
+            read.assign(day=read["day"].astype("datetime64[ns]")), data
+        )
+
+    with ConnectionPool(parameters, min_connections=1, max_connections=2) as db_pool:
+        with db_pool.database() as database:
+            connection = database.connection
+            database.execute("CREATE SCHEMA data_common")
+            database.execute(
+                "CREATE TABLE data_common.lu_test (id int4, count int8, flag bool,"
+                " value float8, amount numeric(14, 4), name text, day date)"
+            )
+            assert database.copy_from_dataframe(
+                data, "data_common.lu_test", chunk_size=chunk_size
+            ) == n_rows
+
+        # Connections are reused, and no more than max_connections are opened
+        with db_pool.database() as database, db_pool.database() as other:
+            assert connection in (database.connection, other.connection)
+            try:
+                db_pool.database()
+            except pool.PoolError:
+                pass
+            else:
+                raise AssertionError("Opened more than max_connections")
+
+            copied = database.copy_to_dataframe(select, (0,))
+            assert_matches_data(copied)
+            assert copied.loc[1, "amount"] == decimal.Decimal("12345678.9012")
+
+            as_float = other.copy_to_dataframe(select, (0,), numeric_as_float=True)
+            assert as_float["amount"].dtype == "float64"
+            pd.testing.assert_series_equal(
+                as_float["amount"], data["amount"].astype(float)
+            )
+
+            # Chunks are full until the last, and together match the whole
+            for chunks in [
+                list(database.copy_chunks(select, (0,), chunk_size=chunk_size)),
+                list(database.query_chunks(select, (0,), chunk_size=chunk_size)),
+            ]:
+                sizes = [len(c) for c in chunks]
+                assert sizes[:-1] == [chunk_size] * (len(chunks) - 1)
+                assert 0 < sizes[-1] <= chunk_size and sum(sizes) == n_rows
+
+            chunked = pd.concat(
+                database.copy_chunks(select, (0,), chunk_size=chunk_size),
+                ignore_index=True,
+            )
+            assert_matches_data(chunked)
+            queried = pd.concat(
+                database.query_chunks(select, (0,), chunk_size=chunk_size),
+                ignore_index=True,
+            )
+            assert queried["amount"].tolist() == data["amount"].tolist()
+            assert queried["id"].tolist() == data["id"].tolist()
+
+            # Empty results
+            assert list(database.copy_chunks(select, (n_rows,))) == []
+            assert list(database.query_chunks(select, (n_rows,))) == []
+            empty = database.copy_to_dataframe(select, (n_rows,))
+            assert len(empty) == 0 and list(empty) == list(data)
+
+
+if __name__ == "__main__":
+    database_tests()
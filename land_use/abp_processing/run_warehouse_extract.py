@@ -35,6 +35,7 @@ def main(parameters: config.WarehouseConfig) -> None:
         output_folder,
         parameters.lsoa_shapefile,
         parameters.year_filter,
+        parameters.single_pass,
     )
 
 
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""Vectorised assignment of ABP points to zone polygons.
+
+Points are built from coordinate arrays in one call, instead of creating
+a shapely `Point` per row, and assigned to zones with a bulk query of an
+STRtree of the zone polygons. Trees are cached for each zones GeoDataFrame,
+so assigning several sets of points to the same zones only builds one.
+"""
+
+##### IMPORTS #####
+# Standard imports
+from __future__ import annotations
+
+import logging
+import weakref
+from typing import Literal
+
+# Third party imports
+import geopandas as gpd
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+import shapely
+
+# Local imports
+
+##### CONSTANTS #####
+LOG = logging.getLogger(__name__)
+UNASSIGNED = -1
+
+##### CLASSES #####
+class ZoneTree:
+    """STRtree of zone polygons for assigning points to zones.
+
+    Points are assigned to the zone which covers them, so points on the
+    boundary between zones are assigned. Where more than one zone covers
+    a point, on shared boundaries or where zones overlap, the point is
+    assigned to whichever of those zones comes first in `zones`.
+
+    The STRtree is cached for each `zones` GeoDataFrame until it is
+    garbage collected, so creating a ZoneTree for zones which have
+    been used before doesn't rebuild it.
+
+    Parameters
+    ----------
+    zones : gpd.GeoDataFrame
+        Zone polygons, the geometries should not be modified after
+        first creating a tree for them.
+    """
+
+    def __init__(self, zones: gpd.GeoDataFrame) -> None:
+        self.zones = zones
+        self._tree = _strtree(zones)
+
+    def __len__(self) -> int:
+        return len(self.zones)
+
+    def assign(self, points: gpd.GeoSeries | npt.ArrayLike) -> np.ndarray:
+        """Find the zone containing each point.
+
+        Parameters
+        ----------
+        points : gpd.GeoSeries | npt.ArrayLike
+            Point geometries, missing geometries aren't assigned.
+
+        Returns
+        -------
+        np.ndarray
+            Integer zone codes, the position of each point's zone in
+            `zones`, or `UNASSIGNED` for points outside all zones.
+
+        Raises
+        ------
+        ValueError
+            If `points` is a GeoSeries with a different CRS to `zones`.
+        """
+        if isinstance(points, gpd.GeoSeries):
+            if (
+                points.crs is not None
+                and self.zones.crs is not None
+                and points.crs != self.zones.crs
+            ):
+                raise ValueError(
+                    f"points CRS ({points.crs}) doesn't match zones CRS ({self.zones.crs})"
+                )
+            points = points.values
+
+        points = np.asarray(points)
+        point_index, zone_index = self._tree.query(points, predicate="intersects")
+
+        # Sort by point then zone, so the first match for each point is its lowest zone
+        order = np.lexsort((zone_index, point_index))
+        point_index, zone_index = point_index[order], zone_index[order]
+        first = np.ones(len(point_index), dtype=bool)
+        first[1:] = point_index[1:] != point_index[:-1]
+
+        codes = np.full(len(points), UNASSIGNED, dtype=np.int32)
+        codes[point_index[first]] = zone_index[first]
+
+        ties = len(point_index) - first.sum()
+        if ties > 0:
+            LOG.debug("%s points covered by more than one zone", ties)
+
+        return codes
+
+    def assign_coordinates(self, x: npt.ArrayLike, y: npt.ArrayLike) -> np.ndarray:
+        """Find the zone containing each X / Y coordinate pair.
+
+        See `assign` for the zone codes returned.
+        """
+        return self.assign(points_from_coordinates(x, y))
+
+    def zone_ids(
+        self, codes: np.ndarray, id_column: str | None = None
+    ) -> pd.Categorical:
+        """Convert zone codes from `assign` to zone IDs.
+
+        Parameters
+        ----------
+        codes : np.ndarray
+            Zone codes from `assign`.
+        id_column : str, optional
+            Column in `zones` containing the IDs, uses the index if not given.
+
+        Returns
+        -------
+        pd.Categorical
+            Zone ID for each code, missing for unassigned points.
+        """
+        if id_column is None:
+            ids = self.zones.index
+        else:
+            ids = pd.Index(self.zones[id_column])
+
+        return pd.Categorical.from_codes(codes, categories=ids)
+
+    def join(
+        self,
+        data: gpd.GeoDataFrame,
+        how: Literal["left", "inner"] = "left",
+        codes: np.ndarray | None = None,
+    ) -> gpd.GeoDataFrame:
+        """Join the attributes of the zone containing each point to `data`.
+
+        Produces the same columns as `gpd.sjoin`, but each point is only
+        joined to one zone, see `ZoneTree` for how ties are resolved.
+
+        Parameters
+        ----------
+        data : gpd.GeoDataFrame
+            Point geometries to join zones to.
+        how : {"left", "inner"}, default "left"
+            Whether to keep the points not in any zone.
+        codes : np.ndarray, optional
+            Zone codes for `data` if already found with `assign`.
+
+        Returns
+        -------
+        gpd.GeoDataFrame
+            `data` with the zones' index and attribute columns appended,
+            clashing column names are suffixed with '_left' and '_right'.
+        """
+        if how not in ("left", "inner"):
+            raise ValueError(f"how should be 'left' or 'inner' not '{how}'")
+        if codes is None:
+            codes = self.assign(data.geometry)
+
+        zones = self.zones.drop(columns=self.zones.geometry.name)
+        if all(i is None for i in zones.index.names):
+            zones.index = zones.index.rename(["index_right"] * zones.index.nlevels)
+        zones = pd.DataFrame(zones.reset_index())
+
+        clashes = data.columns.intersection(zones.columns)
+        data = data.rename(columns={c: f"{c}_left" for c in clashes})
+        zones = zones.rename(columns={c: f"{c}_right" for c in clashes})
+
+        if how == "inner":
+            assigned = codes != UNASSIGNED
+            data, codes = data.loc[assigned], codes[assigned]
+
+        # Reindexing with the unassigned code gives missing attributes
+        zones = zones.reindex(codes)
+        zones.index = data.index
+        return gpd.GeoDataFrame(
+            pd.concat([data, zones], axis=1), geometry=data.geometry.name, crs=data.crs
+        )
+
+
+##### FUNCTIONS #####
+def points_from_coordinates(x: npt.ArrayLike, y: npt.ArrayLike) -> np.ndarray:
+    """Build point geometries from coordinate arrays.
+
+    Parameters
+    ----------
+    x, y : npt.ArrayLike
+        X and Y coordinates of the points.
+
+    Returns
+    -------
+    np.ndarray
+        Shapely points, with None where either coordinate is missing.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    points = shapely.points(x, y)
+    points[np.isnan(x) | np.isnan(y)] = None
+    return points
+
+
+def points_geodata(
+    data: pd.DataFrame, x_column: str, y_column: str, crs=None
+) -> gpd.GeoDataFrame:
+    """Convert `data` to a GeoDataFrame of points from X / Y coordinate columns."""
+    points = points_from_coordinates(data[x_column], data[y_column])
+    return gpd.GeoDataFrame(data, geometry=points, crs=crs)
+
+
+# Cached STRtrees, by the ID of their zones GeoDataFrame
+_TREES: dict[int, tuple[weakref.ref, shapely.STRtree]] = {}
+
+
+def _strtree(zones: gpd.GeoDataFrame) -> shapely.STRtree:
+    """Get the STRtree of `zones` polygons, only building it the first time."""
+    key = id(zones)
+    cached = _TREES.get(key)
+    if cached is not None and cached[0]() is zones:
+        return cached[1]
+
+    LOG.debug("Building STRtree of %s zones", len(zones))
+    tree = shapely.STRtree(np.asarray(zones.geometry.values))
+    _TREES[key] = (weakref.ref(zones), tree)
+    weakref.finalize(zones, _TREES.pop, key, None)
+    return tree
+
+
+def assign_zones(
+    x: npt.ArrayLike, y: npt.ArrayLike, zones: gpd.GeoDataFrame
+) -> np.ndarray:
+    """Find the zone containing each X / Y coordinate pair.
+
+    See `ZoneTree.assign` for the zone codes returned.
+    """
+    return ZoneTree(zones).assign_coordinates(x, y)
+
+
+def spatial_tests(n_points: int = 2_000, seed: int = 2018) -> None:
+    """Check zone assignment against `gpd.sjoin` on synthetic zones.
+
+    Zones are a grid of squares sharing edges, plus one overlapping the
+    grid, in shuffled order. Points include some on shared edges and
+    corners, outside every zone, and with missing coordinates, to check
+    points covered by several zones go to the first of them.
+    """
+    # pylint: disable=import-outside-toplevel
+    from shapely.geometry import box
+
+    print("Running spatial.py tests...")
+    rng = np.random.default_rng(seed)
+
+    squares = [box(i, j, i + 1, j + 1) for i in range(4) for j in range(4)]
+    order = rng.permutation(len(squares) + 1)
+    zones = gpd.GeoDataFrame(
+        {"zone_id": [f"Z{i:02d}" for i in order], "area": 1.0},
+        geometry=[(squares + [box(1.5, 1.5, 2.5, 2.5)])[i] for i in order],
+        crs="EPSG:27700",
+        index=pd.Index(order * 10, name="zone_key"),
+    )
+
+    # Random points, points on edges and corners, and points outside
+    x = np.concatenate(
+        [
+            rng.uniform(-0.5, 4.5, n_points),
+            rng.integers(0, 5, 100),
+            rng.uniform(0, 4, 100),
+            [np.nan, 1.0, 5.0],
+        ]
+    )
+    y = np.concatenate(
+        [
+            rng.uniform(-0.5, 4.5, n_points),
+            rng.uniform(0, 4, 100),
+            rng.integers(0, 5, 100),
+            [1.0, np.nan, 5.0],
+        ]
+    )
+    points = gpd.GeoDataFrame(
+        {"uprn": np.arange(len(x)), "area": 2.0},
+        geometry=points_from_coordinates(x, y),
+        crs=zones.crs,
+    )
+
+    # The first zone, in the order of zones, of every zone sjoin finds
+    matches = gpd.sjoin(
+        points, zones.reset_index(drop=True), how="inner", predicate="intersects"
+    )
+    first_zone = matches.groupby(level=0)["index_right"].min()
+    expected = np.full(len(points), UNASSIGNED, dtype=np.int32)
+    expected[first_zone.index] = first_zone.to_numpy()
+
+    tree = ZoneTree(zones)
+    codes = tree.assign_coordinates(x, y)
+    np.testing.assert_array_equal(codes, expected)
+    np.testing.assert_array_equal(assign_zones(x, y, zones), expected)
+    np.testing.assert_array_equal(tree.assign(points.geometry), expected)
+    assert ZoneTree(zones)._tree is tree._tree
+
+    # Shared edges and corners are covered by several zones
+    shared = matches.index.value_counts()
+    assert (shared > 1).sum() > 100
+    assert (codes == UNASSIGNED).sum() > 0 and codes[n_points + 200] == UNASSIGNED
+
+    ids = tree.zone_ids(codes, "zone_id")
+    assigned = codes != UNASSIGNED
+    assert list(ids[assigned]) == list(zones["zone_id"].to_numpy()[codes[assigned]])
+    assert ids.isna().sum() == (codes == UNASSIGNED).sum()
+
+    # Joins match sjoin, keeping only the first zone of each point
+    joined = tree.join(points, how="left")
+    sjoined = gpd.sjoin(points, zones, how="left", predicate="intersects")
+    position = zones.index.get_indexer(sjoined["zone_key"].fillna(-1))
+    sjoined = sjoined.iloc[np.lexsort((position, sjoined["uprn"]))]
+    sjoined = sjoined.loc[~sjoined.index.duplicated(keep="first")]
+    assert list(joined) == list(sjoined)
+    pd.testing.assert_frame_equal(
+        pd.DataFrame(joined.drop(columns="geometry")),
+        pd.DataFrame(sjoined.drop(columns="geometry")),
+        check_dtype=False,
+    )
+    inner = tree.join(points, how="inner")
+    assert len(inner) == (codes != UNASSIGNED).sum()
+    assert inner["zone_id"].notna().all()
+
+    try:
+        tree.assign(points.geometry.set_crs("EPSG:4326", allow_override=True))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Mismatched CRS not raised")
+
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    spatial_tests()
@@ -14,16 +14,18 @@ from typing import Sequence
 import geopandas as gpd
 import pandas as pd
 from psycopg2 import sql
-from shapely import geometry
 
 # Local imports
-from land_use.abp_processing import config, database
+from land_use import geodata
+from land_use.abp_processing import config, database, spatial
 
 ##### CONSTANTS #####
 LOG = logging.getLogger(__name__)
 CRS_BRITISH_GRID = "EPSG:27700"
 CLASSIFICATION_CODES = {"ABP": ("CI04PL",), "VOA SCAT": ("217", "267")}
 WAREHOUSE_ABP_CODE = "CI04"
+WAREHOUSE_ORGANISATIONS = ("amazon",)
+WAREHOUSE_CANDIDATES_TABLE = "warehouse_candidates"
 WEB_MERCATOR = "EPSG:4326"
 
 ##### CLASSES #####
@@ -66,38 +68,38 @@ def voa_code_count(
         Folder to save Excel workbook to.
     """
     LOG.info("Counting ABP classification codes")
+    # All three counts come from a single scan of the classification table
     query = """
-    SELECT class_scheme, count(*) AS "count"
-        FROM data_common.abp_classification
-        GROUP BY class_scheme;
+    SELECT class_scheme, classification_code, count(*) AS "count",
+        count(*) FILTER (WHERE {warehouse_filter}) AS filtered_count
+    FROM data_common.abp_classification
+    GROUP BY class_scheme, classification_code;
     """
-    class_counts = connected_db.query_to_dataframe(query)
+    counts = connected_db.query_to_dataframe(
+        sql.SQL(query).format(warehouse_filter=classification_codes_filter())
+    )
+
+    class_counts = counts.groupby("class_scheme", dropna=False)["count"].sum()
+    class_counts = class_counts.to_frame()
     class_counts.loc[:, "perc_count"] = (
         class_counts["count"] / class_counts["count"].sum()
     )
-    class_counts = class_counts.set_index("class_scheme")
 
-    query = """
-    SELECT classification_code AS voa_scat_code, count(*) AS "count"
-        FROM data_common.abp_classification
-        WHERE class_scheme = 'VOA Special Category'
-        GROUP BY classification_code;
-    """
-    scat_counts = connected_db.query_to_dataframe(query)
+    scat_counts = counts.loc[
+        counts["class_scheme"] == "VOA Special Category",
+        ["classification_code", "count"],
+    ].rename(columns={"classification_code": "voa_scat_code"})
     scat_counts.loc[:, "perc_count"] = scat_counts["count"] / scat_counts["count"].sum()
     scat_counts = scat_counts.set_index("voa_scat_code")
 
-    query = """
-    SELECT cl.class_scheme, cl.classification_code, count(*) AS "count"
-    FROM ({abp_classification}) cl
-    GROUP BY cl.class_scheme, cl.classification_code
-    """
-    filtered_class_counts = connected_db.query_to_dataframe(
-        sql.SQL(query).format(abp_classification=classification_codes_query())
-    )
+    filtered_class_counts = counts.loc[
+        counts["filtered_count"] > 0,
+        ["class_scheme", "classification_code", "filtered_count"],
+    ].rename(columns={"filtered_count": "count"})
     filtered_class_counts.loc[:, "perc_count"] = (
         filtered_class_counts["count"] / class_counts["count"].sum()
     )
+    filtered_class_counts = filtered_class_counts.reset_index(drop=True)
 
     excel_path = output_folder / "ABP_SCAT_counts.xlsx"
     # pylint: disable=abstract-class-instantiated
@@ -115,10 +117,9 @@ def _positions_geodata(data: pd.DataFrame, out_file: pathlib.Path) -> gpd.GeoDat
     if missing.sum() > 0:
         LOG.warning("Missing coordinates for %s rows", missing.sum())
 
-    data.loc[:, "geometry"] = data.apply(
-        lambda row: geometry.Point(row["x_coordinate"], row["y_coordinate"]), axis=1
+    geodata = spatial.points_geodata(
+        data, "x_coordinate", "y_coordinate", crs=CRS_BRITISH_GRID
     )
-    geodata = gpd.GeoDataFrame(data, geometry="geometry", crs=CRS_BRITISH_GRID)
 
     for column in geodata.select_dtypes(exclude=("number", "geometry")).columns:
         geodata.loc[:, column] = geodata[column].astype(str)
@@ -204,6 +205,12 @@ def get_warehouse_floorspace(
     data = connected_db.query_to_dataframe(
         sql.SQL(query).format(query=warehouse_select_query)
     )
+
+    return _floorspace_geodata(data, output_file)
+
+
+def _floorspace_geodata(data: pd.DataFrame, out_file: pathlib.Path) -> gpd.GeoDataFrame:
+    """Convert `data` into GeoDataframe using WKT polygons column."""
     geom_column = "geom_wkt"
 
     missing = data[geom_column].isna()
@@ -222,7 +229,7 @@ def get_warehouse_floorspace(
     for column in geodata.select_dtypes(exclude=("number", "geometry")).columns:
         geodata.loc[:, column] = geodata[column].astype(str)
 
-    to_kepler_geojson(geodata, output_file)
+    to_kepler_geojson(geodata, out_file)
 
     duplicated = geodata["uprn"].duplicated().sum()
     if duplicated > 0:
@@ -255,29 +262,61 @@ def classification_codes_query(
     sql.Composable
         Select query.
     """
+    query = """
+    SELECT uprn, class_scheme, classification_code,
+        start_date, end_date, last_update_date, entry_date
+    FROM data_common.abp_classification
+    WHERE {filter}
+    """
+    return sql.SQL(query.strip()).format(
+        filter=classification_codes_filter(voa_scat, abp, year)
+    )
+
+
+def classification_codes_filter(
+    voa_scat: Sequence[str] | None = None,
+    abp: Sequence[str] = None,
+    year: int | None = None,
+) -> sql.Composable:
+    """Condition for filtering the 'abp_classification' table.
+
+    Parameters
+    ----------
+    voa_scat: Sequence[str], optional
+        VOA Scat codes for filtering, if not given uses
+        `CLASSIFICATION_CODES["VOA SCAT"]`.
+    abp: Sequence[str], optional
+        ABP classification code for filtering, if not given
+        uses `CLASSIFICATION_CODES["ABP"]`.
+    year : int, optional
+        Year to use for filtering data, excludes rows which
+        have an end date before this or start date after this.
+
+    Returns
+    -------
+    sql.Composable
+        Condition for use in a WHERE clause.
+    """
     if voa_scat is None:
         voa_scat = CLASSIFICATION_CODES["VOA SCAT"]
     if abp is None:
         abp = CLASSIFICATION_CODES["ABP"]
 
-    query = """
-    SELECT uprn, class_scheme, classification_code,
-        start_date, end_date, last_update_date, entry_date
-    FROM data_common.abp_classification
-    WHERE (
+    condition = """
+    (
         (
             class_scheme = 'VOA Special Category'
             AND classification_code IN ({scat})
         ) OR classification_code IN ({abp})
     )
     """
-    sql_query = sql.SQL(query.strip()).format(
+    sql_condition = sql.SQL(condition.strip()).format(
         scat=sql.SQL(",").join(sql.Literal(i) for i in voa_scat),
         abp=sql.SQL(",").join(sql.Literal(i) for i in abp),
     )
 
     if year is None:
-        return sql_query
+        return sql_condition
 
     date_query_str = [
         "(start_date ISNULL OR DATE_TRUNC('year', start_date) <= {date})",
@@ -286,9 +325,7 @@ def classification_codes_query(
     date = sql.Literal(dt.date(year, 1, 1).isoformat())
     date_queries = [sql.SQL(q).format(date=date) for q in date_query_str]
 
-    sql_query = sql.SQL("\n\tAND ").join([sql_query, *date_queries])
-
-    return sql_query
+    return sql.SQL("\n\tAND ").join([sql_condition, *date_queries])
 
 
 def warehouse_organisations_query(
@@ -361,9 +398,9 @@ def get_classification_codes(
 
 
 def load_shapefile(parameters: config.ShapefileParameters) -> gpd.GeoDataFrame:
-    """Load shapefile and set ID column as index."""
+    """Load shapefile, through the geodata cache, and set ID column as index."""
     LOG.info("Loading %s", parameters.path)
-    data: gpd.GeoDataFrame = gpd.read_file(parameters.path)
+    data: gpd.GeoDataFrame = geodata.read_file(parameters.path)
     if parameters.id_column not in data.columns:
         raise KeyError(
             f"ID column {parameters.id_column} not found in {parameters.path.name}"
@@ -426,6 +463,20 @@ def warehouse_by_lsoa(
         query,
     )
 
+    return _lsoa_floorspace(positions, floorspace, lsoas, lsoa_id_column, output_file)
+
+
+def _lsoa_floorspace(
+    positions: gpd.GeoDataFrame,
+    floorspace: gpd.GeoDataFrame,
+    lsoas: gpd.GeoDataFrame,
+    lsoa_id_column: str,
+    output_file: pathlib.Path,
+) -> pd.DataFrame:
+    """Join warehouse `positions` to `floorspace` and aggregate to LSOA.
+
+    See `warehouse_by_lsoa` for the outputs saved and returned.
+    """
     positions: gpd.GeoDataFrame = positions.merge(
         floorspace[["uprn", "area"]],
         on="uprn",
@@ -436,9 +487,8 @@ def warehouse_by_lsoa(
         {"left_only": "positions_only", "right_only": "floorspace_only"}
     )
 
-    lsoa_positions: gpd.GeoDataFrame = gpd.sjoin(
-        positions, lsoas.reset_index(), how="left", op="within"
-    )
+    # Each position is assigned to one LSOA, including those on LSOA boundaries
+    lsoa_positions = spatial.ZoneTree(lsoas).join(positions, how="left")
 
     for column in lsoa_positions.select_dtypes("category").columns:
         lsoa_positions.loc[:, column] = lsoa_positions[column].astype(str)
@@ -470,6 +520,249 @@ def warehouse_by_lsoa(
     return lsoa_positions[[lsoa_id_column, "uprn", "area"]]
 
 
+def create_warehouse_candidates(
+    connected_db: database.Database,
+    organisations: Sequence[str] = WAREHOUSE_ORGANISATIONS,
+    year: int | None = None,
+    table: str = WAREHOUSE_CANDIDATES_TABLE,
+) -> None:
+    """Select every row any warehouse extract needs into a temporary table.
+
+    The table contains the classification rows selected by
+    `classification_codes_query` and `warehouse_organisations_query`,
+    for all `organisations`, so the classification and organisation
+    tables are only scanned once. Rows with the `WAREHOUSE_ABP_CODE`
+    code are only kept if they match an organisation. 'candidate_id'
+    identifies each classification row, which is repeated for every
+    organisation it matches, and 'row_id' identifies each row.
+
+    Parameters
+    ----------
+    connected_db : database.Database
+        ABP database to create the temporary table in.
+    organisations : Sequence[str], default WAREHOUSE_ORGANISATIONS
+        Names of the organisations to include warehouses for.
+    year : int, optional
+        Year to use for filtering data, excludes rows which
+        have an end date before this or start date after this.
+    table : str, default WAREHOUSE_CANDIDATES_TABLE
+        Name of the temporary table to create, replaced if it exists.
+    """
+    query = """
+    DROP TABLE IF EXISTS {table};
+
+    CREATE TEMPORARY TABLE {table} AS
+    SELECT row_number() OVER () AS row_id, cl.*, o.organisation
+
+    FROM (
+        SELECT row_number() OVER () AS candidate_id, c.*
+        FROM ({abp_classification}) c
+    ) cl
+
+    LEFT JOIN (
+        SELECT uprn, organisation
+        FROM data_common.abp_organisation
+        WHERE {organisation_filter}
+    ) o ON cl.uprn = o.uprn
+
+    WHERE o.organisation IS NOT NULL OR {warehouse_filter};
+
+    ANALYZE {table};
+    """
+    if len(organisations) == 0:
+        organisation_filter = sql.SQL("FALSE")
+    else:
+        organisation_filter = sql.SQL("organisation ILIKE ANY (ARRAY[{orgs}])").format(
+            orgs=sql.SQL(",").join(sql.Literal(f"%{i}%") for i in organisations)
+        )
+
+    LOG.info("Selecting warehouse candidates into temporary table %s", table)
+    connected_db.execute(
+        sql.SQL(query).format(
+            table=sql.Identifier(table),
+            abp_classification=classification_codes_query(
+                abp=CLASSIFICATION_CODES["ABP"] + (WAREHOUSE_ABP_CODE,), year=year
+            ),
+            organisation_filter=organisation_filter,
+            warehouse_filter=classification_codes_filter(),
+        )
+    )
+
+
+def get_warehouse_candidates(
+    connected_db: database.Database, table: str = WAREHOUSE_CANDIDATES_TABLE
+) -> pd.DataFrame:
+    """Join coordinates and floorspace polygons to the warehouse candidates.
+
+    The positions and floorspace data for every warehouse extract are
+    selected in one query, `split_warehouse_candidates` separates them.
+
+    Parameters
+    ----------
+    connected_db : database.Database
+        ABP database containing `table`.
+    table : str, default WAREHOUSE_CANDIDATES_TABLE
+        Temporary table created by `create_warehouse_candidates`.
+
+    Returns
+    -------
+    pd.DataFrame
+        Every candidate row with its coordinates, repeated for each
+        floorspace polygon found for it.
+    """
+    query = """
+    SELECT c.*, blpu.x_coordinate, blpu.y_coordinate,
+        f.cross_reference, f.descriptiveterm, f.geom_wkt, f.area
+
+    FROM {table} c
+
+    LEFT JOIN data_common.abp_blpu blpu ON c.uprn = blpu.uprn
+
+    LEFT JOIN (
+        SELECT cr.uprn, cr.cross_reference, mm.descriptiveterm,
+            public.ST_AsText(mm.wkb_geometry) AS geom_wkt,
+            mm.calculatedareavalue AS area
+        FROM data_common.abp_crossref cr
+        INNER JOIN data_common.mm_topographicarea mm ON cr.cross_reference = mm.fid
+        WHERE cr."version" IS NOT NULL
+            AND cr.uprn IN (SELECT uprn FROM {table})
+    ) f ON c.uprn = f.uprn;
+    """
+    LOG.info("Extracting warehouse coordinates and floorspace")
+    return connected_db.query_to_dataframe(
+        sql.SQL(query).format(table=sql.Identifier(table))
+    )
+
+
+def split_warehouse_candidates(
+    candidates: pd.DataFrame, organisation: str | None = None
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Select the positions and floorspace data for one warehouse extract.
+
+    Parameters
+    ----------
+    candidates : pd.DataFrame
+        Output from `get_warehouse_candidates`.
+    organisation : str, optional
+        Select the warehouses from `warehouse_organisations_query` for
+        this organisation, if not given selects the warehouses from
+        `classification_codes_query`.
+
+    Returns
+    -------
+    pd.DataFrame
+        Positions data, with the same columns as `get_warehouse_positions`
+        would select.
+    pd.DataFrame
+        Floorspace data, with the same columns as `get_warehouse_floorspace`
+        would select.
+    """
+    if organisation is None:
+        abp = CLASSIFICATION_CODES["ABP"]
+    else:
+        abp = CLASSIFICATION_CODES["ABP"] + (WAREHOUSE_ABP_CODE,)
+
+    mask = (
+        (candidates["class_scheme"] == "VOA Special Category")
+        & candidates["classification_code"].isin(CLASSIFICATION_CODES["VOA SCAT"])
+    ) | candidates["classification_code"].isin(abp)
+
+    if organisation is None:
+        # Rows are repeated for each organisation, only keep the first
+        first_row = candidates.groupby("candidate_id")["row_id"].transform("min")
+        mask &= candidates["row_id"] == first_row
+        select_columns = ["organisation"]
+    else:
+        mask &= candidates["organisation"].str.contains(
+            organisation, case=False, na=False, regex=False
+        )
+        select_columns = []
+
+    data = candidates.loc[mask].drop(columns=["candidate_id"] + select_columns)
+    query_columns = [
+        c
+        for c in data.columns
+        if c
+        not in (
+            "row_id",
+            "x_coordinate",
+            "y_coordinate",
+            "cross_reference",
+            "descriptiveterm",
+            "geom_wkt",
+            "area",
+        )
+    ]
+
+    positions = data.drop_duplicates("row_id")
+    positions = positions[query_columns + ["x_coordinate", "y_coordinate"]]
+
+    floorspace = data.loc[data["cross_reference"].notna()]
+    floorspace = floorspace[
+        query_columns + ["cross_reference", "descriptiveterm", "geom_wkt", "area"]
+    ]
+
+    return positions.reset_index(drop=True), floorspace.reset_index(drop=True)
+
+
+def warehouses_by_lsoa_single_pass(
+    connected_db: database.Database,
+    lsoas: gpd.GeoDataFrame,
+    lsoa_id_column: str,
+    output_files: dict[str | None, pathlib.Path],
+    year: int | None = None,
+) -> list[pd.DataFrame]:
+    """Extract all warehouse data once and aggregate floorspace to LSOA.
+
+    Produces the same outputs as running `warehouse_by_lsoa` for each
+    extract, but the warehouse selection is only run once, see
+    `create_warehouse_candidates`.
+
+    Parameters
+    ----------
+    connected_db : database.Database
+        ABP database to extract data from.
+    lsoas : gpd.GeoDataFrame
+        LSOA polygons data.
+    lsoa_id_column : str
+        Name of column containing LSOA IDs.
+    output_files : dict[str | None, pathlib.Path]
+        Base file path to save the outputs for each extract to, keyed by
+        organisation name, or None for all warehouses.
+    year : int, optional
+        Year to use for filtering data, excludes rows which
+        have an end date before this or start date after this.
+
+    Returns
+    -------
+    list[pd.DataFrame]
+        Floorspace area by LSOA ID and UPRN for each extract, in the
+        order of `output_files`, see `warehouse_by_lsoa`.
+    """
+    organisations = [i for i in output_files if i is not None]
+    create_warehouse_candidates(connected_db, organisations, year)
+    candidates = get_warehouse_candidates(connected_db)
+
+    lsoa_warehouse_floorspace: list[pd.DataFrame] = []
+    for organisation, output_file in output_files.items():
+        positions, floorspace = split_warehouse_candidates(candidates, organisation)
+
+        positions = _positions_geodata(
+            positions, output_file.with_name(output_file.stem + "-positions.geojson")
+        )
+        floorspace = _floorspace_geodata(
+            floorspace,
+            output_file.with_name(output_file.stem + "-floorspace.geojson"),
+        )
+        lsoa_warehouse_floorspace.append(
+            _lsoa_floorspace(
+                positions, floorspace, lsoas, lsoa_id_column, output_file
+            )
+        )
+
+    return lsoa_warehouse_floorspace
+
+
 def combine_lsoa_areas(
     lsoa_data: list[pd.DataFrame], lsoa_id_column: str, output_file: pathlib.Path
 ) -> None:
@@ -510,6 +803,7 @@ def extract_warehouses(
     output_folder: pathlib.Path,
     shapefile: config.ShapefileParameters,
     year: int | None = None,
+    single_pass: bool = True,
 ) -> None:
     """Extract warehouse data from database and aggregate floorspace to LSOA.
 
@@ -527,6 +821,10 @@ def extract_warehouses(
     year : int, optional
         Year to use for filtering data, excludes rows which
         have an end date before this or start date after this.
+    single_pass : bool, default True
+        Select the warehouses once for all extracts, see
+        `warehouses_by_lsoa_single_pass`, otherwise the positions and
+        floorspace of each extract are queried separately.
     """
     lsoa = load_shapefile(shapefile)
 
@@ -535,14 +833,12 @@ def extract_warehouses(
         get_classification_codes(connected_db, output_folder)
         voa_code_count(connected_db, output_folder)
 
-        queries = {
-            "warehouses": classification_codes_query(year=year),
-            "warehouses_amazon": warehouse_organisations_query("amazon", year=year),
-        }
+        # Extracts of all warehouses, and those for each organisation
+        extracts: dict[str | None, str] = {None: "warehouses"}
+        extracts.update({i: f"warehouses_{i}" for i in WAREHOUSE_ORGANISATIONS})
 
-        lsoa_warehouse_floorspace: list[pd.DataFrame] = []
-
-        for name, query in queries.items():
+        output_files: dict[str | None, pathlib.Path] = {}
+        for organisation, name in extracts.items():
             folder = output_folder / name
             folder.mkdir(exist_ok=True)
 
@@ -551,11 +847,24 @@ def extract_warehouses(
             else:
                 LOG.info("Extracting %s for %s", name, year)
                 name = f"{name}_{year}"
+            output_files[organisation] = folder / name
 
-            lsoa_warehouse = warehouse_by_lsoa(
-                connected_db, query, lsoa, shapefile.id_column, folder / name
+        if single_pass:
+            lsoa_warehouse_floorspace = warehouses_by_lsoa_single_pass(
+                connected_db, lsoa, shapefile.id_column, output_files, year
             )
-            lsoa_warehouse_floorspace.append(lsoa_warehouse)
+        else:
+            lsoa_warehouse_floorspace = []
+            for organisation, output_file in output_files.items():
+                if organisation is None:
+                    query = classification_codes_query(year=year)
+                else:
+                    query = warehouse_organisations_query(organisation, year=year)
+
+                lsoa_warehouse = warehouse_by_lsoa(
+                    connected_db, query, lsoa, shapefile.id_column, output_file
+                )
+                lsoa_warehouse_floorspace.append(lsoa_warehouse)
 
         if year is None:
             out_file = output_folder / "warehouse_floorspace_by_lsoa_inc_amazon.csv"
@@ -323,7 +323,6 @@ def DDGaligned_pop_process(by_lu_obj):
     BYpop_DDG_pop_tfn_tt_path = os.path.join(output_working_dir_path, BYpop_DDG_pop_tfn_tt_filename)
     compress.write_out(BYpop_DDG_out, BYpop_DDG_pop_allsegs_path)
     compress.write_out(BYpop_DDG_exc_t_out, BYpop_DDG_pop_tfn_tt_path)
-    by_lu_obj.state['3.2.9 process DDG data'] = 1
     logging.info('Step 3.2.9 completed')
     print('Step 3.2.9 completed')
 
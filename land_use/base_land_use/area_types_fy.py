@@ -16,6 +16,9 @@ import gc
 import os  
 from functools import reduce
 
+from land_use import lu_constants as consts
+from land_use.concurrency import multiprocessing as mp
+
 
 
 _default_home_dir = 'Y:/NorMITs Land Use/area types/fy_areatypes/'
@@ -24,6 +27,14 @@ _default_landuse_dir = 'Y:/NorMITs Land Use/'
 import_folder = 'Y:/NorMITs Demand/import - test/scenarios/'
 
 _iter = 'fy'
+_regression_data_path = _default_home_dir + 'regression_dataWithScotland.csv'
+_area_types_path = _default_landuse_dir + 'import/scenarios/area_types_fy.csv'
+
+# Scenario ids, as in the scenario column, and their import folders
+SCENARIOS = {1: 'SC01_JAM', 2: 'SC02_PP', 3: 'SC03_DD', 4: 'SC04_UZC'}
+# MSOAs whose features the clusters start from, in tfn_area_type_id order
+START_MSOAS = ['E02006917', 'E02001063', 'E02001050', 'E02001036']
+AREA_TYPE_FEATURES = ['pop_per_hectare', 'workers_per_hectare', 'flat_pop_percent']
 #year = 2040# 2030, 2033. 2050
 
 
@@ -193,13 +204,301 @@ target_folder_sc02 = 'Y:/NorMITs Land Use/import/scenarios/SC02_PP/at_mix/'
 target_folder_sc03 = 'Y:/NorMITs Land Use/import/scenarios/SC03_DD/at_mix/'
 target_folder_sc04 = 'Y:/NorMITs Land Use/import/scenarios/SC04_UZC/at_mix/'
 
-# run clean up
-clean_up_combine(target_folder_sc01)   
-clean_up_combine(target_folder_sc02)   
-clean_up_combine(target_folder_sc03)   
-clean_up_combine(target_folder_sc04)   
- 
- 
-   
-    
-    
\ No newline at end of file
+
+def combine_scenario_area_types():
+    """
+    Combines the area types written by classify_areas into an
+    area_types.csv for each scenario. Was run on import.
+    """
+    clean_up_combine(target_folder_sc01)
+    clean_up_combine(target_folder_sc02)
+    clean_up_combine(target_folder_sc03)
+    clean_up_combine(target_folder_sc04)
+
+
+def area_type_features(pop, emp, regression_data, years, scenario):
+    """
+    Builds the area type features of every MSOA for every year of a
+    scenario at once, as get_scenario_data does for a single year.
+
+    Parameters
+    ----------
+    pop, emp:
+        Future year population and employment by msoa_zone_id, with a
+        column for each year
+    regression_data:
+        regression_dataWithScotland, with msoa_zone_id
+    years:
+        Years to build features for
+    scenario:
+        Scenario id to give the rows
+
+    Returns
+    ----------
+    features:
+        Long format features, a row per MSOA and year
+    """
+    year_cols = [str(year) for year in years]
+    pop = pop.groupby('msoa_zone_id')[year_cols].sum()
+    emp = emp.groupby('msoa_zone_id')[year_cols].sum()
+
+    data = regression_data[regression_data['msoa_zone_id'].isin(pop.index)
+                           & regression_data['msoa_zone_id'].isin(emp.index)]
+    data = data[['msoa_zone_id', 'north', 'ntem_area_type_id', 'area_hectares', 'flat_pop_percent']]
+
+    # Year major, so each year's rows are together
+    features = data.iloc[np.tile(np.arange(len(data)), len(years))].reset_index(drop=True)
+    features.insert(0, 'year', np.repeat(years, len(data)))
+    features.insert(0, 'scenario', scenario)
+    area = features['area_hectares'].to_numpy()
+    features['population'] = pop.reindex(data['msoa_zone_id']).to_numpy().T.reshape(-1)
+    features['pop_per_hectare'] = features['population'] / area
+    features['workers'] = emp.reindex(data['msoa_zone_id']).to_numpy().T.reshape(-1)
+    features['workers_per_hectare'] = features['workers'] / area
+    return features
+
+
+def read_area_type_features(years, scenarios=None):
+    """
+    Reads the population and employment of each scenario once, and builds
+    the area type features for all years and scenarios.
+
+    Parameters
+    ----------
+    years:
+        Years to build features for
+    scenarios:
+        Scenario ids to build features for, all of SCENARIOS if None
+
+    Returns
+    ----------
+    features:
+        Long format features, a row per scenario, MSOA and year
+    """
+    scenarios = list(SCENARIOS) if scenarios is None else scenarios
+    regression_data = pd.read_csv(_regression_data_path).rename(columns={'msoa_area_code': 'msoa_zone_id'})
+
+    features = list()
+    for scenario in scenarios:
+        folder = import_folder + SCENARIOS[scenario]
+        pop = pd.read_csv(folder + '/population/future_growth_values.csv')
+        emp = pd.read_csv(folder + '/employment/future_growth_values.csv')
+        features.append(area_type_features(pop, emp, regression_data, years, scenario))
+    return pd.concat(features, ignore_index=True)
+
+
+def _fit_area_types(year_features, fit_masks, inits):
+    """
+    Fits the area type clusters to each year in turn.
+
+    year_features is a (MSOAs x features) array for each year, and
+    fit_masks which of its MSOAs to fit the clusters to. Each year starts
+    from its init, or from the year before's centroids if its init is None.
+    Returns the cluster of every MSOA, and the centroids, of each year.
+    """
+    labels = list()
+    centroids = list()
+    centres = None
+    for features, fit_mask, init in zip(year_features, fit_masks, inits):
+        init = centres if init is None else init
+        kmeans = KMeans(n_clusters=len(init), init=init, n_init=1)
+        kmeans.fit(features[fit_mask])
+        centres = kmeans.cluster_centers_
+        labels.append(kmeans.predict(features))
+        centroids.append(centres)
+    return labels, centroids
+
+
+def classify_area_types(features,
+                        pooled=True,
+                        warm_start=True,
+                        process_count=consts.PROCESS_COUNT):
+    """
+    Classifies the TfN area type of every MSOA, year and scenario in
+    features, as classify_areas does for a year.
+
+    The clusters are fitted to northern MSOAs of NTEM area types 1 to 4,
+    starting from the features of START_MSOAS in the first year. Later
+    years start from the previous year's centroids, so a cluster is the
+    same area type from one year to the next.
+
+    Parameters
+    ----------
+    features:
+        Area type features, from read_area_type_features()
+    pooled:
+        If True, as classify_areas, each year's clusters are fitted to all
+        scenarios at once, so area types mean the same in every scenario.
+        If False, each scenario is fitted separately, in parallel.
+    warm_start:
+        If False, every year starts from the features of START_MSOAS that
+        year, as classify_areas, rather than the previous year's centroids.
+    process_count:
+        The number of processes to fit scenarios in, when not pooled. See
+        concurrency.multiprocess() for how values are treated.
+
+    Returns
+    ----------
+    area_types:
+        msoa_zone_id, scenario, year and tfn_area_type_id, a row per row
+        of features
+    """
+    features = features.reset_index(drop=True)
+    years = sorted(features['year'].unique())
+    groups = [None] if pooled else sorted(features['scenario'].unique())
+
+    args = list()
+    rows = list()
+    for group in groups:
+        # Starts from the first scenario's features when pooled
+        start_scenario = features['scenario'].min() if group is None else group
+        in_group = np.ones(len(features), dtype=bool) if group is None else \
+            (features['scenario'] == group).to_numpy()
+
+        year_rows, year_features, fit_masks, inits = list(), list(), list(), list()
+        for year in years:
+            year_data = features[in_group & (features['year'] == year).to_numpy()]
+            start = year_data[year_data['scenario'] == start_scenario].set_index('msoa_zone_id')
+            year_rows.append(year_data.index.to_numpy())
+            year_features.append(year_data[AREA_TYPE_FEATURES].to_numpy(dtype=float))
+            fit_masks.append(((year_data['north'] == 1) & (year_data['ntem_area_type_id'] < 5)).to_numpy())
+            if warm_start and year != years[0]:
+                inits.append(None)
+            else:
+                inits.append(start.loc[START_MSOAS, AREA_TYPE_FEATURES].to_numpy(dtype=float))
+        args.append((year_features, fit_masks, inits))
+        rows.append(year_rows)
+
+    fits = mp.multiprocess(_fit_area_types,
+                           args=args,
+                           process_count=0 if len(args) == 1 else process_count,
+                           in_order=True)
+
+    clusters = np.empty(len(features), dtype=int)
+    for year_rows, (labels, _) in zip(rows, fits):
+        for index, year_labels in zip(year_rows, labels):
+            clusters[index] = year_labels
+
+    ntem = features['ntem_area_type_id'].to_numpy()
+    area_types = features[['msoa_zone_id', 'scenario', 'year']].copy()
+    area_types['tfn_area_type_id'] = np.where(ntem > 4, ntem, clusters + 1)
+    return area_types
+
+
+def build_area_types(years,
+                     scenarios=None,
+                     pooled=True,
+                     warm_start=True,
+                     process_count=consts.PROCESS_COUNT):
+    """
+    Classifies area types for all years and scenarios at once, in place
+    of running classify_areas for each year and combining the outputs
+    with combine_scenario_area_types.
+
+    Parameters
+    ----------
+    years:
+        Years to classify
+    scenarios:
+        Scenario ids to classify, all of SCENARIOS if None
+    pooled, warm_start, process_count:
+        See classify_area_types()
+
+    Returns
+    ----------
+    area_types:
+        The long format area types, as written to _area_types_path
+    """
+    features = read_area_type_features(years, scenarios=scenarios)
+    area_types = classify_area_types(features, pooled=pooled, warm_start=warm_start,
+                                     process_count=process_count)
+    area_types.to_csv(_area_types_path, index=False)
+    print('Zones are now classified. Written to ' + _area_types_path)
+    return area_types
+
+
+def area_types_fy_tests(n_msoa=4000, years=range(2019, 2051), seed=0):
+    """
+    Checks area types are continuous across years on synthetic data,
+    where MSOAs stay in the same density cluster as densities grow, other
+    than the last of START_MSOAS, which densifies into another cluster.
+    Also times fitting every year from START_MSOAS against warm starting.
+    """
+    import time
+
+    print("Running area_types_fy.py tests...")
+    process_count = min(len(SCENARIOS), os.cpu_count() - 1)
+    rng = np.random.default_rng(seed)
+    years = list(years)
+
+    # Four density clusters, with START_MSOAS at their centres
+    centres = np.array([[200, 300, 90], [100, 120, 60], [40, 30, 30], [5, 3, 5]], dtype=float)
+    cluster = np.concatenate([np.arange(4), rng.integers(0, 4, n_msoa - 4)])
+    msoas = START_MSOAS + ['E03%06d' % i for i in range(n_msoa - 4)]
+    area = rng.uniform(50, 500, n_msoa)
+    noise = np.exp(rng.normal(0, 0.05, (n_msoa, 3)))
+    noise[:4] = 1
+    regression_data = pd.DataFrame({
+        'msoa_zone_id': msoas,
+        'north': np.where(rng.random(n_msoa) < 0.7, 1, 0),
+        'ntem_area_type_id': np.where(rng.random(n_msoa) < 0.8, cluster + 1, rng.integers(5, 9, n_msoa)),
+        'area_hectares': area,
+        'flat_pop_percent': centres[cluster, 2] * noise[:, 2],
+    })
+    regression_data.loc[:3, ['north', 'ntem_area_type_id']] = [1, 1]
+
+    # Densities grow by a different rate in each scenario, and much
+    # faster in the last start MSOA
+    features = list()
+    for scenario in SCENARIOS:
+        growth = (1 + 0.002 * scenario) ** (np.array(years) - years[0])
+        growth = np.tile(growth, (n_msoa, 1))
+        growth[3] = 1.15 ** (np.array(years) - years[0])
+        pop = pd.DataFrame((centres[cluster, 0] * noise[:, 0] * area)[:, None] * growth,
+                           columns=[str(y) for y in years])
+        emp = pd.DataFrame((centres[cluster, 1] * noise[:, 1] * area)[:, None] * growth,
+                           columns=[str(y) for y in years])
+        pop['msoa_zone_id'] = emp['msoa_zone_id'] = msoas
+        features.append(area_type_features(pop, emp, regression_data, years, scenario))
+    features = pd.concat(features, ignore_index=True)
+
+    timings = dict()
+    results = dict()
+    for name, kwargs in [('from START_MSOAS each year', dict(warm_start=False)),
+                         ('warm started', dict()),
+                         ('warm started by scenario', dict(pooled=False, process_count=process_count))]:
+        start = time.perf_counter()
+        results[name] = classify_area_types(features, **kwargs)
+        timings[name] = time.perf_counter() - start
+    area_types = results['warm started']
+    cold = results['from START_MSOAS each year']
+    steady = (features['msoa_zone_id'] != START_MSOAS[3]).to_numpy()
+
+    def changes(df):
+        return (df[steady].groupby(['scenario', 'msoa_zone_id'])['tfn_area_type_id'].nunique() > 1).sum()
+
+    # Every other MSOA keeps its area type in every year and scenario
+    assert changes(area_types) == 0
+    assert changes(results['warm started by scenario']) == 0
+
+    # Which is the cluster the MSOA was drawn from, other than NTEM types 5+
+    expected = np.where(features['ntem_area_type_id'] > 4, features['ntem_area_type_id'],
+                        pd.Series(cluster + 1, index=msoas).reindex(features['msoa_zone_id']))
+    assert (area_types['tfn_area_type_id'].to_numpy() == expected)[steady].all()
+
+    # The first year is as classify_areas, from START_MSOAS, but starting
+    # each year from START_MSOAS loses a cluster as one densifies
+    first = (area_types['year'] == years[0]).to_numpy()
+    assert (area_types.loc[first, 'tfn_area_type_id'] == cold.loc[first, 'tfn_area_type_id']).all()
+    assert changes(cold) > 0
+    print('MSOAs changing area type from START_MSOAS each year: %d, warm started: %d'
+          % (changes(cold), changes(area_types)))
+
+    for name, seconds in timings.items():
+        print('%s: %d years x %d scenarios x %d MSOAs in %.2fs'
+              % (name, len(years), len(SCENARIOS), n_msoa, seconds))
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    area_types_fy_tests()
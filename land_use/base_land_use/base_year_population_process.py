@@ -35,17 +35,18 @@ Updates here relative to main_build.py are:
     - Revised expansion of NTEM population to full dimensions
 """
 
+import collections
 import pandas as pd
 import numpy as np
 import os
-# from ipfn import ipfn
-from caf.toolkit import iterative_proportional_fitting as ipfn
-from caf.toolkit import concurrency
 import datetime
-import pyodbc
-import geopandas as gpd
+from land_use import geodata
+from land_use.concurrency import multiprocessing as mp
 from land_use.utils import file_ops as utils
 from land_use.utils import compress
+from land_use.utils import ipfn
+from land_use.utils import ntem
+from land_use.utils import segment_keys
 from land_use import lu_constants
 # from land_use.base_land_use import by_lu
 import logging
@@ -147,7 +148,6 @@ def copy_addressbase_files(by_lu_obj):
     with open(audit_3_2_1_path, 'w') as text_file:
         text_file.write(audit_3_2_1_content)
 
-    by_lu_obj.state['3.2.1 read in core property data'] = 1
     logging.info('Step 3.2.1 completed')
     print('Step 3.2.1 completed')
 
@@ -194,7 +194,7 @@ def filled_properties(by_lu_obj):
     filled_properties_df = filled_properties_df.drop(columns={'Filled_Dwells', 'Total_Dwells'})
 
     # The above filled properties probability is based on E+W so need to join back to Scottish MSOAs
-    uk_msoa = gpd.read_file(_default_msoaRef)[['msoa11cd']].rename(columns={'msoa11cd': 'msoaZoneID'})
+    uk_msoa = geodata.read_attributes(_default_msoaRef)[['msoa11cd']].rename(columns={'msoa11cd': 'msoaZoneID'})
     filled_properties_df = uk_msoa.merge(filled_properties_df, on='msoaZoneID', how='outer')
     filled_properties_df = filled_properties_df.fillna(1)  # default to all Scottish properties being occupied
     # Adam - DONE, we need to think how to organise the structure of outputs files per step
@@ -214,7 +214,6 @@ def filled_properties(by_lu_obj):
     with open(audit_3_2_2_path, 'w') as text_file:
         text_file.write(audit_3_2_2_content)
 
-    by_lu_obj.state['3.2.2 filled property adjustment'] = 1  # record that this process has been run
     logging.info('Step 3.2.2 completed')
     print('Step 3.2.2 completed')
     return filled_properties_df
@@ -258,7 +257,7 @@ def lsoa_census_data_prep(dat_path,
     property_imports = _read_census_table(property_tables, "properties")
 
     # Read in the geometry
-    geography = gpd.read_file(geography)
+    geography = geodata.read_attributes(geography)
     geography = geography.iloc[:, 0:3]
 
     # Merge the population data, property data and geometry into a single DataFrame: household_occupancy
@@ -417,7 +416,7 @@ def apply_household_occupancy(by_lu_obj, do_import=False, write_out=True):
 
     # Visual spot checks - count zones, check cpt
     audit = balanced_cpt_data.groupby(['msoaZoneID']).count().reset_index()
-    uk_msoa = gpd.read_file(_default_msoaRef)[['objectid', 'msoa11cd']]
+    uk_msoa = geodata.read_attributes(_default_msoaRef)[['objectid', 'msoa11cd']]
     print('census hops zones =', audit['msoaZoneID'].drop_duplicates().count(), 'should be', len(uk_msoa))
     print('counts of property type by zone', audit['census_property_type'].drop_duplicates())
 
@@ -432,7 +431,7 @@ def apply_household_occupancy(by_lu_obj, do_import=False, write_out=True):
     balanced_cpt_data = balanced_cpt_data.merge(lad_translation, how='left', on='msoaZoneID')
 
     # Join LAD code
-    uk_lad = gpd.read_file(_default_ladRef)[['objectid', 'lad17cd']]
+    uk_lad = geodata.read_attributes(_default_ladRef)[['objectid', 'lad17cd']]
     balanced_cpt_data = balanced_cpt_data.merge(uk_lad, how='left', left_on='ladZoneID', right_on='objectid')
 
     # Check the join
@@ -521,7 +520,6 @@ def apply_household_occupancy(by_lu_obj, do_import=False, write_out=True):
         if write_out:
             all_res_property.to_csv(apply_household_occupancy_path, index=False)
 
-        by_lu_obj.state['3.2.3 household occupancy adjustment'] = 1  # record that this process has been run
         logging.info('Step 3.2.3 completed')
         print('Step 3.2.3 completed')
         return all_res_property
@@ -621,7 +619,6 @@ def property_type_mapping(by_lu_obj):
     with open(audit_3_2_4_path, 'w') as text_file:
         text_file.write(audit_3_2_4_content)
 
-    by_lu_obj.state['3.2.4 property type mapping'] = 1
     logging.info('Step 3.2.4 completed')
     print('Step 3.2.4 completed')
     return crp
@@ -1509,76 +1506,21 @@ def ntem_pop_interpolation(by_lu_obj, calling_functions_dir):
     # Data years
     # NTEM is run in 5-year increments with a base of 2011.
     # This section calculates the upper and lower years of data that are required
-    InterpolationYears = Year % 5
-    LowerYear = Year - ((InterpolationYears - 1) % 5)
-    UpperYear = Year + ((1 - InterpolationYears) % 5)
+    LowerYear, UpperYear = ntem.ntem_interpolation_years(Year)
 
     logging.info("Lower Interpolation Year - " + str(LowerYear))
     logging.info("Upper Interpolation Year - " + str(UpperYear))
     print("Lower Interpolation Year - " + str(LowerYear))
     print("Upper Interpolation Year - " + str(UpperYear))
 
-    # Import Upper and Lower Year Tables
+    # Interpolated population comes from a local cache of the NTEM databases,
+    # kept in the local folder lu_constants.NTEM_CACHE_FOLDER,
+    # which is only built from the Access databases the first time round
     # 'I:/Data/NTEM/NTEM 7.2 outputs for TfN/'
-    LowerNTEMDatabase = by_lu_obj.CTripEnd_Database_path + 'CTripEnd7_' + str(LowerYear) + '.accdb'
-    UpperNTEMDatabase = by_lu_obj.CTripEnd_Database_path + 'CTripEnd7_' + str(UpperYear) + '.accdb'
-    # UpperNTEMDatabase = by_lu_obj.CTripEnd_Database_path + r"\CTripEnd7_" + str(UpperYear) + r".accdb"
-    cnxn = pyodbc.connect('DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};DBQ=' +
-                          '{};'.format(UpperNTEMDatabase))
-
-    query = r"SELECT * FROM ZoneData"
-    UZoneData = pd.read_sql(query, cnxn)
-    cnxn.close()
-
-    cnxn = pyodbc.connect('DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};DBQ=' +
-                          '{};'.format(LowerNTEMDatabase))
-
-    query = r"SELECT * FROM ZoneData"
-    LZoneData = pd.read_sql(query, cnxn)
-    cnxn.close()
-
-    # Re-format Tables
-    LZonePop = LZoneData.copy()
-    UZonePop = UZoneData.copy()
-    LZonePop.drop(
-        ['E01', 'E02', 'E03', 'E04', 'E05', 'E06', 'E07', 'E08', 'E09', 'E10', 'E11', 'E12', 'E13', 'E14', 'E15', 'K01',
-         'K02', 'K03', 'K04', 'K05', 'K06', 'K07', 'K08', 'K09', 'K10', 'K11', 'K12', 'K13', 'K14', 'K15'], axis=1,
-        inplace=True)
-    UZonePop.drop(
-        ['E01', 'E02', 'E03', 'E04', 'E05', 'E06', 'E07', 'E08', 'E09', 'E10', 'E11', 'E12', 'E13', 'E14', 'E15', 'K01',
-         'K02', 'K03', 'K04', 'K05', 'K06', 'K07', 'K08', 'K09', 'K10', 'K11', 'K12', 'K13', 'K14', 'K15'], axis=1,
-        inplace=True)
-    LZonePop_long = pd.melt(LZonePop, id_vars=["I", "R", "B", "Borough", "ZoneID", "ZoneName"],
-                            var_name="LTravellerType", value_name="LPopulation")
-    UZonePop_long = pd.melt(UZonePop, id_vars=["I", "R", "B", "Borough", "ZoneID", "ZoneName"],
-                            var_name="UTravellerType", value_name="UPopulation")
-
-    LZonePop_long.rename(columns={"I": "LZoneID", "B": "LBorough", "R": "LAreaType"}, inplace=True)
-    UZonePop_long.rename(columns={"I": "UZoneID", "B": "UBorough", "R": "UAreaType"}, inplace=True)
-
-    LZonePop_long['LIndivID'] = LZonePop_long.LZoneID.map(str) + "_" + LZonePop_long.LAreaType.map(
-        str) + "_" + LZonePop_long.LBorough.map(str) + "_" + LZonePop_long.LTravellerType.map(str)
-    UZonePop_long['UIndivID'] = UZonePop_long.UZoneID.map(str) + "_" + UZonePop_long.UAreaType.map(
-        str) + "_" + UZonePop_long.UBorough.map(str) + "_" + UZonePop_long.UTravellerType.map(str)
-
-    # Join Upper and Lower Tables
-    TZonePop_DataYear = LZonePop_long.join(UZonePop_long.set_index('UIndivID'), on='LIndivID', how='right',
-                                           lsuffix='_left', rsuffix='_right')
-    TZonePop_DataYear.drop(['UZoneID', 'UBorough', 'UAreaType', 'UTravellerType'], axis=1, inplace=True)
-
-    # Interpolate Between Upper and Lower Years
-    TZonePop_DataYear['GrowthinPeriod'] = TZonePop_DataYear.eval('UPopulation - LPopulation')
-    TZonePop_DataYear['GrowthperYear'] = TZonePop_DataYear.eval('GrowthinPeriod / 5')
-    TZonePop_DataYear = TZonePop_DataYear.assign(GrowthtoYear=TZonePop_DataYear['GrowthperYear'] * (Year - LowerYear))
-    TZonePop_DataYear['Population'] = TZonePop_DataYear.eval('LPopulation + GrowthtoYear')
-
-    # Tidy up
-    TZonePop_DataYear.rename(
-        columns={"LZoneID": "ZoneID", "LBorough": "Borough", "LAreaType": "AreaType", "LTravellerType": "TravellerType",
-                 "LIndivID": "IndivID"}, inplace=True)
-    TZonePop_DataYear.drop(
-        ['GrowthinPeriod', 'GrowthperYear', 'GrowthtoYear', 'LPopulation', 'UPopulation', 'ZoneID_left', 'ZoneID_right',
-         'ZoneName_right', 'ZoneName_left', 'Borough_left', 'Borough_right', 'IndivID'], axis=1, inplace=True)
+    TZonePop_DataYear = ntem.ntem_pop_for_year(
+        year=Year,
+        ctripend_database_path=by_lu_obj.CTripEnd_Database_path,
+    )
     print(TZonePop_DataYear.Population.sum())
 
     # Translating zones for those in Scotland
@@ -1626,7 +1568,18 @@ def ntem_pop_interpolation(by_lu_obj, calling_functions_dir):
     return NTEM_HHpop
 
 
-def mye_pop_compiled(by_lu_obj):
+def mye_aps_compiled(by_lu_obj):
+    """
+    Runs the MYE_APS_process on its own, writing out the outputs step 3.2.5 needs.
+    This lets the MYE compilation run alongside steps 3.2.2 to 3.2.4, rather than
+    inside step 3.2.5.
+    """
+    logging.info('Running the MYE_APS_process for Step 3.2.5')
+    print('Running the MYE_APS_process for Step 3.2.5')
+    mye_aps_process(by_lu_obj, 'MYE_pop_compiled', mye_pop_compiled_dir)
+
+
+def mye_pop_compiled(by_lu_obj, read_base_year_pop_msoa_path_file=False):
     logging.info('Running Step 3.2.5')
     print('Running Step 3.2.5')
     mye_pop_compiled_name = 'MYE_pop_compiled'
@@ -1639,9 +1592,9 @@ def mye_pop_compiled(by_lu_obj):
     #  the function to run and export and then alters the various calls and readings of outputs to work with this
     #  altered format. Some work has been done on this to prevent wasting time exporting the outputs several times,
     #  but it could be made much more efficient!
-    # Added a manual control to allow read in from file (rather than internal memory) in the event of a partial run
+    # read_base_year_pop_msoa_path_file allows read in from file (rather than internal memory) in the event of a
+    # partial run, or when mye_aps_compiled() has already been run as its own step.
     # False means "read in from memory" and is the default.
-    read_base_year_pop_msoa_path_file = False
     if read_base_year_pop_msoa_path_file:
         mye_msoa_pop_name = '_'.join(['gb', by_lu_obj.model_zoning.lower(),
                                       ModelYear, 'pop+hh_pop.csv'])
@@ -1650,8 +1603,6 @@ def mye_pop_compiled(by_lu_obj):
                                                 mye_pop_compiled_dir,
                                                 mye_msoa_pop_name))
         logging.info('Step 3.2.5 read in data processed by step the APS compiling function through an existing csv')
-        logging.info('WARNING - This is not the default way of reading this data!')
-        logging.info('Did you mean to do that?')
     else:
         logging.info(
             'Step 3.2.5 is calling step the APS compiling function in order to obtain Base Year population data')
@@ -1688,7 +1639,7 @@ def mye_pop_compiled(by_lu_obj):
     # Read NTEM hh pop at NorMITs Zone level and make sure the zonal total is consistent to crp
     ntem_hh_pop = ntem_pop_interpolation(by_lu_obj, mye_pop_compiled_dir)
 
-    uk_msoa = gpd.read_file(_default_msoaRef)[['objectid', 'msoa11cd']]
+    uk_msoa = geodata.read_attributes(_default_msoaRef)[['objectid', 'msoa11cd']]
     ntem_hh_pop = ntem_hh_pop.merge(uk_msoa, how='left', left_on='msoaZoneID', right_on='objectid')
     ntem_hh_pop_cols = ['msoaZoneID', 'msoa11cd', 'Borough', 'TravellerType', 'NTEM_TT_Name', 'Age_code',
                         'Age', 'Gender_code', 'Gender', 'Household_composition_code', 'Household_size', 'Household_car',
@@ -1810,7 +1761,6 @@ def mye_pop_compiled(by_lu_obj):
                                     '_'.join(['ntem_gb_msoa_ntem_tt', ModelYear, 'mye_pop']))
     compress.write_out(ntem_hh_pop, ntem_hh_pop_path)
 
-    by_lu_obj.state['3.2.5 Uplifting Base Year population according to Base Year MYPE'] = 1
     logging.info('Step 3.2.5 completed')
     print('Step 3.2.5 completed')
     return [aj_crp, ntem_hh_pop, audit_mye_msoa_pop]
@@ -1949,14 +1899,8 @@ def pop_with_full_dimensions(by_lu_obj):
                      'pop_aj': 'P_NTEM'})
 
         NTEM_HHpop_trim['z'] = NTEM_HHpop_trim['z'].astype(int)
-        NTEM_HHpop_trim_iterator = zip(NTEM_HHpop_trim['z'],
-                                       NTEM_HHpop_trim['a'],
-                                       NTEM_HHpop_trim['g'],
-                                       NTEM_HHpop_trim['h'],
-                                       NTEM_HHpop_trim['e'])
-
-        NTEM_HHpop_trim['aghe_Key'] = ['_'.join([str(z), str(a), str(g), str(h), str(e)])
-                                       for z, a, g, h, e in NTEM_HHpop_trim_iterator]
+        aghe_segments = ['z', 'a', 'g', 'h', 'e']
+        NTEM_HHpop_trim['aghe_Key'] = segment_keys.NORMITS_CODEC.encode(NTEM_HHpop_trim, aghe_segments)
         # Read in f (f_tns|zaghe) to expand adjustedNTEM hh pop with additional dimension of t(dwelling type),
         # n(HRP NS-SEC) and s (SOC)
         # Replace this block with new process from 2011 output f.
@@ -1966,13 +1910,7 @@ def pop_with_full_dimensions(by_lu_obj):
         census_f_value = pd.read_csv(os.path.join(
             by_lu_obj.import_folder, _census_f_value_path, 'NorMITs_2011_post_ipfn_f_values.csv'))
         # census_f_value['z'] = census_f_value['z'].astype(int)
-        census_f_value_iterator = zip(census_f_value['z'],
-                                      census_f_value['a'],
-                                      census_f_value['g'],
-                                      census_f_value['h'],
-                                      census_f_value['e'])
-        census_f_value['aghe_Key'] = ['_'.join([str(z), str(a), str(g), str(h), str(e)])
-                                      for z, a, g, h, e in census_f_value_iterator]
+        census_f_value['aghe_Key'] = segment_keys.NORMITS_CODEC.encode(census_f_value, aghe_segments)
         NTEM_HHpop_trim = pd.merge(NTEM_HHpop_trim,
                                    census_f_value,
                                    on='aghe_Key')
@@ -2228,12 +2166,10 @@ def pop_with_full_dimensions(by_lu_obj):
         # HHpop.to_csv(pop_with_full_dims_csv_path, index=False)
         uk_ave_hh_occ.to_csv(gb_ave_hh_occ_path, index=False)
         logging.info('Step 3.2.6 completed.')
-        by_lu_obj.state[
-            '3.2.6 expand NTEM population to full dimensions'] = 1
 
         print('Step 3.2.6 function has completed')
 
-def furness_hhr(by_lu_obj):
+def furness_hhr(by_lu_obj, export_district_files=False):
     logging.info('Running Step 3.2.7')
     print('Running Step 3.2.7')
     furness_hhr_name = 'Furness_hhr'
@@ -2243,6 +2179,8 @@ def furness_hhr(by_lu_obj):
     # Yan- Make sure the function of MYE_APS_process has been called to write out the outputs needed for this step and
     # read the outputs in rather than calling dataframe.
     read_base_year_pop_msoa_path_file = False
+    # export_district_files writes out the seed, control and furnessed files for every district as an audit.
+    # The ipf itself runs from the in memory district slices either way.
 
     if read_base_year_pop_msoa_path_file:
         logging.info('Step 3.2.7 is calling the MYE_APS_process function in order to write out Base Year population data')
@@ -2503,216 +2441,52 @@ def furness_hhr(by_lu_obj):
     LA_hhr_ageplus = LA_hhr_ageplus_control[['LA', 'a', 'g', 'e+', 'people']]
     # LA_hhr_ageplus = LA_hhr_ageplus_control.groupby(['LA', 'a', 'g', 'e+'], as_index=False)['people'].sum
 
-    #output control file
-    seed_output_file = ''.join([ModelYear, '_seed', '.csv.bz2'])
-    seed_output_file_path = os.path.join(by_lu_obj.out_paths['write_folder'],
-                                                    process_dir,
-                                                    furness_hhr_dir,
-                                                    '00_seed',
-                                                    seed_output_file)
-    # seed.to_csv(seed_output_file_path)
-    LA_hhr_ageplus_control_file = ''.join([ModelYear, '_ctrl_dageplus', '.csv'])
-    LA_hhr_ageplus_control_path = os.path.join(by_lu_obj.out_paths['write_folder'],
-                                                    process_dir,
-                                                    furness_hhr_dir,
-                                                    '05_ctrl_dageplus',
-                                                    LA_hhr_ageplus_control_file)
-    LA_hhr_ageplus_control.to_csv(LA_hhr_ageplus_control_path)
-    LA_hhr_s_control_file = ''.join([ModelYear, '_ctrl_ds', '.csv'])
-    LA_hhr_s_control_path = os.path.join(by_lu_obj.out_paths['write_folder'],
-                                                    process_dir,
-                                                    furness_hhr_dir,
-                                                    '04_ctrl_ds',
-                                                    LA_hhr_s_control_file,)
-    LA_hhr_s_control.to_csv(LA_hhr_s_control_path)
-    z_hhr_ag_control_file = ''.join([ModelYear, '_ctrl_zag', '.csv'])
-    z_hhr_ag_control_path = os.path.join(by_lu_obj.out_paths['write_folder'],
-                                                    process_dir,
-                                                    furness_hhr_dir,
-                                                    '01_ctrl_zag',
-                                                    z_hhr_ag_control_file)
-    z_hhr_ag_control.to_csv(z_hhr_ag_control_path)
-    z_hhr_h_control_file = ''.join([ModelYear, '_ctrl_zh', '.csv'])
-    z_hhr_h_control_path = os.path.join(by_lu_obj.out_paths['write_folder'],
-                                                    process_dir,
-                                                    furness_hhr_dir,
-                                                    '02_ctrl_zh',
-                                                    z_hhr_h_control_file)
-    z_hhr_h_control.to_csv(z_hhr_h_control_path)
-    z_hhr_t_control_file = ''.join([ModelYear, '_ctrl_zt', '.csv'])
-    z_hhr_t_control_path = os.path.join(by_lu_obj.out_paths['write_folder'],
-                                                    process_dir,
-                                                    furness_hhr_dir,
-                                                    '03_ctrl_zt',
-                                                    z_hhr_t_control_file)
-    z_hhr_t_control.to_csv(z_hhr_t_control_path)
-
-    # -----set up for loop for 1 -> Max d in data (363) to output control files and seed files by district ------
+    # -----Slice seed and control files by district------
+    # Group the seed and each control once, rather than re-reading the full control files for every district
     logging.info('Slice files by district')
     print('Slice files by district')
     district_upper_limit = LA_ID['LA'].max() + 1
-    for district in range(1, district_upper_limit):
-        dist_str = str(district)
-        # Main seed file#
-        # seed = pd.read_csv(seed_output_file_path)
-        z_hhr_ag_control = pd.read_csv(z_hhr_ag_control_path)
-        z_hhr_h_control = pd.read_csv(z_hhr_h_control_path)
-        z_hhr_t_control = pd.read_csv(z_hhr_t_control_path)
-        LA_hhr_s_control = pd.read_csv(LA_hhr_s_control_path)
-        LA_hhr_ageplus_control = pd.read_csv(LA_hhr_ageplus_control_path)
-
-        seed_d = seed.loc[seed['LA'] == district]
-        # zonal control files
-        z_hhr_ag_control_d = z_hhr_ag_control.loc[z_hhr_ag_control['LA'] == district].reset_index()
-        z_hhr_ag_control_d_header = ['z', 'a', 'g', 'people']
-        z_hhr_ag_control_d = z_hhr_ag_control_d[z_hhr_ag_control_d_header]
-        z_hhr_h_control_d = z_hhr_h_control.loc[z_hhr_h_control['LA'] == district].reset_index()
-        z_hhr_h_control_d_header = ['z', 'h', 'people']
-        z_hhr_h_control_d = z_hhr_h_control_d[z_hhr_h_control_d_header]
-        z_hhr_t_control_d = z_hhr_t_control.loc[z_hhr_t_control['LA'] == district].reset_index()
-        z_hhr_t_control_d_header = ['z', 't', 'people']
-        z_hhr_t_control_d = z_hhr_t_control_d[z_hhr_t_control_d_header]
-        # district level control files
-        LA_hhr_s_control_d = LA_hhr_s_control.loc[LA_hhr_s_control['LA'] == district].reset_index()
-        LA_hhr_s_control_d_header = ['LA', 's', 'people']
-        LA_hhr_s_control_d = LA_hhr_s_control_d[LA_hhr_s_control_d_header]
-        LA_hhr_ageplus_control_d = LA_hhr_ageplus_control.loc[LA_hhr_ageplus_control['LA'] == district].reset_index()
-        LA_hhr_ageplus_control_d_header = ['LA', 'a', 'g', 'e+', 'people']
-        LA_hhr_ageplus_control_d = LA_hhr_ageplus_control_d[LA_hhr_ageplus_control_d_header]
-
-        # name files
-        seed_file_d = '_'.join([ModelYear, 'seed_d', dist_str, '.csv'])
-        ctrl_zag_file_d = '_'.join([ModelYear, 'ctrl_zag_d', dist_str, '.csv'])
-        ctrl_zh_file_d = '_'.join([ModelYear, 'ctrl_zh_d', dist_str, '.csv'])
-        ctrl_zt_file_d = '_'.join([ModelYear, 'ctrl_zt_d', dist_str, '.csv'])
-        ctrl_ds_file_d = '_'.join([ModelYear, 'ctrl_ds_d', dist_str, '.csv'])
-        ctrl_dageplus_file_d = '_'.join([ModelYear, 'ctrl_dageplus_d', dist_str, '.csv'])
-        # Name sub folders
-        seed_folder = os.path.join(by_lu_obj.out_paths['write_folder'],
-                                               process_dir,
-                                               furness_hhr_dir,
-                                               '00_seed',
-                                   seed_file_d)
-        ctrl_zag_folder = os.path.join(by_lu_obj.out_paths['write_folder'],
-                                               process_dir,
-                                               furness_hhr_dir,
-                                               '01_ctrl_zag',
-                                       ctrl_zag_file_d)
-        ctrl_zh_folder = os.path.join(by_lu_obj.out_paths['write_folder'],
-                                               process_dir,
-                                               furness_hhr_dir,
-                                               '02_ctrl_zh',
-                                      ctrl_zh_file_d)
-        ctrl_zt_folder = os.path.join(by_lu_obj.out_paths['write_folder'],
-                                               process_dir,
-                                               furness_hhr_dir,
-                                               '03_ctrl_zt',
-                                      ctrl_zt_file_d)
-        ctrl_ds_folder = os.path.join(by_lu_obj.out_paths['write_folder'],
-                                               process_dir,
-                                               furness_hhr_dir,
-                                               '04_ctrl_ds',
-                                      ctrl_ds_file_d)
-        ctrl_dageplus_folder = os.path.join(by_lu_obj.out_paths['write_folder'],
-                                               process_dir,
-                                               furness_hhr_dir,
-                                               '05_ctrl_dageplus',
-                                            ctrl_dageplus_file_d)
-
-
-        # output seed and control files by district
-        seed_d.to_csv(seed_folder,index=False)
-        z_hhr_ag_control_d.to_csv(ctrl_zag_folder, index=False)
-        z_hhr_h_control_d.to_csv(ctrl_zh_folder, index=False)
-        z_hhr_t_control_d.to_csv(ctrl_zt_folder, index=False)
-        LA_hhr_s_control_d.to_csv(ctrl_ds_folder, index=False)
-        LA_hhr_ageplus_control_d.to_csv(ctrl_dageplus_folder, index=False)
-        # Print out every tenth row to check on progress
-        if district / 10 == district // 10:
-            print(district)
+    district_seed, kwarg_list = _district_ipf_kwargs(seed,
+                                      z_hhr_ag_control,
+                                      z_hhr_h_control,
+                                      z_hhr_t_control,
+                                      LA_hhr_s_control,
+                                      LA_hhr_ageplus_control,
+                                      district_upper_limit)
     print('Done!')
 
+    # The seed and control files are only written out if asked for, as an audit of the ipf inputs
+    if export_district_files:
+        logging.info('Export seed and control files by district')
+        print('Export seed and control files by district')
+        _export_furness_hhr_inputs(by_lu_obj,
+                                   district_seed,
+                                   kwarg_list,
+                                   z_hhr_ag_control,
+                                   z_hhr_h_control,
+                                   z_hhr_t_control,
+                                   LA_hhr_s_control,
+                                   LA_hhr_ageplus_control)
+
     logging.info('ipf process by districts')
     print('ipf process by districts')
-    # calling function ipf_process to furness data by districts
-
-    seed_path_start = os.path.join(by_lu_obj.out_paths['write_folder'],
-                                               process_dir,
-                                               furness_hhr_dir,
-                                               '00_seed',
-                                               '_'.join([ModelYear, 'seed_d']))
-    ctrl_zag_path_start = os.path.join(by_lu_obj.out_paths['write_folder'],
-                                               process_dir,
-                                               furness_hhr_dir,
-                                               '01_ctrl_zag',
-                                               '_'.join([ModelYear, 'ctrl_zag_d']))
-    ctrl_zh_path_start = os.path.join(by_lu_obj.out_paths['write_folder'],
-                                               process_dir,
-                                               furness_hhr_dir,
-                                               '02_ctrl_zh',
-                                               '_'.join([ModelYear, 'ctrl_zh_d']))
-    ctrl_zt_path_start = os.path.join(by_lu_obj.out_paths['write_folder'],
-                                               process_dir,
-                                               furness_hhr_dir,
-                                               '03_ctrl_zt',
-                                               '_'.join([ModelYear, 'ctrl_zt_d']))
-    ctrl_ds_path_start = os.path.join(by_lu_obj.out_paths['write_folder'],
-                                               process_dir,
-                                               furness_hhr_dir,
-                                               '04_ctrl_ds',
-                                               '_'.join([ModelYear, 'ctrl_ds_d']))
-    ctrl_dageplus_path_start = os.path.join(by_lu_obj.out_paths['write_folder'],
-                                               process_dir,
-                                               furness_hhr_dir,
-                                               '05_ctrl_dageplus',
-                                               '_'.join([ModelYear, 'ctrl_dageplus_d']))
-
-    kwarg_list = list()
-    for district_num in range(1, district_upper_limit):
-        dist_str = str(district_num)
-        my_seed_path = '_'.join([seed_path_start, dist_str, '.csv'])
-        ctrl_zag_path = '_'.join([ctrl_zag_path_start, dist_str, '.csv'])
-        ctrl_zh_path = '_'.join([ctrl_zh_path_start, dist_str, '.csv'])
-        ctrl_zt_path = '_'.join([ctrl_zt_path_start, dist_str, '.csv'])
-        ctrl_ds_path = '_'.join([ctrl_ds_path_start, dist_str, '.csv'])
-        ctrl_dageplus_path = '_'.join([ctrl_dageplus_path_start, dist_str, '.csv'])
-        output_filename = '_'.join([dist_str, 'furnessed_hhpop.csv'])
-        output_path = os.path.join(by_lu_obj.out_paths['write_folder'], output_dir, 'furnessed', output_filename)
-
-        kwarg_list.append({
-            "seed_path": my_seed_path,
-            "ctrl_zag_path": ctrl_zag_path,
-            "ctrl_zh_path": ctrl_zh_path,
-            "ctrl_zt_path": ctrl_zt_path,
-            "ctrl_ds_path": ctrl_ds_path,
-            "ctrl_dageplus_path": ctrl_dageplus_path,
-            "output_path": output_path,
-        })
-
-    concurrency.multiprocess(
-        fn=ipf_process,
-        kwarg_list=kwarg_list,
-        pbar_kwargs={"disable": False}
-    )
+    # calling function ipf_district to furness data by districts
+    furnessed_by_d = _ipf_districts(district_seed, kwarg_list)
 
     # -----Join the furnessed outputs by district to one single dataframe------
     logging.info('Join files by district')
     print('Join files by district')
-    input_directory = os.path.join(by_lu_obj.out_paths['write_folder'], output_dir, 'furnessed')
-    input_filename = 'furnessed_hhpop.csv'
+    furnessed_output_dir = os.path.join(by_lu_obj.out_paths['write_folder'], output_dir, 'furnessed')
     list_of_df = []
-    # Loop over all districts and append to a master df.
-    for district in range(1, district_upper_limit):
-        dist_str = str(district)
-        input_path = os.path.join(input_directory, '_'.join([dist_str, input_filename]))
-        input_df = pd.read_csv(input_path)
-        input_df['LA'] = district
-        list_of_df.append(input_df)
-    print('All', str(district_upper_limit-1), 'files read in ok')
+    for district, furnessed_df in zip(range(1, district_upper_limit), furnessed_by_d):
+        if export_district_files:
+            output_filename = '_'.join([str(district), 'furnessed_hhpop.csv'])
+            furnessed_df.to_csv(os.path.join(furnessed_output_dir, output_filename), index=False)
+        furnessed_df['LA'] = district
+        list_of_df.append(furnessed_df)
+    print('All', str(district_upper_limit-1), 'districts furnessed ok')
     furnessed_hhr = pd.concat(list_of_df, axis=0, ignore_index=True)
 
-
-
     #---- check output against control values
     logging.info('Check furnessed output against control values')
     print('Check furnessed output against control values')
@@ -2859,16 +2633,19 @@ def furness_hhr(by_lu_obj):
     uk_ave_hh_occ_lookup = pd.read_csv(uk_ave_hh_occ_lookup_path)
     final_zonal_hh_pop_by_t = furnessed_hhr.groupby(['2021_LA_code', '2021_LA_Name', 'MSOA', 'z', 't'])['people'].sum()
     final_zonal_hh_pop_by_t = final_zonal_hh_pop_by_t.reset_index()
-    final_zonal_hh_pop_by_t_iterator = zip(final_zonal_hh_pop_by_t['z'], final_zonal_hh_pop_by_t['t'])
-    final_zonal_hh_pop_by_t['z_t'] = ['_'.join([str(z), str(t)]) for z, t in final_zonal_hh_pop_by_t_iterator]
+    final_zonal_hh_pop_by_t['z_t'] = segment_keys.NORMITS_CODEC.encode(final_zonal_hh_pop_by_t, ['z', 't'])
 
     zonal_properties_by_t = pd.read_csv(os.path.join(
         by_lu_obj.out_paths['write_folder'],
         process_dir,
         mye_pop_compiled_dir,
         '_'.join(['gb_msoa_agg_prt', ModelYear, 'hh_pop.csv'])))
-    zonal_properties_by_t_iterator = zip(zonal_properties_by_t['Zone'], zonal_properties_by_t['census_property_type'])
-    zonal_properties_by_t['z_t'] = ['_'.join([str(z), str(t)]) for z, t in zonal_properties_by_t_iterator]
+    # Communal establishments (type 8) are outside the dwelling types of t and
+    # can't match the furnessed population, so are dropped before encoding
+    zonal_properties_by_t = zonal_properties_by_t[segment_keys.NORMITS_CODEC.in_bounds(
+        zonal_properties_by_t, ['z', 't'], columns=['Zone', 'census_property_type'])].copy()
+    zonal_properties_by_t['z_t'] = segment_keys.NORMITS_CODEC.encode(
+        zonal_properties_by_t, ['z', 't'], columns=['Zone', 'census_property_type'])
 
     final_zonal_hh_pop_by_t = pd.merge(final_zonal_hh_pop_by_t,
                                        zonal_properties_by_t,
@@ -2888,23 +2665,8 @@ def furness_hhr(by_lu_obj):
     # Format output files to tfn tt instead of NorMITs segmentation
     furnessed_hhr_out = furnessed_hhr.copy()
     seg_to_tt_df = pd.read_csv(normits_seg_to_tfn_tt_file)
-    tfn_tt_aghens_iterator = zip(seg_to_tt_df['a'],
-                                 seg_to_tt_df['g'],
-                                 seg_to_tt_df['h'],
-                                 seg_to_tt_df['e'],
-                                 seg_to_tt_df['n'],
-                                 seg_to_tt_df['s'])
-    seg_to_tt_df['aghens'] = ['_'.join([str(a), str(g), str(h), str(e), str(n), str(s)])
-                                       for a, g, h, e, n, s in tfn_tt_aghens_iterator]
-    aghens_iterator = zip(furnessed_hhr['a'],
-                          furnessed_hhr['g'],
-                          furnessed_hhr['h'],
-                          furnessed_hhr['e'],
-                          furnessed_hhr['n'],
-                          furnessed_hhr['s'])
-    furnessed_hhr_out['aghens'] = ['_'.join([str(a), str(g), str(h), str(e), str(n), str(s)])
-                                       for a, g, h, e, n, s in aghens_iterator]
-    furnessed_hhr_out = furnessed_hhr_out.merge(seg_to_tt_df, on=['aghens'])
+    furnessed_hhr_out = segment_keys.merge_on_segments(
+        furnessed_hhr_out, seg_to_tt_df, ['a', 'g', 'h', 'e', 'n', 's'])
     furnessed_hhr_out = furnessed_hhr_out[['2021_LA_code', '2021_LA_Name', 'z', 'MSOA', 'tfn_tt', 't', 'people']]
     furnessed_hhr = furnessed_hhr[['2021_LA_code', '2021_LA_Name', 'z', 'MSOA', 'a', 'g', 'h', 'e', 't', 'n', 's', 'people']]
     furnessed_hhr_out_filename = '_'.join(['output_2_gb_tfntt_t', ModelYear, '_hh_pop'])
@@ -2921,27 +2683,146 @@ def furness_hhr(by_lu_obj):
     final_zonal_hh_pop_by_t.to_csv(final_zonal_hh_pop_by_t_path)
     compress.write_out(furnessed_hhr_out, furnessed_hhr_out_path)
     compress.write_out(furnessed_hhr, furnessed_hhr_path)
-    by_lu_obj.state['3.2.7 Furness household population according to control values'] = 1
     logging.info('Step 3.2.7 completed')
     print('Step 3.2.7 completed')
 
-def ipf_process(
-        seed_path,
-        ctrl_zag_path,
-        ctrl_zh_path,
-        ctrl_zt_path,
-        ctrl_ds_path,
-        ctrl_dageplus_path,
-        output_path
+def _slice_by_district(df, headers):
+    """
+    Splits df by its 'LA' column in a single pass.
+
+    Returns a dict of district to the headers columns of that district.
+    Districts missing from df get an empty dataframe.
+    """
+    groups = {district: group[headers].reset_index(drop=True) for district, group in df.groupby('LA')}
+    return collections.defaultdict(lambda: pd.DataFrame(columns=headers), groups)
+
+
+def _district_ipf_kwargs(seed,
+                         z_hhr_ag_control,
+                         z_hhr_h_control,
+                         z_hhr_t_control,
+                         LA_hhr_s_control,
+                         LA_hhr_ageplus_control,
+                         district_upper_limit):
+    """
+    Splits the 3.2.7 seed and controls by district.
+
+    The seed is sorted by district rather than split, so it can be shared
+    with every ipf_district() worker at once, see furness_hhr().
+
+    Returns the sorted seed, and the ipf_district() kwargs of every
+    district from 1 up to, but not including, district_upper_limit. Each
+    district's kwargs hold its rows of the sorted seed as seed_rows, rather
+    than the seed itself.
+    """
+    seed_cols = ['z', 'LA', 'a', 'g', 'h', 'e', 't', 'n', 's', 'e+', 'people']
+    district_seed = seed[seed_cols].sort_values('LA', kind='stable').reset_index(drop=True)
+    districts = np.arange(1, district_upper_limit)
+    starts = np.searchsorted(district_seed['LA'].values, districts, side='left')
+    stops = np.searchsorted(district_seed['LA'].values, districts, side='right')
+    z_hhr_ag_control_by_d = _slice_by_district(z_hhr_ag_control, ['z', 'a', 'g', 'people'])
+    z_hhr_h_control_by_d = _slice_by_district(z_hhr_h_control, ['z', 'h', 'people'])
+    z_hhr_t_control_by_d = _slice_by_district(z_hhr_t_control, ['z', 't', 'people'])
+    LA_hhr_s_control_by_d = _slice_by_district(LA_hhr_s_control, ['LA', 's', 'people'])
+    LA_hhr_ageplus_control_by_d = _slice_by_district(LA_hhr_ageplus_control, ['LA', 'a', 'g', 'e+', 'people'])
+
+    kwarg_list = list()
+    for district, start, stop in zip(districts, starts, stops):
+        kwarg_list.append({
+            "seed_rows": (int(start), int(stop)),
+            "ctrl_zag": z_hhr_ag_control_by_d[district],
+            "ctrl_zh": z_hhr_h_control_by_d[district],
+            "ctrl_zt": z_hhr_t_control_by_d[district],
+            "ctrl_ds": LA_hhr_s_control_by_d[district],
+            "ctrl_dageplus": LA_hhr_ageplus_control_by_d[district],
+        })
+    return district_seed, kwarg_list
+
+
+def _ipf_districts(district_seed, kwarg_list, process_count=lu_constants.PROCESS_COUNT):
+    """
+    Runs ipf_district() for every district, from the sorted seed and kwargs
+    of _district_ipf_kwargs().
+
+    The seed is put in shared memory once, rather than pickled into every
+    district's task. Returns the furnessed seed of each district, in the
+    order of kwarg_list.
+    """
+    return mp.multiprocess(
+        fn=ipf_district,
+        kwargs=kwarg_list,
+        shared_kwargs={'seed': district_seed},
+        process_count=process_count,
+        in_order=True,
+    )
+
+
+def _export_furness_hhr_inputs(by_lu_obj,
+                               district_seed,
+                               kwarg_list,
+                               z_hhr_ag_control,
+                               z_hhr_h_control,
+                               z_hhr_t_control,
+                               LA_hhr_s_control,
+                               LA_hhr_ageplus_control):
+    """
+    Writes the 3.2.7 control files, and the seed and control files for each
+    district, to the ipf sub folders of the 3.2.7 process folder.
+    """
+    furness_process_path = os.path.join(by_lu_obj.out_paths['write_folder'], process_dir, furness_hhr_dir)
+    full_controls = [
+        (LA_hhr_ageplus_control, '05_ctrl_dageplus', '_ctrl_dageplus'),
+        (LA_hhr_s_control, '04_ctrl_ds', '_ctrl_ds'),
+        (z_hhr_ag_control, '01_ctrl_zag', '_ctrl_zag'),
+        (z_hhr_h_control, '02_ctrl_zh', '_ctrl_zh'),
+        (z_hhr_t_control, '03_ctrl_zt', '_ctrl_zt'),
+    ]
+    for control, sub_folder, file_name in full_controls:
+        control.to_csv(os.path.join(furness_process_path, sub_folder, ''.join([ModelYear, file_name, '.csv'])))
+
+    district_files = {
+        'seed': ('00_seed', 'seed_d'),
+        'ctrl_zag': ('01_ctrl_zag', 'ctrl_zag_d'),
+        'ctrl_zh': ('02_ctrl_zh', 'ctrl_zh_d'),
+        'ctrl_zt': ('03_ctrl_zt', 'ctrl_zt_d'),
+        'ctrl_ds': ('04_ctrl_ds', 'ctrl_ds_d'),
+        'ctrl_dageplus': ('05_ctrl_dageplus', 'ctrl_dageplus_d'),
+    }
+    for district, district_kwargs in enumerate(kwarg_list, start=1):
+        dist_str = str(district)
+        start, stop = district_kwargs['seed_rows']
+        district_inputs = {'seed': district_seed.iloc[start:stop], **district_kwargs}
+        for key, (sub_folder, file_name) in district_files.items():
+            district_path = os.path.join(furness_process_path,
+                                         sub_folder,
+                                         '_'.join([ModelYear, file_name, dist_str, '.csv']))
+            district_inputs[key].to_csv(district_path, index=False)
+        # Print out every tenth row to check on progress
+        if district / 10 == district // 10:
+            print(district)
+
+
+def ipf_district(
+        seed,
+        ctrl_zag,
+        ctrl_zh,
+        ctrl_zt,
+        ctrl_ds,
+        ctrl_dageplus,
+        seed_rows=None
 ):
-    seed = pd.read_csv(seed_path)
+    # seed_rows are the (start, stop) rows of seed holding the district, when
+    # seed is the shared seed of every district from _district_ipf_kwargs()
+    if seed_rows is not None:
+        seed = seed.iloc[seed_rows[0]:seed_rows[1]].reset_index(drop=True)
     seed_cols = ['z', 'LA', 'a', 'g', 'h', 'e', 't', 'n', 's', 'e+', 'people']
     seed = seed[seed_cols]
-    ctrl_zag = pd.read_csv(ctrl_zag_path)
-    ctrl_zh = pd.read_csv(ctrl_zh_path)
-    ctrl_zt = pd.read_csv(ctrl_zt_path)
-    ctrl_ds = pd.read_csv(ctrl_ds_path)
-    ctrl_dageplus = pd.read_csv(ctrl_dageplus_path)
+    # Districts without any seed rows have nothing to furness, and the ipf
+    # can't be set up without them
+    if len(seed) == 0:
+        logging.info('District %s has no seed rows, so is not furnessed. Its controls hold %s people'
+                     % (', '.join(str(x) for x in ctrl_ds['LA'].unique()), ctrl_ds['people'].sum()))
+        return seed.copy()
     # prepare marginals
     ctrl_zag = ctrl_zag.groupby(['z', 'a', 'g'])['people'].sum()
     ctrl_zh = ctrl_zh.groupby(['z', 'h'])['people'].sum()
@@ -2955,9 +2836,28 @@ def ipf_process(
         value_col="people",
         max_iterations=5000,
         tol=1e-9,
-        min_tol_rate=1e-9,
-        show_pbar=False)
-    # logging.info('The iteration and convergence for district ' + dist_str + ' is: ', iters, conv)
+        min_tol_rate=1e-9)
+    logging.info('The iteration and convergence for district %s is: %d, %s'
+                 % (', '.join(str(x) for x in seed['LA'].unique()), iters, conv[-1]))
+    return furnessed_df
+
+
+def ipf_process(
+        seed_path,
+        ctrl_zag_path,
+        ctrl_zh_path,
+        ctrl_zt_path,
+        ctrl_ds_path,
+        ctrl_dageplus_path,
+        output_path
+):
+    # Re-runs a single district from the files written by furness_hhr(export_district_files=True)
+    furnessed_df = ipf_district(seed=pd.read_csv(seed_path),
+                                ctrl_zag=pd.read_csv(ctrl_zag_path),
+                                ctrl_zh=pd.read_csv(ctrl_zh_path),
+                                ctrl_zt=pd.read_csv(ctrl_zt_path),
+                                ctrl_ds=pd.read_csv(ctrl_ds_path),
+                                ctrl_dageplus=pd.read_csv(ctrl_dageplus_path))
     furnessed_df.to_csv(output_path, index=False)
 
 
@@ -3177,7 +3077,6 @@ def combine_hhr_cer(by_lu_obj):
     logging.info('Total pop (by z, a, g, h, e, n, s) dumped')
     os.chdir(pre_3_2_8_dir)
 
-    by_lu_obj.state['3.2.8 adjust zonal pop with full dimensions'] = 1
     logging.info('Step 3.2.8 completed')
     logging.info('If undertaking a full run through of the Base Year LU process,')
     logging.info('then this should have been the last function to run.')
@@ -3283,3 +3182,73 @@ def process_cer_data(by_lu_obj, hhpop_combined_from_3_2_8, la_2_z_from_3_2_8):
         text_file.write(audit_3_2_8_CER_content)
 
     return cer_pop_expanded
+
+
+def furness_district_tests(n_zones=5, process_count=2):
+    """
+    Checks furnessing districts with the seed in shared memory matches
+    furnessing each district on its own, and that districts without seed
+    rows are skipped.
+    """
+    print("Running base_year_population_process.py district furness tests...")
+    seed_parts = list()
+    control_parts = collections.defaultdict(list)
+    control_dims = {
+        'zag': ['z', 'a', 'g'],
+        'zh': ['z', 'h'],
+        'zt': ['z', 't'],
+        'ds': ['LA', 's'],
+        'dageplus': ['LA', 'a', 'g', 'e+'],
+    }
+    # District 2 has controls but no seed, district 4 has neither
+    for district in [1, 2, 3]:
+        district_seed, marginals = ipfn._build_test_inputs(n_zones=n_zones, seed=district)
+        district_seed['z'] += district * 100
+        district_seed['LA'] = district
+        district_seed['n'] = 1
+        for name, marginal in zip(control_dims, marginals):
+            control = marginal.reset_index()
+            if 'z' in control:
+                control['z'] += district * 100
+            control['LA'] = district
+            control_parts[name].append(control)
+        if district != 2:
+            seed_parts.append(district_seed)
+
+    seed = pd.concat(seed_parts, ignore_index=True)
+    controls = {name: pd.concat(parts, ignore_index=True) for name, parts in control_parts.items()}
+    district_seed, kwarg_list = _district_ipf_kwargs(seed,
+                                                     controls['zag'],
+                                                     controls['zh'],
+                                                     controls['zt'],
+                                                     controls['ds'],
+                                                     controls['dageplus'],
+                                                     district_upper_limit=5)
+    furnessed = _ipf_districts(district_seed, kwarg_list, process_count=process_count)
+    looped = mp.multiprocess(ipf_district,
+                             kwargs=kwarg_list,
+                             shared_kwargs={'seed': district_seed},
+                             process_count=0)
+    for shared, loop in zip(furnessed, looped):
+        pd.testing.assert_frame_equal(shared, loop)
+
+    assert len(furnessed) == 4
+    assert len(furnessed[1]) == 0 and len(furnessed[3]) == 0
+    for district in [1, 3]:
+        district_seed = seed.loc[seed['LA'] == district].reset_index(drop=True)
+        expected, _, _ = ipfn.ipf_dataframe(
+            seed_df=district_seed[list(furnessed[district - 1])],
+            target_marginals=[
+                controls[name].loc[controls[name]['LA'] == district].groupby(dims)['people'].sum()
+                for name, dims in control_dims.items()
+            ],
+            value_col='people',
+            max_iterations=5000,
+            tol=1e-9,
+            min_tol_rate=1e-9)
+        pd.testing.assert_frame_equal(furnessed[district - 1], expected)
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    furness_district_tests()
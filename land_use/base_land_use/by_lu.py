@@ -1,7 +1,9 @@
 import logging
 import os
+import functools
 from land_use import lu_constants
 from land_use.utils import file_ops
+from land_use.utils import step_graph
 from land_use.base_land_use import base_year_population_process, employment, DDG_process
 
 
@@ -68,13 +70,6 @@ class BaseYearLandUse:
         # Report folder not currently in use.
         # report_folder = os.path.join(write_folder, 'reports')
 
-        # TODO: Implement this way of checking state
-        self.step_keys = lu_constants.BY_POP_BUILD_STEPS
-
-        self.step_descs = lu_constants.BY_POP_BUILD_STEP_DESCS
-        
-        # self._check_state()
-
         list_of_type_folders = ['01 Process', '02 Audits']
         # '03 Outputs' will also be a directory at this level,
         # but does not have the step sub-directories
@@ -132,33 +127,204 @@ class BaseYearLandUse:
             'emp_write_path': emp_write_name
         }
 
-        # Establish a state dictionary recording which steps have been run
-        # These are aligned with the section numbers in the documentation
-        # TODO: enable a way to init from a point part way through the process
-
-        self.state = {
-            '3.2.1 Read in core property data': 0,
-            '3.2.2 Filled property adjustment': 0,
-            '3.2.3 Household occupancy adjustment': 0,
-            '3.2.4 Property type mapping': 0,
-            '3.2.5 Adjust Base Year population according to Base Year MYPE': 0,
-            '3.2.6 Expand NTEM population to full dimensions': 0,
-            '3.2.7 Furness household population according to control values': 0,
-            '3.2.8 Combine HHR with CER to form total population': 0,
-            '3.2.9 Process DDG data': 0
-        }
         # YZ--for DDG aligned process, NorCOM import step is skipped
         self.norcom = 'skip NorCOM'
         # self.norcom = 'export to NorCOM'
         # self.norcom = 'import from NorCOM'
 
-    def build_by_pop(self):
+        # The build steps, and the fingerprints of those that have been run
+        # These are aligned with the section numbers in the documentation
+        self.pop_steps = step_graph.StepGraph(
+            steps=self._pop_build_steps(),
+            state_path=os.path.join(write_folder, '00 Logging', 'base_year_pop_state.json'),
+        )
+
+    def _pop_build_steps(self):
+        """
+        Declares the steps of the base year population build.
+
+        Each step lists the steps it reads the outputs of, the files it reads
+        from the import folders, and the files it writes. Changing any of these
+        makes the step, and all of those that follow it, stale.
+        """
+        bypp = base_year_population_process
+        model_year = bypp.ModelYear
+        zoning = self.model_zoning.lower()
+        descs = dict(zip(lu_constants.BY_POP_BUILD_STEPS, lu_constants.BY_POP_BUILD_STEP_DESCS))
+
+        def step_path(folder_type, step_dir, name):
+            return os.path.join(self.out_paths['write_folder'], folder_type, step_dir, name)
+
+        def process_path(step_dir, name):
+            return step_path(bypp.process_dir, step_dir, name)
+
+        mye_inputs = [
+            bypp.scottish_data_directory,
+            bypp.geography_directory,
+            bypp.lookups_directory,
+            bypp.inputs_directory_mye,
+            bypp.inputs_directory_aps,
+            os.path.join(bypp.inputs_directory_census, bypp.qs101_uk_path),
+            os.path.join(bypp.la_to_msoa_directory, bypp.la_to_msoa_path),
+        ]
+        common_params = {
+            'base_year': self.base_year,
+            'model_year': model_year,
+            'model_zoning': self.model_zoning,
+        }
+
+        return [
+            step_graph.BuildStep(
+                key='3.2.1',
+                desc=descs['3.2.1'],
+                fn=bypp.copy_addressbase_files,
+                outputs=[step_path(bypp.audit_dir, bypp.copy_address_database_dir,
+                                   'Audit_3.2.1_%s.txt' % model_year)],
+            ),
+            step_graph.BuildStep(
+                key='3.2.2',
+                desc=descs['3.2.2'],
+                fn=bypp.filled_properties,
+                inputs=[self.ks401path, self.zone_translation_path, bypp._default_msoaRef],
+                outputs=[process_path(bypp.filled_properties_dir,
+                                      '_'.join(['gb_msoa', model_year, 'dwells_occ.csv']))],
+                params=common_params,
+            ),
+            step_graph.BuildStep(
+                key='3.2.3',
+                desc=descs['3.2.3'],
+                fn=bypp.apply_household_occupancy,
+                depends_on=['3.2.1', '3.2.2'],
+                inputs=[
+                    self.import_folder + 'Nomis Census 2011 Head & Household',
+                    self.import_folder + 'HOPs/hops_growth_factors.csv',
+                    self.zones_folder + 'Export/lad_to_msoa/lad_to_msoa.csv',
+                    lu_constants.ALL_RES_PROPERTY_PATH + '/allResProperty' + self.model_zoning + 'Classified.csv',
+                    bypp._default_lsoaRef,
+                    bypp._default_ladRef,
+                    bypp._default_msoaRef,
+                ],
+                outputs=[process_path(bypp.apply_household_occupancy_dir,
+                                      '_'.join(['resi_gb', zoning, 'prt', model_year, 'dwells+pop.csv']))],
+                params=common_params,
+            ),
+            step_graph.BuildStep(
+                key='3.2.4',
+                desc=descs['3.2.4'],
+                fn=bypp.property_type_mapping,
+                depends_on=['3.2.3'],
+                outputs=[process_path(bypp.land_use_formatting_dir,
+                                      '_'.join(['resi_gb', zoning, 'agg_prt', model_year, 'dwells+pop.csv']))],
+                params=common_params,
+            ),
+            # MYE compilation only reads imports, so runs alongside 3.2.2 to 3.2.4
+            step_graph.BuildStep(
+                key='3.2.5 MYE',
+                desc='Compile Base Year MYE and APS population',
+                fn=bypp.mye_aps_compiled,
+                inputs=mye_inputs,
+                outputs=[process_path(bypp.mye_pop_compiled_dir,
+                                      '_'.join(['gb', zoning, model_year, 'pop+hh_pop.csv']))],
+                params=common_params,
+            ),
+            step_graph.BuildStep(
+                key='3.2.5',
+                desc=descs['3.2.5'],
+                fn=functools.partial(bypp.mye_pop_compiled, read_base_year_pop_msoa_path_file=True),
+                # Re-runs and re-writes 3.2.4 internally, so can't run alongside it
+                depends_on=['3.2.4', '3.2.5 MYE'],
+                inputs=[
+                    self.CTripEnd_Database_path,
+                    self.zones_folder + 'Export/ntem_to_msoa/ntem_msoa_pop_weighted_lookup.csv',
+                    self.import_folder + 'CTripEnd/Pop_Segmentations.csv',
+                    bypp._default_msoaRef,
+                ],
+                outputs=[
+                    process_path(bypp.mye_pop_compiled_dir, '_'.join(['gb_msoa_agg_prt', model_year, 'hh_pop.csv'])),
+                    process_path(bypp.mye_pop_compiled_dir,
+                                 '_'.join(['ntem_gb_msoa_ntem_tt', model_year, 'mye_pop']) + lu_constants.COMPRESSION_SUFFIX),
+                ],
+                params=common_params,
+            ),
+            step_graph.BuildStep(
+                key='3.2.6',
+                desc=descs['3.2.6'],
+                fn=bypp.pop_with_full_dimensions,
+                depends_on=['3.2.5'],
+                inputs=[
+                    os.path.join(self.import_folder, bypp._census_f_value_path),
+                    os.path.join(self.import_folder, bypp._Zone_2021LA_path),
+                ],
+                outputs=[process_path(bypp.pop_with_full_dims_dir,
+                                      '_'.join(['gb_lad', zoning, 'tfn_tt_agg_prt', model_year, 'hh_pop'])
+                                      + lu_constants.COMPRESSION_SUFFIX)],
+                params=dict(common_params, norcom=self.norcom),
+            ),
+            step_graph.BuildStep(
+                key='3.2.7',
+                desc=descs['3.2.7'],
+                fn=bypp.furness_hhr,
+                depends_on=['3.2.5', '3.2.6'],
+                inputs=mye_inputs + [
+                    os.path.join(self.import_folder, bypp._Zone_2021LA_path),
+                    bypp.normits_seg_to_tfn_tt_file,
+                ],
+                outputs=[process_path(bypp.furness_hhr_dir,
+                                      '_'.join(['gb_z_aghetns', model_year, '_hh_pop'])
+                                      + lu_constants.COMPRESSION_SUFFIX)],
+                params=common_params,
+                # Furnesses each district in its own process
+                parallel_safe=False,
+            ),
+            step_graph.BuildStep(
+                key='3.2.8',
+                desc=descs['3.2.8'],
+                fn=bypp.combine_hhr_cer,
+                depends_on=['3.2.5', '3.2.7'],
+                inputs=[
+                    os.path.join(bypp.inputs_directory_mye, bypp.nomis_mye_path),
+                    bypp.normits_seg_to_tfn_tt_file,
+                ],
+                outputs=[step_path(bypp.output_dir, '',
+                                   '_'.join(['output_5_gb_msoa_tfntt_t', model_year, 'tot_pop'])
+                                   + lu_constants.COMPRESSION_SUFFIX)],
+                params=common_params,
+            ),
+            step_graph.BuildStep(
+                key='3.2.9',
+                desc=descs['3.2.9'],
+                fn=DDG_process.DDGaligned_pop_process,
+                depends_on=['3.2.8'],
+                inputs=[
+                    DDG_process.DDG_directory,
+                    os.path.join(self.import_folder, DDG_process._Zone_LA_path),
+                    DDG_process.normits_seg_to_tfn_tt_file,
+                ],
+                outputs=[step_path(bypp.output_dir, '',
+                                   '_'.join(['output_7_DDG_gb_msoa_tfntt_t', DDG_process.ModelYear, 'pop'])
+                                   + lu_constants.COMPRESSION_SUFFIX)],
+                params=dict(common_params, scenario=DDG_process.Scen, cas_scenario=DDG_process.CAS_Scen),
+            ),
+        ]
+
+    def build_by_pop(self, force=None, process_count=lu_constants.PROCESS_COUNT):
         # TODO: Method name, this is more of an adjustment to a base now
         """
+        Runs the stale steps of the base year population build, 3.2.1 to 3.2.8.
+
+        Parameters
+        ----------
+        force:
+            Keys of steps to rerun even if they are up to date. The steps
+            after them are rerun too.
+
+        process_count:
+            The number of processes to run independent steps in.
 
         Returns
         -------
-
+        run_steps:
+            The keys of the steps that were run.
         """
         # Check which parts of the process need running
         # Make a new sub folder of the home directory for the iteration and set this as the working directory
@@ -182,78 +348,13 @@ class BaseYearLandUse:
 
 
         # TODO: Check that this picks up the 2011 process!
+        return self.pop_steps.run(self, targets=['3.2.8'], force=force, process_count=process_count)
 
-        # TODO: Change from copy to check imports
-        # Run through the Base Year Build process
-        # Steps from main build
-        # TODO: Decide if this is used for anything anymore
-        if self.state['3.2.1 Read in core property data'] == 0:
-            logging.info('')
-            logging.info('\n' + '=' * 75)
-            logging.info('Running step 3.2.1, reading in core property data')
-            print('\n' + '=' * 75)
-            base_year_population_process.copy_addressbase_files(self)
-
-        if self.state['3.2.2 Filled property adjustment'] == 0:
-            logging.info('')
-            logging.info('\n' + '=' * 75)
-            logging.info('Running step 3.2.2, calculating the filled property adjustment factors')
-            print('\n' + '=' * 75)
-            base_year_population_process.filled_properties(self)
-
-        if self.state['3.2.3 Household occupancy adjustment'] == 0:
-            logging.info('')
-            logging.info('\n' + '=' * 75)
-            print('\n' + '=' * 75)
-            logging.info('Running step 3.2.3, household occupancy adjustment')
-            base_year_population_process.apply_household_occupancy(self)
-
-        if self.state['3.2.4 Property type mapping'] == 0:
-            logging.info('')
-            logging.info('\n' + '=' * 75)
-            print('\n' + '=' * 75)
-            logging.info('Running step 3.2.4, combining flat types')
-            base_year_population_process.property_type_mapping(self)
-
-        if self.state['3.2.5 Adjust Base Year population according to Base Year MYPE'] == 0:
-            logging.info('')
-            logging.info('\n' + '=' * 75)
-            print('\n' + '=' * 75)
-            logging.info('Running step 3.2.5, adjust 2018 population according to 2018 MYPE')
-            base_year_population_process.mye_pop_compiled(self)
-
-        if self.state['3.2.6 Expand NTEM population to full dimensions'] == 0:
-            logging.info('')
-            logging.info('\n' + '=' * 75)
-            print('\n' + '=' * 75)
-            logging.info('Running step 3.2.6, expand NTEM population to full dimensions')
-            base_year_population_process.pop_with_full_dimensions(self)
-
-        if self.state['3.2.7 Furness household population according to control values'] == 0:
-            logging.info('')
-            logging.info('\n' + '=' * 75)
-            print('\n' + '=' * 75)
-            logging.info('Running step 3.2.7, furness household population according to control values')
-            base_year_population_process.furness_hhr(self)
-
-        if self.state['3.2.8 Combine HHR with CER to form total population'] == 0:
-            logging.info('')
-            logging.info('\n' + '=' * 75)
-            print('\n' + '=' * 75)
-            logging.info('Running step 3.2.9, combine HHR with CER to form total population')
-            base_year_population_process.combine_hhr_cer(self)
-
-
-        # Step 3.2.11 should always be called from Step 3.2.10 (to save read/writing massive files)
-        # Syntax for calling it is maintained here (albeit commented out) for QA purposes
-        # if self.state['3.2.11 process CER data'] == 0:
-        #     logging.info('')
-        #     logging.info('=========================================================================')
-        #     print('\n' + '=' * 75)
-        #     logging.info('Running step 3.2.11, process CER data')
-        #     BaseYear2018_population_process.process_cer_data(self, hhpop_combined_from_3_2_10, la_2_z_from_3_2_10)
-
-    def build_by_pop_DDG(self):
+    def build_by_pop_DDG(self, force=None, process_count=lu_constants.PROCESS_COUNT):
+        """
+        Runs step 3.2.9, aligning the population with the DDG, and any stale
+        steps before it. See build_by_pop() for the parameters.
+        """
         os.chdir(self.model_folder)
         file_ops.create_folder(self.iteration, ch_dir=True)
         os.chdir('00 Logging')
@@ -272,37 +373,7 @@ class BaseYearLandUse:
                             level=logging.INFO,
                             format='%(asctime)s: %(message)s')
 
-        if self.state['3.2.9 Process DDG data'] == 0:
-            logging.info('')
-            logging.info('\n' + '=' * 75)
-            print('\n' + '=' * 75)
-            logging.info('Running step 3.2.9, adjust zonal pop to be aligned with DDG')
-            DDG_process.DDGaligned_pop_process(self)
-            #DDG_pop_process.DDGaligned_pop_process(self)
-
-    def _check_state(self,
-                     step_key: str = None):
-        """
-        Check state function, in development.
-        """
-        if step_key in self.step_keys:
-            check = 1  # TODO: Check run status
-            self.status[self.step_key]['status'] = check
-
-        else:
-            state_dict = dict()
-            # TODO: Derive from another step list
-
-            for step in range(0, len(self.step_keys)):
-                state_dict.update(
-                    {self.step_keys[step]: {'desc': self.steps_descs[step],
-                                            'status': 0}})
-
-            for step, dat in state_dict.iteritems():
-                # Pull from key
-                self.status[self.step_key]['status'] = self._check_state(step)
-
-        pass
+        return self.pop_steps.run(self, targets=['3.2.9'], force=force, process_count=process_count)
 
     def build_by_emp(self):
         """
@@ -33,6 +33,10 @@ import geopandas as gpd
 
 from shapely.geometry import *
 
+from land_use import geodata
+from land_use.utils import rules
+from land_use.abp_processing import spatial
+
 
 # default file paths
 _default_iter = 'iter4'
@@ -133,7 +137,7 @@ def CountListShp(shp=_default_zoning_path, idCol=None):
     Go and fetch a shape and return a count and a list of unq values 
     and get a count of zones. Useful for audits later.
     """
-    shp = gpd.read_file(shp)
+    shp = geodata.read_attributes(shp)
     if idCol is None:
         idCol=list(shp)[0]
     shp = shp.loc[:,idCol]
@@ -247,9 +251,9 @@ def GeoEnable(ABPFile, XYcols = ['X_COORDINATE', 'Y_COORDINATE']):
     Great to have - no longer needed for this as we have the ONS lookup - 
     may move to utils
     """
-    ABPFile['Coordinates'] = list(zip(ABPFile[XYcols[0]], ABPFile[XYcols[1]]))
-    # if successful? don't want it doing this otherwise
-    ABPFile['Coordinates'] = ABPFile['Coordinates'].apply(Point)
+    # Build all the points at once, rather than a Point per row
+    ABPFile['Coordinates'] = spatial.points_from_coordinates(
+        ABPFile[XYcols[0]], ABPFile[XYcols[1]])
     ABPFile = gpd.GeoDataFrame(ABPFile, geometry='Coordinates')
     ABPFile.drop(['X_COORDINATE', 'Y_COORDINATE'], axis=1)
     ABPFile.crs = nf.osgbCrs
@@ -260,15 +264,15 @@ def SubsetBuild(ABPFile, subsetShape):
 
     """
     Function to subset a zonal dataframe by a given shapefile
-    gpd.sjoin is super inefficient and this may need rewriting to go by line
-    This could also just live in utils
+    Points are assigned to subset zones with a bulk STRtree query, points
+    on a boundary between zones are kept once, in the first zone
     """
 
-    subsetShape = gpd.read_file(subsetShape)
+    subsetShape = geodata.read_file(subsetShape)
     ABPFile = GeoEnable(ABPFile)
     # TODO - build a way to make this work using polygon exclusion - 
     # may work already, but check.
-    subsetABP = gpd.sjoin(ABPFile, subsetShape)
+    subsetABP = spatial.ZoneTree(subsetShape).join(ABPFile, how='inner')
     return(subsetABP)
 
 def BuildZoneCorrespondence(ABPFile, writeOut = False, subsetShape = None, \
@@ -370,6 +374,25 @@ def RdCaseWhen(row):
         return(99)
     else:
         return(99)
+
+# Rule tables for Rd06CaseWhen and RdCaseWhen, classifying whole columns
+# at once rather than a row at a time with .apply. The case when
+# functions are kept as the reference for classification_tests()
+RD06_RULES = rules.RuleTable([
+    # if there are more than 4 properties it's purpose built
+    rules.Rule([('property_count', '>=', 4)], 4),
+    # if there's a business there it's a 6
+    rules.Rule([('org_count', '>', 0)], 6),
+    # anything left is probably purpose built
+], default=4)
+
+RD_RULES = rules.RuleTable([
+    # one property is whatever the most common single property is
+    rules.Rule([('property_count', '==', 1)], rules.Column('zpsSP')),
+    # more is whatever the most common multi property is
+    rules.Rule([('property_count', '>', 1)], rules.Column('zpsMP')),
+    # blank and organisation addresses are excluded like everything else
+], default=99)
         
 def ApplyClassificationLogic(allResProperty, logic=None):
     """
@@ -396,7 +419,7 @@ def ApplyClassificationLogic(allResProperty, logic=None):
     rejoin = allResProperty[allResProperty.loc[:, 'CLASSIFICATION_CODE'] != logic]
     
     if logic == 'RD06':
-        scf['census_property_type'] = scf.apply(Rd06CaseWhen, axis=1)
+        scf['census_property_type'] = RD06_RULES.classify(scf)
         scf = scf.drop(['ORGANISATION_NAME', 'DEPARTMENT_NAME', 
                         'SUB_BUILDING_NAME', 'BUILDING_NAME',
                         'BUILDING_NUMBER'], axis=1)
@@ -447,7 +470,7 @@ def ApplyClassificationLogic(allResProperty, logic=None):
         scf = scf.merge(zpsMultiProp, how='left', on='ZoneID')
         del(zpsSingleProp, zpsMultiProp)
         
-        scf['census_property_type'] = scf.apply(RdCaseWhen, axis=1)
+        scf['census_property_type'] = RD_RULES.classify(scf)
         scf = scf.drop(['ORGANISATION_NAME', 'DEPARTMENT_NAME', \
                         'SUB_BUILDING_NAME', 'BUILDING_NAME', \
                         'BUILDING_NUMBER', 'zpsSP', 'zpsMP'], axis=1)
@@ -469,8 +492,8 @@ def ApplyClassificationLogic(allResProperty, logic=None):
     
 def ZonalPropertyCount(RD, 
                        groupingCol=None,
-                       targetLen=CountListShp(shp=_default_zoning_path)[0],
-                       targetZones=CountListShp(shp=_default_zoning_path)[1],
+                       targetLen=None,
+                       targetZones=None,
                        writeOut=False,
                        reportName=''):
     """
@@ -478,7 +501,13 @@ def ZonalPropertyCount(RD,
     Uses the ZoneID cols by default
     Takes grouping variable as a column name
     TODO: Make properly zone agnostic - this will probably break with LSOA
+    targetLen and targetZones default to the zones in _default_zoning_path
     """
+    if targetLen is None or targetZones is None:
+        zoneCount, zones = CountListShp(shp=_default_zoning_path)
+        targetLen = zoneCount if targetLen is None else targetLen
+        targetZones = zones if targetZones is None else targetZones
+
     if groupingCol is None:
         pByZone = RD.groupby(['ZoneID']).count().reindex(['UPRN'],axis=1).reset_index()
     else:
@@ -648,7 +677,7 @@ def PropertyTypeAnalysis(subset = None,
         rejoin = allResProperty[allResProperty.loc[:, 'CLASSIFICATION_CODE'] != logic]
         
         if logic == 'RD06':
-            scf['census_property_type'] = scf.apply(Rd06CaseWhen, axis=1)
+            scf['census_property_type'] = RD06_RULES.classify(scf)
             scf = scf.drop(['ORGANISATION_NAME', 'DEPARTMENT_NAME', 
                             'SUB_BUILDING_NAME', 'BUILDING_NAME',
                             'BUILDING_NUMBER'], axis=1)
@@ -699,7 +728,7 @@ def PropertyTypeAnalysis(subset = None,
             scf = scf.merge(zpsMultiProp, how='left', on='ZoneID')
             del(zpsSingleProp, zpsMultiProp)
             
-            scf['census_property_type'] = scf.apply(RdCaseWhen, axis=1)
+            scf['census_property_type'] = RD_RULES.classify(scf)
             scf = scf.drop(['ORGANISATION_NAME', 'DEPARTMENT_NAME', \
                             'SUB_BUILDING_NAME', 'BUILDING_NAME', \
                             'BUILDING_NUMBER', 'zpsSP', 'zpsMP'], axis=1)
@@ -801,6 +830,15 @@ def ResClassCaseWhen(row):
     else:
         return 'other'
 
+
+# Rule table for ResClassCaseWhen
+RES_CLASS_RULES = rules.RuleTable([
+    rules.Rule([('census_property_type', '==', 0)], 'ignored'),
+    rules.Rule([('census_property_type', '>=', 1),
+                ('census_property_type', '<=', 9)], 'classified'),
+    rules.Rule([('census_property_type', '==', 99)], 'more work required'),
+], default='other')
+
     
 def ClassificationCount(cRD, allResCountPath = _default_home_dir+_default_iter+'/allResCodeCount.csv'):
     """
@@ -825,7 +863,7 @@ def ClassificationCount(cRD, allResCountPath = _default_home_dir+_default_iter+'
 
     compCatCount['pc'] = compCatCount.loc[:,'n']/np.nansum(compCatCount.loc[:,'n'])
         
-    compCatCount['classification_status'] = compCatCount.apply(ResClassCaseWhen, axis=1)
+    compCatCount['classification_status'] = RES_CLASS_RULES.classify(compCatCount)
     
     print(compCatCount.n.sum(), 'properties')
     
@@ -850,7 +888,7 @@ def UprnAudit(defaultZoneName):
     unqUprnLsoa = uprnLookup.loc[:,'lsoa11'].drop_duplicates().reset_index()
   
     lsoaCols = ['objectid', 'lsoa11cd']
-    ukLSOA = gpd.read_file(_default_lsoaRef)
+    ukLSOA = geodata.read_attributes(_default_lsoaRef)
     ukLSOA = ukLSOA.loc[:,lsoaCols]
     auditSet = ukLSOA.merge(unqUprnLsoa, how='outer', left_on='lsoa11cd', right_on='lsoa11')
 
@@ -864,7 +902,7 @@ def UprnAudit(defaultZoneName):
     unqUprnMsoa = uprnLookup.loc[:,'msoa11'].drop_duplicates().reset_index()
 
     msoaCols = ['objectid', 'msoa11cd']
-    ukMSOA = gpd.read_file(_default_msoaRef)
+    ukMSOA = geodata.read_attributes(_default_msoaRef)
     ukMSOA = ukMSOA.loc[:,msoaCols]
     auditSet = ukMSOA.merge(unqUprnMsoa, how='outer', left_on='msoa11cd', right_on='msoa11')
 
@@ -1007,3 +1045,53 @@ def run_abp_prep(project = _default_iter, importFromSQL=False, subset=None, impo
     audits['ZoneID'].drop_duplicates().count()
 
 
+
+
+def classification_tests(n_properties=200000, seed=0):
+    """
+    Checks the rule tables classify a synthetic property set the same as
+    the case when functions, and times both.
+    """
+    import time
+
+    print("Running land_use_data_prep.py classification tests...")
+    rng = np.random.default_rng(seed)
+
+    def maybe_missing(values, share=0.05):
+        values = values.astype(float)
+        values[rng.random(len(values)) < share] = np.nan
+        return values
+
+    properties = pd.DataFrame({
+        'UPRN': np.arange(n_properties),
+        'property_count': maybe_missing(rng.choice([0, 1, 1, 1, 2, 3, 4, 12], n_properties)),
+        'org_count': maybe_missing(rng.choice([0, 0, 0, 1, 2], n_properties)),
+        'ORGANISATION_NAME': rng.choice(['nan', 'Some Business Ltd'], n_properties, p=[0.9, 0.1]),
+        'BUILDING_NAME': rng.choice(['nan', 'Flat 1', 'The Old Mill'], n_properties),
+        'BUILDING_NUMBER': rng.choice(['nan', '1.0', '27.0'], n_properties),
+        'zpsSP': rng.choice([1, 2, 3], n_properties),
+        'zpsMP': rng.choice([4, 5, 6, 7], n_properties),
+        'census_property_type': maybe_missing(rng.choice([0, 1, 2, 4, 8, 9, 10, 99], n_properties)),
+    })
+
+    for name, case_when, rule_table in [('RD06', Rd06CaseWhen, RD06_RULES),
+                                        ('RD', RdCaseWhen, RD_RULES),
+                                        ('status', ResClassCaseWhen, RES_CLASS_RULES)]:
+        start = time.perf_counter()
+        expected = properties.apply(case_when, axis=1)
+        apply_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        achieved = rule_table.classify(properties)
+        rules_time = time.perf_counter() - start
+
+        pd.testing.assert_series_equal(achieved, expected)
+        print('%s: %d properties, apply %.2fs (%.0f/s), rule table %.3fs (%.0f/s)'
+              % (name, n_properties, apply_time, n_properties / apply_time,
+                 rules_time, n_properties / rules_time))
+
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    classification_tests()
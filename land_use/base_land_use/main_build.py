@@ -26,10 +26,10 @@ import sys
 import logging
 import numpy as np
 import pandas as pd
-import geopandas as gpd
 import shutil
 import pyodbc
 import datetime
+from land_use import geodata
 from land_use.utils import file_ops as utils
 from land_use.utils import compress
 import land_use.lu_constants as consts
@@ -93,7 +93,7 @@ def lsoa_census_data_prep(dat_path, population_tables, property_tables, geograph
     property_imports = _read_census_table(property_tables, "properties")
 
     # Read in the geometry
-    geography = gpd.read_file(geography)
+    geography = geodata.read_attributes(geography)
     geography = geography.iloc[:, 0:3]
 
     # Merge the population data, property data and geometry into a single DataFrame: household_occupancy
@@ -204,7 +204,7 @@ def create_employment_segmentation(by_lu_obj, bsq):
     ks_emp = pd.read_csv(ksEmpImportPath)[['msoaZoneID', 'Gender', 'employment_type', 'wap_factor']]
 
     # Change MSOA codes to objectids
-    msoa_shp = gpd.read_file(_default_msoaRef)[['objectid', 'msoa11cd']]
+    msoa_shp = geodata.read_attributes(_default_msoaRef)[['objectid', 'msoa11cd']]
     ks_emp = ks_emp.merge(msoa_shp, how='left', left_on='msoaZoneID', right_on='msoa11cd')
     ks_emp = ks_emp.drop(['msoa11cd', 'msoaZoneID'], axis=1).rename(columns={'objectid': 'msoaZoneID'})
 
@@ -400,8 +400,8 @@ def Process_bsq(by_lu_obj):
     area_types = pd.read_csv(area_type_import_path)
 
     # Shapes
-    mlaShp = gpd.read_file(_default_mladRef)[['objectid', 'cmlad11cd']]
-    msoaShp = gpd.read_file(_default_msoaRef)[['objectid', 'msoa11cd']]
+    mlaShp = geodata.read_attributes(_default_mladRef)[['objectid', 'cmlad11cd']]
+    msoaShp = geodata.read_attributes(_default_msoaRef)[['objectid', 'msoa11cd']]
 
     # Bespoke census query types
     # TODO: make these a dictionary in LU constants
@@ -570,7 +570,7 @@ def filled_properties(by_lu_obj):
     filled_properties_df = filled_properties_df.drop(columns={'Filled_Dwells', 'Total_Dwells'})
 
     # The above filled properties probability is based on E+W so need to join back to Scottish MSOAs
-    uk_msoa = gpd.read_file(_default_msoaRef)[['msoa11cd']].rename(columns={'msoa11cd': 'msoaZoneID'})
+    uk_msoa = geodata.read_attributes(_default_msoaRef)[['msoa11cd']].rename(columns={'msoa11cd': 'msoaZoneID'})
     filled_properties_df = uk_msoa.merge(filled_properties_df, on='msoaZoneID', how='outer')
     filled_properties_df = filled_properties_df.fillna(1)  # default to all Scottish properties being occupied
     filled_properties_df.to_csv('ProbabilityDwellfilled.csv', index=False)
@@ -614,7 +614,7 @@ def apply_household_occupancy(by_lu_obj, do_import=False, write_out=True):
 
     # Visual spot checks - count zones, check cpt
     audit = balanced_cpt_data.groupby(['msoaZoneID']).count().reset_index()
-    uk_msoa = gpd.read_file(_default_msoaRef)[['objectid', 'msoa11cd']]
+    uk_msoa = geodata.read_attributes(_default_msoaRef)[['objectid', 'msoa11cd']]
     print('census hops zones =', audit['msoaZoneID'].drop_duplicates().count(), 'should be', len(uk_msoa))
     print('counts of property type by zone', audit['census_property_type'].drop_duplicates())
 
@@ -629,7 +629,7 @@ def apply_household_occupancy(by_lu_obj, do_import=False, write_out=True):
     balanced_cpt_data = balanced_cpt_data.merge(lad_translation, how='left', on='msoaZoneID')
 
     # Join LAD code
-    uk_lad = gpd.read_file(_default_ladRef)[['objectid', 'lad17cd']]
+    uk_lad = geodata.read_attributes(_default_ladRef)[['objectid', 'lad17cd']]
     balanced_cpt_data = balanced_cpt_data.merge(uk_lad, how='left', left_on='ladZoneID', right_on='objectid')
 
     # Check the join
@@ -720,7 +720,7 @@ def apply_ntem_segments(by_lu_obj, classified_res_property_import_path='classifi
     # Read NTEM hh pop at NorMITs Zone level and make sure the zonal total is consistent to crp
     NTEM_HHpop = NTEM_Pop_Interpolation(by_lu_obj)
 
-    uk_msoa = gpd.read_file(_default_msoaRef)[['objectid', 'msoa11cd']]
+    uk_msoa = geodata.read_attributes(_default_msoaRef)[['objectid', 'msoa11cd']]
     NTEM_HHpop = NTEM_HHpop.merge(uk_msoa, how='left', left_on='msoaZoneID', right_on='objectid')
     NTEM_HHpop_cols = ['msoaZoneID', 'msoa11cd', 'AreaType', 'Borough', 'TravellerType','NTEM_TT_Name', 'Age_code',
                        'Age', 'Gender_code', 'Gender','Household_composition_code', 'Household_size', 'Household_car',
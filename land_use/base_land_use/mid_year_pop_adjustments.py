@@ -26,6 +26,7 @@ import pandas as pd
 import geopandas as gpd
 import gc
 import logging
+from land_use import geodata
 from land_use.utils import compress
 
 # Outputs from previous steps
@@ -49,7 +50,7 @@ _emp_controls = 'NPR Segmentation/raw data and lookups/LAD labour market data/No
 _ladsoc_control = 'NPR Segmentation/raw data and lookups/LAD labour market data/nomis_lad_SOC2018_constraints.csv'
 
 
-def format_scottish_mype(by_lu_obj):
+def format_scottish_mype(by_lu_obj, land_use_segments=None, lad_translation=None, uk_lad=None):
     """
     getting Scottish MYPE into the right format - 'melt' to get columns as rows, then rename them
     This should be a standard from any MYPE in the future segmented into females and males.
@@ -57,24 +58,30 @@ def format_scottish_mype(by_lu_obj):
     
     Parameters
     ----------
+    land_use_segments, lad_translation, uk_lad:
+        The land use segments, LAD to MSOA translation and LAD shapefile,
+        if they have already been read. Read if None.
 
     Returns
     ----------
     Scot_adjust- one formatted DataFrame of new Scottish MYPE including population
     split by age and gender by MSOA
     """
-    land_use_segments = compress.read_in(by_lu_obj.home_folder + _landuse_segments)
+    if land_use_segments is None:
+        land_use_segments = compress.read_in(by_lu_obj.home_folder + _landuse_segments)
 
     # Translation from LAD to MSOAs
-    lad_translation = pd.read_csv(by_lu_obj.zones_folder + _default_lad_translation)
+    if lad_translation is None:
+        lad_translation = pd.read_csv(by_lu_obj.zones_folder + _default_lad_translation)
     lad_translation = lad_translation.rename(columns={'lad_zone_id': 'ladZoneID'})
     lad_cols = ['objectid', 'lad17cd']
-    uk_lad = gpd.read_file(_default_ladRef)
+    if uk_lad is None:
+        uk_lad = geodata.read_attributes(_default_ladRef)
     uk_lad = uk_lad.loc[:, lad_cols]
 
     scot_females = pd.read_csv(by_lu_obj.import_folder + _mypeScot_females)
     scot_males = pd.read_csv(by_lu_obj.import_folder + _mypeScot_males)
-    scot_mype = scot_males.append(scot_females)
+    scot_mype = pd.concat([scot_males, scot_females])
     scot_mype = scot_mype.rename(columns={'Area code': 'lad17cd'})
     scot_mype = pd.melt(scot_mype, id_vars=['lad17cd', 'Gender'], value_vars=['under 16', '16-74', '75 or over'])
     scot_mype = scot_mype.rename(columns={'variable': 'Age', 'value': '2018pop'})
@@ -96,7 +103,7 @@ def format_scottish_mype(by_lu_obj):
     scotland_use = land_use_segments[land_use_segments.ZoneID.str.startswith('S')]
 
     scotland_use_grouped = scotland_use.groupby(by=['ZoneID', 'Age', 'Gender'],
-                                                as_index=False).sum().drop(columns={'area_type',
+                                                as_index=False).sum(numeric_only=True).drop(columns={'area_type',
                                                                                     'household_composition',
                                                                                     'property_type'})
 
@@ -132,7 +139,7 @@ def get_ew_population(by_lu_obj):
     mype_males = pd.read_csv(by_lu_obj.import_folder + _mype_males)
     mype_females = pd.read_csv(by_lu_obj.import_folder + _mype_females)
 
-    mype = mype_males.append(mype_females)
+    mype = pd.concat([mype_males, mype_females])
     mype = mype.rename(columns={'Area Codes': 'ZoneID'})
     mype = pd.melt(mype, id_vars=['ZoneID', 'gender'], value_vars=['under_16', '16-74', '75 or over'])
     mype = mype.rename(columns={'variable': 'Age', 'value': '2018pop'})
@@ -155,7 +162,7 @@ def get_fy_population():
 
 
 # TODO: include block commenting
-def sort_communal_uplift(by_lu_obj, midyear=True):
+def sort_communal_uplift(by_lu_obj, midyear=True, mype=None):
     """
     Imports a csv of Communal Establishments 2011 and uses MYPE to uplift to MYPE (2018 for now)
     First this function takes the communal establishments and adjust for the people living
@@ -174,6 +181,8 @@ def sort_communal_uplift(by_lu_obj, midyear=True):
     midyear
     by_lu_obj:
         Base year land use object.
+    mype:
+        EW MYPE from get_ew_population(), if it has already been read.
     ----------
     Returns
     ----------
@@ -191,16 +200,17 @@ def sort_communal_uplift(by_lu_obj, midyear=True):
     if midyear:
         # group to ZoneID, Gender, Age to match info from MYPE
         ew_land_use_group = ew_land_use.groupby(by=['ZoneID', 'Gender', 'Age'],
-                                                as_index=False).sum()[['ZoneID', 'Gender', 'Age', 'people']]
+                                                as_index=False).sum(numeric_only=True)[['ZoneID', 'Gender', 'Age', 'people']]
         # get a communal factor calculated
         communal_group = communal.groupby(by=['ZoneID', 'Gender', 'Age'],
-                                          as_index=False).sum()[['ZoneID', 'Gender', 'Age', 'communal']]
+                                          as_index=False).sum(numeric_only=True)[['ZoneID', 'Gender', 'Age', 'communal']]
         com2011 = ew_land_use_group.merge(communal_group, on=['ZoneID', 'Gender', 'Age'])
         com2011['CommunalFactor'] = com2011['communal'] / com2011['people']
         com2011 = com2011.rename(columns={'people': 'Census'})
 
         # uplift communal to MYPE
-        mype = get_ew_population(by_lu_obj)
+        if mype is None:
+            mype = get_ew_population(by_lu_obj)
         mype_adjust = mype.merge(com2011, on=['ZoneID', 'Gender', 'Age'], how='outer')
         mype_adjust['communal_mype'] = mype_adjust['pop'].values * mype_adjust['CommunalFactor'].values
         print('Communal establishments total for new MYPE is ', mype_adjust['communal_mype'].sum())
@@ -225,159 +235,187 @@ def sort_communal_uplift(by_lu_obj, midyear=True):
 
 
 # TODO: include block commenting
-def adjust_landuse_to_specific_yr(by_lu_obj, writeOut=True):
+def specific_yr_land_use(landuse_segments, scot_mype, mype_communal, ewmype):
     """
-    Takes adjusted landuse (after splitting out communal establishments)
+    Adjusts the census land use segments to the MYPE, keeping communal
+    establishments separate.
+
     Parameters
     ----------
-    land use output
-        Path to csv of landuseoutput 2011 with all the segmentation (emp type, soc, ns_sec, gender, hc, prop_type), 
-        to get the splits
+    landuse_segments:
+        Land use by NS-SEC and SOC, from _landuse_segments
+    scot_mype:
+        Scottish MYPE, from format_scottish_mype()
+    mype_communal:
+        Communal establishments uplifted to MYPE, from sort_communal_uplift()
+    ewmype:
+        EW MYPE, from get_ew_population()
 
     Returns
     ----------
-    
+    gb_adjusted:
+        Land use adjusted to the MYPE, by NorMITs segment codes
     """
-    if writeOut:
-        landuse_segments = compress.read_in(by_lu_obj.home_folder + _landuse_segments)
-        landuse_segments = landuse_segments[['ZoneID', 'area_type', 'property_type', 'Age',
-                                             'Gender', 'employment_type', 'ns_sec',
-                                             'household_composition',
-                                             'SOC_category', 'people']].drop_duplicates()
-
-        # TODO: put these normalisation dictionaries in lu_constants
-        gender_nt = {'Male': 2, 'Females': 3, 'Children': 1}
-        age_nt = {'under 16': 1, '16-74': 2, '75 or over': 3}
-        emp_nt = {'fte': 1, 'pte': 2, 'unm': 3, 'stu': 4, 'non_wa': 5}
-
-        # Set inactive SOC category to 0 and normalise the data
-        landuse_segments['SOC_category'] = landuse_segments['SOC_category'].fillna(0)
-        landuse_segments['gender'] = landuse_segments['Gender'].map(gender_nt)
-        landuse_segments['age_code'] = landuse_segments['Age'].map(age_nt)
-        landuse_segments['emp'] = landuse_segments['employment_type'].map(emp_nt)
-        landuse_segments = landuse_segments.drop(columns={'Age', 'Gender', 'employment_type'})
-        landuse_segments = landuse_segments.groupby(by=['ZoneID', 'age_code', 'emp', 'gender', 'SOC_category',
-                                                        'ns_sec', 'area_type', 'property_type',
-                                                        'household_composition'],
-                                                    as_index=False).sum()
-
-        # change to int8 to reduce table size
-        landuse_segments['age_code'] = landuse_segments['age_code'].astype(np.int8)
-        landuse_segments['emp'] = landuse_segments['emp'].astype(np.int8)
-        landuse_segments['gender'] = landuse_segments['gender'].astype(np.int8)
-        landuse_segments['ns_sec'] = landuse_segments['ns_sec'].astype(np.int8)
-        landuse_segments['SOC_category'] = landuse_segments['SOC_category'].astype(np.int8)
-        landuse_segments['area_type'] = landuse_segments['area_type'].astype(np.int8)
-        landuse_segments['household_composition'] = landuse_segments['household_composition'].astype(np.int8)
-        landuse_segments['property_type'] = landuse_segments['property_type'].astype(np.int8)
-
-        # Get the communal establishments removed
-        landuse_no_com = landuse_segments[landuse_segments.property_type != 8]
-        # group by age and gender columns and sum people
-        pop_pc_totals = landuse_no_com.groupby(by=['ZoneID', 'age_code', 'gender'],
-                                               as_index=False).sum()[['ZoneID', 'age_code', 'gender', 'people']]
-
-        # LU SIMPLIFICATION
-        # Build simplified land use for building adjustment factors
-        len_before = len(landuse_no_com)
-        lu_index = list(landuse_no_com)
-        lu_groups = lu_index.copy()
-        lu_groups.remove('people')
-        landuse_no_com = landuse_no_com[lu_index].groupby(lu_groups).sum().reset_index()
-        len_after = len(landuse_no_com)
-        # TODO: logging to file rather than console
-        print('LU length %d before %d after' % (len_before, len_after))
+    landuse_segments = landuse_segments[['ZoneID', 'area_type', 'property_type', 'Age',
+                                         'Gender', 'employment_type', 'ns_sec',
+                                         'household_composition',
+                                         'SOC_category', 'people']].drop_duplicates()
+
+    # TODO: put these normalisation dictionaries in lu_constants
+    gender_nt = {'Male': 2, 'Females': 3, 'Children': 1}
+    age_nt = {'under 16': 1, '16-74': 2, '75 or over': 3}
+    emp_nt = {'fte': 1, 'pte': 2, 'unm': 3, 'stu': 4, 'non_wa': 5}
+
+    # Set inactive SOC category to 0 and normalise the data
+    landuse_segments['SOC_category'] = landuse_segments['SOC_category'].fillna(0)
+    landuse_segments['gender'] = landuse_segments['Gender'].map(gender_nt)
+    landuse_segments['age_code'] = landuse_segments['Age'].map(age_nt)
+    landuse_segments['emp'] = landuse_segments['employment_type'].map(emp_nt)
+    landuse_segments = landuse_segments.drop(columns={'Age', 'Gender', 'employment_type'})
+    landuse_segments = landuse_segments.groupby(by=['ZoneID', 'age_code', 'emp', 'gender', 'SOC_category',
+                                                    'ns_sec', 'area_type', 'property_type',
+                                                    'household_composition'],
+                                                as_index=False).sum()
+
+    # change to int8 to reduce table size
+    landuse_segments['age_code'] = landuse_segments['age_code'].astype(np.int8)
+    landuse_segments['emp'] = landuse_segments['emp'].astype(np.int8)
+    landuse_segments['gender'] = landuse_segments['gender'].astype(np.int8)
+    landuse_segments['ns_sec'] = landuse_segments['ns_sec'].astype(np.int8)
+    landuse_segments['SOC_category'] = landuse_segments['SOC_category'].astype(np.int8)
+    landuse_segments['area_type'] = landuse_segments['area_type'].astype(np.int8)
+    landuse_segments['household_composition'] = landuse_segments['household_composition'].astype(np.int8)
+    landuse_segments['property_type'] = landuse_segments['property_type'].astype(np.int8)
+
+    # Get the communal establishments removed
+    landuse_no_com = landuse_segments[landuse_segments.property_type != 8]
+    # group by age and gender columns and sum people
+    pop_pc_totals = landuse_no_com.groupby(by=['ZoneID', 'age_code', 'gender'],
+                                           as_index=False).sum()[['ZoneID', 'age_code', 'gender', 'people']]
 
-        # Get Scottish Population
-        scot_mype = format_scottish_mype(by_lu_obj)
-        scot_mype = scot_mype[['ZoneID', 'Gender', 'Age', 'pop']]
-        print('Reading in new Scot population data')
+    # LU SIMPLIFICATION
+    # Build simplified land use for building adjustment factors
+    len_before = len(landuse_no_com)
+    lu_index = list(landuse_no_com)
+    lu_groups = lu_index.copy()
+    lu_groups.remove('people')
+    landuse_no_com = landuse_no_com[lu_index].groupby(lu_groups).sum().reset_index()
+    len_after = len(landuse_no_com)
+    # TODO: logging to file rather than console
+    print('LU length %d before %d after' % (len_before, len_after))
 
-        mype_communal = sort_communal_uplift(by_lu_obj)
-        ewmype = get_ew_population(by_lu_obj)
+    scot_mype = scot_mype[['ZoneID', 'Gender', 'Age', 'pop']]
 
-        # adjust mype in EW to get rid of communal
+    # adjust mype in EW to get rid of communal
 
-        ewmype = ewmype.merge(mype_communal, on=['ZoneID', 'Gender', 'Age'])
-        ewmype['newpop'] = ewmype['pop'] - ewmype['communal_mype']
-        ewmype = ewmype[['ZoneID', 'Gender', 'Age', 'newpop']].rename(columns={'newpop': 'pop'})
+    ewmype = ewmype.merge(mype_communal, on=['ZoneID', 'Gender', 'Age'])
+    ewmype['newpop'] = ewmype['pop'] - ewmype['communal_mype']
+    ewmype = ewmype[['ZoneID', 'Gender', 'Age', 'newpop']].rename(columns={'newpop': 'pop'})
 
-        mype_gb = ewmype.append(scot_mype)
-        mype_gb['gender'] = mype_gb['Gender'].map(gender_nt).drop(columns={'Gender'})
-        mype_gb['age_code'] = mype_gb['Age'].map(age_nt).drop(columns={'Age'})
+    mype_gb = pd.concat([ewmype, scot_mype])
+    mype_gb['gender'] = mype_gb['Gender'].map(gender_nt).drop(columns={'Gender'})
+    mype_gb['age_code'] = mype_gb['Age'].map(age_nt).drop(columns={'Age'})
 
-        mype_pops = pop_pc_totals.merge(mype_gb, on=['ZoneID', 'gender', 'age_code'])
-        del scot_mype, ewmype
-        mype_pops['pop_factor'] = mype_pops['pop'] / mype_pops['people']
+    mype_pops = pop_pc_totals.merge(mype_gb, on=['ZoneID', 'gender', 'age_code'])
+    del scot_mype, ewmype
+    mype_pops['pop_factor'] = mype_pops['pop'] / mype_pops['people']
 
-        # mype simplification
-        mype_before = len(mype_pops)
+    # mype simplification
+    mype_before = len(mype_pops)
 
-        mype_index = ['ZoneID', 'gender', 'age_code', 'pop_factor']
-        mype_groups = ['ZoneID', 'gender', 'age_code']
-        mype_pops = mype_pops[mype_index].groupby(mype_groups).sum()
-        mype_pops = mype_pops.reset_index()
+    mype_index = ['ZoneID', 'gender', 'age_code', 'pop_factor']
+    mype_groups = ['ZoneID', 'gender', 'age_code']
+    mype_pops = mype_pops[mype_index].groupby(mype_groups).sum()
+    mype_pops = mype_pops.reset_index()
 
-        mype_after = len(mype_pops)
+    mype_after = len(mype_pops)
 
-        print('MYPE length %d before %d after' % (mype_before, mype_after))
+    print('MYPE length %d before %d after' % (mype_before, mype_after))
 
-        # 1. select relevant categories only - group by categories, sum
-        landuse_simple_cols = ['ZoneID', 'gender', 'age_code', 'people']
-        # TODO: this is v similar to mype_pops minus the factors, so is it needed? Also gets overwritten!
-        landuse_simple = landuse_no_com[landuse_simple_cols].groupby(mype_groups).sum().reset_index()
+    # 1. select relevant categories only - group by categories, sum
+    landuse_simple_cols = ['ZoneID', 'gender', 'age_code', 'people']
+    # TODO: this is v similar to mype_pops minus the factors, so is it needed? Also gets overwritten!
+    landuse_simple = landuse_no_com[landuse_simple_cols].groupby(mype_groups).sum().reset_index()
 
-        landuse = pd.merge(landuse_simple, mype_pops, how='inner', on=['ZoneID', 'gender', 'age_code'])
-        landuse['adj_pop'] = landuse['people'] * landuse['pop_factor']  # adjusted 2018 population
+    landuse = pd.merge(landuse_simple, mype_pops, how='inner', on=['ZoneID', 'gender', 'age_code'])
+    landuse['adj_pop'] = landuse['people'] * landuse['pop_factor']  # adjusted 2018 population
 
-        # Merge adj factors onto main land use build
-        landuse = pd.merge(landuse_no_com, mype_pops, how='inner', on=['ZoneID', 'gender', 'age_code'])
+    # Merge adj factors onto main land use build
+    landuse = pd.merge(landuse_no_com, mype_pops, how='inner', on=['ZoneID', 'gender', 'age_code'])
 
-        landuse['people'] = landuse['people'] * landuse['pop_factor']
-        landuse = landuse.drop(columns={'pop_factor'})
-        landuse_cols = ['ZoneID', 'gender', 'age_code', 'emp', 'SOC_category', 'ns_sec',
-                        'area_type', 'property_type', 'household_composition', 'people']
-        landuse = landuse[landuse_cols]
+    landuse['people'] = landuse['people'] * landuse['pop_factor']
+    landuse = landuse.drop(columns={'pop_factor'})
+    landuse_cols = ['ZoneID', 'gender', 'age_code', 'emp', 'SOC_category', 'ns_sec',
+                    'area_type', 'property_type', 'household_composition', 'people']
+    landuse = landuse[landuse_cols]
 
-        # COMMUNAL ESTABLISHMENTS
-        # Get the communal establishments 
-        landuse_com = landuse_segments[landuse_segments.property_type == 8]
+    # COMMUNAL ESTABLISHMENTS
+    # Get the communal establishments 
+    landuse_com = landuse_segments[landuse_segments.property_type == 8]
 
-        com = sort_communal_uplift(by_lu_obj)
-        com['gender'] = com['Gender'].map(gender_nt)
-        com['age_code'] = com['Age'].map(age_nt)
-        com = com.drop(columns={'Age', 'Gender'})
+    com = mype_communal.copy()
+    com['gender'] = com['Gender'].map(gender_nt)
+    com['age_code'] = com['Age'].map(age_nt)
+    com = com.drop(columns={'Age', 'Gender'})
 
-        pop_pc_comms = landuse_com.groupby(by=['ZoneID', 'age_code', 'gender'],
-                                           as_index=False).sum()[['ZoneID', 'age_code', 'gender', 'people']]
+    pop_pc_comms = landuse_com.groupby(by=['ZoneID', 'age_code', 'gender'],
+                                       as_index=False).sum()[['ZoneID', 'age_code', 'gender', 'people']]
+
+    mye_pops = pop_pc_comms.merge(com, on=['ZoneID', 'gender', 'age_code'])
+    mye_pops['pop_factor'] = mye_pops['communal_mype'] / mye_pops['people']
+    mye_pops = mye_pops.drop(columns={'communal_mype', 'people'})
 
-        mye_pops = pop_pc_comms.merge(com, on=['ZoneID', 'gender', 'age_code'])
-        mye_pops['pop_factor'] = mye_pops['communal_mype'] / mye_pops['people']
-        mye_pops = mye_pops.drop(columns={'communal_mype', 'people'})
-
-        communal_pop = landuse_com.merge(mye_pops, on=['ZoneID', 'gender', 'age_code'])
-        communal_pop['newpop'] = communal_pop['people'] * communal_pop['pop_factor']
-        communal_pop['newpop'].sum()
-
-        communal_pop = communal_pop.drop(columns={'people', 'pop_factor'}).rename(columns={'newpop': 'people'})
-        communal_pop = communal_pop[landuse_cols]
-        # need to retain the missing MSOAs for both population landuse outputs and HOPs  
-        gb_adjusted = landuse.append(communal_pop)
-
-        # checks:
-        # TODO: put these checks into logging file rather than console
-        print('checking for null values:', gb_adjusted.isnull().any())
-        print('Full population for 2018 is now =', gb_adjusted['people'].sum())
-        print('check all MSOAs are present, should be 8480:', gb_adjusted['ZoneID'].drop_duplicates().count())
-        gb_adjusted = gb_adjusted.groupby(by=['ZoneID', 'gender', 'age_code', 'emp', 'SOC_category', 'ns_sec',
-                                              'area_type', 'property_type', 'household_composition']
-                                          , as_index=False).sum()
-        logging.info('Population currently {}'.format(gb_adjusted.people.sum()))
+    communal_pop = landuse_com.merge(mye_pops, on=['ZoneID', 'gender', 'age_code'])
+    communal_pop['newpop'] = communal_pop['people'] * communal_pop['pop_factor']
+    communal_pop['newpop'].sum()
+
+    communal_pop = communal_pop.drop(columns={'people', 'pop_factor'}).rename(columns={'newpop': 'people'})
+    communal_pop = communal_pop[landuse_cols]
+    # need to retain the missing MSOAs for both population landuse outputs and HOPs  
+    gb_adjusted = pd.concat([landuse, communal_pop])
+
+    # checks:
+    # TODO: put these checks into logging file rather than console
+    print('checking for null values:', gb_adjusted.isnull().any())
+    print('Full population for 2018 is now =', gb_adjusted['people'].sum())
+    print('check all MSOAs are present, should be 8480:', gb_adjusted['ZoneID'].drop_duplicates().count())
+    gb_adjusted = gb_adjusted.groupby(by=['ZoneID', 'gender', 'age_code', 'emp', 'SOC_category', 'ns_sec',
+                                          'area_type', 'property_type', 'household_composition']
+                                      , as_index=False).sum()
+    logging.info('Population currently {}'.format(gb_adjusted.people.sum()))
+
+    return gb_adjusted
+
+
+def adjust_landuse_to_specific_yr(by_lu_obj, writeOut=True):
+    """
+    Takes adjusted landuse (after splitting out communal establishments)
+    Parameters
+    ----------
+    land use output
+        Path to csv of landuseoutput 2011 with all the segmentation (emp type, soc, ns_sec, gender, hc, prop_type), 
+        to get the splits
+
+    Returns
+    ----------
+    
+    """
+    if writeOut:
+        landuse_segments = compress.read_in(by_lu_obj.home_folder + _landuse_segments)
+
+        # Get Scottish Population
+        scot_mype = format_scottish_mype(by_lu_obj, land_use_segments=landuse_segments)
+        print('Reading in new Scot population data')
+
+        ewmype = get_ew_population(by_lu_obj)
+        mype_communal = sort_communal_uplift(by_lu_obj, mype=ewmype)
+
+        gb_adjusted = specific_yr_land_use(landuse_segments, scot_mype, mype_communal, ewmype)
         compress.write_out(gb_adjusted, by_lu_obj.home_folder + '/landUseOutputMSOA_2018')
         print('full GB adjusted dataset should be now saved in default iter folder')
 
         # reclaim memory
-        del (communal_pop, pop_pc_comms, mye_pops, landuse_com, com, landuse_segments, len_before, len_after)
+        del landuse_segments, gb_adjusted
         gc.collect()
     else:
         print('FY not set up yet')
@@ -385,7 +423,7 @@ def adjust_landuse_to_specific_yr(by_lu_obj, writeOut=True):
 
 # TODO: rename this function
 # TODO: include block commenting
-def sort_out_hops_uplift(by_lu_obj):
+def sort_out_hops_uplift(by_lu_obj, mype_pop=None):
     """    
     This provides the new household occupancy figures for each property type 
     following MYPE adjustment.
@@ -394,6 +432,8 @@ def sort_out_hops_uplift(by_lu_obj):
     ----------
     allResPropertyZonal calculated from main build
     MYPE population
+    mype_pop:
+        Land use adjusted to the MYPE, read from landUseOutputMSOA_2018 if None
 
     Returns
     ----------
@@ -408,11 +448,12 @@ def sort_out_hops_uplift(by_lu_obj):
     all_res_property_zonal.loc[all_res_property_zonal['census_property_type'] == 7, 'new_prop_type'] = 4
     all_res_property_zonal = all_res_property_zonal.drop(columns='census_property_type')
     all_res_property_zonal = all_res_property_zonal.rename(columns={'new_prop_type': 'property_type'})
-    all_res_property_zonal = all_res_property_zonal.groupby(by=['ZoneID', 'property_type'], as_index=False).sum()
+    all_res_property_zonal = all_res_property_zonal.groupby(by=['ZoneID', 'property_type'], as_index=False).sum(numeric_only=True)
     all_res_property_zonal['household_occupancy_18'] = all_res_property_zonal['population'] / \
                                                        all_res_property_zonal['UPRN']
 
-    mype_pop = compress.read_in(by_lu_obj.home_folder + '/landUseOutputMSOA_2018')
+    if mype_pop is None:
+        mype_pop = compress.read_in(by_lu_obj.home_folder + '/landUseOutputMSOA_2018')
     mype_pop = mype_pop.groupby(by=['ZoneID', 'property_type'], as_index=False).sum()
     mype_pop = mype_pop[['ZoneID', 'property_type', 'people']]
 
@@ -429,16 +470,19 @@ def sort_out_hops_uplift(by_lu_obj):
 
 
 # TODO: improve block commenting
-def adjust_car_availability(by_lu_obj):
+def adjust_car_availability(by_lu_obj, land_use=None):
     """
     applies nts extract to landuse
     Parameters
     ----------
+    land_use:
+        Land use by NS-SEC and SOC, read from _landuse_segments if None
     Returns
     ----------
     """
     _nts_import_path = by_lu_obj.home_folder + '/nts_splits.csv'
-    land_use = compress.read_in(by_lu_obj.home_folder + _landuse_segments)
+    if land_use is None:
+        land_use = compress.read_in(by_lu_obj.home_folder + _landuse_segments)
     cars_adjust = pd.read_csv(_nts_import_path)
 
     segments = land_use.groupby(by=['area_type', 'employment_type', 'household_composition'],
@@ -465,27 +509,20 @@ def adjust_car_availability(by_lu_obj):
     all_combined2['new'] = all_combined2['newhc'] * all_combined2['factor']
     all_combined2.to_csv(by_lu_obj.home_folder + '/landuse_caradj.csv', index=False)
 
-    car_available = all_combined2.groupby(by=['household_composition'], as_index=False).sum()
+    car_available = all_combined2.groupby(by=['household_composition'], as_index=False).sum(numeric_only=True)
     car_available.to_csv(by_lu_obj.home_folder + '/caravailable.csv')
 
     by_lu_obj.state['5.2.11 car availability'] = 1
     logging.info('Step 5.2.11 completed')
 
 
-# TODO: revise the print statements in this function. Good points to add logging maybe
-# TODO: include block commenting
-def adjust_soc_gb(by_lu_obj):
+def _gb_soc_splits(by_lu_obj):
     """
-    To apply before the MYPE
-    adjusts SOC values to gb levels for 2018
+    Splits of people in employment by SOC category in EW and Scotland, for
+    adjust_soc_gb()
     """
     gb_soc_totals = pd.read_csv(by_lu_obj.import_folder + _gb_soc_totals)
 
-    lad_translation = pd.read_csv(by_lu_obj.zones_folder + _default_lad_translation)
-    lad_translation = lad_translation.drop(columns={'overlap_type', 'lad_to_msoa', 'msoa_to_lad'}).rename(
-        columns={'msoa_zone_id': 'ZoneID', 'lad_zone_id': 'objectid'}
-    )
-
     gb_soc_totals = gb_soc_totals.rename(columns={
         'T12a:1 (1 Managers, Directors and Senior Officials (SOC2010) : All people )': 'SOC1',
         'T12a:4 (2 Professional Occupations (SOC2010) : All people )': 'SOC2',
@@ -515,14 +552,16 @@ def adjust_soc_gb(by_lu_obj):
     gb_soc_totals['total'] = gb_soc_totals.groupby(['Country'])['value'].transform('sum')
     gb_soc_totals['splits'] = gb_soc_totals['value'] / gb_soc_totals['total']
 
-    land_use_segments = compress.read_in(by_lu_obj.home_folder + '/AdjustedGBlanduse_emp')
-    employed = land_use_segments[land_use_segments.emp.isin([1, 2])]  # fte and pte
-    employed = employed.merge(lad_translation, on='ZoneID')
-    employed['Country'] = 'England and Wales number'
-    employed.loc[employed['ZoneID'].str.startswith('S'), 'Country'] = 'Scotland number'
+    return gb_soc_totals
+
 
+def _gb_soc_factors(by_lu_obj, employed, gb_soc_totals):
+    """
+    Factors to scale employed people by Country and SOC category to meet
+    gb_soc_totals, for adjust_soc_gb(). Writes SOCsplitsComparison.csv.
+    """
     emp_soc_total = employed.groupby(by=['Country', 'SOC_category'],
-                                     as_index=False).sum()[['Country', 'SOC_category', 'people']]
+                                     as_index=False).sum(numeric_only=True)[['Country', 'SOC_category', 'people']]
     emp_soc_total['total_land'] = emp_soc_total.groupby(['Country'])['people'].transform('sum')
 
     # for audit
@@ -540,7 +579,7 @@ def adjust_soc_gb(by_lu_obj):
     print(emp_compare['pop'].sum())
     emp_compare = emp_compare.drop(columns={'total_land', 'splits'})
 
-    land_use_grouped = employed.groupby(by=['Country', 'SOC_category'], as_index=False).sum()
+    land_use_grouped = employed.groupby(by=['Country', 'SOC_category'], as_index=False).sum(numeric_only=True)
     land_use_grouped = land_use_grouped[['Country', 'SOC_category', 'people']]
     land_use_grouped['total'] = land_use_grouped.groupby(['Country'])['people'].transform('sum')
     land_use_grouped['factor'] = land_use_grouped['people'] / land_use_grouped['total']
@@ -548,6 +587,31 @@ def adjust_soc_gb(by_lu_obj):
     soc_revised = emp_compare.merge(land_use_grouped, on=['Country', 'SOC_category'], how='left')
     soc_revised['factor'] = soc_revised['pop'] / soc_revised['people']
     soc_revised = soc_revised[['Country', 'SOC_category', 'factor']]
+
+    return soc_revised
+
+
+# TODO: revise the print statements in this function. Good points to add logging maybe
+# TODO: include block commenting
+def adjust_soc_gb(by_lu_obj):
+    """
+    To apply before the MYPE
+    adjusts SOC values to gb levels for 2018
+    """
+    lad_translation = pd.read_csv(by_lu_obj.zones_folder + _default_lad_translation)
+    lad_translation = lad_translation.drop(columns={'overlap_type', 'lad_to_msoa', 'msoa_to_lad'}).rename(
+        columns={'msoa_zone_id': 'ZoneID', 'lad_zone_id': 'objectid'}
+    )
+
+    gb_soc_totals = _gb_soc_splits(by_lu_obj)
+
+    land_use_segments = compress.read_in(by_lu_obj.home_folder + '/AdjustedGBlanduse_emp')
+    employed = land_use_segments[land_use_segments.emp.isin([1, 2])]  # fte and pte
+    employed = employed.merge(lad_translation, on='ZoneID')
+    employed['Country'] = 'England and Wales number'
+    employed.loc[employed['ZoneID'].str.startswith('S'), 'Country'] = 'Scotland number'
+
+    soc_revised = _gb_soc_factors(by_lu_obj, employed, gb_soc_totals)
     soc_revised = employed.merge(soc_revised, on=['Country', 'SOC_category'])
 
     soc_revised['newpop'] = soc_revised['factor'] * soc_revised['people']
@@ -563,15 +627,16 @@ def adjust_soc_gb(by_lu_obj):
 
     # join to the rest
     not_employed = land_use_segments[~land_use_segments.emp.isin([1, 2])]  # neither fte nor pte
-    npr_segmentation = not_employed.append(soc_revised)
+    npr_segmentation = pd.concat([not_employed, soc_revised])
 
     logging.info('Population currently {}'.format(npr_segmentation.people.sum()))
     compress.write_out(npr_segmentation, by_lu_obj.home_folder + '/landuse_adjustedSOCs')
 
 
-def adjust_soc_lad(by_lu_obj):
+def _lad_soc_splits(by_lu_obj):
     """
-    TODO: lad translation path has changed here - needs updating
+    Splits of people in employment by SOC category in each LAD, for
+    adjust_soc_lad()
     """
     # Read in the LAD controls data and pick out the totals columns
     lad_soc_control = pd.read_csv(by_lu_obj.import_folder + _ladsoc_control)
@@ -604,27 +669,33 @@ def adjust_soc_lad(by_lu_obj):
     lad_soc = lad_soc.groupby(by=['lad17cd', 'SOC_category'])[['value', 'total', 'splits']].apply(
         lambda x: x.sum(min_count=1, skipna=False)).reset_index()  # sum where np.nan is retained
 
-    # Read in the MSOA-LAD correspondence and perform a cross join such that every MSOA pair within an LAD is included
-    lad_ref = pd.read_csv(by_lu_obj.zones_folder + _default_lad_translation).iloc[:, 0:2]
-    lad_ref = lad_ref.rename(columns={'msoa_zone_id': 'ZoneID'})
-
-    # Read in the population to adjust
-    land_use = compress.read_in(by_lu_obj.home_folder + '/landuse_adjustedSOCs')
+    return lad_soc
 
-    # First handle employed
-    employed = land_use[land_use.emp.isin([1, 2])]  # fte and pte
-    print('Employed people in landuse: ', employed['people'].sum())
 
-    ladref = gpd.read_file(_default_ladRef).iloc[:, 0:2].rename(columns={'objectid': 'lad_zone_id'})
+def _lad_soc_factors(employed, lad_soc, lad_ref, ladref):
+    """
+    Factors to scale people by LAD and SOC category to meet lad_soc, for
+    adjust_soc_lad()
 
+    Parameters
+    ----------
+    employed:
+        Land use of people in employment
+    lad_soc:
+        LAD SOC splits, from _lad_soc_splits()
+    lad_ref:
+        MSOA 'ZoneID' to 'lad_zone_id'
+    ladref:
+        'lad_zone_id' to 'lad17cd'
+    """
     # Compute existing totals by LAD
     soc_totals_msoa = employed.groupby(by=['ZoneID', 'SOC_category'], as_index=False).sum()[
         ['ZoneID', 'SOC_category', 'people']]
     soc_totals_msoa = soc_totals_msoa.merge(lad_ref, on='ZoneID')
-    soc_totals_lad = soc_totals_msoa.groupby(by=['lad_zone_id'], as_index=False).sum()
+    soc_totals_lad = soc_totals_msoa.groupby(by=['lad_zone_id'], as_index=False).sum(numeric_only=True)
     soc_totals_lad = soc_totals_lad[['lad_zone_id', 'people']]
     soc_totals_lad = soc_totals_lad.merge(ladref, on='lad_zone_id')
-    soc_totals_before = soc_totals_msoa.groupby(by=['lad_zone_id', 'SOC_category'], as_index=False).sum()
+    soc_totals_before = soc_totals_msoa.groupby(by=['lad_zone_id', 'SOC_category'], as_index=False).sum(numeric_only=True)
 
     # Compute the re-constrained totals by LAD
     soc_totals_after = soc_totals_lad.merge(lad_soc, on=['lad17cd'])
@@ -636,6 +707,30 @@ def adjust_soc_lad(by_lu_obj):
     compare['factor'] = compare['newpop'] / compare['people']
     compare = compare.drop(columns={'lad17cd', 'people', 'newpop'})
 
+    return compare
+
+
+def adjust_soc_lad(by_lu_obj):
+    """
+    TODO: lad translation path has changed here - needs updating
+    """
+    lad_soc = _lad_soc_splits(by_lu_obj)
+
+    # Read in the MSOA-LAD correspondence and perform a cross join such that every MSOA pair within an LAD is included
+    lad_ref = pd.read_csv(by_lu_obj.zones_folder + _default_lad_translation).iloc[:, 0:2]
+    lad_ref = lad_ref.rename(columns={'msoa_zone_id': 'ZoneID'})
+
+    # Read in the population to adjust
+    land_use = compress.read_in(by_lu_obj.home_folder + '/landuse_adjustedSOCs')
+
+    # First handle employed
+    employed = land_use[land_use.emp.isin([1, 2])]  # fte and pte
+    print('Employed people in landuse: ', employed['people'].sum())
+
+    ladref = geodata.read_attributes(_default_ladRef).iloc[:, 0:2].rename(columns={'objectid': 'lad_zone_id'})
+
+    compare = _lad_soc_factors(employed, lad_soc, lad_ref, ladref)
+
     # Apply the scaling factors to the main land use DataFrame
     land_use = land_use[~(land_use.emp.isin([1, 2]) & (land_use.SOC_category == 0))]  # exclude employed rows with SOC 0
     land_use = land_use.merge(lad_ref, on='ZoneID')
@@ -653,30 +748,22 @@ def adjust_soc_lad(by_lu_obj):
     logging.info('Step 5.2.10 completed')
 
     
-def control_to_lad_employment_ag(by_lu_obj):
+def _lad_employment_controls(by_lu_obj, land_use):
     """
-    control to employment at LAD level for age, gender and fte/pte employment; 
-    adjusts inactive people in work accordingly
-    
+    LAD employment controls, for control_to_lad_employment_ag()
+
     Parameters
     ----------
-    by_lu_obj: base year land use object
-    
+    land_use:
+        Land use with 'lad17cd' joined
+
     Returns
     ----------
-    gb_land_use_controlled: number of employed people is controlled to 2018 age, gender and
-    fte/pte patterns in employment
+    lad_controlled2:
+        Splits of working age people in and not in employment, by LAD and gender
+    lad_fte_pte_controls:
+        Splits of people in employment into fte and pte, by LAD and gender
     """
-
-    land_use = compress.read_in(by_lu_obj.home_folder + '/landUseOutputMSOA_2018')
-
-    lad_translation = pd.read_csv(by_lu_obj.zones_folder + _default_lad_translation)
-    lad_translation = lad_translation.drop(columns={'lad_to_msoa', 'msoa_to_lad', 'overlap_type'})
-    lad_translation = lad_translation.rename(columns={'msoa_zone_id': 'ZoneID', 'lad_zone_id': 'objectid'})
-    lad_ref = gpd.read_file(_default_ladRef).iloc[:, 0:2]
-    land_use = land_use.merge(lad_translation, on='ZoneID', how='left')
-    land_use = land_use.merge(lad_ref, on='objectid')
-
     emp_controls = pd.read_csv(by_lu_obj.import_folder + _emp_controls)
     emp_controls = emp_controls.rename(columns={
         'T08:29 (Males - Aged 16 - 64 : Full-time ) number': 'Male FTE',
@@ -700,11 +787,11 @@ def control_to_lad_employment_ag(by_lu_obj):
     lad_controlled.loc[lad_controlled['variable'] == 'Females Emp', 'gender'] = 3
     lad_controlled['value'] = pd.to_numeric(lad_controlled['value'])
 
-    lad_controlled = lad_controlled.groupby(by=['lad17cd', 'employment_cat', 'gender'], as_index=False).sum()
+    lad_controlled = lad_controlled.groupby(by=['lad17cd', 'employment_cat', 'gender'], as_index=False).sum(numeric_only=True)
 
     # Compute the total for the 16-74 working age population
     wa_all = land_use[land_use.emp != 5]
-    total_wa_pop = wa_all.groupby(by=['lad17cd', 'gender'], as_index=False).sum()
+    total_wa_pop = wa_all.groupby(by=['lad17cd', 'gender'], as_index=False).sum(numeric_only=True)
     total_wa_pop = total_wa_pop.drop(columns={'household_composition', 'area_type',
                                               'property_type', 'objectid', 'SOC_category',
                                               'ns_sec', 'age_code'})
@@ -712,7 +799,7 @@ def control_to_lad_employment_ag(by_lu_obj):
     lad_controlled_wa['splits'] = lad_controlled_wa['value'] / lad_controlled_wa['people']
 
     # For Isles of Scilly E06000053:
-    LADcontrolledAverage = lad_controlled_wa.groupby(by=['employment_cat'], as_index=False).sum()
+    LADcontrolledAverage = lad_controlled_wa.groupby(by=['employment_cat'], as_index=False).sum(numeric_only=True)
     LADcontrolledAverage['av_splits'] = LADcontrolledAverage['value'] / LADcontrolledAverage['people']
     LADcontrolledAverage = LADcontrolledAverage.drop(columns={'value', 'people', 'splits', 'gender', 'emp'})
     lad_controlled_wa = lad_controlled_wa.drop(columns={'value', 'people'})
@@ -754,7 +841,7 @@ def control_to_lad_employment_ag(by_lu_obj):
     lad_fte_pte_controls['totals'] = lad_fte_pte_controls.groupby(['lad17cd', 'gender'])['value'].transform('sum')
     lad_fte_pte_controls['splits'] = lad_fte_pte_controls['value'] / lad_fte_pte_controls['totals']
 
-    lad_fte_pte_controls_average = lad_fte_pte_controls.groupby(by=['emp'], as_index=False).sum().drop(
+    lad_fte_pte_controls_average = lad_fte_pte_controls.groupby(by=['emp'], as_index=False).sum(numeric_only=True).drop(
         columns={'gender'})
     lad_fte_pte_controls_average['av_splits'] = lad_fte_pte_controls_average['value'] / lad_fte_pte_controls_average[
         'totals']
@@ -766,6 +853,35 @@ def control_to_lad_employment_ag(by_lu_obj):
     lad_fte_pte_controls = lad_fte_pte_controls.drop(columns={'av_splits', 'value', 'totals'})
     lad_fte_pte_controls['employment_cat'] = 'emp'
 
+    return lad_controlled2, lad_fte_pte_controls
+
+
+def control_to_lad_employment_ag(by_lu_obj):
+    """
+    control to employment at LAD level for age, gender and fte/pte employment; 
+    adjusts inactive people in work accordingly
+    
+    Parameters
+    ----------
+    by_lu_obj: base year land use object
+    
+    Returns
+    ----------
+    gb_land_use_controlled: number of employed people is controlled to 2018 age, gender and
+    fte/pte patterns in employment
+    """
+
+    land_use = compress.read_in(by_lu_obj.home_folder + '/landUseOutputMSOA_2018')
+
+    lad_translation = pd.read_csv(by_lu_obj.zones_folder + _default_lad_translation)
+    lad_translation = lad_translation.drop(columns={'lad_to_msoa', 'msoa_to_lad', 'overlap_type'})
+    lad_translation = lad_translation.rename(columns={'msoa_zone_id': 'ZoneID', 'lad_zone_id': 'objectid'})
+    lad_ref = geodata.read_attributes(_default_ladRef).iloc[:, 0:2]
+    land_use = land_use.merge(lad_translation, on='ZoneID', how='left')
+    land_use = land_use.merge(lad_ref, on='objectid')
+
+    lad_controlled2, lad_fte_pte_controls = _lad_employment_controls(by_lu_obj, land_use)
+
     # Calculate the total population by LAD and apply the splits between inactive and active
     wa_all = land_use[land_use.emp != 5]
     land_use_lad = wa_all.groupby(by=['ZoneID', 'lad17cd', 'gender'],
@@ -834,7 +950,7 @@ def control_to_lad_employment_ag(by_lu_obj):
     inactive_land_use2 = inactive_land_use2[gb_cols]
     inactive_land_use2['newpop'].sum()
     active_land_use2 = active_land_use2[gb_cols]
-    gb_land_use_controlled = inactive_land_use2.append(active_land_use2)
+    gb_land_use_controlled = pd.concat([inactive_land_use2, active_land_use2])
 
     # bring back the children to make the full GB population again
     nowa_all = land_use[land_use.emp == 5]
@@ -844,7 +960,7 @@ def control_to_lad_employment_ag(by_lu_obj):
     # check the total of children - should be about 17.6m in 2018
     print('Bring back the children, should be ~17.6m in 2018', nowa_all['newpop'].sum())
 
-    gb_land_use_controlled = gb_land_use_controlled.append(nowa_all)
+    gb_land_use_controlled = pd.concat([gb_land_use_controlled, nowa_all])
     gb_land_use_controlled = gb_land_use_controlled.rename(columns={'newpop': 'people'})
     print('People in jobs are now adjusted. Total population should be back to ~64.5m, and is',
           gb_land_use_controlled['people'].sum(), 'Now saving the new landuse dataset.')
@@ -865,14 +981,15 @@ def control_to_lad_employment_ag(by_lu_obj):
     return gb_land_use_controlled
 
 
-def check_msoa_totals(by_lu_obj, df, function_name):
+def check_msoa_totals(by_lu_obj, df, function_name, mype=None):
     """
     check how the outputs compare to MYPE for audits
+    mype: EW MYPE from get_ew_population(), read if None
     """
-    df_msoa = df.groupby(by=['ZoneID'], as_index=False).sum().reindex(columns={'ZoneID', 'people'})
+    df_msoa = df.groupby(by=['ZoneID'], as_index=False).sum(numeric_only=True).reindex(columns=['ZoneID', 'people'])
     # read in mype msoa totals
-    msoa_totals = get_ew_population(by_lu_obj)
-    msoa_totals = msoa_totals.groupby(by=['ZoneID'], as_index=False).sum().rename(columns={'pop': 'mype'}).reindex(
+    msoa_totals = get_ew_population(by_lu_obj) if mype is None else mype
+    msoa_totals = msoa_totals.groupby(by=['ZoneID'], as_index=False).sum(numeric_only=True).rename(columns={'pop': 'mype'}).reindex(
         columns=['ZoneID', 'mype'])
 
     msoa_comparison = msoa_totals.merge(df_msoa, on=['ZoneID'])
@@ -880,6 +997,18 @@ def check_msoa_totals(by_lu_obj, df, function_name):
     print(msoa_comparison)
 
 
+def _country_employment_controls(by_lu_obj):
+    """
+    Numbers of people in work in EW and Scotland, for country_emp_control()
+    """
+    # Country employment control for total numbers of people in work in EW and Scotland
+    country_emp = pd.read_csv(by_lu_obj.import_folder + _country_control)
+    country_emp = country_emp.rename(columns={'T01:7 (All aged 16 & over - In employment : All People )': 'Emp'})
+    country_emp = country_emp[['Country', 'Emp']]
+    country_emp = country_emp[country_emp.Country.isin(['England and Wales number', 'Scotland number'])]
+    return country_emp
+
+
 def country_emp_control(by_lu_obj):
     """
     this function is to make sure we have the right amount of people in work 
@@ -896,11 +1025,7 @@ def country_emp_control(by_lu_obj):
     
     """
 
-    # Country employment control for total numbers of people in work in EW and Scotland
-    country_emp = pd.read_csv(by_lu_obj.import_folder + _country_control)
-    country_emp = country_emp.rename(columns={'T01:7 (All aged 16 & over - In employment : All People )': 'Emp'})
-    country_emp = country_emp[['Country', 'Emp']]
-    country_emp = country_emp[country_emp.Country.isin(['England and Wales number', 'Scotland number'])]
+    country_emp = _country_employment_controls(by_lu_obj)
     # read in landuse with some employment controls already
     land_use = compress.read_in(by_lu_obj.home_folder + '/GBlanduseControlled')
     zones = land_use['ZoneID'].drop_duplicates()
@@ -911,7 +1036,7 @@ def country_emp_control(by_lu_obj):
     # add this column for matching to control
     scott_active['Country'] = 'Scotland number'
     scott_active['people'].sum()
-    scott_active_total = scott_active.groupby(by=['Country'], as_index=False).sum()[['Country', 'people']]
+    scott_active_total = scott_active.groupby(by=['Country'], as_index=False).sum(numeric_only=True)[['Country', 'people']]
     # ' match the control and landuse for Scotland to work out scaling factor and apply it
     scott_active_total = scott_active_total.merge(country_emp, on='Country')
     scott_active_total['factor'] = scott_active_total['Emp'] / scott_active_total['people']
@@ -923,7 +1048,7 @@ def country_emp_control(by_lu_obj):
     # work out EW employed people, match to control and work out scaling factor
     eng_active = active[~active.ZoneID.isin(scott)]
     eng_active['Country'] = 'England and Wales number'
-    eng_active_total = eng_active.groupby(by=['Country'], as_index=False).sum()[['Country', 'people']]
+    eng_active_total = eng_active.groupby(by=['Country'], as_index=False).sum(numeric_only=True)[['Country', 'people']]
     eng_active_total = eng_active_total.merge(country_emp, on='Country')
     eng_active_total['factor'] = eng_active_total['Emp'] / eng_active_total['people']
     eng_active_total = eng_active_total.drop(columns={'people', 'Emp'})
@@ -936,7 +1061,7 @@ def country_emp_control(by_lu_obj):
     gb_cols = ['ZoneID', 'age_code', 'emp', 'area_type', 'property_type',
                'household_composition', 'gender', 'ns_sec', 'SOC_category', 'people']
     # append the new employed population adjusted for Scotland, England and Wales
-    active_adj = eng_active.append(scott_active)
+    active_adj = pd.concat([eng_active, scott_active])
     active_adj = active_adj.rename(columns={'newpop': 'people'})
     active_adj = active_adj[gb_cols]
     active_new_total = active_adj.groupby('ZoneID', as_index=False).sum()[['ZoneID', 'people']]
@@ -965,14 +1090,14 @@ def country_emp_control(by_lu_obj):
     inactive3['people'].sum()
 
     # inactive plus active people appending
-    adjusted_gb_land_use = inactive3.append(active_adj)
+    adjusted_gb_land_use = pd.concat([inactive3, active_adj])
     adjusted_gb_land_use['people'].sum()
     # get the children by MSOA too
     children = land_use[land_use.emp == 5]
     children = children[gb_cols]
     # children['people'].sum() # should be ~17m
     # append children
-    adjusted_gb_land_use = adjusted_gb_land_use.append(children)
+    adjusted_gb_land_use = pd.concat([adjusted_gb_land_use, children])
     # adjusted_gb_land_use['people'].sum() # should be 64.5m
     # audit the msoa population totals
     check_msoa_totals(by_lu_obj, adjusted_gb_land_use, function_name='country_control')
@@ -984,7 +1109,264 @@ def country_emp_control(by_lu_obj):
     logging.info('Step 5.2.9 completed')
 
 
-def run_mype(by_lu_obj, midyear=True):
+def _join_unique(left, right, on, how='inner'):
+    """
+    Joins the columns of right onto left, as left.merge(right, on=on, how=how)
+    would. Where right has one row per key, rows are looked up by index
+    rather than merged.
+    """
+    if not right[on].is_unique:
+        return left.merge(right, on=on, how=how)
+    if how == 'inner':
+        left = left[left[on].isin(right[on])]
+    joined = right.set_index(on).reindex(left[on])
+    left = left.copy()
+    for col in joined.columns:
+        left[col] = joined[col].to_numpy()
+    return left
+
+
+def _lookup(table, keys, value, df, df_keys=None):
+    """
+    Looks up value in table by keys for each row of df, as a merge would.
+
+    Returns the values, NaN where a row has no match, and whether each row
+    matched.
+    """
+    df_keys = keys if df_keys is None else df_keys
+    index = pd.MultiIndex.from_frame(table[keys])
+    idx = index.get_indexer(pd.MultiIndex.from_arrays([df[k].to_numpy() for k in df_keys]))
+    found = idx >= 0
+    values = np.full(len(df), np.nan)
+    values[found] = table[value].to_numpy(dtype=float)[idx[found]]
+    return values, found
+
+
+def _group_sums(df, keys, mask=None):
+    """
+    Sums of people by keys, for each row of df, over the rows in mask.
+    """
+    people = df['people']
+    if mask is not None:
+        people = people.where(mask, 0)
+    return people.groupby([df[k] for k in keys], sort=False).transform('sum').to_numpy(dtype=float)
+
+
+def _control_to_lad_employment_fused(by_lu_obj, land_use, msoa_lads, lad_ref, mype):
+    """
+    As control_to_lad_employment_ag(), scaling the people of land_use by
+    index rather than by merges.
+    """
+    land_use = _join_unique(land_use, msoa_lads, 'ZoneID', how='left')
+    land_use = _join_unique(land_use, lad_ref, 'objectid')
+    lad_controlled2, lad_fte_pte_controls = _lad_employment_controls(by_lu_obj, land_use)
+
+    emp = land_use['emp']
+    active = emp.isin([1, 2]).to_numpy()
+    inactive = emp.isin([3, 4]).to_numpy()
+    zone_keys = ['ZoneID', 'lad17cd', 'gender']
+    wa_pop = _group_sums(land_use, zone_keys, emp != 5)
+
+    splits, _ = _lookup(lad_controlled2, ['lad17cd', 'gender'], 'splits', land_use)
+    inactivesplits, _ = _lookup(lad_controlled2, ['lad17cd', 'gender'], 'inactivesplits', land_use)
+    fte_pte_splits, _ = _lookup(lad_fte_pte_controls, ['lad17cd', 'gender', 'emp'], 'splits', land_use)
+
+    # Factors of active people by zone, gender and fte/pte, and of inactive
+    # people by zone and gender
+    with np.errstate(divide='ignore', invalid='ignore'):
+        active_factor = wa_pop * splits * fte_pte_splits / _group_sums(land_use, zone_keys + ['emp'])
+        inactive_factor = wa_pop * inactivesplits / _group_sums(land_use, zone_keys, inactive)
+    factor = np.where(active, active_factor, np.where(inactive, inactive_factor, 1))
+
+    gb_cols = ['ZoneID', 'age_code', 'emp', 'area_type', 'property_type',
+               'household_composition', 'gender',
+               'SOC_category', 'ns_sec', 'people']
+    land_use['people'] = land_use['people'].to_numpy() * factor
+    land_use = land_use.loc[emp.isin([1, 2, 3, 4, 5]), gb_cols]
+    print('People in jobs are now adjusted. Total population should be back to ~64.5m, and is',
+          land_use['people'].sum())
+
+    check_msoa_totals(by_lu_obj, land_use, function_name='control_to_lad', mype=mype)
+    logging.info('Population currently {}'.format(land_use.people.sum()))
+    by_lu_obj.state['5.2.8 MYPE adjustment'] = 1
+    logging.info('Step 5.2.8 completed')
+    return land_use
+
+
+def _country_emp_control_fused(by_lu_obj, land_use, mype):
+    """
+    As country_emp_control(), scaling the people of land_use by index
+    rather than by merges.
+    """
+    country_emp = _country_employment_controls(by_lu_obj)
+    controls = country_emp.set_index('Country')['Emp']
+
+    emp = land_use['emp']
+    active = emp.isin([1, 2]).to_numpy()
+    inactive = emp.isin([3, 4]).to_numpy()
+    children = (emp == 5).to_numpy()
+    zone_codes, zones = pd.factorize(land_use['ZoneID'])
+    country = np.where(land_use['ZoneID'].str.startswith('S'), 'Scotland number', 'England and Wales number')
+    people = land_use['people'].to_numpy(dtype=float)
+
+    # Scale people in work to the country controls, dropping those of
+    # countries without controls
+    active_total = pd.Series(people[active]).groupby(country[active]).sum()
+    active_country = country[active]
+    active_factor = (controls.reindex(active_country).to_numpy()
+                     / active_total.reindex(active_country).to_numpy())
+    kept_active = active.copy()
+    kept_active[active] = np.isin(active_country, controls.index)
+    new_people = people.copy()
+    new_people[active] = people[active] * active_factor
+
+    # Scale inactive people so each zone's working age total is unchanged
+    def zone_sums(values, mask):
+        return np.bincount(zone_codes[mask], weights=np.nan_to_num(values[mask]), minlength=len(zones))
+    employed = zone_sums(new_people, kept_active)
+    has_employed = np.bincount(zone_codes[kept_active], minlength=len(zones)) > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inactive_factor = (zone_sums(people, ~children) - employed) / zone_sums(people, inactive)
+    inactive_factor[inactive_factor == np.inf] = 0
+    new_people[inactive] = people[inactive] * inactive_factor[zone_codes[inactive]]
+    kept_inactive = inactive & has_employed[zone_codes]
+
+    gb_cols = ['ZoneID', 'age_code', 'emp', 'area_type', 'property_type',
+               'household_composition', 'gender', 'ns_sec', 'SOC_category', 'people']
+    land_use = land_use.assign(people=new_people)
+    land_use = land_use.loc[kept_active | kept_inactive | children, gb_cols]
+
+    check_msoa_totals(by_lu_obj, land_use, function_name='country_control', mype=mype)
+    logging.info('Population currently {}'.format(land_use.people.sum()))
+    by_lu_obj.state['5.2.9 employment adjustment'] = 1
+    logging.info('Step 5.2.9 completed')
+    return land_use
+
+
+def _adjust_soc_gb_fused(by_lu_obj, land_use, msoa_lads):
+    """
+    As adjust_soc_gb(), scaling the people of land_use by index rather than
+    by merges.
+    """
+    gb_soc_totals = _gb_soc_splits(by_lu_obj)
+
+    is_employed = land_use['emp'].isin([1, 2])
+    employed = _join_unique(land_use[is_employed], msoa_lads[['ZoneID']], 'ZoneID')
+    employed['Country'] = np.where(employed['ZoneID'].str.startswith('S'),
+                                   'Scotland number', 'England and Wales number')
+
+    soc_revised = _gb_soc_factors(by_lu_obj, employed, gb_soc_totals)
+    factor, found = _lookup(soc_revised, ['Country', 'SOC_category'], 'factor', employed)
+    employed['people'] = factor * employed['people'].to_numpy()
+
+    not_employed = land_use[~is_employed]
+    land_use = pd.concat([not_employed, employed.loc[found, list(not_employed.columns)]])
+    logging.info('Population currently {}'.format(land_use.people.sum()))
+    return land_use
+
+
+def _adjust_soc_lad_fused(by_lu_obj, land_use, lad_translation, uk_lad):
+    """
+    As adjust_soc_lad(), scaling the people of land_use by index rather than
+    by merges.
+    """
+    lad_soc = _lad_soc_splits(by_lu_obj)
+    lad_ref = lad_translation.iloc[:, 0:2].rename(columns={'msoa_zone_id': 'ZoneID'})
+    ladref = uk_lad.iloc[:, 0:2].rename(columns={'objectid': 'lad_zone_id'})
+
+    is_employed = land_use['emp'].isin([1, 2])
+    compare = _lad_soc_factors(land_use[is_employed], lad_soc, lad_ref, ladref)
+
+    land_use = land_use[~(is_employed & (land_use.SOC_category == 0))]  # exclude employed rows with SOC 0
+    land_use = _join_unique(land_use, lad_ref, 'ZoneID')
+    factor, _ = _lookup(compare, ['lad_zone_id', 'SOC_category'], 'factor', land_use)
+
+    # Missing values are filled with 1, and infinite values are 0
+    people = land_use['people'].to_numpy(dtype=float)
+    people = np.where(np.isnan(people), 1, people)
+    people[people == np.inf] = 0
+    factor = np.where(np.isnan(factor), 1, factor)
+    factor[factor == np.inf] = 0
+
+    print('Population before LAD SOC control:', people.sum())
+    land_use['people'] = people * factor
+    print('Population after LAD SOC control:', land_use.people.sum())
+
+    land_use = land_use.drop(columns='lad_zone_id').reset_index(drop=True)
+    logging.info('Population currently {}'.format(land_use.people.sum()))
+    by_lu_obj.state['5.2.10 SEC/SOC'] = 1
+    logging.info('Step 5.2.10 completed')
+    return land_use
+
+
+def run_mype_fused(by_lu_obj, write_intermediate=False):
+    """
+    Runs the MYPE adjustments of run_mype() with the land use held in memory.
+
+    Each input is read once, rather than by each step that needs it, and
+    each adjustment scales the people of the one land use frame by index
+    lookups and grouped sums, rather than merging its factors onto copies
+    of the land use and writing them out for the next step. Gives the same
+    final_land_use and audits as running each step in turn.
+
+    Parameters
+    ----------
+    by_lu_obj:
+        Base year land use object.
+    write_intermediate:
+        If True, also writes the land use after each step, as each step of
+        run_mype() does. Otherwise only final_land_use is written.
+
+    Returns
+    ----------
+    land_use:
+        The final land use, as written to final_land_use
+    """
+    def write_step(df, name):
+        if write_intermediate:
+            compress.write_out(df, by_lu_obj.home_folder + name)
+
+    # Inputs used by more than one step
+    landuse_segments = compress.read_in(by_lu_obj.home_folder + _landuse_segments)
+    mype = get_ew_population(by_lu_obj)
+    lad_translation = pd.read_csv(by_lu_obj.zones_folder + _default_lad_translation)
+    uk_lad = geodata.read_attributes(_default_ladRef)
+    lad_ref = uk_lad.iloc[:, 0:2]
+    msoa_lads = lad_translation.drop(columns={'overlap_type', 'lad_to_msoa', 'msoa_to_lad'}).rename(
+        columns={'msoa_zone_id': 'ZoneID', 'lad_zone_id': 'objectid'})
+
+    scot_mype = format_scottish_mype(by_lu_obj, land_use_segments=landuse_segments,
+                                     lad_translation=lad_translation, uk_lad=uk_lad)
+    mype_communal = sort_communal_uplift(by_lu_obj, mype=mype)
+    land_use = specific_yr_land_use(landuse_segments, scot_mype, mype_communal, mype)
+    write_step(land_use, '/landUseOutputMSOA_2018')
+    sort_out_hops_uplift(by_lu_obj, mype_pop=land_use)  # audit
+
+    land_use = _control_to_lad_employment_fused(by_lu_obj, land_use, msoa_lads, lad_ref, mype)
+    write_step(land_use, '/GBlanduseControlled')
+    land_use = _country_emp_control_fused(by_lu_obj, land_use, mype)
+    write_step(land_use, '/AdjustedGBlanduse_emp')
+    land_use = _adjust_soc_gb_fused(by_lu_obj, land_use, msoa_lads)
+    write_step(land_use, '/landuse_adjustedSOCs')
+    land_use = _adjust_soc_lad_fused(by_lu_obj, land_use, lad_translation, uk_lad)
+    compress.write_out(land_use, by_lu_obj.home_folder + '/final_land_use')
+
+    adjust_car_availability(by_lu_obj, land_use=landuse_segments)  # TODO: replace with NTEM
+    return land_use
+
+
+def run_mype(by_lu_obj, midyear=True, fused=False, write_intermediate=True):
+    """
+    Runs the MYPE adjustments.
+
+    fused: if True, runs them with run_mype_fused(), holding the land use in
+        memory between steps
+    write_intermediate: if fused, whether to write the land use after each
+        step as well as the final land use
+    """
+    if fused:
+        run_mype_fused(by_lu_obj, write_intermediate=write_intermediate)
+        return
     # normalise_landuse()
     adjust_landuse_to_specific_yr(by_lu_obj)
     control_to_lad_employment_ag(by_lu_obj)
@@ -993,3 +1375,193 @@ def run_mype(by_lu_obj, midyear=True):
     adjust_soc_lad(by_lu_obj)
     sort_out_hops_uplift(by_lu_obj)  # audit
     adjust_car_availability(by_lu_obj)  # TODO: replace with NTEM
+
+
+def _write_synthetic_mype_inputs(folder, n_lads=40, zones_per_lad=20, rows_per_zone=150, seed=2018):
+    """
+    Writes seeded synthetic inputs for run_mype() to folder, returning a
+    base year land use object to run it with and the path of the LAD
+    shapefile to use for _default_ladRef.
+    """
+    import os
+    import types
+    from shapely import geometry
+
+    rng = np.random.default_rng(seed)
+    home = os.path.join(folder, 'home')
+    imports = os.path.join(folder, 'import') + '/'
+    zones_folder = os.path.join(folder, 'zones') + '/'
+    for sub in [os.path.join(home, 'CommunalEstablishments'), os.path.join(home, 'Hops Population Audits'),
+                imports + 'MYE 2018 ONS/2018_MidyearMSOA',
+                imports + 'NPR Segmentation/processed data/Country Control 2018',
+                imports + 'NPR Segmentation/raw data and lookups/LAD labour market data',
+                zones_folder + 'Export/lad_to_msoa']:
+        os.makedirs(sub, exist_ok=True)
+
+    # LADs, the last quarter Scottish, including the LADs with special cases
+    n_scot = max(n_lads // 4, 1)
+    lads = ['E0%07d' % (1000000 + i) for i in range(n_lads - n_scot)] + \
+           ['S12%06d' % i for i in range(n_scot)]
+    lads[:2] = ['E06000053', 'E09000001']
+    objectids = np.arange(1, n_lads + 1)
+    gpd.GeoDataFrame({'objectid': objectids, 'lad17cd': lads},
+                     geometry=[geometry.box(i, 0, i + 1, 1) for i in range(n_lads)],
+                     crs='EPSG:27700').to_file(os.path.join(folder, 'lads.shp'))
+
+    zone_lads = np.repeat(np.arange(n_lads), zones_per_lad)
+    zones = np.array(['%s02%06d' % (lads[x][0], i) for i, x in enumerate(zone_lads)])
+    pd.DataFrame({'lad_zone_id': objectids[zone_lads], 'msoa_zone_id': zones,
+                  'overlap_type': 'msoa_in_lad', 'lad_to_msoa': 1 / zones_per_lad,
+                  'msoa_to_lad': 1.0}).to_csv(zones_folder + _default_lad_translation, index=False)
+
+    # Census land use by NS-SEC and SOC
+    n_rows = len(zones) * rows_per_zone
+    age = rng.choice(['under 16', '16-74', '75 or over'], n_rows, p=[0.2, 0.65, 0.15])
+    adult_gender = rng.choice(['Male', 'Females'], n_rows)
+    emp = rng.choice(['fte', 'pte', 'unm', 'stu'], n_rows, p=[0.45, 0.2, 0.2, 0.15])
+    employed = np.isin(emp, ['fte', 'pte']) & (age == '16-74')
+    soc = np.where(employed, rng.choice([1, 2, 3, np.nan], n_rows, p=[0.3, 0.4, 0.28, 0.02]), np.nan)
+    land_use = pd.DataFrame({
+        'ZoneID': np.repeat(zones, rows_per_zone),
+        'area_type': rng.integers(1, 9, n_rows),
+        'property_type': rng.choice(np.arange(1, 9), n_rows, p=[0.2, 0.2, 0.2, 0.2, 0.05, 0.05, 0.05, 0.05]),
+        'Age': age,
+        'Gender': np.where(age == 'under 16', 'Children', adult_gender),
+        'employment_type': np.where(age == '16-74', emp, 'non_wa'),
+        'ns_sec': rng.integers(1, 6, n_rows),
+        'household_composition': rng.integers(1, 9, n_rows),
+        'SOC_category': soc,
+        'people': rng.random(n_rows) * 10,
+    })
+    compress.write_out(land_use, home + _landuse_segments)
+
+    by_age = land_use.groupby(['ZoneID', 'Gender', 'Age'], as_index=False)['people'].sum()
+    compress.write_out(by_age, home + _default_landuse_2011)
+    by_age.assign(people=by_age['people'] * rng.random(len(by_age)) * 0.05).to_csv(
+        home + _default_communal_2011, index=False)
+
+    # EW MYPE by MSOA, and Scottish MYPE by LAD
+    ew_zones = zones[~pd.Series(zones).str.startswith('S').to_numpy()]
+    for gender, path in [('male', _mype_males), ('female', _mype_females)]:
+        pd.DataFrame({'Area Codes': ew_zones, 'gender': gender,
+                      'under_16': rng.random(len(ew_zones)) * 200,
+                      '16-74': rng.random(len(ew_zones)) * 800,
+                      '75 or over': rng.random(len(ew_zones)) * 100}).to_csv(imports + path, index=False)
+    scot_lads = [x for x in lads if x.startswith('S')]
+    for gender, path in [('Male', _mypeScot_males), ('Females', _mypeScot_females)]:
+        pd.DataFrame({'Area code': scot_lads, 'Gender': gender,
+                      'under 16': rng.random(len(scot_lads)) * 4000,
+                      '16-74': rng.random(len(scot_lads)) * 16000,
+                      '75 or over': rng.random(len(scot_lads)) * 2000}).to_csv(imports + path, index=False)
+
+    # Employment controls
+    countries = ['England and Wales number', 'Scotland number', 'Great Britain number']
+    pd.DataFrame({'Country': countries,
+                  'T01:7 (All aged 16 & over - In employment : All People )': [6e5, 1.5e5, 7.5e5]}
+                 ).to_csv(imports + _country_control, index=False)
+    soc_cols = ['T12a:%d (%d %s (SOC2010) : All people )' % (3 * i + 1, i + 1, name) for i, name in enumerate([
+        'Managers, Directors and Senior Officials', 'Professional Occupations',
+        'Associate Prof & Tech Occupations', 'Administrative and Secretarial Occupations',
+        'Skilled Trades Occupations', 'Caring, Leisure and Other Service Occupations',
+        'Sales and Customer Service Occupations', 'Process, Plant and Machine Operatives',
+        'Elementary occupations'])]
+    gb_soc = pd.DataFrame(rng.random((3, 9)) * 1e5, columns=soc_cols)
+    gb_soc.insert(0, 'Country', countries)
+    gb_soc.to_csv(imports + _gb_soc_totals, index=False)
+
+    emp_cols = ['T08:29 (Males - Aged 16 - 64 : Full-time ) number',
+                'T08:30 (Males - Aged 16 - 64 : Part-time ) number',
+                'T08:44 (Females - Aged 16 - 64 : Full-time ) number',
+                'T08:45 (Females - Aged 16 - 64 : Part-time ) number',
+                'T01:8 (All aged 16 & over - In employment : Males ) number',
+                'T01:9 (All aged 16 & over - In employment : Females ) number']
+    # One LAD has no controls, to be filled with the average
+    emp_controls = pd.DataFrame(rng.random((n_lads - 1, 6)) * 4000 + 1000, columns=emp_cols)
+    emp_controls.insert(0, 'lad17cd', lads[:-1])
+    emp_controls.to_csv(imports + _emp_controls, index=False)
+
+    lad_soc_cols = ['%% all in employment who are - %d: %s (SOC2010) numerator' % (i + 1, name)
+                    for i, name in enumerate([
+                        'managers, directors and senior officials', 'professional occupations',
+                        'associate prof & tech occupations', 'administrative and secretarial occupations',
+                        'skilled trades occupations', 'caring, leisure and other service occupations',
+                        'sales and customer service occupations', 'process, plant and machine operatives',
+                        'elementary occupations'])]
+    lad_soc = pd.DataFrame(np.round(rng.random((n_lads, 9)) * 5000), columns=lad_soc_cols).astype(object)
+    lad_soc.iloc[3, 2] = '-'
+    lad_soc.iloc[4, 5] = '!'
+    lad_soc.insert(0, 'lad17cd', lads)
+    lad_soc.to_csv(imports + _ladsoc_control, index=False)
+
+    # Properties and NTS car availability splits
+    pd.DataFrame({'ZoneID': np.repeat(zones, 8), 'census_property_type': np.tile(np.arange(1, 9), len(zones)),
+                  'UPRN': rng.integers(50, 500, len(zones) * 8),
+                  'population': rng.random(len(zones) * 8) * 1000}
+                 ).to_csv(home + '/classifiedResPropertyMSOA.csv', index=False)
+    nts = pd.MultiIndex.from_product([['fte', 'pte', 'unm', 'stu', 'non_wa'], range(1, 9), range(1, 9)],
+                                     names=['employment_type', 'area_type', 'household_composition']).to_frame(index=False)
+    nts['splits'] = rng.random(len(nts))
+    nts['splits'] /= nts.groupby(['employment_type', 'area_type'])['splits'].transform('sum')
+    nts.to_csv(home + '/nts_splits.csv', index=False)
+
+    by_lu_obj = types.SimpleNamespace(home_folder=home, import_folder=imports,
+                                      zones_folder=zones_folder, state=dict())
+    return by_lu_obj, os.path.join(folder, 'lads.shp')
+
+
+def mype_tests(n_lads=40, zones_per_lad=20, rows_per_zone=150):
+    """
+    Checks run_mype_fused() gives the same final land use and audits as
+    running each step of run_mype() in turn, on synthetic inputs, and times
+    them. Outputs are cleared between the two runs, so an audit the fused
+    mode fails to write is reported as missing.
+    """
+    import glob
+    import os
+    import tempfile
+    import time
+    global _default_ladRef
+
+    print("Running mid_year_pop_adjustments.py tests...")
+    default_lad_ref = _default_ladRef
+    with tempfile.TemporaryDirectory() as tmp:
+        by_lu_obj, _default_ladRef = _write_synthetic_mype_inputs(tmp, n_lads, zones_per_lad, rows_per_zone)
+        inputs = set(glob.glob(os.path.join(tmp, '**', '*'), recursive=True))
+        try:
+            outputs = dict()
+            timings = dict()
+            for name, fused in [('step by step', False), ('fused', True)]:
+                # Clear the previous run's outputs, so each mode is only compared on what it wrote
+                for path in set(glob.glob(os.path.join(tmp, '**', '*'), recursive=True)) - inputs:
+                    if os.path.isfile(path):
+                        os.remove(path)
+                by_lu_obj.state = dict()
+                start = time.perf_counter()
+                run_mype(by_lu_obj, fused=fused, write_intermediate=False)
+                timings[name] = time.perf_counter() - start
+
+                outputs[name] = {'final_land_use': compress.read_in(by_lu_obj.home_folder + '/final_land_use')}
+                for path in glob.glob(os.path.join(by_lu_obj.home_folder, '**', '*.csv'), recursive=True):
+                    if not path.endswith(('nts_splits.csv', 'classifiedResPropertyMSOA.csv',
+                                          'MSOACommunalEstablishments2011.csv')):
+                        outputs[name][os.path.relpath(path, by_lu_obj.home_folder)] = pd.read_csv(path)
+        finally:
+            _default_ladRef = default_lad_ref
+
+    expected, achieved = outputs.values()
+    assert expected.keys() == achieved.keys(), (expected.keys(), achieved.keys())
+    segments = [x for x in expected['final_land_use'].columns if x != 'people']
+    for name in expected:
+        df_1, df_2 = expected[name], achieved[name]
+        if name == 'final_land_use':
+            df_1, df_2 = [df.sort_values(segments + ['people']).reset_index(drop=True) for df in (df_1, df_2)]
+        pd.testing.assert_frame_equal(df_1, df_2, check_dtype=False, rtol=1e-9)
+    assert len(expected['final_land_use']) > 0
+
+    print('%d rows of land use: step by step %.1fs, fused %.1fs'
+          % (len(expected['final_land_use']), timings['step by step'], timings['fused']))
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    mype_tests()
@@ -20,8 +20,10 @@ For future years:
 import os
 import sys
 
+import numpy as np
 import pandas as pd
 from functools import reduce
+from typing import NamedTuple
 
 _UTILS_GIT = ('C:/Users/' +
               os.getlogin() +
@@ -57,6 +59,20 @@ sc02_pop = _import_folder + 'SC02_PP/population/future_growth_values.csv'
 sc03_pop = _import_folder + 'SC03_DD/population/future_growth_values.csv'
 sc04_pop = _import_folder + 'SC04_UZC/population/future_growth_values.csv'
 _landuse_path = 'Y:/NorMITs Land Use/iter3b/outputs/land_use_output_msoa.csv'
+_npier_sic_path = 'Y:/NorMITs Demand/import - test/scenarios/NPIER/North_summary_040920_v2_sic_formatted.xlsx'
+_msoa_rgn_lookup = 'Y:/NorMITs Land Use/import/MSOAtoRGNlookup.csv'
+_msoa_socs_folder = 'Y:/NorMITs Land Use/iter3b/outputs/scenarios/soc splits/'
+
+# Years, regions and SOC classes of the future year employment splits
+FY_YEARS = list(range(2019, 2051))
+NORTH = ['North West', 'North East', 'Yorkshire and The Humber', 'East Midlands']
+SOC_CLASSES = ['higher', 'medium', 'skilled']
+_region_names = {'EM': 'East Midlands', 'YH': 'Yorkshire and The Humber',
+                 'NW': 'North West', 'NE': 'North East'}
+_scenario_names = {sc01_jam: 'sc01_jam', sc02_pp: 'sc02_pp',
+                   sc03_dd: 'sc03_dd', sc04_uzc: 'sc04_uzc'}
+# NPIER case behind each scenario, business as usual or transformational
+_npier_cases = {sc01_jam: 'BAU', sc02_pp: 'BAU', sc03_dd: 'TRA', sc04_uzc: 'TRA'}
 
 
 def get_emp_values_fy(scenario):
@@ -100,7 +116,7 @@ def combine_sic_splits_fy(target_folder = _sic_to_soc):
        Combines all regional splits into one DataFrame    
     """
     
-    df_sheet_map = pd.read_excel(target_folder, sheetname=None)
+    df_sheet_map = pd.read_excel(target_folder, sheet_name=None)
     sicsoc = pd.concat(df_sheet_map, axis=0, ignore_index=True)
     sicsoc = sicsoc.drop(columns={2010, 2011, 2012, 2013, 2014, 2015, 2016, 2017, 2018})
     sicsoc['SIC'] = sicsoc['SIC'].str[:1]
@@ -139,7 +155,7 @@ def sic_splits_regions(scenario):
     # the values in the spreadsheets are in thousands but since we're deriving splits, it doesn't matter
     if scenario == sc01_jam or scenario == sc02_pp:
         sic_npier_bau = pd.read_excel('Y:/NorMITs Demand/import - test/scenarios/NPIER/North_summary_040920_v2_sic_formatted.xlsx', 
-                                      sheetname = 'BAU - North econ')
+                                      sheet_name = 'BAU - North econ')
         sic_npier_bau = sic_npier_bau.groupby(by=['SIC'], as_index = False).sum()
 
         bau = []
@@ -157,7 +173,7 @@ def sic_splits_regions(scenario):
     
     elif scenario == sc03_dd or scenario == sc04_uzc:
         sic_npier_tra = pd.read_excel('Y:/NorMITs Demand/import - test/scenarios/NPIER/North_summary_040920_v2_sic_formatted.xlsx', 
-                                      sheetname = 'TRA - North econ')
+                                      sheet_name = 'TRA - North econ')
         sic_npier_tra = sic_npier_tra.groupby(by=['SIC'], as_index = False).sum()
     
         tra= []
@@ -184,7 +200,7 @@ def derive_soc_fy(scenario):
     North = ['North West', 'North East', 'Yorkshire and The Humber', 'East Midlands']
     scenario_emp = scenario_emp.merge(msoa_lookup, on = 'msoa_zone_id')
     scenario_emp = scenario_emp[scenario_emp.Region.isin(North)]
-    scenario_emp_north = scenario_emp.groupby(by=['Region'], as_index = False).sum().drop(columns={'2018'})
+    scenario_emp_north = scenario_emp.groupby(by=['Region'], as_index = False).sum(numeric_only=True).drop(columns={'2018'})
     scenario_emp_north['North'] = 1
     # for regions outside assume 2018 split? unless there's another split for regions outside
     # split using the same splits for SIC for every region
@@ -238,12 +254,12 @@ def derive_soc_fy(scenario):
         fy_scenario_soc = fy_scenario_soc.drop(columns={(x), 'jobs_'+str(x)}) 
             
     # totals for each region by SOC (exclulding SOC 0)
-    soc_fy = fy_scenario_soc.groupby(by=['Region', 'soc_class'], as_index = False).sum().drop(columns={'North'})
+    soc_fy = fy_scenario_soc.groupby(by=['Region', 'soc_class'], as_index = False).sum(numeric_only=True).drop(columns={'North'})
     soc_fy.to_csv(_home_dir+'soc_fy.csv', index= False)
     
     # Need to convert to splits
     soc_fy['North'] = 1
-    soc_fy_splits = soc_fy.groupby(by = ['North', 'soc_class'], as_index = False).sum()
+    soc_fy_splits = soc_fy.groupby(by = ['North', 'soc_class'], as_index = False).sum(numeric_only=True)
     for x in range(int(2019), int(2051)):
         soc_fy_splits['total_'+str(x)] = soc_fy_splits['emp_'+str(x)].sum()
         soc_fy_splits['splits_'+str(x)] = soc_fy_splits['emp_'+str(x)]/soc_fy_splits['total_'+str(x)]
@@ -258,7 +274,7 @@ def quals_to_soc(scenario):
     # for non-North regions use 2018 splits for now
     
     if scenario == sc01_jam or scenario == sc02_pp:
-        npier_quals = pd.read_excel(_npierqualifications, Sheet = 'BAU - North demog')
+        npier_quals = pd.read_excel(_npierqualifications, sheet_name = 'BAU - North demog')
         quals = pd.read_excel(_qualstosoctranslation)
         
         # BAU scenario       
@@ -296,7 +312,7 @@ def quals_to_soc(scenario):
         return soc_quals_splits
 
     if scenario == sc03_dd or scenario == sc04_uzc:
-        npier_quals = pd.read_excel(_npierqualifications, Sheet = 'TRA - North demog')
+        npier_quals = pd.read_excel(_npierqualifications, sheet_name = 'TRA - North demog')
         quals = pd.read_excel(_qualstosoctranslation)
 
         fy_soc = npier_quals.merge(quals, on = 'Labour force by highest qualification')
@@ -375,7 +391,7 @@ def base_yr_soc_splits():
     # use the landuse base year splits here
 
     landuse = pd.read_csv(_landuse_path)
-    landuse_emp = landuse.groupby(by=['soc_cat', 'msoa_zone_id'], as_index = False).sum()
+    landuse_emp = landuse.groupby(by=['soc_cat', 'msoa_zone_id'], as_index = False).sum(numeric_only=True)
     msoa_lookup = pd.read_csv('Y:/NorMITs Land Use/import/MSOAtoRGNlookup.csv').rename(columns={'MSOA11CD':'msoa_zone_id'})
     msoa_lookup = msoa_lookup[['msoa_zone_id', 'RGN11NM']]
     msoa_lookup= msoa_lookup.rename(columns={'RGN11NM':'Region'})
@@ -420,8 +436,8 @@ def balance_msoa_fy_soc_splits(scenario):
 
     # North regions only  - change into splits
     by_socs_north = by_socs[by_socs.Region.isin(North)]
-    by_socs_reg = by_socs_north.groupby(by = ['Region', 'soc'], as_index = False).sum()
-    rgtots = by_socs_reg.groupby(by=['Region'], as_index = False).sum()
+    by_socs_reg = by_socs_north.groupby(by = ['Region', 'soc'], as_index = False).sum(numeric_only=True)
+    rgtots = by_socs_reg.groupby(by=['Region'], as_index = False).sum(numeric_only=True)
     land_rg_splits = by_socs_reg.merge(rgtots, on = ['Region'])
     for year in range(int(2019), int(2051)):    
         land_rg_splits[str(year)+'_lusplits'] = land_rg_splits['emp_'+str(year)+'_x']/land_rg_splits['emp_'+str(year)+'_y']
@@ -429,7 +445,7 @@ def balance_msoa_fy_soc_splits(scenario):
     
     # bring in regional constraint - change into splits
     rgn_socs = balance_northern_socs_fy(scenario)
-    tots = rgn_socs.groupby(by=['Region'], as_index = False).sum()
+    tots = rgn_socs.groupby(by=['Region'], as_index = False).sum(numeric_only=True)
     rgn_splits = rgn_socs.merge(tots, on = ['Region'])
     for year in range(int(2019), int(2051)):    
         rgn_splits[str(year)+'_splits'] = rgn_splits[str(year)+'_x']/rgn_splits[str(year)+'_y']
@@ -449,7 +465,7 @@ def balance_msoa_fy_soc_splits(scenario):
         zone_socs[(year)] = zone_socs['fc_'+str(year)]*zone_socs['emp_'+str(year)]
         zone_socs = zone_socs.drop(columns=['fc_'+str(year), 'emp_'+str(year)])
     zone_socs = zone_socs.drop(columns={'North_x', 'North_y'})  
-    zone_socs_reg = zone_socs.groupby(by=['Region'], as_index= False).sum()
+    zone_socs_reg = zone_socs.groupby(by=['Region'], as_index= False).sum(numeric_only=True)
 
     
     by_socs_out = by_socs[~by_socs.Region.isin(North)]
@@ -460,7 +476,7 @@ def balance_msoa_fy_soc_splits(scenario):
         by_socs_out = by_socs_out.drop(columns={'emp_'+str(year)})
  
     #zone_socs = zone_socs.drop(columns={'North_x', 'North_y'})
-    zone_socs_all = zone_socs.append(by_socs_out)
+    zone_socs_all = pd.concat([zone_socs, by_socs_out])
     if scenario == sc01_jam: 
         sc = 'sc01_jam'
     elif scenario == sc02_pp:
@@ -470,7 +486,7 @@ def balance_msoa_fy_soc_splits(scenario):
     elif scenario == sc04_uzc:
         sc='sc04_uzc'
     
-    zone_socs_all.to_csv('Y:/NorMITs Land Use/iter3b/outputs/scenarios/soc splits/'+sc+'_msoa_socs.csv', index = False)
+    zone_socs_all.to_csv(_msoa_socs_folder+sc+'_msoa_socs.csv', index = False)
     
     return rgn_socs
 
@@ -525,22 +541,389 @@ def fy_age_splits(scenario):
     
     """
     if scenario == sc01_jam or scenario == sc02_pp:
-        nwa_age_splits = pd.read_excel('Y:/NorMITs Demand/import - test/scenarios/NPIER/North_summary_040920_v2_age.xlsx', Sheet = 'BAU')
+        nwa_age_splits = pd.read_excel('Y:/NorMITs Demand/import - test/scenarios/NPIER/North_summary_040920_v2_age.xlsx', sheet_name = 'BAU')
         
     if scenario == sc03_dd or scenario == sc04_uzc:
-        nwa_age_splits = pd.read_excel('Y:/NorMITs Demand/import - test/scenarios/NPIER/North_summary_040920_v2_age.xlsx', Sheet = 'TRA')
+        nwa_age_splits = pd.read_excel('Y:/NorMITs Demand/import - test/scenarios/NPIER/North_summary_040920_v2_age.xlsx', sheet_name = 'TRA')
         
     return(nwa_age_splits)
-    
-        
-def build_employers_splits(scenario):
+
+
+class FyEmploymentInputs(NamedTuple):
+    """
+    Everything the future year SOC employment splits are built from, read
+    once by read_fy_employment_inputs().
+    """
+    emp: pd.DataFrame  # future year employment by MSOA, as get_emp_values_fy
+    sic_npier: pd.DataFrame  # NPIER North employment by SIC and year
+    sic_to_soc: pd.DataFrame  # SIC to SOC splits by region, all sheets combined
+    npier_quals: pd.DataFrame  # NPIER North labour force by qualification and year
+    quals_to_soc: pd.DataFrame  # qualification to SOC class splits
+    msoa_lookup: pd.DataFrame  # msoa_zone_id to Region
+    landuse: pd.DataFrame  # base year people by msoa_zone_id and soc_cat
+
+
+def read_fy_employment_inputs(scenario):
+    """
+    Reads the inputs of the future year SOC employment splits for a
+    scenario, once each.
+
+    Parameters
+    ----------
+    scenario:
+        One of sc01_jam, sc02_pp, sc03_dd and sc04_uzc
+
+    Returns
+    ----------
+    inputs:
+        FyEmploymentInputs
+    """
+    if scenario not in _npier_cases:
+        raise ValueError("Scenario %s is not supported, scenarios are: %s"
+                         % (scenario, list(_scenario_names.values())))
+    case = _npier_cases[scenario]
+
+    sic_to_soc = pd.read_excel(_sic_to_soc, sheet_name=None)
+    msoa_lookup = pd.read_csv(_msoa_rgn_lookup, usecols=['MSOA11CD', 'RGN11NM'])
+
+    return FyEmploymentInputs(
+        emp=get_emp_values_fy(scenario),
+        sic_npier=pd.read_excel(_npier_sic_path, sheet_name=case + ' - North econ'),
+        sic_to_soc=pd.concat(sic_to_soc, axis=0, ignore_index=True),
+        npier_quals=pd.read_excel(_npierqualifications, sheet_name=case + ' - North demog'),
+        quals_to_soc=pd.read_excel(_qualstosoctranslation),
+        msoa_lookup=msoa_lookup.rename(columns={'MSOA11CD': 'msoa_zone_id', 'RGN11NM': 'Region'}),
+        landuse=pd.read_csv(_landuse_path, usecols=['msoa_zone_id', 'soc_cat', 'people']),
+    )
+
+
+def _year_values(df, years):
+    """
+    The year columns of df as a (rows x years) array, whether the columns
+    are named by int or str years.
+    """
+    columns = [year if year in df.columns else str(year) for year in years]
+    return df[columns].to_numpy(dtype=float)
+
+
+def _sum_years_by(df, keys, years):
+    """
+    Sums the year columns of df by keys, returning a DataFrame indexed by
+    keys with a column for each position in years.
+    """
+    grouped = pd.DataFrame(_year_values(df, years), index=df.index)
+    grouped = grouped.groupby([df[k] for k in keys]).sum()
+    return grouped
+
+
+def _regional_soc_class_splits(sic_to_soc, years):
+    """
+    Sums the SIC to SOC splits by Region, soc_class and SIC, as
+    combine_sic_splits_fy and classify_soc do in derive_soc_fy.
+    """
+    splits = pd.DataFrame({
+        'Region': sic_to_soc['Region'].replace(_region_names),
+        'SIC': sic_to_soc['SIC'].str[:1],
+    })
+    soc = pd.to_numeric(sic_to_soc['SOC'].str[:2])
+    splits['soc'] = np.select([soc < 40, soc < 80, soc < 100], SOC_CLASSES, default=None)
+    values = pd.DataFrame(_year_values(sic_to_soc, years), index=splits.index)
+    return values.groupby([splits['Region'], splits['soc'], splits['SIC']]).sum()
+
+
+def _quals_soc_class_splits(npier_quals, quals_to_soc, years):
+    """
+    Northern SOC class splits of the NPIER labour force by qualification,
+    as quals_to_soc, as a (soc x years) DataFrame.
+    """
+    quals = npier_quals.merge(quals_to_soc, on='Labour force by highest qualification')
+    by_soc = quals[['High', 'Medium', 'Skilled']].to_numpy(dtype=float).T @ _year_values(quals, years)
+    return pd.DataFrame(by_soc / by_soc.sum(axis=0), index=pd.Index(SOC_CLASSES, name='soc'))
+
+
+def _base_year_soc_splits(landuse):
+    """
+    Base year SOC splits of each MSOA, as base_yr_soc_splits.
+    """
+    land = landuse[landuse['soc_cat'].isin([1, 2, 3])]
+    land = land.groupby(['msoa_zone_id', 'soc_cat'], as_index=False)['people'].sum()
+    land['soc_splits'] = land['people'] / land.groupby('msoa_zone_id')['people'].transform('sum')
+    land['soc'] = land['soc_cat'].map(dict(zip([1, 2, 3], SOC_CLASSES)))
+    return land[['msoa_zone_id', 'soc', 'soc_splits']]
+
+
+def _to_long(keys, values, years, value_name):
+    """
+    Unpivots a (rows x years) array, with a DataFrame of keys for its rows,
+    to one row per key and year.
+    """
+    long = keys.iloc[np.repeat(np.arange(len(keys)), len(years))].reset_index(drop=True)
+    long['year'] = np.tile(years, len(keys))
+    long[value_name] = values.reshape(-1)
+    return long
+
+
+def project_soc_employment(inputs, years=None):
+    """
+    Builds the future year employment by MSOA and SOC class for every year
+    at once, holding each quantity as an array with a year axis.
+
+    Gives the same employment as balance_northern_socs_fy and
+    balance_msoa_fy_soc_splits, without adding and dropping columns a year
+    at a time or merging frames for each year.
+    1. SIC shares of NPIER North employment
+    2. Employment of each northern region by SIC, and by SOC class with
+       the regional SIC to SOC splits
+    3. Northern SOC class splits, controlled to NPIER qualifications
+    4. MSOA employment split by base year SOC splits, then balanced to the
+       regional SOC class splits in the North
+
+    Parameters
+    ----------
+    inputs:
+        FyEmploymentInputs, from read_fy_employment_inputs()
+    years:
+        Years to build, FY_YEARS if None
+
+    Returns
+    ----------
+    msoa_socs:
+        Long format employment by msoa_zone_id, Region, soc and year
+    rgn_socs:
+        Long format northern employment by Region, soc and year
+    """
+    years = FY_YEARS if years is None else list(years)
+
+    # Employment by MSOA, of the MSOAs with a region
+    region = inputs.msoa_lookup.drop_duplicates('msoa_zone_id').set_index('msoa_zone_id')['Region']
+    emp = _sum_years_by(inputs.emp, ['msoa_zone_id'], years)
+    emp = emp[emp.index.isin(region.index)]
+    north_emp = emp.groupby(region.reindex(emp.index).to_numpy()).sum()
+    north_emp = north_emp[north_emp.index.isin(NORTH)]
+
+    # 1. SIC shares of NPIER employment
+    sic_shares = _sum_years_by(inputs.sic_npier, ['SIC'], years)
+    sic_shares = sic_shares / sic_shares.sum()
+
+    # 2. Regional employment by SIC and SOC class
+    splits = _regional_soc_class_splits(inputs.sic_to_soc, years)
+    split_regions = splits.index.get_level_values('Region')
+    split_sics = splits.index.get_level_values('SIC')
+    splits = splits[split_regions.isin(north_emp.index) & split_sics.isin(sic_shares.index)]
+    jobs = (north_emp.reindex(splits.index.get_level_values('Region')).to_numpy()
+            * sic_shares.reindex(splits.index.get_level_values('SIC')).to_numpy())
+    soc_fy = (splits * jobs).groupby(level=['Region', 'soc']).sum()
+
+    # 3. Control the northern SOC class splits to qualifications
+    soc_fy_splits = soc_fy.groupby(level='soc').sum()
+    soc_fy_splits = soc_fy_splits / soc_fy_splits.sum()
+    quals_splits = _quals_soc_class_splits(inputs.npier_quals, inputs.quals_to_soc, years)
+    soc_factors = quals_splits.reindex(soc_fy_splits.index) / soc_fy_splits
+    soc_fy = soc_fy[soc_fy.index.get_level_values('soc').isin(quals_splits.index)]
+    rgn_socs = soc_fy * soc_factors.reindex(soc_fy.index.get_level_values('soc')).to_numpy()
+
+    # 4. Split MSOA employment by SOC, and balance the North to rgn_socs
+    by_socs = _base_year_soc_splits(inputs.landuse)
+    by_socs = by_socs[by_socs['msoa_zone_id'].isin(emp.index)].reset_index(drop=True)
+    by_socs['Region'] = region.reindex(by_socs['msoa_zone_id']).to_numpy()
+    msoa_emp = (emp.reindex(by_socs['msoa_zone_id']).to_numpy()
+                * by_socs['soc_splits'].to_numpy()[:, None])
+
+    north = by_socs['Region'].isin(NORTH).to_numpy()
+    north_keys = pd.MultiIndex.from_frame(by_socs.loc[north, ['Region', 'soc']])
+    lu_splits = pd.DataFrame(msoa_emp[north], index=north_keys).groupby(level=['Region', 'soc']).sum()
+    lu_splits = lu_splits / lu_splits.groupby(level='Region').transform('sum')
+    rgn_splits = rgn_socs / rgn_socs.groupby(level='Region').transform('sum')
+    balanced = lu_splits.index.intersection(rgn_splits.index)
+    factors = rgn_splits.reindex(balanced) / lu_splits.reindex(balanced)
+
+    # Northern rows without a factor are dropped, as their merge did
+    keep = ~north
+    keep[north] = north_keys.isin(balanced)
+    msoa_emp[north & keep] *= factors.reindex(north_keys[keep[north]]).to_numpy()
+
+    msoa_socs = _to_long(by_socs.loc[keep, ['msoa_zone_id', 'Region', 'soc']],
+                         msoa_emp[keep], years, 'emp')
+    rgn_socs = _to_long(rgn_socs.index.to_frame(index=False), rgn_socs.to_numpy(), years, 'emp')
+    return msoa_socs, rgn_socs
+
+
+def build_employers_splits(scenario, engine=False):
+    """
+    Builds the future year MSOA SOC splits for a scenario.
+
+    Parameters
+    ----------
+    scenario:
+        One of sc01_jam, sc02_pp, sc03_dd and sc04_uzc
+    engine:
+        If True, builds every year at once with project_soc_employment()
+        from inputs read once, and writes a single long format table of
+        employment by MSOA, SOC class and year.
+        Otherwise runs balance_northern_socs_fy and
+        balance_msoa_fy_soc_splits, writing employment with a column per
+        year.
+
+    Returns
+    ----------
+    None
+    """
+    if engine:
+        msoa_socs, _ = project_soc_employment(read_fy_employment_inputs(scenario))
+        msoa_socs.to_csv(_msoa_socs_folder + _scenario_names[scenario] + '_msoa_socs_long.csv',
+                         index=False)
+        return
+
     # scenario can be sc01_jam, sc02_pp, sc03_dd, sc04_uzc
     balance_northern_socs_fy(scenario)
     balance_msoa_fy_soc_splits(scenario) # this should write out the MSOA level SOC split
-    
-        
-    
-    
-    
 
 
+def _synthetic_fy_employment_inputs(rng, n_msoa, region_codes, sic_npier, sic_to_soc_sics,
+                                    looked_up_msoas=None):
+    """
+    Synthetic FyEmploymentInputs, with the SIC to SOC splits given for
+    region_codes and sic_to_soc_sics, NPIER employment for sic_npier, and
+    regions looked up for the first looked_up_msoas MSOAs (all if None).
+    """
+    years = list(range(2018, 2051))
+    regions = NORTH + ['London']
+    msoas = ['E02%06d' % i for i in range(n_msoa)]
+    quals = ['NVQ4+', 'NVQ3', 'NVQ1', 'None']
+
+    def with_years(df, low, high, years=years):
+        values = pd.DataFrame(rng.uniform(low, high, (len(df), len(years))), columns=years)
+        return pd.concat([df.reset_index(drop=True), values], axis=1)
+
+    emp = with_years(pd.DataFrame({'msoa_zone_id': msoas}), 10, 1000)
+    emp.columns = [str(c) for c in emp.columns]
+    sic_to_soc = pd.DataFrame([(code, s + ': sector', '%d1 job' % soc)
+                               for code in region_codes
+                               for s in sic_to_soc_sics for soc in range(1, 10)],
+                              columns=['Region', 'SIC', 'SOC'])
+    looked_up = msoas[:looked_up_msoas]
+    return FyEmploymentInputs(
+        emp=emp,
+        sic_npier=with_years(pd.DataFrame({'SIC': sic_npier}), 1, 100),
+        # With the 2010-2017 columns combine_sic_splits_fy drops
+        sic_to_soc=with_years(sic_to_soc, 0, 1, list(range(2010, 2051))),
+        npier_quals=with_years(pd.DataFrame({'Labour force by highest qualification': quals}), 100, 1000),
+        quals_to_soc=pd.concat([pd.DataFrame({'Labour force by highest qualification': quals}),
+                                pd.DataFrame(rng.dirichlet([1, 1, 1], len(quals)),
+                                             columns=['High', 'Medium', 'Skilled'])], axis=1),
+        msoa_lookup=pd.DataFrame({'msoa_zone_id': looked_up,
+                                  'Region': rng.choice(regions, len(looked_up))}),
+        landuse=pd.DataFrame({'msoa_zone_id': rng.choice(msoas, 10 * n_msoa),
+                              'soc_cat': rng.integers(0, 4, 10 * n_msoa),
+                              'people': rng.uniform(0, 50, 10 * n_msoa)}),
+    )
+
+
+def _legacy_soc_employment(inputs, scenario, folder):
+    """
+    Runs balance_northern_socs_fy and balance_msoa_fy_soc_splits on inputs,
+    with the pandas readers patched to return them and every output
+    written to folder. Returns the MSOA employment they write, with a
+    column per year.
+    """
+    global _home_dir, _msoa_socs_folder
+    case = _npier_cases[scenario]
+    csvs = {
+        scenario: inputs.emp.assign(**{'soc': 0, '% of MSOA_people_sum': 0, 'MSOA people sum': 0}),
+        _msoa_rgn_lookup: inputs.msoa_lookup.rename(columns={'msoa_zone_id': 'MSOA11CD',
+                                                             'Region': 'RGN11NM'}),
+        _landuse_path: inputs.landuse,
+    }
+    sheets = {
+        (_sic_to_soc, None): {'Sheet1': inputs.sic_to_soc},
+        (_npier_sic_path, case + ' - North econ'): inputs.sic_npier,
+        (_npierqualifications, case + ' - North demog'): inputs.npier_quals,
+        (_qualstosoctranslation, 0): inputs.quals_to_soc,
+    }
+    read_csv, read_excel = pd.read_csv, pd.read_excel
+
+    def patched_read_csv(path, *args, **kwargs):
+        if path in csvs:
+            return csvs[path].copy()
+        return read_csv(path, *args, **kwargs)
+
+    def patched_read_excel(path, sheet_name=0):
+        sheet = sheets[path, sheet_name]
+        return {k: v.copy() for k, v in sheet.items()} if sheet_name is None else sheet.copy()
+
+    home_dir, msoa_socs_folder = _home_dir, _msoa_socs_folder
+    _home_dir = _msoa_socs_folder = folder + '/'
+    pd.read_csv, pd.read_excel = patched_read_csv, patched_read_excel
+    try:
+        build_employers_splits(scenario)
+    finally:
+        pd.read_csv, pd.read_excel = read_csv, read_excel
+        _home_dir, _msoa_socs_folder = home_dir, msoa_socs_folder
+    return pd.read_csv(os.path.join(folder, _scenario_names[scenario] + '_msoa_socs.csv'))
+
+
+def sic_to_soc_fy_tests(n_msoa=300, seed=0):
+    """
+    Checks project_soc_employment() on synthetic inputs: MSOAs outside the
+    North keep their base year SOC splits, and the North matches the
+    regional SOC class splits and the qualifications control. Then checks
+    it gives the same MSOA employment as balance_msoa_fy_soc_splits, on
+    inputs where its merges drop rows.
+    """
+    import tempfile
+
+    print("Running sic_to_soc_fy.py tests...")
+    rng = np.random.default_rng(seed)
+    sics = list('ABCDEF')
+    inputs = _synthetic_fy_employment_inputs(rng, n_msoa, ['NW', 'NE', 'YH', 'EM'], sics, sics)
+    emp = inputs.emp
+    msoa_socs, rgn_socs = project_soc_employment(inputs)
+
+    # Every key has every year
+    assert len(msoa_socs) == len(msoa_socs.drop_duplicates(['msoa_zone_id', 'soc'])) * len(FY_YEARS)
+    assert sorted(msoa_socs['year'].unique()) == FY_YEARS
+
+    # Outside the North, MSOA employment is split by the base year splits
+    splits = _base_year_soc_splits(inputs.landuse)
+    london = msoa_socs[msoa_socs['Region'] == 'London'].merge(splits, on=['msoa_zone_id', 'soc'])
+    london = london.merge(emp.melt(id_vars='msoa_zone_id', var_name='year', value_name='total')
+                          .astype({'year': int}), on=['msoa_zone_id', 'year'])
+    assert np.allclose(london['emp'], london['total'] * london['soc_splits'])
+
+    # In the North, MSOAs sum to the regional SOC class splits
+    def shares(df, by):
+        totals = df.groupby(by)['emp'].sum()
+        return totals / totals.groupby(level=[b for b in by if b != 'soc']).transform('sum')
+    achieved = shares(msoa_socs[msoa_socs['Region'].isin(NORTH)], ['Region', 'year', 'soc'])
+    expected = shares(rgn_socs, ['Region', 'year', 'soc'])
+    assert np.allclose(achieved, expected.reindex(achieved.index))
+
+    # And the North as a whole is controlled to the qualifications splits
+    north = shares(rgn_socs.assign(North=1), ['North', 'year', 'soc'])
+    quals_splits = _quals_soc_class_splits(inputs.npier_quals, inputs.quals_to_soc, FY_YEARS)
+    assert np.allclose(north.unstack('soc')[quals_splits.index].to_numpy(), quals_splits.to_numpy().T)
+
+    # Against the legacy process. East Midlands has no SIC to SOC splits, so
+    # none of its MSOAs have a factor, Yorkshire and The Humber has none
+    # for the skilled SOC class, SIC F has no splits and G no NPIER
+    # employment, and the last MSOAs have no region.
+    inputs = _synthetic_fy_employment_inputs(rng, n_msoa, ['NW', 'NE', 'YH'], list('ABCDEF'), list('ABCDEG'),
+                                             looked_up_msoas=n_msoa - 20)
+    yh_skilled = (inputs.sic_to_soc['Region'] == 'YH') & (inputs.sic_to_soc['SOC'].str[0].astype(int) >= 8)
+    inputs = inputs._replace(sic_to_soc=inputs.sic_to_soc[~yh_skilled].reset_index(drop=True))
+    with tempfile.TemporaryDirectory() as tmp:
+        expected = _legacy_soc_employment(inputs, sc01_jam, tmp)
+    achieved = project_soc_employment(inputs)[0].pivot(
+        index=['msoa_zone_id', 'soc', 'Region'], columns='year', values='emp')
+    expected = expected.set_index(['msoa_zone_id', 'soc', 'Region'])[[str(y) for y in FY_YEARS]]
+    expected.columns = FY_YEARS
+    expected.columns.name = 'year'
+    assert not expected.index.get_level_values('Region').isin(['East Midlands']).any()
+    assert len(expected) < len(inputs.emp) * len(SOC_CLASSES)
+    pd.testing.assert_frame_equal(achieved.sort_index(), expected.sort_index(), rtol=1e-10)
+
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    sic_to_soc_fy_tests()
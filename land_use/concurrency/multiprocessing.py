@@ -14,17 +14,35 @@ import os
 import sys
 import time
 import warnings
+import queue
+import functools
+import itertools
 import traceback
+import collections
 
 from typing import Any
 from typing import List
 from typing import Dict
+from typing import Tuple
 from typing import Iterable
+from typing import Iterator
 from typing import Callable
 
 from multiprocessing import Event
 from multiprocessing import TimeoutError
 from multiprocessing import Pool as ProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# How often, in seconds, to check for errors elsewhere in a pool while
+# blocked waiting on a result
+_EVENT_CHECK_INTERVAL = 1
+
+# Shared memory blocks this process has attached to, by name.
+# Kept open so arrays built on top of them stay valid between tasks.
+_ATTACHED_SHARED_MEMORY = dict()
 
 
 class MultiprocessingError(Exception):
@@ -90,60 +108,44 @@ def wait_for_pool_results(results, terminate_process_event, result_timeout):
     -------
     results_out:
         A list of the results collected from the original results.
-        May not be in the same order as received.
+        In the same order as results.
     """
-    # Initialise loop
+    # Init
     start_time = time.time()
-    got_all_results = False
     return_results = list()
-    n_start_results = len(results)
-
-    while not got_all_results:
-        # Wait for a little bit to avoid intensive looping
-        time.sleep(0.05)
-
-        # Check for an event
-        if terminate_process_event.is_set():
-            raise MultiprocessingError(
-                "While getting results terminate_process_event was set.")
-
-        # Check if we've ran out of time
-        if (time.time() - start_time) > result_timeout:
-            raise TimeoutError("Ran out of time while waiting for results.")
-
-        # Check if we have any results
-        res_to_remove = list()
-        for i, res in enumerate(results):
-            if not res.ready():
-                continue
 
-            if not res.successful():
+    for res in results:
+        # Block until this result is ready. AsyncResult.wait() returns as
+        # soon as it is, only waking up early to check on the rest of the pool
+        while not res.ready():
+            if terminate_process_event.is_set():
                 raise MultiprocessingError(
-                    "An error occurred in one of the processes.")
+                    "While getting results terminate_process_event was set.")
 
-            # Give a minute to get the result
-            # Shouldn't take this long as we know the result is ready
-            return_results.append(res.get(60))
-            res_to_remove.append(i)
+            remaining_time = result_timeout - (time.time() - start_time)
+            if remaining_time <= 0:
+                raise TimeoutError("Ran out of time while waiting for results.")
 
-        # Remove results we've got
-        for i in sorted(res_to_remove, reverse=True):
-            del results[i]
+            res.wait(min(remaining_time, _EVENT_CHECK_INTERVAL))
 
-        # Quick sanity check
-        if not len(results) + len(return_results) == n_start_results:
+        if not res.successful():
             raise MultiprocessingError(
-                "While getting the multiprocessing results an error occurred." +
-                "Lost one or more results. Started with %d, now have %d." %
-                (n_start_results, len(results)+len(return_results)))
+                "An error occurred in one of the processes.")
 
-        # Check if we have all results
-        if len(return_results) == n_start_results:
-            got_all_results = True
+        return_results.append(res.get())
 
     return return_results
 
 
+class _TaskError:
+    """
+    Placed on a completion queue in place of a result when a task fails
+    """
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
 def _call_order_wrapper(index, func, *args, **kwargs):
     """
     A function wrapper allowing an index to be added to the function call
@@ -159,6 +161,154 @@ def _call_order_wrapper(index, func, *args, **kwargs):
     return index, func(*args, **kwargs)
 
 
+class SharedArrayHandle:
+    """
+    A lightweight, picklable reference to a numpy array in shared memory.
+
+    Only the name, shape and dtype are pickled when the handle is passed to
+    a worker. resolve() attaches to the shared memory block and returns a
+    read-only array backed by it, without copying the data.
+    """
+
+    def __init__(self, name: str, shape: Tuple[int, ...], dtype: np.dtype):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+    def resolve(self) -> np.ndarray:
+        """
+        Returns the shared array. Must be treated as read-only.
+        """
+        shm = _ATTACHED_SHARED_MEMORY.get(self.name)
+        if shm is None:
+            # Pool workers share the resource tracker of the creating
+            # process, so attaching here does not take ownership of the block
+            shm = shared_memory.SharedMemory(name=self.name)
+            _ATTACHED_SHARED_MEMORY[self.name] = shm
+
+        arr = np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+        arr.flags.writeable = False
+        return arr
+
+
+class SharedDataFrameHandle:
+    """
+    A lightweight, picklable reference to a pd.DataFrame in shared memory.
+
+    Every column (and the index) with a plain numpy dtype is stored as a
+    SharedArrayHandle. Any other columns, e.g. object or categorical, are
+    pickled as normal alongside the handles.
+    """
+
+    def __init__(self,
+                 columns: List[Tuple[Any, Any]],
+                 index: Any,
+                 index_names: List[Any],
+                 ):
+        self.columns = columns
+        self.index = index
+        self.index_names = index_names
+
+    def resolve(self) -> pd.DataFrame:
+        """
+        Returns the shared dataframe. Must be treated as read-only.
+        """
+        data = {i: _resolve_shared(col) for i, (_, col) in enumerate(self.columns)}
+        index = _resolve_shared(self.index)
+        df = pd.DataFrame(data, index=index, copy=False)
+        df.columns = [name for name, _ in self.columns]
+        df.index.names = self.index_names
+        return df
+
+
+def _resolve_shared(o: Any) -> Any:
+    """
+    Resolves o back into its object if it is a shared memory handle
+    """
+    if isinstance(o, (SharedArrayHandle, SharedDataFrameHandle)):
+        return o.resolve()
+    return o
+
+
+def _is_shareable_array(o: Any) -> bool:
+    """
+    True if o is a numpy array that can be placed directly in shared memory
+    """
+    return isinstance(o, np.ndarray) and not o.dtype.hasobject
+
+
+class _SharedPayload:
+    """
+    Context manager placing objects into shared memory for a pool's lifetime.
+
+    numpy arrays and pandas DataFrames are copied into shared memory once
+    and replaced by handles. All other objects are passed through as they
+    are. The shared memory is released on exit.
+    """
+
+    def __init__(self, objects: Dict[str, Any]):
+        self.objects = objects
+        self._blocks = list()
+
+    def _share_array(self, arr: np.ndarray) -> SharedArrayHandle:
+        arr = np.ascontiguousarray(arr)
+        shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        self._blocks.append(shm)
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+        return SharedArrayHandle(shm.name, arr.shape, arr.dtype)
+
+    def _share(self, o: Any) -> Any:
+        if _is_shareable_array(o):
+            return self._share_array(o)
+
+        if isinstance(o, pd.DataFrame):
+            columns = list()
+            for i, name in enumerate(o.columns):
+                col = o.iloc[:, i]
+                if _is_shareable_array(col.values):
+                    columns.append((name, self._share_array(col.values)))
+                else:
+                    columns.append((name, col.values))
+
+            index = o.index
+            if not isinstance(index, (pd.RangeIndex, pd.MultiIndex)) and _is_shareable_array(index.values):
+                index = self._share_array(index.values)
+
+            return SharedDataFrameHandle(columns, index, list(o.index.names))
+
+        return o
+
+    def __enter__(self) -> Dict[str, Any]:
+        try:
+            return {k: self._share(v) for k, v in self.objects.items()}
+        except BaseException:
+            self.release()
+            raise
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def release(self):
+        """
+        Closes and unlinks all the shared memory created by this payload
+        """
+        for shm in self._blocks:
+            shm.close()
+            shm.unlink()
+        self._blocks = list()
+
+
+def _call_shared_wrapper(func, shared_kwargs, *args, **kwargs):
+    """
+    A function wrapper resolving shared memory handles before calling func
+
+    shared_kwargs are resolved in the worker and passed to func alongside
+    the kwargs for the individual call.
+    """
+    resolved = {k: _resolve_shared(v) for k, v in shared_kwargs.items()}
+    return func(*args, **resolved, **kwargs)
+
+
 def _check_args_kwargs(args: List[Any],
                        kwargs: List[Any],
                        args_default: Any = None,
@@ -193,7 +343,8 @@ def _process_pool_wrapper_kwargs_in_order(fn,
                                           kwargs=None,
                                           process_count=os.cpu_count()-1,
                                           pool_maxtasksperchild=4,
-                                          result_timeout=86400):
+                                          result_timeout=86400,
+                                          shared_kwargs=None):
     """
     See process_pool_wrapper() for full documentation of this function.
     Sister function with _process_pool_wrapper_kwargs_out_order().
@@ -201,8 +352,12 @@ def _process_pool_wrapper_kwargs_in_order(fn,
     """
     args, kwargs = _check_args_kwargs(args, kwargs)
     terminate_processes_event = Event()
+    shared_kwargs = dict() if shared_kwargs is None else shared_kwargs
 
-    with ProcessPool(processes=process_count, maxtasksperchild=pool_maxtasksperchild) as pool:
+    with _SharedPayload(shared_kwargs) as shared_handles, \
+            ProcessPool(processes=process_count, maxtasksperchild=pool_maxtasksperchild) as pool:
+        if len(shared_handles) > 0:
+            fn = functools.partial(_call_shared_wrapper, fn, shared_handles)
         kill_pool = create_kill_pool_fn(pool, terminate_processes_event)
 
         try:
@@ -240,7 +395,8 @@ def _process_pool_wrapper_kwargs_out_order(fn,
                                            kwargs=None,
                                            process_count=os.cpu_count()-1,
                                            pool_maxtasksperchild=4,
-                                           result_timeout=86400):
+                                           result_timeout=86400,
+                                           shared_kwargs=None):
     """
     See process_pool_wrapper() for full documentation of this function.
     Sister function with _process_pool_wrapper_kwargs_in_order().
@@ -249,8 +405,12 @@ def _process_pool_wrapper_kwargs_out_order(fn,
     args, kwargs = _check_args_kwargs(args, kwargs)
 
     terminate_process_event = Event()
+    shared_kwargs = dict() if shared_kwargs is None else shared_kwargs
 
-    with ProcessPool(processes=process_count, maxtasksperchild=pool_maxtasksperchild) as pool:
+    with _SharedPayload(shared_kwargs) as shared_handles, \
+            ProcessPool(processes=process_count, maxtasksperchild=pool_maxtasksperchild) as pool:
+        if len(shared_handles) > 0:
+            fn = functools.partial(_call_shared_wrapper, fn, shared_handles)
         kill_pool = create_kill_pool_fn(pool, terminate_process_event)
 
         try:
@@ -279,13 +439,39 @@ def _process_pool_wrapper_kwargs_out_order(fn,
     return results
 
 
+def get_process_count(process_count: int) -> int:
+    """
+    Validates process_count and converts negative values into the number
+    of processes to use. See multiprocess() for how values are treated.
+    """
+    # Validate process_count
+    if process_count < -os.cpu_count():
+        raise ValueError(
+            "Negative process_count given is too small. Cannot run %d less "
+            "processes than cpu count as only %d cpu have been found by python."
+            % (process_count, os.cpu_count())
+        )
+
+    if process_count > os.cpu_count()-1:
+        warnings.warn("process_count given is too high! It is higher than the "
+                      "cpu count - 1  This might cause your system to run "
+                      "really slow!")
+
+    # Determine the number of processes to use
+    if process_count < 0:
+        process_count = os.cpu_count() + process_count
+
+    return process_count
+
+
 def multiprocess(fn: Callable,
                  args: List[Iterable[Any]] = None,
                  kwargs: List[Dict[str, Any]] = None,
                  process_count: int = os.cpu_count()-1,
                  pool_maxtasksperchild: int = 4,
                  in_order: bool = False,
-                 result_timeout: int = 86400
+                 result_timeout: int = 86400,
+                 shared_kwargs: Dict[str, Any] = None,
                  ) -> Any:
     """
     Runs the given function with the arguments given in a multiprocessing.Pool,
@@ -339,6 +525,15 @@ def multiprocess(fn: Callable,
         because the results have taken too long to return
         Defaults to 86400 seconds, (24 hours).
 
+    shared_kwargs:
+        A dictionary of keyword arguments to pass to every call of fn, on top
+        of kwargs. Any numpy arrays or pandas DataFrames are placed in shared
+        memory once, and each worker is given a lightweight handle to them
+        rather than a pickled copy per call. In the worker these are
+        rebuilt without copying, so fn must treat them as read-only.
+        Useful when every call of fn needs the same large inputs.
+        Defaults to None.
+
     Examples
     --------
     The following three function calls:
@@ -364,34 +559,12 @@ def multiprocess(fn: Callable,
     """
     # Init
     args, kwargs = _check_args_kwargs(args, kwargs)
-
-    # Validate process_count
-    if process_count < -os.cpu_count():
-        raise ValueError(
-            "Negative process_count given is too small. Cannot run %d less "
-            "processes than cpu count as only %d cpu have been found by python."
-            % (process_count, os.cpu_count())
-        )
-
-    if process_count > os.cpu_count()-1:
-        warnings.warn("process_count given is too high! It is higher than the "
-                      "cpu count - 1  This might cause your system to run "
-                      "really slow!")
-
-    # Determine the number of processes to use
-    if process_count < 0:
-        if process_count < -os.cpu_count():
-            raise ValueError(
-                "Negative process_count given is too small. Cannot run %d less "
-                "processes than cpu count as only %d cpu can be used."
-                % (process_count, os.cpu_count())
-            )
-        else:
-            process_count = os.cpu_count() + process_count
+    process_count = get_process_count(process_count)
 
     # If the process count is 0, run as a normal for loop
     if process_count == 0:
-        return [fn(*a, **k) for a, k in zip(args, kwargs)]
+        shared_kwargs = dict() if shared_kwargs is None else shared_kwargs
+        return [fn(*a, **shared_kwargs, **k) for a, k in zip(args, kwargs)]
 
     # If we get here, the process count must be > 0 and valid
     return process_pool_wrapper(
@@ -401,17 +574,194 @@ def multiprocess(fn: Callable,
         process_count=process_count,
         pool_maxtasksperchild=pool_maxtasksperchild,
         in_order=in_order,
-        result_timeout=result_timeout
+        result_timeout=result_timeout,
+        shared_kwargs=shared_kwargs,
     )
 
 
+def multiprocess_iter(fn: Callable,
+                      args: List[Iterable[Any]] = None,
+                      kwargs: List[Dict[str, Any]] = None,
+                      process_count: int = os.cpu_count()-1,
+                      pool_maxtasksperchild: int = 4,
+                      in_order: bool = False,
+                      result_timeout: int = 86400,
+                      max_pending: int = None,
+                      shared_kwargs: Dict[str, Any] = None,
+                      ) -> Iterator[Any]:
+    """
+    Runs the given function with the arguments given in a multiprocessing.Pool,
+    yielding each function output as it completes.
+
+    Unlike multiprocess(), results are not held until every call has
+    finished. Each one is handed to the caller as soon as it arrives on a
+    completion queue, so it can be consumed and discarded straight away.
+    Combined with max_pending this keeps peak memory bounded, no matter how
+    many calls are made.
+
+    Parameters
+    ----------
+    fn:
+        The name of the function to call.
+
+    args:
+        See multiprocess().
+
+    kwargs:
+        See multiprocess().
+
+    process_count:
+        See multiprocess(). If 0, fn is called lazily in this process as
+        each result is requested.
+
+    pool_maxtasksperchild:
+        See multiprocess().
+
+    in_order:
+        Boolean. Whether to yield results in the same order they were given.
+        If False, results are yielded in the order they complete.
+        In order results are waited on one at a time, as in
+        process_pool_wrapper(), so a slow call holds back the ones after it.
+        Defaults to False.
+
+    result_timeout:
+        Int. How long to wait for the next result before throwing an
+        exception because the results have taken too long to return.
+        Defaults to 86400 seconds, (24 hours).
+
+    max_pending:
+        The maximum number of calls that can be submitted to the pool, but
+        not yet yielded, at any one time. Calls are submitted in chunks as
+        results are consumed. If None, all calls are submitted at once.
+        Defaults to None.
+
+    shared_kwargs:
+        See multiprocess().
+
+    Yields
+    ------
+    result:
+        The return value of a single call of fn.
+
+    Examples
+    --------
+    Write out each district as soon as it is ready, only holding a few in
+    memory at any time:
+    >>> for district_df in multiprocess_iter(furness_district,
+    >>>                                      kwargs=kwarg_list,
+    >>>                                      max_pending=16):
+    >>>     district_df.to_csv(...)
+    """
+    # Init
+    args, kwargs = _check_args_kwargs(args, kwargs)
+    process_count = get_process_count(process_count)
+    shared_kwargs = dict() if shared_kwargs is None else shared_kwargs
+
+    if max_pending is not None and max_pending < 1:
+        raise ValueError(
+            "max_pending must be at least 1. Got %d" % max_pending
+        )
+
+    # If the process count is 0, run as a normal for loop
+    if process_count == 0:
+        for a, k in zip(args, kwargs):
+            yield fn(*a, **shared_kwargs, **k)
+        return
+
+    n_tasks = len(args)
+    max_pending = n_tasks if max_pending is None else max_pending
+    tasks = enumerate(zip(args, kwargs))
+    completed = queue.Queue()
+    terminate_process_event = Event()
+
+    with _SharedPayload(shared_kwargs) as shared_handles, \
+            ProcessPool(processes=process_count, maxtasksperchild=pool_maxtasksperchild) as pool:
+        kill_pool = create_kill_pool_fn(pool, terminate_process_event)
+        if len(shared_handles) > 0:
+            fn = functools.partial(_call_shared_wrapper, fn, shared_handles)
+
+        if in_order:
+            yield from _iter_results_in_order(pool, fn, tasks, max_pending,
+                                              kill_pool, result_timeout)
+            return
+
+        n_submitted = 0
+        n_yielded = 0
+        while n_yielded < n_tasks:
+            # Top up the pool with the next chunk of tasks
+            for i, (a, k) in itertools.islice(tasks, max_pending - (n_submitted - n_yielded)):
+                pool.apply_async(_call_order_wrapper,
+                                 args=(i, fn, *a),
+                                 kwds=k,
+                                 callback=completed.put,
+                                 error_callback=lambda e: completed.put(_TaskError(e)))
+                n_submitted += 1
+
+            # Block until the next task completes
+            try:
+                res = completed.get(timeout=result_timeout)
+            except queue.Empty:
+                raise TimeoutError("Ran out of time while waiting for results.")
+
+            if isinstance(res, _TaskError):
+                kill_pool(res.error)
+                raise MultiprocessingError(
+                    "An error occurred in one of the processes."
+                ) from res.error
+
+            n_yielded += 1
+            yield res[1]
+
+
+def _iter_results_in_order(pool, fn, tasks, max_pending, kill_pool, result_timeout):
+    """
+    Submits tasks to pool and yields their results in submission order.
+    Should only be called from multiprocess_iter().
+
+    Waits on each AsyncResult in turn, as process_pool_wrapper() does,
+    rather than collecting results from a completion queue and reordering
+    them. Results that finish early are held by their AsyncResult, so
+    there is no per-result callback, index or buffering.
+    """
+    errors = list()
+    pending = collections.deque()
+    while True:
+        # Top up the pool with the next chunk of tasks
+        for _, (a, k) in itertools.islice(tasks, max_pending - len(pending)):
+            pending.append(pool.apply_async(fn,
+                                            args=a,
+                                            kwds=k,
+                                            error_callback=errors.append))
+        if len(pending) == 0:
+            return
+
+        # Block until the next result in line is ready, waking up early to
+        # check for errors elsewhere in the pool
+        res = pending.popleft()
+        start_time = time.time()
+        while not res.ready() and len(errors) == 0:
+            remaining_time = result_timeout - (time.time() - start_time)
+            if remaining_time <= 0:
+                raise TimeoutError("Ran out of time while waiting for results.")
+            res.wait(min(remaining_time, _EVENT_CHECK_INTERVAL))
+
+        if len(errors) > 0:
+            kill_pool(errors[0])
+            raise MultiprocessingError(
+                "An error occurred in one of the processes."
+            ) from errors[0]
+
+        yield res.get()
+
+
 def process_pool_wrapper(fn,
                          args=None,
                          kwargs=None,
                          process_count=os.cpu_count()-1,
                          pool_maxtasksperchild=4,
                          in_order=False,
-                         result_timeout=86400):
+                         result_timeout=86400,
+                         shared_kwargs=None):
     """
     Runs the given function with the arguments given in a multiprocessing.Pool,
     returning the function output.
@@ -457,6 +807,15 @@ def process_pool_wrapper(fn,
         because the results have taken too long to return
         Defaults to 86400 seconds, (24 hours).
 
+    shared_kwargs:
+        A dictionary of keyword arguments to pass to every call of fn, on top
+        of kwargs. Any numpy arrays or pandas DataFrames are placed in shared
+        memory once, and each worker is given a lightweight handle to them
+        rather than a pickled copy per call. In the worker these are
+        rebuilt without copying, so fn must treat them as read-only.
+        Useful when every call of fn needs the same large inputs.
+        Defaults to None.
+
     Examples
     --------
     The following three function calls:
@@ -492,7 +851,8 @@ def process_pool_wrapper(fn,
             kwargs,
             process_count=process_count,
             pool_maxtasksperchild=pool_maxtasksperchild,
-            result_timeout=result_timeout
+            result_timeout=result_timeout,
+            shared_kwargs=shared_kwargs,
         )
     else:
         return _process_pool_wrapper_kwargs_out_order(
@@ -501,7 +861,8 @@ def process_pool_wrapper(fn,
             kwargs,
             process_count=process_count,
             pool_maxtasksperchild=pool_maxtasksperchild,
-            result_timeout=result_timeout
+            result_timeout=result_timeout,
+            shared_kwargs=shared_kwargs,
         )
 
 
@@ -519,6 +880,131 @@ def _test_raise_error(index):
     time.sleep(5)
 
 
+def _test_segment_total(zone_mod, n_tasks, segments=None):
+    mask = segments['msoa_zone_id'].values % n_tasks == zone_mod
+    return zone_mod, segments['people'].values[mask].sum()
+
+
+def _build_test_segment_table(n_rows=2500000, seed=42):
+    """
+    Builds a synthetic segment table, shaped like a TfN traveller type land use
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'msoa_zone_id': rng.integers(1, 8481, n_rows),
+        'tfn_traveller_type': rng.integers(1, 761, n_rows),
+        'tfn_at': rng.integers(1, 9, n_rows),
+        'ca': rng.integers(1, 3, n_rows),
+        'soc': rng.integers(1, 5, n_rows),
+        'ns': rng.integers(1, 6, n_rows),
+        'people': rng.random(n_rows) * 10,
+    })
+
+
+def shared_memory_tests(n_rows=2500000, n_tasks=32, process_count=4):
+    """
+    Checks shared_kwargs gives the same results as pickling the payload into
+    every call, and prints how long each transport takes.
+    """
+    print("Running shared memory transport tests...")
+    segments = _build_test_segment_table(n_rows)
+    baseline = {i: _test_segment_total(i, n_tasks, segments)[1] for i in range(n_tasks)}
+
+    # Pickled into every task
+    start = time.perf_counter()
+    results = process_pool_wrapper(
+        _test_segment_total,
+        args=[(i, n_tasks) for i in range(n_tasks)],
+        kwargs=[{'segments': segments} for _ in range(n_tasks)],
+        process_count=process_count,
+    )
+    pickled_time = time.perf_counter() - start
+    assert all(np.isclose(baseline[i], total) for i, total in results)
+
+    # Placed in shared memory once
+    start = time.perf_counter()
+    results = process_pool_wrapper(
+        _test_segment_total,
+        args=[(i, n_tasks) for i in range(n_tasks)],
+        process_count=process_count,
+        shared_kwargs={'segments': segments},
+    )
+    shared_time = time.perf_counter() - start
+    assert all(np.isclose(baseline[i], total) for i, total in results)
+
+    print("%d rows, %d tasks, %d processes" % (n_rows, n_tasks, process_count))
+    print("Pickled transport: %.2fs" % pickled_time)
+    print("Shared transport:  %.2fs" % shared_time)
+    print("All tests passed!")
+
+
+def _test_tiny_task(index):
+    return index
+
+
+def _test_failing_task(index):
+    if index == 50:
+        raise ValueError("Throwing a test error!")
+    return index
+
+
+def _test_heavy_task(index, size=300):
+    rng = np.random.default_rng(index)
+    mat = rng.random((size, size))
+    return index, float((mat @ mat).sum())
+
+
+def result_collection_tests(process_count=4):
+    """
+    Checks multiprocess_iter() against process_pool_wrapper(), and prints
+    how long each takes for lots of tiny tasks and a few heavy ones.
+    """
+    print("Running result collection tests...")
+    benchmarks = [
+        ('tiny', _test_tiny_task, 10000),
+        ('heavy', _test_heavy_task, 300),
+    ]
+    for name, fn, n_tasks in benchmarks:
+        args = [(i, ) for i in range(n_tasks)]
+        baseline = [fn(*a) for a in args]
+
+        start = time.perf_counter()
+        results = process_pool_wrapper(fn, args, process_count=process_count, in_order=True)
+        wrapper_time = time.perf_counter() - start
+        assert results == baseline
+
+        start = time.perf_counter()
+        results = list(multiprocess_iter(fn, args, process_count=process_count, in_order=True))
+        ordered_time = time.perf_counter() - start
+        assert results == baseline
+
+        start = time.perf_counter()
+        n_results = 0
+        for _ in multiprocess_iter(fn, args, process_count=process_count, max_pending=64):
+            n_results += 1
+        streamed_time = time.perf_counter() - start
+        assert n_results == n_tasks
+
+        print("%d %s tasks:" % (n_tasks, name))
+        print("\tprocess_pool_wrapper:         %.2fs" % wrapper_time)
+        print("\tmultiprocess_iter, in order:  %.2fs" % ordered_time)
+        print("\tmultiprocess_iter, streamed:  %.2fs" % streamed_time)
+
+    # Errors are raised in either order
+    for in_order in [True, False]:
+        try:
+            for _ in multiprocess_iter(_test_failing_task, [(i, ) for i in range(100)],
+                                       process_count=process_count, in_order=in_order,
+                                       max_pending=16):
+                pass
+        except MultiprocessingError:
+            pass
+        else:
+            raise AssertionError("Error in a process not raised, in_order=%s" % in_order)
+
+    print("All tests passed!")
+
+
 def process_pool_tests():
     """
     Run some tests to make sure the written functions are working correctly.
@@ -590,4 +1076,6 @@ def process_pool_tests():
 
 if __name__ == '__main__':
     process_pool_tests()
+    shared_memory_tests()
+    result_collection_tests()
 
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+File purpose:
+Helpers shared by the local file caches across Land Use, such as the
+reference lookups and the shapefile cache.
+
+A cached file is written with the stamp of its source, identifying the
+version of the source it was made from. The cache is used while the stamp
+matches the source, and is used as it is if the source can't be reached.
+Caches are written to a temporary file and renamed into place, so other
+processes never read half a cache.
+"""
+import os
+import uuid
+import tempfile
+
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+
+from land_use.types import PathLike
+
+
+def source_stamp(path: PathLike, sidecars: List[str] = None) -> Dict:
+    """
+    Identifies the version of the file at path, None if it can't be found.
+
+    path: PathLike - source file
+    sidecars: List[str] - suffixes of files kept beside path that are part
+        of the same source, such as '.dbf' for a shapefile. Included if
+        they exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    stamp = {'path': os.path.abspath(os.fspath(path)),
+             'mtime_ns': stat.st_mtime_ns,
+             'size': stat.st_size}
+
+    base = os.path.splitext(os.fspath(path))[0]
+    for suffix in sidecars or list():
+        try:
+            sidecar = os.stat(base + suffix)
+        except OSError:
+            continue
+        stamp[suffix] = [sidecar.st_mtime_ns, sidecar.st_size]
+    return stamp
+
+
+def use_cached(cache_path: PathLike, cached_stamp: Any, stamp: Any, source: Any) -> bool:
+    """
+    Whether to use the cache at cache_path rather than reading its source.
+
+    cache_path: PathLike - cached file
+    cached_stamp: Any - stamp the cache was written with, None if there
+        is no cache
+    stamp: Any - stamp of the source now, None if it can't be found
+    source: Any - the source, for the message when it can't be found
+    """
+    if cached_stamp is None:
+        return False
+    if stamp is None:
+        print("Can't find %s, using the cache %s" % (source, cache_path))
+        return True
+    return cached_stamp == stamp
+
+
+def write_atomic(path: PathLike, write: Callable[[str], None]) -> None:
+    """
+    Writes a file with write(tmp_path) then renames it to path, so other
+    processes never read half a file.
+
+    The temporary file is unique to this call, so processes writing the
+    same file at once don't write over each other, and is removed if
+    write fails.
+    """
+    path = os.fspath(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = '%s.%d.%s.tmp' % (path, os.getpid(), uuid.uuid4().hex[:8])
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def file_cache_tests() -> None:
+    """
+    Checks stamps follow their sources and failed writes leave no files.
+    """
+    print("Running file_cache.py tests...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'lads.shp')
+        assert source_stamp(path) is None
+
+        def write_text(text):
+            def write(tmp_path):
+                with open(tmp_path, 'w') as f:
+                    f.write(text)
+            return write
+
+        write_atomic(path, write_text('shp'))
+        stamp = source_stamp(path, sidecars=['.dbf'])
+        assert stamp['size'] == 3 and '.dbf' not in stamp
+
+        write_atomic(os.path.join(tmp, 'lads.dbf'), write_text('dbf'))
+        assert source_stamp(path, sidecars=['.dbf']) != stamp
+        assert source_stamp(path) == stamp
+
+        # Caches are used while their stamp matches, or the source is missing
+        assert use_cached('cache', stamp, stamp, path)
+        assert use_cached('cache', stamp, None, path)
+        assert not use_cached('cache', stamp, source_stamp(path, sidecars=['.dbf']), path)
+        assert not use_cached('cache', None, stamp, path)
+
+        def failed_write(tmp_path):
+            with open(tmp_path, 'w') as f:
+                f.write('half')
+            raise RuntimeError("Write failed")
+
+        try:
+            write_atomic(path, failed_write)
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("Failed write not raised")
+        assert sorted(os.listdir(tmp)) == ['lads.dbf', 'lads.shp']
+        with open(path) as f:
+            assert f.read() == 'shp'
+
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    file_cache_tests()
@@ -1,6 +1,11 @@
 
 import os
+import time
 
+from typing import List
+from typing import Tuple
+
+import numpy as np
 import pandas as pd
 
 import land_use.lu_constants as consts
@@ -174,13 +179,22 @@ class FutureYearLandUse:
         }
 
         # Write init reports for param audits
-        init_report = pd.DataFrame(self.in_paths.values(),
-                                   self.in_paths.keys()
+        self._write_input_params(self.future_year)
+
+    def _write_input_params(self,
+                            future_year):
+        """
+        Write the input params audit for a future year, with
+        in_paths['future_year'] set to that year.
+        """
+        in_paths = dict(self.in_paths, future_year=future_year)
+        init_report = pd.DataFrame(in_paths.values(),
+                                   in_paths.keys()
                                    )
         init_report.to_csv(
             os.path.join(self.out_paths['report_folder'],
                          '%s_%s_input_params.csv' % (self.scenario_name,
-                                                   self.future_year))
+                                                   future_year))
         )
 
     def NTEM_pop(self):
@@ -271,6 +285,128 @@ class FutureYearLandUse:
 
         return fy_pop
 
+    def build_fy_pop_years(self,
+                           future_years: List[str],
+                           balance_demographics=True,
+                           adjust_ca=True,
+                           adjust_area_type=True,
+                           ca_growth_method='factor',
+                           normalise=True,
+                           export=True,
+                           verbose=True,
+                           reports=True) -> pd.DataFrame:
+        """
+        Build future year population for several future years in one pass.
+
+        Equivalent to calling build_fy_pop() once per future year, but the
+        base year population is read, infilled and expanded once, and
+        growth, demographic balancing and car availability adjustment
+        are applied to all years together as columns of a single frame.
+        Area type adjustment, reporting, normalisation and export are then
+        done per year, to the same paths build_fy_pop() would write to,
+        as is the input params audit the object writes for its own
+        future year on init. SOC adjustment is not supported.
+
+        Parameters
+        ----------
+        future_years:
+            The future years to build, as strings. Each must be a column
+            in the growth inputs for this scenario.
+
+        Returns
+        -------
+        fy_pop:
+            Expanded future year population, with a column for each
+            future year.
+        """
+        years = [str(x) for x in future_years]
+        report_folder = self.out_paths['report_folder']
+
+        # Build population
+        fy_pop, pop_reports = self._grow_pop(verbose=verbose,
+                                             future_years=years)
+
+        if balance_demographics:
+            fy_pop, dem_reports = self._balance_demographics(fy_pop,
+                                                             reports=reports,
+                                                             verbose=verbose,
+                                                             future_years=years)
+        else:
+            dem_reports = {year: dict() for year in years}
+
+        # Adjust car availability mix
+        if adjust_ca:
+            fy_pop, ca_changes = self._adjust_ca(fy_pop,
+                                                 ca_growth_method=ca_growth_method,
+                                                 verbose=verbose,
+                                                 future_years=years)
+
+        if adjust_area_type:
+            fy_at = pd.read_csv(self.in_paths['fy_at_mix'])
+
+        fy_pop_report_cols = [x for x in list(pop_reports[1]) if x not in years]
+
+        for year in years:
+            year_pop = fy_pop.drop([x for x in years if x != year], axis=1)
+
+            # Param audit, as __init__ writes for a single year
+            self._write_input_params(year)
+
+            if adjust_ca and reports:
+                ca_changes.reindex([year], axis=1).to_csv(
+                    os.path.join(report_folder, 'ca_changes_%s.csv' % year),
+                    index=False
+                )
+
+            if adjust_area_type:
+                # Adjust area type
+                year_pop, at_changes = self._adjust_area_type(year_pop,
+                                                              future_year=year,
+                                                              fy_at=fy_at)
+                print('Adjusting area type for %s' % year)
+                if reports:
+                    at_changes.to_csv(
+                        os.path.join(report_folder,
+                                     'area_type_changes_%s.csv' % year),
+                        index=False
+                    )
+
+            # Reporting
+            if reports:
+                pop_reports[0].to_csv(
+                    os.path.join(report_folder,
+                                 'pop_changes_%s_for_%s.csv' % (str(self.base_year),
+                                                                year)),
+                    index=False)
+
+                pop_reports[1].reindex(fy_pop_report_cols + [year], axis=1).to_csv(
+                    os.path.join(report_folder, 'pop_changes_%s.csv' % year),
+                    index=False
+                )
+
+                for dr in list(dem_reports[year]):
+                    dem_reports[year][dr].to_csv(
+                        os.path.join(report_folder,
+                                     'dem_changes_%s_%s.csv' % (str(dr), year)),
+                        index=False
+                    )
+
+            # Normalise to tfn tt
+            if normalise:
+                year_pop = norm.expanded_to_normalised(year_pop,
+                                                       var_col=year)
+
+            # Export main dataset
+            if export:
+                write_path = os.path.join(self.out_paths['write_folder'],
+                                          'land_use_' + year + '_pop.csv')
+                if verbose:
+                    print('Writing to:')
+                    print(write_path)
+                comp.write_out(year_pop, write_path)
+
+        return fy_pop
+
     def build_fy_emp(self,
                      export=True,
                      verbose=True):
@@ -338,7 +474,9 @@ class FutureYearLandUse:
 
     def _adjust_area_type(self,
                           fy_pop: pd.DataFrame,
-                          verbose=False):
+                          verbose=False,
+                          future_year: str = None,
+                          fy_at: pd.DataFrame = None):
 
         """
         Parameters
@@ -346,6 +484,12 @@ class FutureYearLandUse:
         fy_pop: pd.Dataframe
         Data frame of population for future year by land use zoning (MSOA)
 
+        future_year: str
+        Year of area types to adjust to, defaults to the future year
+
+        fy_at: pd.Dataframe
+        Future year area type mix, read from the inputs if not given
+
         Returns
         -------
         fy_pop_w_at = Dataframe with future adjusted area types
@@ -356,11 +500,15 @@ class FutureYearLandUse:
         # Define model zone
         model_zone = self.model_zoning.lower() + '_zone_id'
 
+        if future_year is None:
+            future_year = self.future_year
+
         # Import and process future year area type
-        fy_at = pd.read_csv(self.in_paths['fy_at_mix'])
+        if fy_at is None:
+            fy_at = pd.read_csv(self.in_paths['fy_at_mix'])
         fy_at = fy_at.reindex([model_zone,
-                               self.future_year], axis=1)
-        fy_at = fy_at.rename(columns={self.future_year: 'fy_at'})
+                               future_year], axis=1)
+        fy_at = fy_at.rename(columns={future_year: 'fy_at'})
 
         # Merge future onto base
         fy_pop_w_at = fy_pop.merge(fy_at,
@@ -380,20 +528,34 @@ class FutureYearLandUse:
 
         return fy_pop_w_at, changes
 
-    def _grow_pop(self,
-                  verbose=False
-                  ):
+    def _load_base_year_pop(self,
+                            population_growth: pd.DataFrame):
+        """
+        Loads the base year population, ready to be grown by population_growth.
+
+        Parameters
+        ----------
+        population_growth:
+            Population growth factors, as returned by _get_fy_pop_emp().
+            The soc and ns columns are cast to int in place.
+
+        Returns
+        -------
+        base_year_pop:
+            The base year population, with the population in a column named
+            by the base year.
+
+        by_pop_report:
+            Summary report of the base year population.
 
+        merge_cols:
+            The columns to join base_year_pop and population_growth on.
+        """
         # Define zone col name
         zone_col = self._define_zone_col()
 
         #TODO: Check if bases are misaligned
 
-        # Get pop growth, filter to target year only
-        population_growth = self._get_fy_pop_emp(
-            'pop',
-            retain_cols=['soc', 'ns'])  # If there's NPR segments, keep them
-
         # ## BASE YEAR POPULATION ## #
         print("Loading the base year population data...")
         base_year_pop = utils.get_land_use(
@@ -418,8 +580,6 @@ class FutureYearLandUse:
         # Audit population numbers
         print("Base Year Population: %d" % base_year_pop[self.base_year].sum())
 
-        # ## FUTURE YEAR POPULATION ## #
-        print("Generating future year population data...")
         # Merge on all possible segmentations - not years
         merge_cols = utils.intersection(list(base_year_pop),
                                         list(population_growth))
@@ -438,13 +598,32 @@ class FutureYearLandUse:
         population_growth['soc'] = population_growth['soc'].astype(float).astype(int)
         population_growth['ns'] = population_growth['ns'].astype(float).astype(int)
 
+        return base_year_pop, by_pop_report, merge_cols
+
+    def _grow_pop(self,
+                  verbose=False,
+                  future_years: List[str] = None
+                  ):
+        years = [self.future_year] if future_years is None else list(future_years)
+
+        # Get pop growth, filter to target years only
+        population_growth = self._get_fy_pop_emp(
+            'pop',
+            retain_cols=['soc', 'ns'],  # If there's NPR segments, keep them
+            future_years=years)
+
+        base_year_pop, by_pop_report, merge_cols = self._load_base_year_pop(population_growth)
+
+        # ## FUTURE YEAR POPULATION ## #
+        print("Generating future year population data...")
         population = self._grow_to_future_year(
             by_vector=base_year_pop,
             fy_vector=population_growth,
-            merge_cols=merge_cols
+            merge_cols=merge_cols,
+            future_years=years
         )
         fy_pop_report = utils.lu_out_report(population,
-                                            pop_var=self.future_year)
+                                            pop_var=years)
 
         # Population Audit
         if verbose:
@@ -452,7 +631,8 @@ class FutureYearLandUse:
             print(merge_cols)
             print(list(population))
             print('\n', '-' * 15, 'Population Audit', '-' * 15)
-            print('Total population for year %s is: %.4f' % (self.future_year, population[self.future_year].sum()))
+            for year in years:
+                print('Total population for year %s is: %.4f' % (year, population[year].sum()))
             print('\n')
 
         # Write the produced population to file
@@ -516,22 +696,26 @@ class FutureYearLandUse:
     def _adjust_ca(self,
                    fy_pop_vector: pd.DataFrame,
                    ca_growth_method: str,
-                   verbose=True) -> pd.DataFrame:
+                   verbose=True,
+                   future_years: List[str] = None) -> pd.DataFrame:
         """
 
         Parameters
         ----------
         fy_pop_vector: Ready adjusted future year pop vector
         ca_growth_method: flat adjustment in fy or factor based growth
+        future_years: Population columns to adjust, one per future year.
+            Defaults to the future year of this object.
 
         Returns
         -------
         fy_pop_vector: Population vector with adjusted car availability
-        ca_adjustment_factors: Report Dataframe
+        ca_adjustment_factors: Report Dataframe, one column per future year
 
         """
         # Get zone name
         zone_col = self._define_zone_col()
+        years = [self.future_year] if future_years is None else list(future_years)
 
         # Build base year ca totals
         # This doesn't touch the future year vector, yet
@@ -540,25 +724,12 @@ class FutureYearLandUse:
         # TODO: Check ca in cols
 
         by_ca = by_ca.reindex(
-            [zone_col, 'ca', self.future_year], axis=1).groupby(
+            [zone_col, 'ca'] + years, axis=1).groupby(
             [zone_col, 'ca']).sum().reset_index()
 
         # Get the relative shares of each segment
         by_ca_share = by_ca.copy()
-        by_ca_share = by_ca_share.pivot(
-            index=zone_col,
-            columns='ca',
-            values=self.future_year).reset_index()
-
-        by_ca_share['total'] = by_ca_share[1] + by_ca_share[2]
-        by_ca_share[1] /= by_ca_share['total']
-        by_ca_share[2] /= by_ca_share['total']
-        by_ca_share = by_ca_share.drop('total', axis=1)
-        by_ca_share = by_ca_share.melt(id_vars=zone_col,
-                                       var_name='ca',
-                                       value_name=self.future_year)
-        by_ca_share = by_ca_share.rename(
-            columns={self.future_year: 'by_ca'})
+        by_ca_share[years] = by_ca[years] / by_ca.groupby(zone_col)[years].transform('sum')
         by_ca_share = by_ca_share.sort_values([zone_col, 'ca']).reset_index(drop=True)
 
         # So:
@@ -571,16 +742,16 @@ class FutureYearLandUse:
             ca_shares = pd.read_csv(self.in_paths['ca_shares'])
             # Filter to target_year
             ca_shares = ca_shares.reindex(
-                [zone_col, 'ca', self.future_year], axis=1)
-            ca_shares = ca_shares.rename(columns={self.future_year: 'fy_ca'})
+                [zone_col, 'ca'] + years, axis=1)
 
             # Join
             fy_ca_factors = by_ca_share.merge(
                 ca_shares,
                 how='left',
-                on=[zone_col, 'ca'])
-            fy_ca_factors['ca_adj'] = fy_ca_factors['fy_ca'] / fy_ca_factors['by_ca']
-            fy_ca_factors = fy_ca_factors.drop(['by_ca', 'fy_ca'], axis=1)
+                on=[zone_col, 'ca'],
+                suffixes=('_by_ca', ''))
+            fy_ca_factors[years] = (fy_ca_factors[years].values
+                                    / fy_ca_factors[[y + '_by_ca' for y in years]].values)
 
         elif ca_growth_method == 'factor':
             # Get ca growth
@@ -592,44 +763,39 @@ class FutureYearLandUse:
             ca_factors = pd.read_csv(self.in_paths['ca_growth'])
             # Filter to target year
             ca_factors = ca_factors.reindex(
-                [zone_col, 'ca', self.future_year], axis=1)
-            ca_factors = ca_factors.rename(columns={self.future_year: 'fy_ca'})
+                [zone_col, 'ca'] + years, axis=1)
 
             # Join
-            ca_shares = by_ca_share.merge(
+            fy_ca_factors = by_ca_share.merge(
                 ca_factors,
                 how='left',
-                on=[zone_col, 'ca'])
-            # Sum total so control factors to 1 (itself)
-            ca_shares['fy_ca'] *= ca_shares['by_ca']
-
-            totals = ca_shares.groupby('msoa_zone_id')['fy_ca'].sum().reset_index()
-            totals = totals.rename(columns={'fy_ca': 'fy_ca_tot'})
+                on=[zone_col, 'ca'],
+                suffixes=('_by_ca', ''))
+            by_ca_cols = [y + '_by_ca' for y in years]
 
-            fy_ca_factors = ca_shares.merge(
-                totals,
-                how='left',
-                on=zone_col
-            )
-            fy_ca_factors['fy_ca'] /= fy_ca_factors['fy_ca_tot']
-            fy_ca_factors['ca_adj'] = fy_ca_factors['fy_ca']/fy_ca_factors['by_ca']
+            # Sum total so control factors to 1 (itself)
+            fy_ca = fy_ca_factors[years].values * fy_ca_factors[by_ca_cols].values
+            fy_ca_factors[years] = fy_ca
+            fy_ca /= fy_ca_factors.groupby('msoa_zone_id')[years].transform('sum').values
+            fy_ca_factors[years] = fy_ca / fy_ca_factors[by_ca_cols].values
 
-            fy_ca_factors = fy_ca_factors.drop(
-                ['by_ca', 'fy_ca', 'fy_ca_tot'], axis=1)
+        fy_ca_factors = fy_ca_factors.reindex([zone_col, 'ca'] + years, axis=1)
 
-        before = fy_pop_vector[self.future_year].sum()
-        ca_before = fy_pop_vector.groupby(['ca'])[self.future_year].sum()
+        before = fy_pop_vector[years].sum()
+        ca_before = fy_pop_vector.groupby(['ca'])[years].sum()
 
         # Adjust CA
         fy_pop_vector = fy_pop_vector.merge(
             fy_ca_factors,
             how='left',
-            on=[zone_col, 'ca'])
-        fy_pop_vector[self.future_year] *= fy_pop_vector['ca_adj']
-        fy_pop_vector = fy_pop_vector.drop('ca_adj', axis=1)
+            on=[zone_col, 'ca'],
+            suffixes=('', '_ca_adj'))
+        ca_adj_cols = [y + '_ca_adj' for y in years]
+        fy_pop_vector[years] = fy_pop_vector[years].values * fy_pop_vector[ca_adj_cols].values
+        fy_pop_vector = fy_pop_vector.drop(ca_adj_cols, axis=1)
 
-        after = fy_pop_vector[self.future_year].sum()
-        ca_after = fy_pop_vector.groupby(['ca'])[self.future_year].sum()
+        after = fy_pop_vector[years].sum()
+        ca_after = fy_pop_vector.groupby(['ca'])[years].sum()
 
         ca_changes = pd.DataFrame(ca_after)
 
@@ -637,8 +803,8 @@ class FutureYearLandUse:
             print('*' * 15)
             print('Car availability adjustment')
             print('CA growth method: %s' % ca_growth_method)
-            print('Total before: ' + str(before.astype(int)))
-            print('Total after: ' + str(after.astype(int)))
+            print('Total before: ' + str(before.astype(int).to_dict()))
+            print('Total after: ' + str(after.astype(int).to_dict()))
             print('Shares before: ' + str(ca_before.astype(int)))
             print('Shares after: ' + str(ca_after.astype(int)))
 
@@ -647,7 +813,8 @@ class FutureYearLandUse:
     def _balance_demographics(self,
                               fy_pop,
                               reports=False,
-                              verbose=True):
+                              verbose=True,
+                              future_years: List[str] = None):
         """
         Reshape future year population to match a given demographic vector
 
@@ -656,25 +823,30 @@ class FutureYearLandUse:
         fy_pop:
             Vector of future year population, already grown in volume
 
+        future_years:
+            Population columns to balance, one per future year. Defaults to
+            the future year of this object.
+
         Returns
         -------
         fy_pop:
             FY pop with age segments adjusted to demographic outputs
         segment_change_report:
-            Report detailing how segments have fared with the change
+            Report detailing how segments have fared with the change.
+            If future_years is given, a dictionary of these by future year.
         """
+        years = [self.future_year] if future_years is None else list(future_years)
+
         # Get totals by segment before and after
         intact_cols = list(fy_pop)
 
         if verbose:
-            print('Pop before = %d' % fy_pop[self.future_year].sum())
+            print('Pop before = %s' % fy_pop[years].sum().astype(int).to_dict())
 
         # Get target demographic mix data
         demographics = pd.read_csv(self.in_paths['fy_dem_mix'])
         # Get demographic factors
-        target_factors = self._get_age_factors(demographics)
-        target_factors = target_factors.rename(
-            columns={'factor': 'target_factor'})
+        target_factors = self._get_age_factors(demographics, pop_cols=years)
 
         # Infill traveller types
         fy_pop = norm.infill_ntem_tt(fy_pop)
@@ -682,75 +854,74 @@ class FutureYearLandUse:
         # Report on all tt segments
         report_cols = list(fy_pop)
         report_cols.remove('msoa_zone_id')
-        report_cols.remove(self.future_year)
+        report_cols = [x for x in report_cols if x not in years]
         if reports:
-            report_dict = dict()
+            before_reports = dict()
             for rc in report_cols:
-                before_report = utils.lu_out_report(
+                before_reports[rc] = utils.lu_out_report(
                     fy_pop,
-                    pop_var=self.future_year,
+                    pop_var=years,
                     group_vars=[rc])
-                before_report = before_report.rename(
-                    columns={self.future_year: 'before'}
-                )
-                report_dict.update({rc: before_report})
 
         # Get current factors
-        current_factors = self._get_age_factors(fy_pop)
-        current_factors = current_factors.rename(
-            columns={'factor': 'current_factor'})
+        current_factors = self._get_age_factors(fy_pop, pop_cols=years)
 
         # Get correction factors
         corr_factors = current_factors.merge(
-            target_factors, how='left', on=['msoa_zone_id', 'age']
-        )
-        corr_factors['corr'] = corr_factors['target_factor'] / corr_factors['current_factor']
+            target_factors, how='left', on=['msoa_zone_id', 'age'],
+            suffixes=('_current', '_target'))
+        corr_factors[years] = (corr_factors[[y + '_target' for y in years]].values
+                               / corr_factors[[y + '_current' for y in years]].values)
+        corr_factors = corr_factors.reindex(['msoa_zone_id', 'age'] + years, axis=1)
 
         # Apply correction factors
         fy_pop = fy_pop.merge(corr_factors,
                               how='left',
-                              on=['msoa_zone_id', 'age'])
-        fy_pop[self.future_year] *= fy_pop['corr']
+                              on=['msoa_zone_id', 'age'],
+                              suffixes=('', '_corr'))
+        fy_pop[years] = fy_pop[years].values * fy_pop[[y + '_corr' for y in years]].values
 
+        report_dict = {year: dict() for year in years}
         if reports:
             for rc in report_cols:
                 after_report = utils.lu_out_report(
                     fy_pop,
-                    pop_var=self.future_year,
+                    pop_var=years,
                     group_vars=[rc])
-                after_report = after_report.rename(
-                    columns={self.future_year: 'after_adj'})
                 # Merge
-                after_report = report_dict[rc].merge(
-                    after_report,
-                    on=rc)
-                report_dict.update({rc: after_report})
-
-        else:
-            report_dict = dict()
+                for year in years:
+                    report_dict[year][rc] = before_reports[rc].reindex([rc, year], axis=1).rename(
+                        columns={year: 'before'}).merge(
+                        after_report.reindex([rc, year], axis=1).rename(columns={year: 'after_adj'}),
+                        on=rc)
 
         # Back to original cols
         fy_pop = fy_pop.reindex(intact_cols, axis=1)
 
         if verbose:
-            print('Pop after = %d' % fy_pop[self.future_year].sum())
+            print('Pop after = %s' % fy_pop[years].sum().astype(int).to_dict())
             if reports:
                 print('Adjustment before/after')
-                print(report_dict['age'])
+                print(report_dict[years[-1]]['age'])
 
+        if future_years is None:
+            return fy_pop, report_dict[self.future_year]
         return fy_pop, report_dict
 
     def _grow_to_future_year(self,
                              by_vector: pd.DataFrame,
                              fy_vector: pd.DataFrame,
                              merge_cols=None,
-                             verbose=True) -> pd.DataFrame:
+                             verbose=True,
+                             future_years: List[str] = None) -> pd.DataFrame:
         """
         Parameters
         ----------
         by_vector: Dataframe of a base year pop/emp vector
         fy_vector: Dataframe of growth factors from a given base year
         to a give future year, by year
+        future_years: Growth columns in fy_vector to grow to, defaults to
+        the future year
 
         Returns
         -------
@@ -758,6 +929,8 @@ class FutureYearLandUse:
         """
         if merge_cols is None:
             merge_cols = self._define_zone_col()
+        if future_years is None:
+            future_years = [self.future_year]
         ####
         print(merge_cols)
         print(by_vector[merge_cols])
@@ -771,14 +944,15 @@ class FutureYearLandUse:
                                     on=merge_cols)
         merge = fy_vector[self.base_year].sum()
 
-        fy_vector[self.future_year] *= fy_vector[self.base_year]
-        end = fy_vector[self.future_year].sum()
+        fy_vector[future_years] = fy_vector[future_years].mul(
+            fy_vector[self.base_year], axis=0)
+        end = fy_vector[future_years].sum()
         fy_vector = fy_vector.drop(self.base_year, axis=1)
 
         if verbose:
             print('Start: ' + str(start))
             print('Merge:' + str(merge))
-            print('End:' + str(end))
+            print('End:' + str(end.to_dict() if len(future_years) > 1 else end.iloc[0]))
 
         return fy_vector
 
@@ -945,10 +1119,14 @@ class FutureYearLandUse:
 
     def _get_fy_pop_emp(self,
                         vector_type,
-                        retain_cols):
+                        retain_cols,
+                        future_years: List[str] = None):
         """
         vector_type = 'pop' or 'emp'
+        future_years = growth columns to keep, defaults to the future year
         """
+        if future_years is None:
+            future_years = [self.future_year]
 
         if vector_type == 'pop':
             dat = pd.read_csv(self.in_paths['pop_growth'])
@@ -958,7 +1136,7 @@ class FutureYearLandUse:
         for col in retain_cols:
             if col in list(dat):
                 ri_cols.append(col)
-        ri_cols.append(self.future_year)
+        ri_cols += list(future_years)
         dat = dat.reindex(ri_cols, axis=1)
 
         return dat
@@ -1006,41 +1184,37 @@ class FutureYearLandUse:
 
     def _get_age_factors(self,
                          age_vector: pd.DataFrame,
-                         pop_col: str = None):
+                         pop_cols: List[str] = None):
         """
         Get age factors from a df with age in
 
         Parameters
         ----------
-        self
-        age_vector
+        age_vector:
+            Vector with msoa_zone_id, age and pop_cols columns.
+
+        pop_cols:
+            The population columns to get factors for. Defaults to the
+            future year of this object.
 
         Returns
         -------
-
+        age_factors:
+            The share of each zone's population in each age, by
+            msoa_zone_id and age. Has a factor column for each of pop_cols,
+            named the same.
         """
+        if pop_cols is None:
+            pop_cols = [self.future_year]
 
-        if pop_col is None:
-            pop_col = self.future_year
-
-        # Reindex
-        """
-        One liner challenge
-        
-        """
-
-        dem_cols = ['msoa_zone_id', 'age', pop_col]
+        dem_cols = ['msoa_zone_id', 'age'] + pop_cols
         age_vector = age_vector.reindex(dem_cols, axis=1)
 
         # Get total
-        age_vector['factor'] = age_vector[pop_col] / age_vector.groupby(
-            'msoa_zone_id')[pop_col].transform('sum')
+        age_vector[pop_cols] = age_vector[pop_cols] / age_vector.groupby(
+            'msoa_zone_id')[pop_cols].transform('sum')
 
-        ri_cols = ['msoa_zone_id', 'age', 'factor']
-        rig_cols = ri_cols.copy()
-        rig_cols.remove('factor')
-        age_factors = age_vector.reindex(ri_cols, axis=1).\
-            groupby(rig_cols).sum().reset_index()
+        age_factors = age_vector.groupby(['msoa_zone_id', 'age']).sum().reset_index()
 
         return age_factors
 
@@ -1071,3 +1245,171 @@ class FutureYearLandUse:
                 [self.model_zoning + '_zone_id', soc_col])
 
         return out_growth
+
+
+def batch_pop_tests(n_zones: int = 500,
+                    future_years: List[str] = None) -> None:
+    """
+    Checks build_fy_pop_years() against a build_fy_pop() per year on
+    synthetic inputs and prints how long each takes. The base population
+    is normalised to TfN traveller types, and the traveller type and MSOA
+    to region lookups are synthetic ones registered in consts.REFERENCES.
+    """
+    import tempfile
+
+    if future_years is None:
+        future_years = [str(x) for x in range(2019, 2051)]
+
+    print("Running fy_lu.py batch population tests...")
+    rng = np.random.default_rng(0)
+    zones = ['E020%05d' % i for i in range(n_zones)]
+
+    # Small traveller type indices, TfN types 1-180 over NTEM types 1-12
+    tfn_tt_index = pd.MultiIndex.from_product(
+        [[1, 2, 3], [1, 2], [1, 2], [1, 2, 3], [1, 2, 3, 4, 5]],
+        names=['age', 'gender', 'ca', 'soc', 'ns']).to_frame(index=False)
+    tfn_tt_index.insert(0, 'tfn_traveller_type', range(1, len(tfn_tt_index) + 1))
+    tfn_tt_index['ntem_traveller_type'] = ((tfn_tt_index['age'] - 1) * 4
+                                           + (tfn_tt_index['gender'] - 1) * 2
+                                           + tfn_tt_index['ca'])
+    ntem_tt_index = tfn_tt_index[['ntem_traveller_type', 'age', 'gender', 'ca']].drop_duplicates()
+    ntem_tt_index['hh_type'] = ntem_tt_index['ntem_traveller_type'] % 4 + 1
+
+    base = pd.DataFrame({
+        'msoa_zone_id': np.repeat(zones, len(tfn_tt_index)),
+        'tfn_traveller_type': np.tile(tfn_tt_index['tfn_traveller_type'], n_zones),
+    })
+    base.insert(1, 'area_type', base['msoa_zone_id'].str[-1].astype(int) % 8 + 1)
+    base['people'] = rng.random(len(base)) * 100
+
+    growth = pd.MultiIndex.from_product(
+        [zones, [1, 2, 3], [1, 2, 3, 4, 5]],
+        names=['msoa_zone_id', 'soc', 'ns']).to_frame(index=False)
+    ca_growth = pd.MultiIndex.from_product(
+        [zones, [1, 2]], names=['msoa_zone_id', 'ca']).to_frame(index=False)
+    demographics = pd.MultiIndex.from_product(
+        [zones, [1, 2, 3]], names=['msoa_zone_id', 'age']).to_frame(index=False)
+    for year in future_years:
+        growth[year] = 1 + rng.random(len(growth)) * 0.3
+        ca_growth[year] = 1 + rng.random(len(ca_growth)) * 0.2
+        demographics[year] = rng.random(len(demographics)) * 1000
+
+    # Swap in the synthetic lookups, without caching them in place of
+    # the real ones
+    references = consts.REFERENCES
+    cache_folder = references.cache_folder
+    lookups = {
+        'msoa_region': pd.DataFrame({'msoa_zone_id': zones,
+                                     'region': ['Region %d' % (i % 9) for i in range(n_zones)]}),
+        'tfn_traveller_types_normalised': tfn_tt_index,
+        'ntem_traveller_types_normalised': ntem_tt_index,
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        references.cache_folder = None
+        for name, lookup in lookups.items():
+            path = os.path.join(tmp_dir, name + '.csv')
+            lookup.to_csv(path, index=False)
+            references.register(name, path)
+        try:
+            loop_time, batch_time = _batch_pop_tests(
+                tmp_dir, base, growth, ca_growth, demographics, future_years)
+        finally:
+            references.cache_folder = cache_folder
+            references.register('msoa_region', consts.MSOA_REGION)
+            references.register('tfn_traveller_types_normalised',
+                                os.path.join(consts.REF_PATH, 'tfn_traveller_types_normalised.csv'),
+                                dtype=int)
+            references.register('ntem_traveller_types_normalised',
+                                os.path.join(consts.REF_PATH, 'ntem_traveller_types_normalised.csv'))
+
+    print('%d years, %d zones: per year %.2fs, batched %.2fs (%.1fx)'
+          % (len(future_years), n_zones, loop_time, batch_time,
+             loop_time / batch_time))
+    print("Done!")
+
+
+def _batch_pop_tests(tmp_dir: str,
+                     base: pd.DataFrame,
+                     growth: pd.DataFrame,
+                     ca_growth: pd.DataFrame,
+                     demographics: pd.DataFrame,
+                     future_years: List[str],
+                     ) -> Tuple[float, float]:
+    """
+    Runs batch_pop_tests() with its inputs in tmp_dir. Returns the time
+    taken per year and batched.
+    """
+    in_paths = {
+        'base_resi_land_use_path': os.path.join(tmp_dir, 'base.csv'),
+        'pop_growth_path': os.path.join(tmp_dir, 'growth.csv'),
+        'ca_growth_path': os.path.join(tmp_dir, 'ca_growth.csv'),
+        'fy_demographic_path': os.path.join(tmp_dir, 'demographics.csv'),
+    }
+    base.to_csv(in_paths['base_resi_land_use_path'], index=False)
+    growth.to_csv(in_paths['pop_growth_path'], index=False)
+    ca_growth.to_csv(in_paths['ca_growth_path'], index=False)
+    demographics.to_csv(in_paths['fy_demographic_path'], index=False)
+
+    def build(future_year, model_folder):
+        return FutureYearLandUse(
+            model_folder=os.path.join(tmp_dir, model_folder),
+            future_year=future_year,
+            scenario_name='NTEM',
+            base_non_resi_land_use_path=in_paths['base_resi_land_use_path'],
+            fy_at_mix_path='',
+            fy_soc_mix_path='',
+            emp_growth_path='',
+            ca_shares_path='',
+            **in_paths)
+
+    # Export and area type are left out of the timings, they are
+    # done a year at a time either way
+    run_kwargs = {
+        'balance_demographics': True,
+        'adjust_area_type': False,
+        'normalise': False,
+        'export': False,
+        'reports': False,
+        'verbose': False,
+    }
+
+    start = time.perf_counter()
+    loop_pop = dict()
+    for year in future_years:
+        loop_fym = build(year, 'loop')
+        loop_pop[year] = loop_fym.build_fy_pop(adjust_soc=False,
+                                               **run_kwargs)
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_fym = build(future_years[0], 'batch')
+    batch_pop = batch_fym.build_fy_pop_years(future_years, **run_kwargs)
+    batch_time = time.perf_counter() - start
+
+    for year in future_years:
+        other_years = [x for x in future_years if x != year]
+        pd.testing.assert_frame_equal(loop_pop[year],
+                                      batch_pop.drop(other_years, axis=1))
+
+        # Every year gets its own input params audit, as in the loop
+        loop_params, batch_params = [
+            pd.read_csv(os.path.join(fym.out_paths['report_folder'],
+                                     'NTEM_%s_input_params.csv' % year),
+                        index_col=0)
+            for fym in (loop_fym, batch_fym)]
+        assert str(batch_params.loc['future_year'].item()) == year
+        pd.testing.assert_frame_equal(loop_params, batch_params)
+
+        # Each zone is balanced to the age mix of the demographics, give or
+        # take the car availability adjustment made after
+        achieved = batch_pop.groupby(['msoa_zone_id', 'age'])[year].sum()
+        target = demographics.set_index(['msoa_zone_id', 'age'])[year].reindex(achieved.index)
+        np.testing.assert_allclose(achieved / achieved.groupby(level=0).transform('sum'),
+                                   target / target.groupby(level=0).transform('sum'),
+                                   rtol=0.05)
+    return loop_time, batch_time
+
+
+if __name__ == '__main__':
+    batch_pop_tests()
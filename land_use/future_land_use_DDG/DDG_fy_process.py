@@ -20,10 +20,13 @@ import os
 #from ipfn import ipfn
 import datetime
 import pyodbc
+import pyarrow as pa
+import pyarrow.parquet as pq
 #import geopandas as gpd
 #from land_use.utils import file_ops as utils
 from land_use.utils import compress
-#from land_use import lu_constants
+from land_use import lu_constants
+from land_use import file_cache
 import logging
 
 # Other paths
@@ -206,192 +209,376 @@ def NTEMaligned_pop_process(fy_lu_obj):
     print('Step completed -- NTEMaligned_by_pop_process for '+ fy_lu_obj.future_year)
     return 0
 
-def DDGaligned_fy_pop_process(fy_lu_obj):
-    logging.info('Processing fy pop to be aligned with DDG for ' + fy_lu_obj.future_year + fy_lu_obj.scenario_name)
-    print('Processing fy pop to be aligned with DDG for ' + fy_lu_obj.future_year + fy_lu_obj.scenario_name)
-    base_year = fy_lu_obj.base_year
-    future_year = fy_lu_obj.future_year
-    # by_output_folder = fy_lu_obj.by_home_folder
+class DDGAlignment:
+    """
+    DDG LAD controls for every year of a scenario, for aligning future
+    year population to them.
+
+    The population and worker fraction controls are held as year x LAD
+    arrays, so they are read once for all years. Each year's LAD scaling
+    factors are then found by dividing arrays of LAD totals, and applied
+    to the population by LAD and worker_type index, rather than by merges.
+    """
+
+    def __init__(self, pop_DDG, wkrfrac_DDG):
+        """
+        pop_DDG: pd.DataFrame - DDG population by 'LAD13CD', a column per year
+        wkrfrac_DDG: pd.DataFrame - DDG worker over WAP fraction, as pop_DDG
+        """
+        self.pop_lads, self.pop_years, self.pop = self._year_lad_array(pop_DDG)
+        self.wkrfrac_lads, self.wkrfrac_years, self.wkrfrac = self._year_lad_array(wkrfrac_DDG)
+
+    @staticmethod
+    def _year_lad_array(controls):
+        """
+        Splits controls into the LAD index, the year index, and a year x
+        LAD array of values.
+        """
+        controls = controls.set_index('LAD13CD').select_dtypes('number')
+        years = pd.Index([str(x) for x in controls.columns])
+        return controls.index, years, controls.to_numpy(dtype=float).T
+
+    @classmethod
+    def read(cls, pop_path, wkrfrac_path):
+        """
+        Reads the DDG controls at pop_path and wkrfrac_path. Controls are
+        cached by path and modification time, so each is only read once per
+        process for all of the years run in it.
+        """
+        key = tuple((p, os.stat(p).st_mtime_ns) for p in (pop_path, wkrfrac_path))
+        if key not in _alignment_cache:
+            _alignment_cache.clear()
+            _alignment_cache[key] = cls(pd.read_csv(pop_path), pd.read_csv(wkrfrac_path))
+        return _alignment_cache[key]
+
+    @staticmethod
+    def _controls(lads, years, values, year, lad_codes):
+        """
+        Returns the controls of year for each of lad_codes, NaN where a LAD
+        has no control, as a left merge gives.
+        """
+        if year not in years:
+            raise KeyError("No DDG controls for %s" % year)
+        lad_idx = lads.get_indexer(lad_codes)
+        out = values[years.get_loc(year)][lad_idx]
+        out[lad_idx < 0] = np.nan
+        return out
+
+    def align(self, FYpop, FYpop_LAD, future_year):
+        """
+        Aligns FYpop to the DDG controls of future_year.
+
+        Adjustment 1 scales population to the DDG LAD totals, adjustment 2
+        then scales workers and non workers so the worker over WAP fraction
+        of each LAD meets DDG. Matches the merge based process this replaced,
+        see ddg_fy_alignment_tests().
+
+        FYpop: pd.DataFrame - NTEM fy pop with '2013_LA_code', 'a',
+            'worker_type' and 'pop_fy' columns
+        FYpop_LAD: pd.DataFrame - NTEM fy pop LAD totals, '2013_LA_code' and
+            'pop_fy'
+        future_year: str - the year to align to
+
+        Returns the aligned population, with 'pop_DDG_aj2' in place of
+        'pop_fy', and a dict of the audit dataframes: 'audit_2', 'audit_3',
+        'audit_4' and 'audit_5'.
+        """
+        # Adjustment 1: factor for each LAD to meet the DDG LAD total
+        lad_fac = (self._controls(self.pop_lads, self.pop_years, self.pop,
+                                  future_year, FYpop_LAD['2013_LA_code'])
+                   / FYpop_LAD['pop_fy'].to_numpy(dtype=float))
+        lad_fac = np.where(np.isnan(lad_fac), 1, lad_fac)
+
+        fac_idx = pd.Index(FYpop_LAD['2013_LA_code']).get_indexer(FYpop['2013_LA_code'])
+        pop_fac = np.where(fac_idx >= 0, lad_fac[fac_idx], np.nan)
+        pop_aj1 = FYpop['pop_fy'].to_numpy(dtype=float) * pop_fac
+        logging.info('DDG population after adjustment 1 currently {}'.format(np.nansum(pop_aj1)))
+
+        # LAD totals of population, WAP and workers
+        lad_codes, lads = pd.factorize(FYpop['2013_LA_code'], sort=True)
+        is_wap = (FYpop['a'] == 2).to_numpy()
+        is_wkr = (FYpop['worker_type'] == 'wkr').to_numpy()
+
+        pop_aj1_LAD = _lad_sums(lad_codes, len(lads), pop_aj1)
+        WAP_aj1 = _lad_sums(lad_codes, len(lads), pop_aj1, is_wap)
+        # Workers are only joined to LADs with WAP
+        wkr_aj1 = np.where(np.isnan(WAP_aj1), np.nan,
+                           _lad_sums(lad_codes, len(lads), pop_aj1, is_wkr))
+        logging.info('DDG aj1 pop aggregated from LAD currently {}'.format(pop_aj1_LAD.sum()))
+        logging.info('DDG aj1 WAP currently {}'.format(np.nansum(WAP_aj1)))
+        logging.info('DDG aj1 worker currently {}'.format(np.nansum(wkr_aj1)))
+
+        # Adjustment 2: factors for workers and non workers to meet DDG
+        # worker fractions of WAP
+        wrkfac = self._controls(self.wkrfrac_lads, self.wkrfrac_years, self.wkrfrac,
+                                future_year, lads)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            nwkr_aj1 = WAP_aj1 - wkr_aj1
+            wkr_aj2 = WAP_aj1 * wrkfac
+            nwkr_aj2 = WAP_aj1 - wkr_aj2
+            audit_2 = pd.DataFrame({
+                '2013_LA_code': lads,
+                'pop_DDG_aj1': pop_aj1_LAD,
+                'WAP_DDG_aj1': WAP_aj1,
+                'wkr_DDG_aj1': wkr_aj1,
+                'nwkr_DDG_aj1': nwkr_aj1,
+                'fact_wkr_pop_DDGaj1': wkr_aj1 / pop_aj1_LAD,
+                'fact_wkr_WAP_DDGaj1': wkr_aj1 / WAP_aj1,
+                'wrkfac_DDG': wrkfac,
+                'wkr_DDG_aj2': wkr_aj2,
+                'nwkr_DDG_aj2': nwkr_aj2,
+            })
+            wkr_fac = wkr_aj2 / wkr_aj1
+            nwkr_fac = nwkr_aj2 / nwkr_aj1
+        wkr_fac = np.where(np.isnan(wkr_fac), 1, wkr_fac)
+        nwkr_fac = np.where(np.isnan(nwkr_fac), 1, nwkr_fac)
+
+        audit_3 = pd.concat([
+            pd.DataFrame({'2013_LA_code': np.concatenate([lads, lads]),
+                          'worker_type': ['wkr'] * len(lads) + ['nwkr'] * len(lads),
+                          'aj2_fac': np.concatenate([wkr_fac, nwkr_fac])}),
+            pd.DataFrame({'2013_LA_code': lads, 'worker_type': 'nwap', 'aj2_fac': 1}),
+        ])
+
+        # Factors by LAD and worker type, as a LAD x worker type array
+        worker_types = pd.Index(['wkr', 'nwkr', 'nwap'])
+        type_fac = np.stack([wkr_fac, nwkr_fac, np.ones(len(lads))], axis=1)
+        type_codes = worker_types.get_indexer(FYpop['worker_type'])
+        found = (lad_codes >= 0) & (type_codes >= 0)
+        row_fac = np.full(len(FYpop), np.nan)
+        row_fac[found] = type_fac[lad_codes[found], type_codes[found]]
+        pop_aj2 = pop_aj1 * row_fac
+
+        FYpop_DDG = FYpop[['2013_LA_code', 'z', 'MSOA', 'tfn_tt', 't', 'a', 'worker_type']].copy()
+        FYpop_DDG['pop_DDG_aj2'] = pop_aj2
+        logging.info('DDG population after adjustment 2 currently {}'.format(np.nansum(pop_aj2)))
+
+        # Audits of the worker fractions and LAD totals met
+        WAP_aj2 = _lad_sums(lad_codes, len(lads), pop_aj2, is_wap)
+        wkr_aj2_rows = np.where(np.isnan(WAP_aj2), np.nan,
+                                _lad_sums(lad_codes, len(lads), pop_aj2, is_wkr))
+        logging.info('DDG aj2 WAP currently {}'.format(np.nansum(WAP_aj2)))
+        logging.info('DDG aj2 worker currently {}'.format(np.nansum(wkr_aj2_rows)))
+        has_wap = ~np.isnan(WAP_aj2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fact_wkr_WAP_fy = wkr_aj2_rows[has_wap] / WAP_aj2[has_wap]
+            audit_4 = pd.DataFrame({
+                '2013_LA_code': lads[has_wap],
+                'fact_wkr_WAP_fy': fact_wkr_WAP_fy,
+                'wrkfac_DDG': wrkfac[has_wap],
+            })
+            audit_4['ratio_deviation'] = audit_4['wrkfac_DDG'] / audit_4['fact_wkr_WAP_fy'] - 1
+
+            pop_aj2_LAD = _lad_sums(lad_codes, len(lads), pop_aj2)
+            pop_DDG = self._controls(self.pop_lads, self.pop_years, self.pop, future_year, lads)
+            audit_5 = pd.DataFrame({
+                '2013_LA_code': lads,
+                'pop_DDG_aj2': pop_aj2_LAD,
+                'pop_DDG': pop_DDG,
+            })
+            audit_5['pop_deviation'] = audit_5['pop_DDG_aj2'] / audit_5['pop_DDG'] - 1
+
+        audits = {'audit_2': audit_2, 'audit_3': audit_3, 'audit_4': audit_4, 'audit_5': audit_5}
+        return FYpop_DDG, audits
+
+
+# The DDG controls of the last scenario read in this process
+_alignment_cache = dict()
+
+
+def _lad_sums(lad_codes, n_lads, values, mask=None):
+    """
+    Sums values by LAD, as a groupby would, NaN for LADs with no rows in mask.
+    """
+    keep = lad_codes >= 0
+    if mask is not None:
+        keep &= mask
+    codes = lad_codes[keep]
+    sums = np.bincount(codes, weights=np.nan_to_num(values[keep]), minlength=n_lads)
+    counts = np.bincount(codes, minlength=n_lads)
+    return np.where(counts > 0, sums, np.nan)
+
+
+def DDGaligned_fy_pop_paths(fy_lu_obj, future_year=None):
+    """
+    Returns the paths DDGaligned_fy_pop_process() reads and writes, so runs
+    can be checked for whether they are up to date.
+
+    future_year defaults to fy_lu_obj.future_year. Returns a dict of
+    'inputs' and 'outputs', each a dict of name to path.
+    """
+    if future_year is None:
+        future_year = fy_lu_obj.future_year
     fy_output_folder = fy_lu_obj.fy_home_folder
     scenario_name = fy_lu_obj.scenario_name
     CAS_scen = fy_lu_obj.CAS_scen
+    write_folder = fy_lu_obj.out_paths['write_folder']
 
     # Directory and file paths for the DDG
-    # Directory Paths
     DDG_directory = os.path.join(fy_lu_obj.import_folder, 'DDG', scenario_name)
-    # File names
     DDG_pop_path = '_'.join(['DD', 'Nov21', CAS_scen, 'Pop', 'LA.csv'])
     DDG_wkrfrac_path = '_'.join(['DD', 'Nov21', CAS_scen, 'frac{WOR}{WAP}', 'LA.csv'])
 
+    def audit_path(name):
+        return os.path.join(write_folder, audit_dir, scenario_name, name)
+
+    inputs = {
+        'FYpop_NTEM': os.path.join(fy_output_folder, process_dir,
+                                   '_'.join(['process_1_NTEM_allsegs', future_year, 'pop.csv.bz2'])),
+        'FYpop_NTEM_audit': os.path.join(fy_output_folder, audit_dir,
+                                         '_'.join(['audit_1_gb_LAD_preaj', future_year, 'pop.csv'])),
+        'DDG_pop': os.path.join(DDG_directory, DDG_pop_path),
+        'DDG_wkrfrac': os.path.join(DDG_directory, DDG_wkrfrac_path),
+    }
+    outputs = {
+        'audit_2': audit_path('_'.join(['audit_2_gb_LAD_DDG', future_year, scenario_name, 'pop.csv'])),
+        'audit_3': audit_path('_'.join(['audit_3_gb_LAD', future_year, scenario_name, 'ajfac.csv'])),
+        'audit_4': audit_path('_'.join(['audit_4_gb_lad', future_year, scenario_name, 'worker_ratio.csv'])),
+        'audit_5': audit_path('_'.join(['audit_5_gb_lad', future_year, scenario_name, 'check_pop.csv'])),
+        'audit_text': audit_path(''.join(['Audit_DDG_pop_process_', future_year, CAS_scen, '.txt'])),
+        'pop_tfn_tt': os.path.join(write_folder, output_dir, scenario_name,
+                                   '_'.join(['output_2_DDG_gb_msoa_tfn_tt', future_year, CAS_scen, 'pop.csv.bz2'])),
+    }
+    return {'inputs': inputs, 'outputs': outputs}
+
+
+def DDGaligned_fy_pop_years_path(fy_lu_obj, future_years):
+    """
+    Returns the path of the output DDGaligned_fy_pop_years() writes for
+    future_years of fy_lu_obj's scenario.
+    """
+    return os.path.join(fy_lu_obj.out_paths['write_folder'], output_dir, fy_lu_obj.scenario_name,
+                        '_'.join(['output_2_DDG_gb_msoa_tfn_tt', future_years[0], future_years[-1],
+                                  fy_lu_obj.CAS_scen, 'pop' + lu_constants.PARQUET_SUFFIX]))
 
-    # Directiry and file paths for fy NTEM pop
-    # process_working_path = os.path.join(fy_output_folder, process_dir)
-    # output_working_path = os.path.join(fy_output_folder, output_dir)
-    FYpop_NTEM_output_file = os.path.join(fy_output_folder, process_dir,
-                                          '_'.join(['process_1_NTEM_allsegs', future_year, 'pop.csv.bz2']))
-    FYpop = pd.read_csv(FYpop_NTEM_output_file)
-    FYpop_NTEM_audit_file = os.path.join(fy_output_folder, audit_dir,
-                                          '_'.join(['audit_1_gb_LAD_preaj', future_year, 'pop.csv']))
-    FYpop_LAD = pd.read_csv(FYpop_NTEM_audit_file)
 
-    # get DDG pop for base year 2018 to adjust all population for base year
-    pop_DDG_LAD = pd.read_csv(
-        os.path.join(
-            DDG_directory, DDG_pop_path))[['LAD13CD', future_year]]
-    # get DDG proportion of worker over total WAP for base year
-    wrkfac_DDG_LAD = pd.read_csv(
-        os.path.join(
-            DDG_directory, DDG_wkrfrac_path))[['LAD13CD', future_year]]
+def DDGaligned_fy_pop_process(fy_lu_obj):
+    """
+    Aligns the NTEM future year population to the DDG LAD population and
+    worker fraction controls, with a DDGAlignment, and writes the audits
+    and output of the year.
 
+    See DDGaligned_fy_pop_years() to align every year of a scenario at once.
+    """
+    logging.info('Processing fy pop to be aligned with DDG for ' + fy_lu_obj.future_year + fy_lu_obj.scenario_name)
+    print('Processing fy pop to be aligned with DDG for ' + fy_lu_obj.future_year + fy_lu_obj.scenario_name)
+    future_year = fy_lu_obj.future_year
+    scenario_name = fy_lu_obj.scenario_name
 
-    # Adjustments: step 1 to make sure pop by segs are scaled to meet DDG LAD totals;
-    # Adjustments: step 2 to incorporate worker ratio into scaled WAP to produce worker;
-    # Adjustment1:
-    #Merge LAD population with DDG population
-    FYpop_LAD = FYpop_LAD.merge(pop_DDG_LAD, how='left',
-                        left_on=['2013_LA_code'],
-                        right_on=['LAD13CD']).drop(columns={'LAD13CD'})
-    FYpop_LAD = FYpop_LAD.rename(columns={future_year: 'pop_fy_DDG'})
-    #calculate adjustment factor on total pop per LAD
-    FYpop_LAD['pop_aj_fac'] = FYpop_LAD['pop_fy_DDG'] / FYpop_LAD['pop_fy']
-    FYpop_LAD['pop_aj_fac'] = FYpop_LAD['pop_aj_fac'].fillna(1)
-    FYpop_LAD_fac = FYpop_LAD[['2013_LA_code', 'pop_aj_fac']]
-    FYpop = FYpop.merge(FYpop_LAD_fac, how='left', on=['2013_LA_code'])
-    FYpop_DDG = FYpop.copy()
-
-
-    #scale MYE pop by segments to be compliant with DDG
-    FYpop_DDG['pop_DDG_aj1'] = FYpop_DDG['pop_fy'] * FYpop_DDG['pop_aj_fac']
-    logging.info('DDG population after adjustment 1 currently {}'.format(FYpop_DDG.pop_DDG_aj1.sum()))
-    FYpop_DDG = FYpop_DDG[['2013_LA_code', 'z', 'MSOA',
-                            'tfn_tt', 't', 'a',
-                            'worker_type', 'pop_DDG_aj1']]
-    # sum up LAD total of DDG aj1 base year pop
-    FYpop_DDG_LAD = FYpop_DDG.groupby(['2013_LA_code'])[['pop_DDG_aj1']].sum().reset_index()
-    logging.info('DDG aj1 pop aggregated from LAD currently {}'.format(FYpop_DDG_LAD.pop_DDG_aj1.sum()))
-
-    # sum LAD level WAP and wkr based on DDG_pop_aj1
-    FYpop_DDG_agg_da = FYpop_DDG.groupby(['2013_LA_code', 'a'])[['pop_DDG_aj1']].sum().reset_index()
-    FYWAP_DDG_LAD = FYpop_DDG_agg_da.loc[(FYpop_DDG_agg_da['a'] == 2)]
-    logging.info('DDG aj1 WAP currently {}'.format(FYWAP_DDG_LAD.pop_DDG_aj1.sum()))
-    FYWAP_DDG_LAD = FYWAP_DDG_LAD.rename(columns={'pop_DDG_aj1': 'WAP_DDG_aj1'})
-    FYpop_DDG_agg_dw = FYpop_DDG.groupby(['2013_LA_code', 'worker_type'])[['pop_DDG_aj1']].sum().reset_index()
-    FYwkr_DDG_LAD = FYpop_DDG_agg_dw.loc[(FYpop_DDG_agg_dw['worker_type'] =='wkr')]
-    logging.info('DDG aj1 worker currently {}'.format(FYwkr_DDG_LAD.pop_DDG_aj1.sum()))
-    FYwkr_DDG_LAD = FYwkr_DDG_LAD.rename(columns={'pop_DDG_aj1': 'wkr_DDG_aj1'})
-
-    # Merge LAD WAP and worker with total pop from BY DDG aj1 process
-    # Columns in df BYpop_DDG_LAD after merging is: ['2013_LA_code','pop_DDG_aj1','pop_DDG_aj1','wkr_DDG_aj1']
-    FYWAP_DDG_LAD = FYWAP_DDG_LAD.merge(FYwkr_DDG_LAD, how='left',
-                                        on=['2013_LA_code']).drop(columns={'a','worker_type'})
-    FYpop_DDG_LAD = FYpop_DDG_LAD.merge(FYWAP_DDG_LAD, how='left', on=['2013_LA_code'])
-
-    # addtional three columns created-- work out ration of worker over total pop as well as over total WAP from DDG aj1
-    FYpop_DDG_LAD['nwkr_DDG_aj1'] = FYpop_DDG_LAD['WAP_DDG_aj1'] - FYpop_DDG_LAD['wkr_DDG_aj1']
-    FYpop_DDG_LAD['fact_wkr_pop_DDGaj1'] = FYpop_DDG_LAD['wkr_DDG_aj1'] / FYpop_DDG_LAD['pop_DDG_aj1']
-    FYpop_DDG_LAD['fact_wkr_WAP_DDGaj1'] = FYpop_DDG_LAD['wkr_DDG_aj1'] / FYpop_DDG_LAD['WAP_DDG_aj1']
-
-    # Adjustment2:
-    # Merge LAD WAP and worker with DDG wkr ratio over WAP
-    FYpop_DDG_LAD = FYpop_DDG_LAD.merge(wrkfac_DDG_LAD, how='left',
-                        left_on=['2013_LA_code'],
-                        right_on=['LAD13CD']).drop(columns={'LAD13CD'})
-    FYpop_DDG_LAD = FYpop_DDG_LAD.rename(columns={future_year: 'wrkfac_DDG'})
-    FYpop_DDG_LAD['wkr_DDG_aj2'] = FYpop_DDG_LAD['WAP_DDG_aj1'] * FYpop_DDG_LAD['wrkfac_DDG']
-    FYpop_DDG_LAD['nwkr_DDG_aj2'] = FYpop_DDG_LAD['WAP_DDG_aj1'] - FYpop_DDG_LAD['wkr_DDG_aj2']
-
-    # audit2- dump df FYpop_DDG_LAD for checking purpose
-    pop_DDG_LAD_audit = FYpop_DDG_LAD.copy()
-    pop_DDG_LAD_audit_path = os.path.join(fy_lu_obj.out_paths['write_folder'],
-                                          audit_dir,
-                                          scenario_name,
-                                        '_'.join(['audit_2_gb_LAD_DDG', future_year, scenario_name, 'pop.csv']))
-    pop_DDG_LAD_audit.to_csv(pop_DDG_LAD_audit_path, index=False)
-
-    # Calculate adjustment factor by worker_type per LAD
-    FYpop_DDG_LAD['wkr_aj_fac'] = FYpop_DDG_LAD['wkr_DDG_aj2'] / FYpop_DDG_LAD['wkr_DDG_aj1']
-    FYpop_DDG_LAD['wkr_aj_fac'] = FYpop_DDG_LAD['wkr_aj_fac'].fillna(1)
-    FYpop_DDG_LAD['nwkr_aj_fac'] = FYpop_DDG_LAD['nwkr_DDG_aj2'] / FYpop_DDG_LAD['nwkr_DDG_aj1']
-    FYpop_DDG_LAD['nwkr_aj_fac'] = FYpop_DDG_LAD['nwkr_aj_fac'].fillna(1)
-    FYpop_DDG_LAD_fac = FYpop_DDG_LAD[['2013_LA_code', 'wkr_aj_fac', 'nwkr_aj_fac']]
-    FYpop_DDG_LAD_fac = FYpop_DDG_LAD_fac.rename(columns={'wkr_aj_fac': 'wkr', 'nwkr_aj_fac': 'nwkr'})
-    FYpop_DDG_LAD_fac = FYpop_DDG_LAD_fac.melt(id_vars=['2013_LA_code'], var_name='worker_type', value_name='aj2_fac')
-    FYpop_DDG_LAD_fac_append = FYpop_DDG_LAD[['2013_LA_code']]
-    FYpop_DDG_LAD_fac_append = FYpop_DDG_LAD_fac_append.assign(worker_type='nwap')
-    FYpop_DDG_LAD_fac_append = FYpop_DDG_LAD_fac_append.assign(aj2_fac=1)
-    FYpop_DDG_LAD_fac = pd.concat([FYpop_DDG_LAD_fac, FYpop_DDG_LAD_fac_append])
-
-    # audit3- dump aj_factor
-    ajfac_DDG_LAD_audit = FYpop_DDG_LAD_fac.copy()
-    ajfac_DDG_LAD_audit_path = os.path.join(fy_lu_obj.out_paths['write_folder'],
-                                        audit_dir,
-                                        scenario_name,
-                                        '_'.join(['audit_3_gb_LAD', future_year, scenario_name, 'ajfac.csv']))
-    ajfac_DDG_LAD_audit.to_csv(ajfac_DDG_LAD_audit_path, index=False)
+    paths = DDGaligned_fy_pop_paths(fy_lu_obj)
+    in_paths, out_paths = paths['inputs'], paths['outputs']
 
-    # scale DDG aj1 pop FY worker_type to be compliant with DDG on worker and non worker
-    FYpop_DDG = FYpop_DDG.merge(FYpop_DDG_LAD_fac, how='left', on=['2013_LA_code', 'worker_type'])
+    # DDG controls are read once for all the years run in this process
+    alignment = DDGAlignment.read(in_paths['DDG_pop'], in_paths['DDG_wkrfrac'])
+    FYpop_DDG, audits = _align_fy_pop(alignment, in_paths, future_year)
+    _write_DDG_fy_pop_audits(FYpop_DDG, audits, future_year, scenario_name, out_paths)
+    _DDG_fy_pop_tfn_tt(FYpop_DDG).to_csv(out_paths['pop_tfn_tt'])
 
-    FYpop_DDG['pop_DDG_aj2'] = FYpop_DDG['pop_DDG_aj1'] * FYpop_DDG['aj2_fac']
-    FYpop_DDG = FYpop_DDG[['2013_LA_code', 'z', 'MSOA',
-                            'tfn_tt', 't', 'a',
-                            'worker_type', 'pop_DDG_aj2']]
-    logging.info('DDG population after adjustment 2 currently {}'.format(FYpop_DDG.pop_DDG_aj2.sum()))
-    # audit4
-    # sum LAD level WAP and wkr based on DDG_pop_aj2
-    FYpop_DDGaj2_agg_da = FYpop_DDG.groupby(['2013_LA_code', 'a'])[['pop_DDG_aj2']].sum().reset_index()
-    FYWAP_DDGaj2_LAD = FYpop_DDGaj2_agg_da.loc[(FYpop_DDGaj2_agg_da['a'] == 2)]
-    logging.info('DDG aj2 WAP currently {}'.format(FYWAP_DDGaj2_LAD.pop_DDG_aj2.sum()))
-    FYWAP_DDGaj2_LAD = FYWAP_DDGaj2_LAD.rename(columns={'pop_DDG_aj2': 'WAP_DDG_aj2'})
-    FYpop_DDGaj2_agg_dw = FYpop_DDG.groupby(['2013_LA_code', 'worker_type'])[['pop_DDG_aj2']].sum().reset_index()
-    FYwkr_DDGaj2_LAD = FYpop_DDGaj2_agg_dw.loc[(FYpop_DDGaj2_agg_dw['worker_type'] =='wkr')]
-    logging.info('DDG aj2 worker currently {}'.format(FYwkr_DDGaj2_LAD.pop_DDG_aj2.sum()))
-    FYwkr_DDGaj2_LAD = FYwkr_DDGaj2_LAD.rename(columns={'pop_DDG_aj2': 'wkr_DDG_aj2'})
-
-    # Columns in df FYWAP_MYE_LAD after merging is: ['2013_LA_code','pop_DDG_aj2','WAP_DDG_aj2','wkr_DDG_aj2']
-    FYWAP_DDGaj2_LAD = FYWAP_DDGaj2_LAD.merge(FYwkr_DDGaj2_LAD, how='left',
-                                        on=['2013_LA_code']).drop(columns={'a', 'worker_type'})
+    logging.info('Step completed-- processing fy pop to be aligned with DDG for ' + fy_lu_obj.future_year + fy_lu_obj.scenario_name)
+    print('Step completed -- processing fy pop to be aligned with DDG for ' + fy_lu_obj.future_year + fy_lu_obj.scenario_name)
+    return 0
 
-    # addtional two columns created-- work out ration of worker over total pop as well as over total WAP from MYE
-    # FYWAP_DDGaj2_LAD['nwkr_DDG_aj2'] = FYpop_MYE_LAD['WAP_DDG_aj2'] - FYpop_MYE_LAD['wkr_DDG_aj2']
-    FYWAP_DDGaj2_LAD['fact_wkr_WAP_fy'] = FYWAP_DDGaj2_LAD['wkr_DDG_aj2'] / FYWAP_DDGaj2_LAD['WAP_DDG_aj2']
-    FYWkrfac_DDG_LAD_audit = FYWAP_DDGaj2_LAD[['2013_LA_code', 'fact_wkr_WAP_fy']]
-    FYWkrfac_DDG_LAD_audit = FYWkrfac_DDG_LAD_audit.merge(wrkfac_DDG_LAD, how='left',
-                                                          left_on=['2013_LA_code'],
-                                                          right_on=['LAD13CD']).drop(columns={'LAD13CD'})
-    FYWkrfac_DDG_LAD_audit = FYWkrfac_DDG_LAD_audit.rename(columns={future_year: 'wrkfac_DDG'})
-    FYWkrfac_DDG_LAD_audit['ratio_deviation'] = FYWkrfac_DDG_LAD_audit['wrkfac_DDG']\
-                                                /FYWkrfac_DDG_LAD_audit['fact_wkr_WAP_fy']-1
-
-    logging.info('The min %age diff is ' + str(FYWkrfac_DDG_LAD_audit['ratio_deviation'].min() * 100) + '%')
-    logging.info('The max %age diff is ' + str(FYWkrfac_DDG_LAD_audit['ratio_deviation'].max() * 100) + '%')
-    logging.info('The mean %age diff is ' + str(FYWkrfac_DDG_LAD_audit['ratio_deviation'].mean() * 100) + '%')
-
-    FYWkrfac_DDG_LAD_audit_path = os.path.join(fy_lu_obj.out_paths['write_folder'],
-                                            audit_dir,
-                                            scenario_name,
-                                           '_'.join(['audit_4_gb_lad', future_year, scenario_name, 'worker_ratio.csv']))
-    FYWkrfac_DDG_LAD_audit.to_csv(FYWkrfac_DDG_LAD_audit_path, index=False)
-
-    # audit5
-    # check LAD level pop is consistent with DDG LAD
-    FYpop_DDG_LAD_audit = FYpop_DDG.groupby(['2013_LA_code'])[['pop_DDG_aj2']].sum().reset_index()
-    FYpop_DDG_LAD_audit = FYpop_DDG_LAD_audit.merge(pop_DDG_LAD, how='left',
-                        left_on=['2013_LA_code'],
-                        right_on=['LAD13CD']).drop(columns={'LAD13CD'})
-    FYpop_DDG_LAD_audit = FYpop_DDG_LAD_audit.rename(columns={future_year: 'pop_DDG'})
-    FYpop_DDG_LAD_audit['pop_deviation'] = FYpop_DDG_LAD_audit['pop_DDG_aj2']/FYpop_DDG_LAD_audit['pop_DDG']-1
-    logging.info('The min %age diff is ' + str(FYpop_DDG_LAD_audit['pop_deviation'].min() * 100) + '%')
-    logging.info('The max %age diff is ' + str(FYpop_DDG_LAD_audit['pop_deviation'].max() * 100) + '%')
-    logging.info('The mean %age diff is ' + str(FYpop_DDG_LAD_audit['pop_deviation'].mean() * 100) + '%')
+
+def DDGaligned_fy_pop_years(fy_lu_obj, future_years, audits=False):
+    """
+    Aligns the NTEM population of every one of future_years to the DDG
+    controls of fy_lu_obj's scenario, and writes them all to one output.
+
+    The DDG controls are read once for all the years. Only each year's NTEM
+    population is read, and nothing is written per year unless audits is
+    True. The output is a parquet file of the population by
+    '2013_LA_code', 'z', 'MSOA' and 'tfn_tt', as
+    DDGaligned_fy_pop_process() writes, with a 'year' column and one row
+    group per year, so single years can be read back cheaply with
+    compress.read_parquet(path, filters=[('year', '==', year)]).
+
+    fy_lu_obj: FutureYearLandUse - the scenario to align, its future_year
+        is not used
+    future_years: list of str - the years to align, in the order to write
+    audits: bool - if True, also writes each year's audits and audit text,
+        as DDGaligned_fy_pop_process() does
+
+    Returns the path of the output, see DDGaligned_fy_pop_years_path().
+    """
+    scenario_name = fy_lu_obj.scenario_name
+    logging.info('Processing fy pop to be aligned with DDG for %s to %s %s'
+                 % (future_years[0], future_years[-1], scenario_name))
+    print('Processing fy pop to be aligned with DDG for %s to %s %s'
+          % (future_years[0], future_years[-1], scenario_name))
+
+    in_paths = DDGaligned_fy_pop_paths(fy_lu_obj, future_years[0])['inputs']
+    alignment = DDGAlignment.read(in_paths['DDG_pop'], in_paths['DDG_wkrfrac'])
+    out_path = DDGaligned_fy_pop_years_path(fy_lu_obj, future_years)
+
+    def write(tmp_path):
+        writer = None
+        try:
+            for future_year in future_years:
+                paths = DDGaligned_fy_pop_paths(fy_lu_obj, future_year)
+                FYpop_DDG, year_audits = _align_fy_pop(alignment, paths['inputs'], future_year)
+                if audits:
+                    _write_DDG_fy_pop_audits(FYpop_DDG, year_audits, future_year,
+                                             scenario_name, paths['outputs'])
+                FYpop_DDG_exc_t_out = _DDG_fy_pop_tfn_tt(FYpop_DDG)
+                FYpop_DDG_exc_t_out.insert(0, 'year', future_year)
+                table = pa.Table.from_pandas(FYpop_DDG_exc_t_out, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema,
+                                              compression=lu_constants.PARQUET_COMPRESSION)
+                writer.write_table(table.cast(writer.schema))
+                logging.info('Aligned fy pop to DDG for ' + future_year + scenario_name)
+        finally:
+            if writer is not None:
+                writer.close()
+    file_cache.write_atomic(out_path, write)
+
+    logging.info('Step completed-- processing fy pop to be aligned with DDG for %s to %s %s'
+                 % (future_years[0], future_years[-1], scenario_name))
+    print('Step completed -- processing fy pop to be aligned with DDG for %s to %s %s'
+          % (future_years[0], future_years[-1], scenario_name))
+    return out_path
+
+
+def _align_fy_pop(alignment, in_paths, future_year):
+    """
+    Reads the NTEM pop of future_year at in_paths and aligns it with
+    alignment, see DDGAlignment.align().
+    """
+    FYpop = pd.read_csv(in_paths['FYpop_NTEM'],
+                        usecols=['2013_LA_code', 'z', 'MSOA', 'tfn_tt', 't', 'a', 'worker_type', 'pop_fy'])
+    FYpop_LAD = pd.read_csv(in_paths['FYpop_NTEM_audit'])
+    return alignment.align(FYpop, FYpop_LAD, future_year)
+
+
+def _write_DDG_fy_pop_audits(FYpop_DDG, audits, future_year, scenario_name, out_paths):
+    """
+    Writes the audits DDGAlignment.align() returns, and the audit text.
+    """
+    for name, audit in audits.items():
+        audit.to_csv(out_paths[name], index=False)
+    for name, col in [('audit_4', 'ratio_deviation'), ('audit_5', 'pop_deviation')]:
+        logging.info('The min %age diff is ' + str(audits[name][col].min() * 100) + '%')
+        logging.info('The max %age diff is ' + str(audits[name][col].max() * 100) + '%')
+        logging.info('The mean %age diff is ' + str(audits[name][col].mean() * 100) + '%')
+    _write_DDG_fy_pop_audit_text(FYpop_DDG, audits['audit_5'], future_year,
+                                 scenario_name, out_paths)
+
+
+def _DDG_fy_pop_tfn_tt(FYpop_DDG):
+    """
+    Formats the aligned pop as an output, grouped removing t.
+    """
+    groupby_cols = ['2013_LA_code', 'z', 'MSOA', 'tfn_tt']
+    FYpop_DDG = FYpop_DDG.rename(columns={'pop_DDG_aj2': 'people'})
+    return FYpop_DDG.groupby(groupby_cols)['people'].sum().reset_index()
+
+
+def _write_DDG_fy_pop_audit_text(FYpop_DDG, FYpop_DDG_LAD_audit, future_year, scenario_name, out_paths):
+    """
+    Writes the audit text of the DDG aligned fy pop process.
+    """
     logging.info('The overall deviation is ' + str(
         FYpop_DDG_LAD_audit['pop_DDG_aj2'].sum() - FYpop_DDG_LAD_audit['pop_DDG'].sum()) + ' people')
-    FYpop_DDG_LAD_audit_path = os.path.join(fy_lu_obj.out_paths['write_folder'],
-                                            audit_dir,
-                                            scenario_name,
-                                           '_'.join(['audit_5_gb_lad', future_year, scenario_name, 'check_pop.csv']))
-    FYpop_DDG_LAD_audit.to_csv(FYpop_DDG_LAD_audit_path, index=False)
-    # Auditing text for DDG aligned pop process
     audit_header = '\n'.join(['Audit for  DDG aligned fy pop process',
                                      'Created ' + str(datetime.datetime.now())])
     audit_text = '\n'.join(['The total ' + future_year + ' population at the end of the running process is:',
@@ -408,45 +595,12 @@ def DDGaligned_fy_pop_process(fy_lu_obj):
                                        FYpop_DDG_LAD_audit['pop_DDG'].sum()) + ' people',
                                    'All of the above values should be equal (or close) to 0.',
                                    'A full breakdown of the ' + future_year + scenario_name + 'population FY d can be found at:',
-                                   FYpop_DDG_LAD_audit_path])
+                                   out_paths['audit_5']])
 
     audit_DDG_fypop_process_content = '\n'.join([audit_header, audit_text])
-    audit_DDG_fypop_process_path = os.path.join(fy_lu_obj.out_paths['write_folder'],
-                                     audit_dir,
-                                     scenario_name,
-                                     ''.join(['Audit_DDG_pop_process_', future_year, CAS_scen, '.txt']))
-    with open(audit_DDG_fypop_process_path, 'w') as text_file:
+    with open(out_paths['audit_text'], 'w') as text_file:
         text_file.write(audit_DDG_fypop_process_content)
 
-    # Format ouputs
-    FYpop_DDG = FYpop_DDG.rename(columns={'pop_DDG_aj2': 'people'})
-    FYpop_DDG_out = FYpop_DDG[['2013_LA_code', 'z', 'MSOA', 'tfn_tt', 't', 'people']]
-
-    #Also groupby this output FY removing t
-    groupby_cols = ['2013_LA_code', 'z', 'MSOA', 'tfn_tt']
-    FYpop_DDG_exc_t_out = FYpop_DDG_out.groupby(groupby_cols)['people'].sum().reset_index()
-
-    #Dump outputs
-    #DDG_aligned_pop_output_path = os.path.join(fy_lu_obj.out_paths['write_folder'], output_dir)
-    FYpop_DDG_pop_allsegs_filename = '_'.join(['output_1_DDG_gb_msoa_allsegs_', future_year, CAS_scen,'pop.csv.bz2'])
-    FYpop_DDG_pop_tfn_tt_filename = '_'.join(['output_2_DDG_gb_msoa_tfn_tt', future_year, CAS_scen,'pop.csv.bz2'])
-
-    FYpop_DDG_pop_allsegs_path = os.path.join(fy_lu_obj.out_paths['write_folder'],
-                                  output_dir,
-                                  scenario_name,
-                                  FYpop_DDG_pop_allsegs_filename)
-    FYpop_DDG_pop_tfn_tt_path = os.path.join(fy_lu_obj.out_paths['write_folder'],
-                                  output_dir,
-                                  scenario_name,
-                                  FYpop_DDG_pop_tfn_tt_filename)
-    # compress.write_out(FYpop_DDG_out, FYpop_DDG_pop_allsegs_path)
-    # compress.write_out(FYpop_DDG_exc_t_out, FYpop_DDG_pop_tfn_tt_path)
-    # FYpop_DDG_out.to_csv(FYpop_DDG_pop_allsegs_path)
-    FYpop_DDG_exc_t_out.to_csv(FYpop_DDG_pop_tfn_tt_path)
-    logging.info('Step completed-- processing fy pop to be aligned with DDG for ' + fy_lu_obj.future_year + fy_lu_obj.scenario_name)
-    print('Step completed -- processing fy pop to be aligned with DDG for ' + fy_lu_obj.future_year + fy_lu_obj.scenario_name)
-    return 0
-
 
 def DDGaligned_fy_emp_process(fy_lu_obj):
     # Distrctory and file from standard base year employment process in employment.py
@@ -544,3 +698,313 @@ def DDGaligned_fy_emp_process(fy_lu_obj):
     return 0
 
 
+
+
+def ddg_fy_alignment_tests(n_lads=380, n_rows=20000, seed=2018):
+    """
+    Checks DDGaligned_fy_pop_process() and DDGaligned_fy_pop_years() write
+    the same audits and output as the merge based process they replaced,
+    for synthetic future years, and times them.
+
+    Runs on a small population by default. Pass n_rows=2000000, around the
+    size of a GB future year, to benchmark them.
+    """
+    import re
+    import tempfile
+    import time
+    import types
+
+    # The merge based process DDGAlignment replaced, as the expected results
+    def legacy_process(fy_lu_obj):
+        logging.info('Processing fy pop to be aligned with DDG for ' + fy_lu_obj.future_year + fy_lu_obj.scenario_name)
+        print('Processing fy pop to be aligned with DDG for ' + fy_lu_obj.future_year + fy_lu_obj.scenario_name)
+        future_year = fy_lu_obj.future_year
+        scenario_name = fy_lu_obj.scenario_name
+
+        # Directory and file paths for the DDG and fy NTEM pop
+        paths = DDGaligned_fy_pop_paths(fy_lu_obj)
+        in_paths, out_paths = paths['inputs'], paths['outputs']
+
+        FYpop = pd.read_csv(in_paths['FYpop_NTEM'])
+        FYpop_LAD = pd.read_csv(in_paths['FYpop_NTEM_audit'])
+
+        # get DDG pop for base year 2018 to adjust all population for base year
+        pop_DDG_LAD = pd.read_csv(in_paths['DDG_pop'])[['LAD13CD', future_year]]
+        # get DDG proportion of worker over total WAP for base year
+        wrkfac_DDG_LAD = pd.read_csv(in_paths['DDG_wkrfrac'])[['LAD13CD', future_year]]
+
+
+        # Adjustments: step 1 to make sure pop by segs are scaled to meet DDG LAD totals;
+        # Adjustments: step 2 to incorporate worker ratio into scaled WAP to produce worker;
+        # Adjustment1:
+        #Merge LAD population with DDG population
+        FYpop_LAD = FYpop_LAD.merge(pop_DDG_LAD, how='left',
+                            left_on=['2013_LA_code'],
+                            right_on=['LAD13CD']).drop(columns={'LAD13CD'})
+        FYpop_LAD = FYpop_LAD.rename(columns={future_year: 'pop_fy_DDG'})
+        #calculate adjustment factor on total pop per LAD
+        FYpop_LAD['pop_aj_fac'] = FYpop_LAD['pop_fy_DDG'] / FYpop_LAD['pop_fy']
+        FYpop_LAD['pop_aj_fac'] = FYpop_LAD['pop_aj_fac'].fillna(1)
+        FYpop_LAD_fac = FYpop_LAD[['2013_LA_code', 'pop_aj_fac']]
+        FYpop = FYpop.merge(FYpop_LAD_fac, how='left', on=['2013_LA_code'])
+        FYpop_DDG = FYpop.copy()
+
+
+        #scale MYE pop by segments to be compliant with DDG
+        FYpop_DDG['pop_DDG_aj1'] = FYpop_DDG['pop_fy'] * FYpop_DDG['pop_aj_fac']
+        logging.info('DDG population after adjustment 1 currently {}'.format(FYpop_DDG.pop_DDG_aj1.sum()))
+        FYpop_DDG = FYpop_DDG[['2013_LA_code', 'z', 'MSOA',
+                                'tfn_tt', 't', 'a',
+                                'worker_type', 'pop_DDG_aj1']]
+        # sum up LAD total of DDG aj1 base year pop
+        FYpop_DDG_LAD = FYpop_DDG.groupby(['2013_LA_code'])[['pop_DDG_aj1']].sum().reset_index()
+        logging.info('DDG aj1 pop aggregated from LAD currently {}'.format(FYpop_DDG_LAD.pop_DDG_aj1.sum()))
+
+        # sum LAD level WAP and wkr based on DDG_pop_aj1
+        FYpop_DDG_agg_da = FYpop_DDG.groupby(['2013_LA_code', 'a'])[['pop_DDG_aj1']].sum().reset_index()
+        FYWAP_DDG_LAD = FYpop_DDG_agg_da.loc[(FYpop_DDG_agg_da['a'] == 2)]
+        logging.info('DDG aj1 WAP currently {}'.format(FYWAP_DDG_LAD.pop_DDG_aj1.sum()))
+        FYWAP_DDG_LAD = FYWAP_DDG_LAD.rename(columns={'pop_DDG_aj1': 'WAP_DDG_aj1'})
+        FYpop_DDG_agg_dw = FYpop_DDG.groupby(['2013_LA_code', 'worker_type'])[['pop_DDG_aj1']].sum().reset_index()
+        FYwkr_DDG_LAD = FYpop_DDG_agg_dw.loc[(FYpop_DDG_agg_dw['worker_type'] =='wkr')]
+        logging.info('DDG aj1 worker currently {}'.format(FYwkr_DDG_LAD.pop_DDG_aj1.sum()))
+        FYwkr_DDG_LAD = FYwkr_DDG_LAD.rename(columns={'pop_DDG_aj1': 'wkr_DDG_aj1'})
+
+        # Merge LAD WAP and worker with total pop from BY DDG aj1 process
+        # Columns in df BYpop_DDG_LAD after merging is: ['2013_LA_code','pop_DDG_aj1','pop_DDG_aj1','wkr_DDG_aj1']
+        FYWAP_DDG_LAD = FYWAP_DDG_LAD.merge(FYwkr_DDG_LAD, how='left',
+                                            on=['2013_LA_code']).drop(columns={'a','worker_type'})
+        FYpop_DDG_LAD = FYpop_DDG_LAD.merge(FYWAP_DDG_LAD, how='left', on=['2013_LA_code'])
+
+        # addtional three columns created-- work out ration of worker over total pop as well as over total WAP from DDG aj1
+        FYpop_DDG_LAD['nwkr_DDG_aj1'] = FYpop_DDG_LAD['WAP_DDG_aj1'] - FYpop_DDG_LAD['wkr_DDG_aj1']
+        FYpop_DDG_LAD['fact_wkr_pop_DDGaj1'] = FYpop_DDG_LAD['wkr_DDG_aj1'] / FYpop_DDG_LAD['pop_DDG_aj1']
+        FYpop_DDG_LAD['fact_wkr_WAP_DDGaj1'] = FYpop_DDG_LAD['wkr_DDG_aj1'] / FYpop_DDG_LAD['WAP_DDG_aj1']
+
+        # Adjustment2:
+        # Merge LAD WAP and worker with DDG wkr ratio over WAP
+        FYpop_DDG_LAD = FYpop_DDG_LAD.merge(wrkfac_DDG_LAD, how='left',
+                            left_on=['2013_LA_code'],
+                            right_on=['LAD13CD']).drop(columns={'LAD13CD'})
+        FYpop_DDG_LAD = FYpop_DDG_LAD.rename(columns={future_year: 'wrkfac_DDG'})
+        FYpop_DDG_LAD['wkr_DDG_aj2'] = FYpop_DDG_LAD['WAP_DDG_aj1'] * FYpop_DDG_LAD['wrkfac_DDG']
+        FYpop_DDG_LAD['nwkr_DDG_aj2'] = FYpop_DDG_LAD['WAP_DDG_aj1'] - FYpop_DDG_LAD['wkr_DDG_aj2']
+
+        # audit2- dump df FYpop_DDG_LAD for checking purpose
+        pop_DDG_LAD_audit = FYpop_DDG_LAD.copy()
+        pop_DDG_LAD_audit_path = out_paths['audit_2']
+        pop_DDG_LAD_audit.to_csv(pop_DDG_LAD_audit_path, index=False)
+
+        # Calculate adjustment factor by worker_type per LAD
+        FYpop_DDG_LAD['wkr_aj_fac'] = FYpop_DDG_LAD['wkr_DDG_aj2'] / FYpop_DDG_LAD['wkr_DDG_aj1']
+        FYpop_DDG_LAD['wkr_aj_fac'] = FYpop_DDG_LAD['wkr_aj_fac'].fillna(1)
+        FYpop_DDG_LAD['nwkr_aj_fac'] = FYpop_DDG_LAD['nwkr_DDG_aj2'] / FYpop_DDG_LAD['nwkr_DDG_aj1']
+        FYpop_DDG_LAD['nwkr_aj_fac'] = FYpop_DDG_LAD['nwkr_aj_fac'].fillna(1)
+        FYpop_DDG_LAD_fac = FYpop_DDG_LAD[['2013_LA_code', 'wkr_aj_fac', 'nwkr_aj_fac']]
+        FYpop_DDG_LAD_fac = FYpop_DDG_LAD_fac.rename(columns={'wkr_aj_fac': 'wkr', 'nwkr_aj_fac': 'nwkr'})
+        FYpop_DDG_LAD_fac = FYpop_DDG_LAD_fac.melt(id_vars=['2013_LA_code'], var_name='worker_type', value_name='aj2_fac')
+        FYpop_DDG_LAD_fac_append = FYpop_DDG_LAD[['2013_LA_code']]
+        FYpop_DDG_LAD_fac_append = FYpop_DDG_LAD_fac_append.assign(worker_type='nwap')
+        FYpop_DDG_LAD_fac_append = FYpop_DDG_LAD_fac_append.assign(aj2_fac=1)
+        FYpop_DDG_LAD_fac = pd.concat([FYpop_DDG_LAD_fac, FYpop_DDG_LAD_fac_append])
+
+        # audit3- dump aj_factor
+        ajfac_DDG_LAD_audit = FYpop_DDG_LAD_fac.copy()
+        ajfac_DDG_LAD_audit_path = out_paths['audit_3']
+        ajfac_DDG_LAD_audit.to_csv(ajfac_DDG_LAD_audit_path, index=False)
+
+        # scale DDG aj1 pop FY worker_type to be compliant with DDG on worker and non worker
+        FYpop_DDG = FYpop_DDG.merge(FYpop_DDG_LAD_fac, how='left', on=['2013_LA_code', 'worker_type'])
+
+        FYpop_DDG['pop_DDG_aj2'] = FYpop_DDG['pop_DDG_aj1'] * FYpop_DDG['aj2_fac']
+        FYpop_DDG = FYpop_DDG[['2013_LA_code', 'z', 'MSOA',
+                                'tfn_tt', 't', 'a',
+                                'worker_type', 'pop_DDG_aj2']]
+        logging.info('DDG population after adjustment 2 currently {}'.format(FYpop_DDG.pop_DDG_aj2.sum()))
+        # audit4
+        # sum LAD level WAP and wkr based on DDG_pop_aj2
+        FYpop_DDGaj2_agg_da = FYpop_DDG.groupby(['2013_LA_code', 'a'])[['pop_DDG_aj2']].sum().reset_index()
+        FYWAP_DDGaj2_LAD = FYpop_DDGaj2_agg_da.loc[(FYpop_DDGaj2_agg_da['a'] == 2)]
+        logging.info('DDG aj2 WAP currently {}'.format(FYWAP_DDGaj2_LAD.pop_DDG_aj2.sum()))
+        FYWAP_DDGaj2_LAD = FYWAP_DDGaj2_LAD.rename(columns={'pop_DDG_aj2': 'WAP_DDG_aj2'})
+        FYpop_DDGaj2_agg_dw = FYpop_DDG.groupby(['2013_LA_code', 'worker_type'])[['pop_DDG_aj2']].sum().reset_index()
+        FYwkr_DDGaj2_LAD = FYpop_DDGaj2_agg_dw.loc[(FYpop_DDGaj2_agg_dw['worker_type'] =='wkr')]
+        logging.info('DDG aj2 worker currently {}'.format(FYwkr_DDGaj2_LAD.pop_DDG_aj2.sum()))
+        FYwkr_DDGaj2_LAD = FYwkr_DDGaj2_LAD.rename(columns={'pop_DDG_aj2': 'wkr_DDG_aj2'})
+
+        # Columns in df FYWAP_MYE_LAD after merging is: ['2013_LA_code','pop_DDG_aj2','WAP_DDG_aj2','wkr_DDG_aj2']
+        FYWAP_DDGaj2_LAD = FYWAP_DDGaj2_LAD.merge(FYwkr_DDGaj2_LAD, how='left',
+                                            on=['2013_LA_code']).drop(columns={'a', 'worker_type'})
+
+        # addtional two columns created-- work out ration of worker over total pop as well as over total WAP from MYE
+        # FYWAP_DDGaj2_LAD['nwkr_DDG_aj2'] = FYpop_MYE_LAD['WAP_DDG_aj2'] - FYpop_MYE_LAD['wkr_DDG_aj2']
+        FYWAP_DDGaj2_LAD['fact_wkr_WAP_fy'] = FYWAP_DDGaj2_LAD['wkr_DDG_aj2'] / FYWAP_DDGaj2_LAD['WAP_DDG_aj2']
+        FYWkrfac_DDG_LAD_audit = FYWAP_DDGaj2_LAD[['2013_LA_code', 'fact_wkr_WAP_fy']]
+        FYWkrfac_DDG_LAD_audit = FYWkrfac_DDG_LAD_audit.merge(wrkfac_DDG_LAD, how='left',
+                                                              left_on=['2013_LA_code'],
+                                                              right_on=['LAD13CD']).drop(columns={'LAD13CD'})
+        FYWkrfac_DDG_LAD_audit = FYWkrfac_DDG_LAD_audit.rename(columns={future_year: 'wrkfac_DDG'})
+        FYWkrfac_DDG_LAD_audit['ratio_deviation'] = FYWkrfac_DDG_LAD_audit['wrkfac_DDG']\
+                                                    /FYWkrfac_DDG_LAD_audit['fact_wkr_WAP_fy']-1
+
+        logging.info('The min %age diff is ' + str(FYWkrfac_DDG_LAD_audit['ratio_deviation'].min() * 100) + '%')
+        logging.info('The max %age diff is ' + str(FYWkrfac_DDG_LAD_audit['ratio_deviation'].max() * 100) + '%')
+        logging.info('The mean %age diff is ' + str(FYWkrfac_DDG_LAD_audit['ratio_deviation'].mean() * 100) + '%')
+
+        FYWkrfac_DDG_LAD_audit_path = out_paths['audit_4']
+        FYWkrfac_DDG_LAD_audit.to_csv(FYWkrfac_DDG_LAD_audit_path, index=False)
+
+        # audit5
+        # check LAD level pop is consistent with DDG LAD
+        FYpop_DDG_LAD_audit = FYpop_DDG.groupby(['2013_LA_code'])[['pop_DDG_aj2']].sum().reset_index()
+        FYpop_DDG_LAD_audit = FYpop_DDG_LAD_audit.merge(pop_DDG_LAD, how='left',
+                            left_on=['2013_LA_code'],
+                            right_on=['LAD13CD']).drop(columns={'LAD13CD'})
+        FYpop_DDG_LAD_audit = FYpop_DDG_LAD_audit.rename(columns={future_year: 'pop_DDG'})
+        FYpop_DDG_LAD_audit['pop_deviation'] = FYpop_DDG_LAD_audit['pop_DDG_aj2']/FYpop_DDG_LAD_audit['pop_DDG']-1
+        logging.info('The min %age diff is ' + str(FYpop_DDG_LAD_audit['pop_deviation'].min() * 100) + '%')
+        logging.info('The max %age diff is ' + str(FYpop_DDG_LAD_audit['pop_deviation'].max() * 100) + '%')
+        logging.info('The mean %age diff is ' + str(FYpop_DDG_LAD_audit['pop_deviation'].mean() * 100) + '%')
+        FYpop_DDG_LAD_audit_path = out_paths['audit_5']
+        FYpop_DDG_LAD_audit.to_csv(FYpop_DDG_LAD_audit_path, index=False)
+        _write_DDG_fy_pop_audit_text(FYpop_DDG, FYpop_DDG_LAD_audit, future_year,
+                                     scenario_name, out_paths)
+
+        # Format ouputs
+        FYpop_DDG = FYpop_DDG.rename(columns={'pop_DDG_aj2': 'people'})
+        FYpop_DDG_out = FYpop_DDG[['2013_LA_code', 'z', 'MSOA', 'tfn_tt', 't', 'people']]
+
+        #Also groupby this output FY removing t
+        groupby_cols = ['2013_LA_code', 'z', 'MSOA', 'tfn_tt']
+        FYpop_DDG_exc_t_out = FYpop_DDG_out.groupby(groupby_cols)['people'].sum().reset_index()
+
+        FYpop_DDG_exc_t_out.to_csv(out_paths['pop_tfn_tt'])
+        logging.info('Step completed-- processing fy pop to be aligned with DDG for ' + fy_lu_obj.future_year + fy_lu_obj.scenario_name)
+        print('Step completed -- processing fy pop to be aligned with DDG for ' + fy_lu_obj.future_year + fy_lu_obj.scenario_name)
+        return 0
+
+    print("Running DDG_fy_process.py alignment tests...")
+    rng = np.random.default_rng(seed)
+    years = ['2030', '2040', '2050']
+    lads = np.array(['E%08d' % i for i in range(n_lads)])
+
+    FYpop = pd.DataFrame({
+        '2013_LA_code': lads[rng.integers(0, n_lads, n_rows)],
+        'z': rng.integers(1, 8481, n_rows),
+        'tfn_tt': rng.integers(1, 761, n_rows),
+        't': rng.integers(1, 5, n_rows),
+        'a': rng.integers(1, 4, n_rows),
+        'pop_fy': rng.random(n_rows) * 10,
+    })
+    FYpop['MSOA'] = 'E02%06d' % 1 + FYpop['z'].astype(str)
+    FYpop['worker_type'] = np.where(FYpop['a'] != 2, 'nwap',
+                                    np.where(rng.random(n_rows) < 0.7, 'wkr', 'nwkr'))
+    # LADs without WAP, without workers, and with no DDG controls
+    FYpop = FYpop.loc[~((FYpop['2013_LA_code'] == lads[0]) & (FYpop['a'] == 2))]
+    FYpop = FYpop.loc[~((FYpop['2013_LA_code'] == lads[1]) & (FYpop['worker_type'] == 'wkr'))]
+    FYpop_LAD = FYpop.groupby('2013_LA_code')[['pop_fy']].sum().reset_index()
+    FYpop_LAD = FYpop_LAD.loc[FYpop_LAD['2013_LA_code'] != lads[3]]
+
+    pop_DDG = pd.DataFrame({'LAD13CD': lads[2:], 'LAD13NM': lads[2:]})
+    wkrfrac_DDG = pd.DataFrame({'LAD13CD': lads[:-2]})
+    for year in years:
+        pop_DDG[year] = rng.random(len(pop_DDG)) * n_rows * 6 / n_lads
+        wkrfrac_DDG[year] = 0.5 + rng.random(len(wkrfrac_DDG)) * 0.4
+
+    number = r'-?[\d.]+(?:e-?\d+)?'
+
+    def assert_audits_equal(expected, achieved):
+        for name in expected:
+            if name == 'audit_text':
+                # Skipping the created time and the audit 5 path
+                with open(expected[name]) as f1, open(achieved[name]) as f2:
+                    expected_text = f1.read().splitlines()[2:-1]
+                    achieved_text = f2.read().splitlines()[2:-1]
+                for line_1, line_2 in zip(expected_text, achieved_text):
+                    assert re.sub(number, '', line_1) == re.sub(number, '', line_2)
+                    assert np.allclose(np.array(re.findall(number, line_1), dtype=float),
+                                       np.array(re.findall(number, line_2), dtype=float),
+                                       rtol=1e-6, atol=1e-6)
+            elif name != 'pop_tfn_tt':
+                pd.testing.assert_frame_equal(pd.read_csv(expected[name]),
+                                              pd.read_csv(achieved[name]),
+                                              check_dtype=False, rtol=1e-9)
+
+    def written_files(folder):
+        return sorted(os.path.relpath(os.path.join(root, f), folder)
+                      for root, _, files in os.walk(folder) for f in files)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        def fy_lu_obj(year, write_folder):
+            obj = types.SimpleNamespace(
+                base_year='2018', future_year=year, scenario_name='SC01_JAM',
+                CAS_scen='CASReference', fy_home_folder=os.path.join(tmp, 'fy'),
+                import_folder=os.path.join(tmp, 'import'),
+                out_paths={'write_folder': os.path.join(tmp, write_folder)},
+            )
+            paths = DDGaligned_fy_pop_paths(obj)
+            for path in list(paths['inputs'].values()) + list(paths['outputs'].values()):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            return obj, paths
+
+        for year in years:
+            obj, paths = fy_lu_obj(year, 'legacy')
+            FYpop.assign(pop_fy=FYpop['pop_fy'] * int(year) / 2018).to_csv(
+                paths['inputs']['FYpop_NTEM'], index=False)
+            FYpop_LAD.to_csv(paths['inputs']['FYpop_NTEM_audit'], index=False)
+        pop_DDG.to_csv(paths['inputs']['DDG_pop'], index=False)
+        wkrfrac_DDG.to_csv(paths['inputs']['DDG_wkrfrac'], index=False)
+
+        timings = dict()
+        for name, process in [('legacy', legacy_process),
+                              ('aligned', DDGaligned_fy_pop_process)]:
+            _alignment_cache.clear()
+            start = time.perf_counter()
+            for year in years:
+                process(fy_lu_obj(year, name)[0])
+            timings[name] = time.perf_counter() - start
+
+        for run, audits in [('years', False), ('years_audits', True)]:
+            _alignment_cache.clear()
+            obj = fy_lu_obj(years[0], run)[0]
+            start = time.perf_counter()
+            out_path = DDGaligned_fy_pop_years(obj, years, audits=audits)
+            timings[run] = time.perf_counter() - start
+            assert out_path == DDGaligned_fy_pop_years_path(obj, years)
+            assert written_files(obj.out_paths['write_folder']) == sorted(
+                [os.path.relpath(out_path, obj.out_paths['write_folder'])]
+                + [os.path.relpath(path, obj.out_paths['write_folder'])
+                   for year in years
+                   for name, path in fy_lu_obj(year, run)[1]['outputs'].items()
+                   if audits and name != 'pop_tfn_tt'])
+
+            # One row group per year, in order
+            assert pq.ParquetFile(out_path).metadata.num_row_groups == len(years)
+            for year in years:
+                expected = fy_lu_obj(year, 'legacy')[1]['outputs']
+                achieved = compress.read_parquet(out_path, filters=[('year', '==', year)])
+                assert (achieved['year'] == year).all()
+                pd.testing.assert_frame_equal(
+                    pd.read_csv(expected['pop_tfn_tt'], index_col=0),
+                    achieved.drop(columns='year').reset_index(drop=True),
+                    check_dtype=False, rtol=1e-9)
+                if audits:
+                    assert_audits_equal(expected, fy_lu_obj(year, run)[1]['outputs'])
+
+        for year in years:
+            expected = fy_lu_obj(year, 'legacy')[1]['outputs']
+            achieved = fy_lu_obj(year, 'aligned')[1]['outputs']
+            assert_audits_equal(expected, achieved)
+            pd.testing.assert_frame_equal(pd.read_csv(expected['pop_tfn_tt']),
+                                          pd.read_csv(achieved['pop_tfn_tt']),
+                                          check_dtype=False, rtol=1e-9)
+
+    print('%d years of %d rows: merges %.1fs, DDGAlignment by year %.1fs, '
+          'all years %.1fs, all years with audits %.1fs'
+          % (len(years), len(FYpop), timings['legacy'], timings['aligned'],
+             timings['years'], timings['years_audits']))
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    ddg_fy_alignment_tests()
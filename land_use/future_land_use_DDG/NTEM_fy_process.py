@@ -19,10 +19,10 @@ import numpy as np
 import os
 #from ipfn import ipfn
 import datetime
-import pyodbc
 #import geopandas as gpd
 #from land_use.utils import file_ops as utils
 from land_use.utils import compress
+from land_use.utils import ntem
 #from land_use import lu_constants
 import logging
 
@@ -85,76 +85,21 @@ def ntem_fy_pop_interpolation(fy_lu_obj):
     # Data years
     # NTEM is run in 5-year increments with a base of 2011.
     # This section calculates the upper and lower years of data that are required
-    InterpolationYears = Year % 5
-    LowerYear = Year - ((InterpolationYears - 1) % 5)
-    UpperYear = Year + ((1 - InterpolationYears) % 5)
+    LowerYear, UpperYear = ntem.ntem_interpolation_years(Year)
 
     logging.info("Lower Interpolation Year - " + str(LowerYear))
     logging.info("Upper Interpolation Year - " + str(UpperYear))
     print("Lower Interpolation Year - " + str(LowerYear))
     print("Upper Interpolation Year - " + str(UpperYear))
 
-    # Import Upper and Lower Year Tables
+    # Interpolated population comes from a local cache of the NTEM databases,
+    # kept in the local folder lu_constants.NTEM_CACHE_FOLDER,
+    # built for every year the first time any year is asked for
     # 'I:/Data/NTEM/NTEM 7.2 outputs for TfN/'
-    LowerNTEMDatabase = fy_lu_obj.CTripEnd_Database_path + 'CTripEnd7_' + str(LowerYear) + '.accdb'
-    UpperNTEMDatabase = fy_lu_obj.CTripEnd_Database_path + 'CTripEnd7_' + str(UpperYear) + '.accdb'
-    # UpperNTEMDatabase = fy_lu_obj.CTripEnd_Database_path + r"\CTripEnd7_" + str(UpperYear) + r".accdb"
-    cnxn = pyodbc.connect('DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};DBQ=' +
-                          '{};'.format(UpperNTEMDatabase))
-
-    query = r"SELECT * FROM ZoneData"
-    UZoneData = pd.read_sql(query, cnxn)
-    cnxn.close()
-
-    cnxn = pyodbc.connect('DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};DBQ=' +
-                          '{};'.format(LowerNTEMDatabase))
-
-    query = r"SELECT * FROM ZoneData"
-    LZoneData = pd.read_sql(query, cnxn)
-    cnxn.close()
-
-    # Re-format Tables
-    LZonePop = LZoneData.copy()
-    UZonePop = UZoneData.copy()
-    LZonePop.drop(
-        ['E01', 'E02', 'E03', 'E04', 'E05', 'E06', 'E07', 'E08', 'E09', 'E10', 'E11', 'E12', 'E13', 'E14', 'E15', 'K01',
-         'K02', 'K03', 'K04', 'K05', 'K06', 'K07', 'K08', 'K09', 'K10', 'K11', 'K12', 'K13', 'K14', 'K15'], axis=1,
-        inplace=True)
-    UZonePop.drop(
-        ['E01', 'E02', 'E03', 'E04', 'E05', 'E06', 'E07', 'E08', 'E09', 'E10', 'E11', 'E12', 'E13', 'E14', 'E15', 'K01',
-         'K02', 'K03', 'K04', 'K05', 'K06', 'K07', 'K08', 'K09', 'K10', 'K11', 'K12', 'K13', 'K14', 'K15'], axis=1,
-        inplace=True)
-    LZonePop_long = pd.melt(LZonePop, id_vars=["I", "R", "B", "Borough", "ZoneID", "ZoneName"],
-                            var_name="LTravellerType", value_name="LPopulation")
-    UZonePop_long = pd.melt(UZonePop, id_vars=["I", "R", "B", "Borough", "ZoneID", "ZoneName"],
-                            var_name="UTravellerType", value_name="UPopulation")
-
-    LZonePop_long.rename(columns={"I": "LZoneID", "B": "LBorough", "R": "LAreaType"}, inplace=True)
-    UZonePop_long.rename(columns={"I": "UZoneID", "B": "UBorough", "R": "UAreaType"}, inplace=True)
-
-    LZonePop_long['LIndivID'] = LZonePop_long.LZoneID.map(str) + "_" + LZonePop_long.LAreaType.map(
-        str) + "_" + LZonePop_long.LBorough.map(str) + "_" + LZonePop_long.LTravellerType.map(str)
-    UZonePop_long['UIndivID'] = UZonePop_long.UZoneID.map(str) + "_" + UZonePop_long.UAreaType.map(
-        str) + "_" + UZonePop_long.UBorough.map(str) + "_" + UZonePop_long.UTravellerType.map(str)
-
-    # Join Upper and Lower Tables
-    TZonePop_DataYear = LZonePop_long.join(UZonePop_long.set_index('UIndivID'), on='LIndivID', how='right',
-                                           lsuffix='_left', rsuffix='_right')
-    TZonePop_DataYear.drop(['UZoneID', 'UBorough', 'UAreaType', 'UTravellerType'], axis=1, inplace=True)
-
-    # Interpolate Between Upper and Lower Years
-    TZonePop_DataYear['GrowthinPeriod'] = TZonePop_DataYear.eval('UPopulation - LPopulation')
-    TZonePop_DataYear['GrowthperYear'] = TZonePop_DataYear.eval('GrowthinPeriod / 5')
-    TZonePop_DataYear = TZonePop_DataYear.assign(GrowthtoYear=TZonePop_DataYear['GrowthperYear'] * (Year - LowerYear))
-    TZonePop_DataYear['Population'] = TZonePop_DataYear.eval('LPopulation + GrowthtoYear')
-
-    # Tidy up
-    TZonePop_DataYear.rename(
-        columns={"LZoneID": "ZoneID", "LBorough": "Borough", "LAreaType": "AreaType", "LTravellerType": "TravellerType",
-                 "LIndivID": "IndivID"}, inplace=True)
-    TZonePop_DataYear.drop(
-        ['GrowthinPeriod', 'GrowthperYear', 'GrowthtoYear', 'LPopulation', 'UPopulation', 'ZoneID_left', 'ZoneID_right',
-         'ZoneName_right', 'ZoneName_left', 'Borough_left', 'Borough_right', 'IndivID'], axis=1, inplace=True)
+    TZonePop_DataYear = ntem.ntem_pop_for_year(
+        year=Year,
+        ctripend_database_path=fy_lu_obj.CTripEnd_Database_path,
+    )
     print(TZonePop_DataYear.Population.sum())
 
     # Translating zones for those in Scotland
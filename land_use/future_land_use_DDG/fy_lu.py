@@ -1,11 +1,26 @@
 import os
 import logging
+import functools
+import contextlib
 import pandas as pd
 
 import land_use.lu_constants as consts
 import land_use.utils.file_ops as fo
+from land_use.utils import step_graph, compress
 from land_use.future_land_use_DDG import NTEM_fy_process, DDG_fy_process
 
+# DDG scenario names to the CAS scenario codes in the DDG file names
+CAS_SCENARIOS = {
+    'CAS Regional Scenario': 'CASReg',
+    'CAS High': 'CASHi',
+    'CAS Low': 'CASLo',
+    'Nov 21 central': 'Central',
+}
+
+# Each year holds a whole future year population in memory, so only a few
+# are built at once
+FY_POP_DDG_PROCESS_COUNT = 3
+
 
 class FutureYearLandUse:
     def __init__(self,
@@ -166,37 +181,56 @@ class FutureYearLandUse:
         DDG_fy_process.ntem_fy_pop_growthfactor(self)
         DDG_fy_process.NTEMaligned_pop_process(self)
 
-    def build_fy_pop_DDG(self):
+    def build_fy_pop_DDG(self, log_path=None):
         # TODO: Method name, this is more of an adjustment to a base now
         """
+        Aligns the future year population of this scenario and year to the
+        DDG.
+
+        Parameters
+        ----------
+        log_path:
+            The file to log to. Defaults to '<scenario_name>_<future_year>.log'
+            in the iteration's logging folder, so every scenario and year,
+            including those run at once, logs to its own file.
+        """
+        if log_path is None:
+            log_path = os.path.join(self.out_paths['write_folder'], '00 Logging',
+                                    '%s_%s.log' % (self.scenario_name, self.future_year))
 
-        Returns
-        -------
+        with _log_to(log_path):
+            DDG_fy_process.DDGaligned_fy_pop_process(self)
 
+    def build_fy_pop_DDG_all_years(self, future_years, audits=False, log_path=None):
         """
-        # Check which parts of the process need running
-        # Make a new sub folder of the home directory for the iteration and set this as the working directory
-        os.chdir(self.model_folder)
-        fo.create_folder(self.iteration, ch_dir=True)
-        os.chdir('00 Logging')
-        # Create log file without overwriting existing files
-        future_year_log_name = '_'.join(['future_year_land_use.log'])
-        future_year_log_dir = os.getcwd()
-        if os.path.exists(os.path.join(future_year_log_dir, future_year_log_name)):
-            log_v_count = 1
-            og_future_year_log_name = future_year_log_name[:-4]
-            while os.path.exists(os.path.join(future_year_log_dir, future_year_log_name)):
-                future_year_log_name = ''.join([og_future_year_log_name, '_', str(log_v_count), '.log'])
-                log_v_count = log_v_count + 1
-                print('The last log name I tried was already taken!')
-                print('Now trying log name: %s' % future_year_log_name)
-        logging.basicConfig(filename=future_year_log_name,
-                            level=logging.INFO,
-                            format='%(asctime)s: %(message)s')
+        Aligns the future year population of every one of future_years of
+        this scenario to the DDG, writing them all to one output.
 
+        Parameters
+        ----------
+        future_years:
+            The years to align, as strings.
 
+        audits:
+            If True, also writes the audits of every year, as
+            build_fy_pop_DDG() does.
 
-        DDG_fy_process.DDGaligned_fy_pop_process(self)
+        log_path:
+            The file to log to. Defaults to '<scenario_name>_<first
+            year>_<last year>.log' in the iteration's logging folder.
+
+        Returns
+        -------
+        output_path:
+            The path of the output, see
+            DDG_fy_process.DDGaligned_fy_pop_years().
+        """
+        if log_path is None:
+            log_path = os.path.join(self.out_paths['write_folder'], '00 Logging',
+                                    '%s_%s_%s.log' % (self.scenario_name, future_years[0], future_years[-1]))
+
+        with _log_to(log_path):
+            return DDG_fy_process.DDGaligned_fy_pop_years(self, future_years, audits=audits)
 
 
 
@@ -221,5 +255,207 @@ class FutureYearLandUse:
 
         DDG_fy_process.DDGaligned_fy_emp_process(self)
 
+    def fy_pop_DDG_step(self) -> step_graph.BuildStep:
+        """
+        Returns build_fy_pop_DDG() for this scenario and year as a step,
+        keyed '<scenario_name>/<future_year>', with the files it reads
+        and writes.
+        """
+        paths = DDG_fy_process.DDGaligned_fy_pop_paths(self)
+        key = '/'.join([self.scenario_name, self.future_year])
+        return step_graph.BuildStep(
+            key=key,
+            desc='DDG aligned fy pop for %s %s' % (self.scenario_name, self.future_year),
+            fn=functools.partial(_run_fy_pop_DDG, key=key),
+            inputs=list(paths['inputs'].values()),
+            outputs=list(paths['outputs'].values()),
+            params={
+                'iteration': self.iteration,
+                'base_year': self.base_year,
+                'future_year': self.future_year,
+                'scenario_name': self.scenario_name,
+                'CAS_scen': self.CAS_scen,
+            },
+        )
+
+
+@contextlib.contextmanager
+def _log_to(log_path):
+    """
+    Sends INFO logging to log_path while in the context, without changing
+    the working directory or any logging set up before.
+    """
+    handler = logging.FileHandler(log_path)
+    handler.setFormatter(logging.Formatter('%(asctime)s: %(message)s'))
+    root = logging.getLogger()
+    level = root.level
+    root.addHandler(handler)
+    root.setLevel(min(level, logging.INFO))
+    try:
+        yield
+    finally:
+        root.setLevel(level)
+        root.removeHandler(handler)
+        handler.close()
+
+
+def _run_fy_pop_DDG(fy_runs, key):
+    fy_runs[key].build_fy_pop_DDG()
+
+
+def build_fy_pop_DDG_years(iteration,
+                           scenarios,
+                           future_years,
+                           resume=True,
+                           process_count=FY_POP_DDG_PROCESS_COUNT,
+                           **kwargs):
+    """
+    Runs build_fy_pop_DDG() for every scenario and future year, skipping
+    those already run with the same inputs.
+
+    Every (scenario, year) is a step of a step_graph.StepGraph. Each one is
+    recorded in a run manifest as soon as it completes, with the hashes of
+    the files it read and wrote. Rerunning picks up where a failed run
+    stopped, and reruns any year whose inputs or outputs have changed since.
+    Years don't depend on each other, so are run in a pool of processes,
+    each logging to its own file. See build_fy_pop_DDG().
+
+    Parameters
+    ----------
+    iteration:
+        The land use iteration to build.
+
+    scenarios:
+        The DDG scenario names to build, keys of CAS_SCENARIOS.
+
+    future_years:
+        The years to build, as strings.
+
+    resume:
+        If False, every scenario and year is rerun, whatever the manifest
+        holds. The manifest is still updated.
+
+    process_count:
+        The number of processes to run years in. See
+        concurrency.multiprocess() for how values are treated. Defaults to
+        a few, as each year needs a whole population in memory.
+
+    kwargs:
+        Any other arguments for FutureYearLandUse.
+
+    Returns
+    -------
+    run_steps:
+        The '<scenario_name>/<future_year>' keys of the years that were run.
+    """
+    fy_runs = dict()
+    for scenario in scenarios:
+        for fy in future_years:
+            fy_run = FutureYearLandUse(iteration=iteration,
+                                       future_year=fy,
+                                       scenario_name=scenario,
+                                       CAS_scen=CAS_SCENARIOS[scenario],
+                                       **kwargs)
+            fy_runs['/'.join([scenario, fy])] = fy_run
+
+    write_folder = list(fy_runs.values())[0].out_paths['write_folder']
+    graph = step_graph.StepGraph(
+        steps=[x.fy_pop_DDG_step() for x in fy_runs.values()],
+        state_path=os.path.join(write_folder, '00 Logging', 'fy_pop_DDG_manifest.json'),
+    )
+
+    force = None if resume else list(fy_runs)
+    return graph.run(fy_runs, force=force, process_count=process_count)
+
+
+def fy_pop_DDG_resume_tests(n_rows=20000, seed=2018):
+    """
+    Checks build_fy_pop_DDG_years() skips the years already built, and
+    rebuilds a year once one of its inputs changes, on synthetic inputs.
+    """
+    import tempfile
+    import numpy as np
+
+    print("Running fy_lu.py DDG resume tests...")
+    rng = np.random.default_rng(seed)
+    scenario = 'CAS High'
+    years = ['2030', '2040']
+    lads = np.array(['E%08d' % i for i in range(20)])
+
+    FYpop = pd.DataFrame({
+        '2013_LA_code': lads[rng.integers(0, len(lads), n_rows)],
+        'z': rng.integers(1, 8481, n_rows),
+        'tfn_tt': rng.integers(1, 761, n_rows),
+        't': rng.integers(1, 5, n_rows),
+        'a': rng.integers(1, 4, n_rows),
+        'pop_fy': rng.random(n_rows) * 10,
+    })
+    FYpop['MSOA'] = 'E02' + FYpop['z'].astype(str).str.zfill(6)
+    FYpop['worker_type'] = np.where(FYpop['a'] != 2, 'nwap',
+                                    np.where(rng.random(n_rows) < 0.7, 'wkr', 'nwkr'))
+    FYpop_LAD = FYpop.groupby('2013_LA_code')[['pop_fy']].sum().reset_index()
+    pop_DDG = pd.DataFrame({'LAD13CD': lads, 'LAD13NM': lads})
+    wkrfrac_DDG = pd.DataFrame({'LAD13CD': lads})
+    for year in years:
+        pop_DDG[year] = rng.random(len(lads)) * n_rows * 6 / len(lads)
+        wkrfrac_DDG[year] = 0.5 + rng.random(len(lads)) * 0.4
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        run_kwargs = {
+            'iteration': 'iter_test',
+            'scenarios': [scenario],
+            'future_years': years,
+            'process_count': 0,
+            'model_folder': tmp,
+            'import_folder': 'imports',
+        }
 
-
+        for year in years:
+            fy_run = FutureYearLandUse(iteration='iter_test', future_year=year,
+                                       scenario_name=scenario,
+                                       CAS_scen=CAS_SCENARIOS[scenario],
+                                       model_folder=tmp, import_folder='imports')
+            inputs = DDG_fy_process.DDGaligned_fy_pop_paths(fy_run)['inputs']
+            for path in inputs.values():
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            FYpop.to_csv(inputs['FYpop_NTEM'], index=False)
+            FYpop_LAD.to_csv(inputs['FYpop_NTEM_audit'], index=False)
+        pop_DDG.to_csv(inputs['DDG_pop'], index=False)
+        wkrfrac_DDG.to_csv(inputs['DDG_wkrfrac'], index=False)
+        keys = ['/'.join([scenario, year]) for year in years]
+
+        # Every year is built on the first run, and logged to its own file
+        assert build_fy_pop_DDG_years(**run_kwargs) == keys
+        log_folder = os.path.join(fy_run.out_paths['write_folder'], '00 Logging')
+        for year in years:
+            with open(os.path.join(log_folder, '%s_%s.log' % (scenario, year))) as f:
+                assert 'Processing fy pop to be aligned with DDG for %s' % year in f.read()
+        assert os.getcwd() == cwd
+
+        # Nothing is rebuilt until an input changes, then only its year is
+        assert build_fy_pop_DDG_years(**run_kwargs) == list()
+        FYpop.assign(pop_fy=FYpop['pop_fy'] * 1.1).to_csv(inputs['FYpop_NTEM'], index=False)
+        assert build_fy_pop_DDG_years(**run_kwargs) == [keys[-1]]
+        assert build_fy_pop_DDG_years(**run_kwargs) == list()
+        assert build_fy_pop_DDG_years(**run_kwargs, resume=False) == keys
+
+        # All years at once gives the same population, logged to its own file
+        all_run = FutureYearLandUse(iteration='iter_test', scenario_name=scenario,
+                                    CAS_scen=CAS_SCENARIOS[scenario],
+                                    model_folder=tmp, import_folder='imports')
+        all_years = compress.read_parquet(all_run.build_fy_pop_DDG_all_years(years))
+        for year in years:
+            fy_run.future_year = year
+            pop_tfn_tt = DDG_fy_process.DDGaligned_fy_pop_paths(fy_run)['outputs']['pop_tfn_tt']
+            pd.testing.assert_frame_equal(
+                pd.read_csv(pop_tfn_tt, index_col=0),
+                all_years.loc[all_years['year'] == year].drop(columns='year').reset_index(drop=True),
+                check_dtype=False, rtol=1e-9)
+        assert os.path.exists(os.path.join(log_folder, '%s_%s_%s.log' % (scenario, years[0], years[-1])))
+
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    fy_pop_DDG_resume_tests()
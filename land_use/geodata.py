@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+File purpose:
+Cache for the shapefiles read across Land Use, such as the LAD and MSOA
+zone shapefiles.
+
+Reading a shapefile through OGR takes seconds, and most callers only want
+its attribute table, such as the zone ids. The first time a shapefile is
+read it is converted to a parquet file in a local cache folder, with its
+attributes as columns and its geometry as WKB. Later reads, by this or
+any other process, load the parquet instead. read_attributes() only loads
+the attribute columns, so never decodes the geometry.
+
+A cached shapefile is converted again if the source has changed since it
+was cached, and is used as it is if the source can't be reached. Without
+a cache folder, shapefiles are still only read once per process.
+
+The cache folder is set with the LU_GEODATA_CACHE environment variable,
+or by passing cache_folder to GeodataCache.
+"""
+import hashlib
+import json
+import os
+
+from typing import Dict
+from typing import List
+
+import geopandas as gpd
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+
+from land_use import file_cache
+from land_use.types import PathLike
+
+CACHE_SUFFIX = '.parquet'
+METADATA_KEY = b'land_use.geodata'
+# Shapefile files holding the attributes and projection, part of its stamp
+SIDECARS = ['.dbf', '.prj']
+
+
+class GeodataCache:
+    """
+    Reads shapefiles once, converting them to parquet in cache_folder.
+    See the module docstring.
+    """
+
+    def __init__(self, cache_folder: PathLike = None):
+        """
+        cache_folder: PathLike - folder to cache shapefiles in, not cached if None
+        """
+        self.cache_folder = cache_folder
+        self._loaded = dict()
+
+    def read_file(self,
+                  path: PathLike,
+                  columns: List[str] = None,
+                  ) -> gpd.GeoDataFrame:
+        """
+        Reads the shapefile at path, with its geometry.
+
+        path: PathLike - shapefile to read
+        columns: List[str] - attribute columns to keep, all if None
+
+        Returns a copy, so can be changed by the caller.
+        """
+        data = self._get(path, geometry=True)
+        if columns is not None:
+            data = data[list(columns) + [data.geometry.name]]
+        return data.copy()
+
+    def read_attributes(self,
+                        path: PathLike,
+                        columns: List[str] = None,
+                        ) -> pd.DataFrame:
+        """
+        Reads the attribute table of the shapefile at path, without its
+        geometry.
+
+        path: PathLike - shapefile to read
+        columns: List[str] - attribute columns to keep, all if None
+
+        Returns a copy, so can be changed by the caller.
+        """
+        data = self._get(path, geometry=False)
+        if columns is not None:
+            data = data[list(columns)]
+        return data.copy()
+
+    def convert(self, path: PathLike) -> str:
+        """
+        Converts the shapefile at path into the cache, if it isn't already.
+        Returns the path of the cached file.
+        """
+        if self.cache_folder is None:
+            raise ValueError("No cache_folder to convert shapefiles to")
+        self._get(path, geometry=True)
+        return self._cache_path(path)
+
+    def clear(self) -> None:
+        """
+        Forgets the shapefiles read so far, so they're loaded again when
+        next read.
+        """
+        self._loaded.clear()
+
+    def _cache_path(self, path: PathLike) -> str:
+        path = os.path.abspath(os.fspath(path))
+        stem = os.path.splitext(os.path.basename(path))[0]
+        key = hashlib.sha1(path.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self.cache_folder, '%s_%s%s' % (stem, key, CACHE_SUFFIX))
+
+    def _get(self, path: PathLike, geometry: bool) -> pd.DataFrame:
+        """
+        Gets the shapefile at path from this process, the cache or the
+        source, in that order. Attribute-only reads also use a full read
+        that this process has already made.
+        """
+        key = os.path.abspath(os.fspath(path))
+        stamp = file_cache.source_stamp(path, sidecars=SIDECARS)
+
+        for wanted in [(key, geometry), (key, True)]:
+            if wanted in self._loaded:
+                loaded_stamp, data = self._loaded[wanted]
+                if stamp is None or loaded_stamp == stamp:
+                    if not wanted[1] or geometry:
+                        return data
+                    return pd.DataFrame(data.drop(columns=data.geometry.name))
+
+        data = self._load(path, stamp, geometry)
+        self._loaded[(key, geometry)] = (stamp, data)
+        return data
+
+    def _load(self, path: PathLike, stamp: Dict, geometry: bool) -> pd.DataFrame:
+        """
+        Loads a shapefile from the cache if it is up to date, otherwise from
+        its source, converting it if there is a cache_folder.
+        """
+        if self.cache_folder is not None and os.path.exists(self._cache_path(path)):
+            cached_stamp = _cached_metadata(self._cache_path(path))['stamp']
+            if file_cache.use_cached(self._cache_path(path), cached_stamp, stamp, path):
+                return _read_cached(self._cache_path(path), geometry)
+
+        if stamp is None:
+            raise FileNotFoundError("Can't find shapefile %s" % path)
+
+        if self.cache_folder is None:
+            if geometry:
+                return gpd.read_file(path)
+            return pd.DataFrame(gpd.read_file(path, ignore_geometry=True))
+
+        data = gpd.read_file(path)
+        _write_cached(data, stamp, self._cache_path(path))
+        if geometry:
+            return data
+        return pd.DataFrame(data.drop(columns=data.geometry.name))
+
+
+def _write_cached(data: gpd.GeoDataFrame, stamp: Dict, cache_path: str) -> None:
+    """
+    Writes a shapefile read by geopandas to parquet, with its geometry as WKB.
+    """
+    geometry_col = data.geometry.name
+    table = pd.DataFrame(data)
+    table[geometry_col] = shapely.to_wkb(data.geometry.values)
+    table = pa.Table.from_pandas(table, preserve_index=False)
+
+    metadata = {'stamp': stamp,
+                'geometry_column': geometry_col,
+                'crs': None if data.crs is None else data.crs.to_wkt()}
+    table = table.replace_schema_metadata({**table.schema.metadata,
+                                           METADATA_KEY: json.dumps(metadata)})
+
+    file_cache.write_atomic(cache_path, lambda tmp_path: pq.write_table(table, tmp_path))
+
+
+def _cached_metadata(cache_path: str) -> Dict:
+    return json.loads(pq.read_schema(cache_path).metadata[METADATA_KEY])
+
+
+def _read_cached(cache_path: str, geometry: bool) -> pd.DataFrame:
+    """
+    Reads a cached shapefile, only reading the attribute columns if
+    geometry is False.
+    """
+    metadata = _cached_metadata(cache_path)
+    geometry_col = metadata['geometry_column']
+
+    if not geometry:
+        columns = [c for c in pq.read_schema(cache_path).names if c != geometry_col]
+        return pq.read_table(cache_path, columns=columns).to_pandas()
+
+    data = pq.read_table(cache_path).to_pandas()
+    data[geometry_col] = gpd.GeoSeries(shapely.from_wkb(data[geometry_col].values),
+                                       index=data.index,
+                                       crs=metadata['crs'])
+    return gpd.GeoDataFrame(data, geometry=geometry_col, crs=metadata['crs'])
+
+
+# Cache used by read_file and read_attributes
+GEODATA = GeodataCache(cache_folder=os.environ.get('LU_GEODATA_CACHE'))
+
+
+def read_file(path: PathLike, columns: List[str] = None) -> gpd.GeoDataFrame:
+    """
+    Reads a shapefile with its geometry, through GEODATA.
+    See GeodataCache.read_file.
+    """
+    return GEODATA.read_file(path, columns=columns)
+
+
+def read_attributes(path: PathLike, columns: List[str] = None) -> pd.DataFrame:
+    """
+    Reads the attribute table of a shapefile, through GEODATA.
+    See GeodataCache.read_attributes.
+    """
+    return GEODATA.read_attributes(path, columns=columns)
+
+
+def geodata_tests() -> None:
+    """
+    Checks shapefiles are converted once, and cached and refreshed on disk.
+    """
+    import tempfile
+    from shapely.geometry import box
+
+    def write_shapefile(path, n):
+        gpd.GeoDataFrame({'objectid': range(1, n + 1),
+                          'lad17cd': ['E%08d' % i for i in range(n)]},
+                         geometry=[box(i, 0, i + 1, 1) for i in range(n)],
+                         crs='EPSG:27700').to_file(path)
+
+    print("Running geodata.py tests...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'lads.shp')
+        write_shapefile(path, 3)
+        expected = gpd.read_file(path)
+
+        # Without a cache folder shapefiles are read once per process
+        cache = GeodataCache()
+        attributes = cache.read_attributes(path)
+        assert isinstance(attributes, pd.DataFrame) and 'geometry' not in attributes
+        pd.testing.assert_frame_equal(attributes, pd.DataFrame(expected.drop(columns='geometry')))
+        assert cache.read_attributes(path) is not cache.read_attributes(path)
+
+        # With one, the first read converts and later processes load the cache
+        cache = GeodataCache(cache_folder=os.path.join(tmp, 'cache'))
+        read = cache.read_file(path)
+        assert len(os.listdir(cache.cache_folder)) == 1
+        assert read.crs == expected.crs
+        pd.testing.assert_frame_equal(pd.DataFrame(read), pd.DataFrame(expected))
+
+        cache = GeodataCache(cache_folder=os.path.join(tmp, 'cache'))
+        assert cache.read_attributes(path, columns=['lad17cd'])['lad17cd'].tolist() == \
+            expected['lad17cd'].tolist()
+        read = cache.read_file(path, columns=['objectid'])
+        assert list(read) == ['objectid', 'geometry'] and read.crs == expected.crs
+        assert read.geometry.geom_equals(expected.geometry).all()
+
+        # Changed sources are converted again
+        write_shapefile(path, 4)
+        os.utime(path, ns=(0, 0))
+        assert len(cache.read_attributes(path)) == 4
+        cache = GeodataCache(cache_folder=os.path.join(tmp, 'cache'))
+        assert len(cache.read_file(path)) == 4
+
+        # Cached shapefiles are used when their source can't be found
+        for suffix in ['.shp', '.shx', '.dbf', '.prj', '.cpg']:
+            if os.path.exists(os.path.join(tmp, 'lads' + suffix)):
+                os.remove(os.path.join(tmp, 'lads' + suffix))
+        cache.clear()
+        assert len(cache.read_attributes(path)) == 4
+
+        try:
+            GeodataCache().read_file(os.path.join(tmp, 'missing.shp'))
+        except FileNotFoundError:
+            pass
+        else:
+            raise AssertionError("Read a missing shapefile")
+
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    geodata_tests()
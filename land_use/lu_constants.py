@@ -6,8 +6,13 @@ import os
 
 import pandas as pd
 
+from land_use import references
+
 # SUFFIXES AND SEMI-STATIC CONFIG
 COMPRESSION_SUFFIX = '.pbz2'
+PARQUET_SUFFIX = '.parquet'
+PARQUET_COMPRESSION = 'zstd'
+PARQUET_ROW_GROUP_SIZE = 250000
 PROCESS_COUNT = -2
 
 # PATHS
@@ -184,29 +189,54 @@ CA_MODEL = pd.DataFrame({'cars': [0, 1, 2, 3],
 
 REF_PATH = os.path.join(LU_FOLDER, LU_IMPORTS, LU_REFS)
 
-AGE_REF = pd.read_csv(os.path.join(REF_PATH,
-                                   'age_index.csv'))
-
-GENDER_REF = pd.read_csv(os.path.join(REF_PATH,
-                                      'gender_index.csv'))
+# Local folder to cache reference lookups in, see land_use.references.
+# Lookups aren't cached on disk unless this is set.
+REFERENCE_CACHE_FOLDER = os.environ.get('LU_REFERENCE_CACHE')
 
-HC_REF = pd.read_csv(os.path.join(REF_PATH,
-                                  'household_composition_index.csv'))
+# Local folder to cache the extracted and interpolated NTEM population in,
+# see land_use.utils.ntem. Kept off the network drive so runs after the
+# first don't read the NTEM databases again. Set LU_NTEM_CACHE to move it.
+NTEM_CACHE_FOLDER = os.environ.get(
+    'LU_NTEM_CACHE',
+    os.path.join(os.path.expanduser('~'), '.land_use', 'ntem_cache'),
+)
 
+# Reference lookups, read the first time they're used
+REFERENCES = references.ReferenceRegistry(cache_folder=REFERENCE_CACHE_FOLDER)
+REFERENCES.register('age_index', os.path.join(REF_PATH, 'age_index.csv'))
+REFERENCES.register('gender_index', os.path.join(REF_PATH, 'gender_index.csv'))
+REFERENCES.register('household_composition_index',
+                    os.path.join(REF_PATH, 'household_composition_index.csv'))
 # NTEM Traveller Type Reference
-RAW_TT_INDEX = pd.read_csv(os.path.join(REF_PATH,
-                           'ntem_traveller_types.csv'))
+REFERENCES.register('ntem_traveller_types',
+                    os.path.join(REF_PATH, 'ntem_traveller_types.csv'))
+REFERENCES.register('ntem_traveller_types_normalised',
+                    os.path.join(REF_PATH, 'ntem_traveller_types_normalised.csv'))
+# TfN Traveller Type Reference
+REFERENCES.register('tfn_traveller_types_normalised',
+                    os.path.join(REF_PATH, 'tfn_traveller_types_normalised.csv'),
+                    dtype=int)
+REFERENCES.register('tfn_traveller_types_illustrated',
+                    os.path.join(REF_PATH, 'tfn_traveller_types_illustrated.csv'))
+REFERENCES.register('msoa_region', MSOA_REGION)
+
+# Constants that were read on import, now got from REFERENCES when used
+_LAZY_REFERENCES = {
+    'AGE_REF': 'age_index',
+    'GENDER_REF': 'gender_index',
+    'HC_REF': 'household_composition_index',
+    'RAW_TT_INDEX': 'ntem_traveller_types',
+    'TT_INDEX': 'ntem_traveller_types_normalised',
+    'TFN_TT_INDEX': 'tfn_traveller_types_normalised',
+    'TFN_TT_DESC': 'tfn_traveller_types_illustrated',
+}
 
-TT_INDEX = pd.read_csv(os.path.join(REF_PATH,
-                                    'ntem_traveller_types_normalised.csv'))
 
-# TfN Traveller Type Reference
-TFN_TT_INDEX = pd.read_csv(os.path.join(REF_PATH,
-                                        'tfn_traveller_types_normalised.csv'),
-                           dtype=int)
+def __getattr__(name):
+    if name in _LAZY_REFERENCES:
+        return REFERENCES.get(_LAZY_REFERENCES[name])
+    raise AttributeError("module '%s' has no attribute '%s'" % (__name__, name))
 
-TFN_TT_DESC = pd.read_csv(os.path.join(REF_PATH,
-                                       'tfn_traveller_types_illustrated.csv'))
 
 # LU Pop Build Steps
 BY_POP_BUILD_STEPS = [
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+File purpose:
+Registry of the reference lookups used across Land Use, such as the
+traveller type indices.
+
+Lookups are registered by name with the path to read them from, and are
+only read the first time they are asked for. After that the same dataframe
+is returned for the rest of the process, so importing lu_constants, or
+starting a worker process, doesn't read any files.
+
+Lookups can also be cached as pickles in a local folder, which are much
+quicker to load than csvs on a network drive. A cached lookup is re-read
+from its source if the source has changed since it was cached, and is used
+as it is if the source can't be reached, so lookups that have been cached
+can be used without the network drive.
+"""
+import os
+import pickle
+
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Tuple
+
+import pandas as pd
+
+from land_use import file_cache
+from land_use.types import PathLike
+
+CACHE_SUFFIX = '.pkl'
+
+
+class Reference(NamedTuple):
+    """
+    A lookup that can be read from path with reader(path, **read_kwargs).
+    """
+    path: PathLike
+    reader: Callable[..., pd.DataFrame]
+    read_kwargs: Dict[str, Any]
+
+
+class ReferenceRegistry:
+    """
+    Reads reference lookups on first access, and keeps them for the
+    process. See the module docstring.
+    """
+
+    def __init__(self, cache_folder: PathLike = None):
+        """
+        cache_folder: PathLike - folder to cache lookups in, not cached if None
+        """
+        self.cache_folder = cache_folder
+        self._references = dict()
+        self._loaded = dict()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._references
+
+    def __getitem__(self, name: str) -> pd.DataFrame:
+        return self.get(name)
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._references)
+
+    def register(self,
+                 name: str,
+                 path: PathLike,
+                 reader: Callable[..., pd.DataFrame] = pd.read_csv,
+                 **read_kwargs,
+                 ) -> None:
+        """
+        Registers a lookup, without reading it.
+
+        name: str - name to get the lookup by
+        path: PathLike - path to read the lookup from
+        reader: Callable - function to read the lookup with, pd.read_csv by default
+        read_kwargs: any other arguments for reader
+        """
+        self._references[name] = Reference(path, reader, read_kwargs)
+        self._loaded.pop(name, None)
+
+    def get(self, name: str) -> pd.DataFrame:
+        """
+        Returns the lookup registered as name, reading it if it hasn't been.
+
+        The same dataframe is returned to every caller, so it shouldn't be
+        changed in place.
+        """
+        if name not in self._loaded:
+            if name not in self._references:
+                raise KeyError(
+                    "No reference lookup called '%s', lookups are: %s"
+                    % (name, self.names)
+                )
+            self._loaded[name] = self._load(name)
+        return self._loaded[name]
+
+    def is_loaded(self, name: str) -> bool:
+        """
+        Whether the lookup registered as name has been read by this process.
+        """
+        return name in self._loaded
+
+    def clear(self) -> None:
+        """
+        Forgets the lookups read so far, so they're read again when next got.
+        """
+        self._loaded.clear()
+
+    def preserialise(self,
+                     names: List[str] = None,
+                     cache_folder: PathLike = None,
+                     ) -> None:
+        """
+        Reads lookups from their sources and writes them to the cache.
+
+        names: List[str] - lookups to cache, all registered lookups if None
+        cache_folder: PathLike - sets the folder to cache lookups in first
+        """
+        if cache_folder is not None:
+            self.cache_folder = cache_folder
+        if self.cache_folder is None:
+            raise ValueError("No cache_folder to preserialise lookups to")
+
+        names = self.names if names is None else names
+        for name in names:
+            self._loaded.pop(name, None)
+            self.get(name)
+
+    def _cache_path(self, name: str) -> str:
+        return os.path.join(self.cache_folder, name + CACHE_SUFFIX)
+
+    def _load(self, name: str) -> pd.DataFrame:
+        """
+        Loads a lookup from the cache if it is up to date, otherwise from
+        its source, caching it if there is a cache_folder.
+        """
+        reference = self._references[name]
+        stamp = _source_stamp(reference)
+
+        if self.cache_folder is not None and os.path.exists(self._cache_path(name)):
+            with open(self._cache_path(name), 'rb') as f:
+                cached = pickle.load(f)
+            if file_cache.use_cached(self._cache_path(name), cached['stamp'], stamp, reference.path):
+                return cached['data']
+
+        data = reference.reader(reference.path, **reference.read_kwargs)
+
+        if self.cache_folder is not None and stamp is not None:
+            def write(tmp_path):
+                with open(tmp_path, 'wb') as f:
+                    pickle.dump({'stamp': stamp, 'data': data}, f,
+                                protocol=pickle.HIGHEST_PROTOCOL)
+            file_cache.write_atomic(self._cache_path(name), write)
+
+        return data
+
+
+def _source_stamp(reference: Reference) -> Tuple:
+    """
+    Identifies the version of a lookup's source, None if it can't be found.
+    """
+    stamp = file_cache.source_stamp(reference.path)
+    if stamp is None:
+        return None
+    kwargs = tuple(sorted((k, repr(v)) for k, v in reference.read_kwargs.items()))
+    reader = getattr(reference.reader, '__qualname__', repr(reference.reader))
+    return (stamp, reader, kwargs)
+
+
+def references_tests() -> None:
+    """
+    Checks lookups are read lazily, once, and cached and refreshed on disk.
+    """
+    import tempfile
+
+    print("Running references.py tests...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'age_index.csv')
+        pd.DataFrame({'age': [1, 2, 3], 'age_desc': ['under 16', '16-74', '75 or over']}
+                     ).to_csv(path, index=False)
+
+        reads = list()
+
+        def reader(p, **kwargs):
+            reads.append(p)
+            return pd.read_csv(p, **kwargs)
+
+        registry = ReferenceRegistry(cache_folder=os.path.join(tmp, 'cache'))
+        registry.register('age', path, reader=reader)
+
+        # Nothing is read until asked for, then only once
+        assert reads == [] and not registry.is_loaded('age')
+        assert registry['age'] is registry.get('age')
+        assert len(reads) == 1
+
+        # A new process loads from the cache
+        registry = ReferenceRegistry(cache_folder=os.path.join(tmp, 'cache'))
+        registry.register('age', path, reader=reader)
+        pd.testing.assert_frame_equal(registry.get('age'), pd.read_csv(path))
+        assert len(reads) == 1
+
+        # Changed sources are re-read
+        pd.DataFrame({'age': [1, 2]}).to_csv(path, index=False)
+        os.utime(path, ns=(0, 0))
+        registry.clear()
+        assert registry.get('age')['age'].tolist() == [1, 2]
+        assert len(reads) == 2
+
+        # Cached lookups are used when their source can't be found
+        registry.register('missing', os.path.join(tmp, 'missing.csv'))
+        os.remove(path)
+        registry.clear()
+        assert registry.get('age')['age'].tolist() == [1, 2]
+
+        for name, error in [('missing', FileNotFoundError), ('unknown', KeyError)]:
+            try:
+                registry.get(name)
+            except error:
+                pass
+            else:
+                raise AssertionError("Got lookup '%s'" % name)
+
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    references_tests()
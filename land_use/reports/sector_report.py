@@ -10,9 +10,24 @@ import os
 import pandas as pd
 import numpy as np
 
+from typing import Dict
 from typing import List
 
 import land_use.utils.file_ops as fo
+from land_use import lu_constants as consts
+from land_use.utils import translate
+from land_use.concurrency import multiprocessing as mp
+
+# Sector correspondence columns of each report
+REPORT_SECTORS = {
+    'ca_report': 'ca_sector_2020_zone_id',
+    'three_sector_report': '3_sector_id',
+    'ie_sector_report': 'ie_id',
+}
+
+# Columns of the consolidated batch report, around the retained columns
+BATCH_ID_COLS = ['folder', 'file', 'report', 'sector_type', 'sector']
+BATCH_VALUE_COLS = ['variable', 'value']
 
 
 class SectorReporter:
@@ -93,17 +108,12 @@ class SectorReporter:
 
         # Index folder
         # TODO: Pull imports and parsing into line with NorMITs standard
-        target_mats = os.listdir(self.target_folder)
-        # Filter down to target file types
-        target_mats = [x for y in self.target_file_types for x in target_mats if y in x]
+        target_mats = self._target_files()
 
         # Subset sectors into ie and 3 sector reports
-        ca_sectors = self.sectors.reindex(
-            ['msoa_zone_id', 'ca_sector_2020_zone_id'], axis=1).drop_duplicates()
-        three_sectors = self.sectors.reindex(
-            ['msoa_zone_id', '3_sector_id'], axis=1).drop_duplicates()
-        ie_sectors = self.sectors.reindex(
-            ['msoa_zone_id', 'ie_id'], axis=1).drop_duplicates()
+        ca_sectors = self._report_sectors('ca_report')
+        three_sectors = self._report_sectors('three_sector_report')
+        ie_sectors = self._report_sectors('ie_sector_report')
 
         # Apply translation
         mat_sector_reports = dict()
@@ -146,6 +156,61 @@ class SectorReporter:
 
         return mat_sector_reports
 
+    def batch_sector_report(self,
+                            ca_report: bool = True,
+                            three_sector_report: bool = False,
+                            ie_sector_report: bool = False,
+                            process_count: int = consts.PROCESS_COUNT,
+                            output_path: str = None,  # PathLike
+                            folder_reports: bool = False,
+                            ) -> pd.DataFrame:
+        """
+        Builds the requested reports for every file, in one pass over each.
+
+        Each file is read once, summed once by zone and retain_cols, and
+        every report is built from those sums. Files are processed
+        in a pool of worker processes.
+
+        ca_report, three_sector_report, ie_sector_report:
+            As sector_report()
+        process_count:
+            Number of worker processes, 0 processes files in this process.
+            See concurrency.multiprocess() for how values are treated.
+        output_path:
+            Path to write the consolidated report to, not written if None.
+            Written with fo.write_df(), so can be a csv, pbz2 or parquet.
+        folder_reports:
+            True: Also write each report of each file to a csv in a
+            sector_reports folder of target_folder
+
+        Returns a long dataframe of every report for every file, with
+        columns BATCH_ID_COLS, the retain_cols and BATCH_VALUE_COLS.
+        """
+        return batch_sector_reports(
+            [self],
+            ca_report=ca_report,
+            three_sector_report=three_sector_report,
+            ie_sector_report=ie_sector_report,
+            process_count=process_count,
+            output_path=output_path,
+            folder_reports=folder_reports,
+        )
+
+    def _target_files(self) -> List[str]:
+        """
+        Lists the files in target_folder of the target file types.
+        """
+        target_mats = os.listdir(self.target_folder)
+        # Filter down to target file types
+        return [x for y in self.target_file_types for x in target_mats if y in x]
+
+    def _report_sectors(self, report: str) -> pd.DataFrame:
+        """
+        Subsets the sector correspondence to the zones and sectors of report.
+        """
+        return self.sectors.reindex(
+            ['msoa_zone_id', REPORT_SECTORS[report]], axis=1).drop_duplicates()
+
     def _vector_sector_report_join_method(self,
                                           long_data: pd.DataFrame,
                                           sector_df: pd.DataFrame,
@@ -162,21 +227,272 @@ class SectorReporter:
         var_col: str - name of variable to sum on
         """
 
-        long_data = long_data.merge(sector_df,
-                                    how='left',
-                                    on=self.zone_id)
-
-        present_retain_cols = [x for x in self.retain_cols if x in list(long_data)]
-
-        # Build reindex and group cols
-        group_cols = [sector_heading]
-        [group_cols.append(x) for x in present_retain_cols]
-        ri_cols = group_cols.copy()
-        ri_cols.append(var_col)
-
-        # Apply reindex and group cols
-        long_data = long_data.reindex(ri_cols, axis=1)
-        long_data = long_data.groupby(group_cols).sum().reset_index()
-        long_data = long_data.sort_values(group_cols).reset_index(drop=True)
+        # Sectors are an unweighted zone translation
+        return translate.vector_join_translation(
+            long_data,
+            sector_df,
+            retain_cols=self.retain_cols,
+            join_id=self.zone_id,
+            zone_id=sector_heading,
+            var_col=var_col,
+            verbose=False,
+        )
+
+
+def _file_sector_reports(path: str,  # PathLike
+                         zone_id: str,
+                         retain_cols: List[str],
+                         report_sectors: Dict[str, pd.DataFrame],
+                         ) -> Dict[str, pd.DataFrame]:
+    """
+    Reads the file at path once, and builds every report in report_sectors.
 
-        return long_data
+    The file is summed by zone and the retain_cols present once, into
+    translate.ZoneSegments, and each report translates that to its sectors.
+    The last column of the file is reported, as sector_report() does.
+    """
+    mat = fo.read_df(path)
+    var_col = list(mat)[-1]
+
+    sector_cols = [list(x)[-1] for x in report_sectors.values()]
+    if any(x in sector_cols and x not in list(mat) for x in retain_cols):
+        # Retaining sector columns needs the join, as sector_report()
+        return {k: translate.vector_join_translation(
+            mat, v, retain_cols=retain_cols, join_id=zone_id,
+            zone_id=list(v)[-1], var_col=var_col, verbose=False)
+            for k, v in report_sectors.items()}
+
+    group_cols = [x for x in retain_cols if x in list(mat) and x not in sector_cols]
+    segments = translate.ZoneSegments(mat, zone_id, var_col, group_cols)
+    del mat
+
+    reports = dict()
+    for report, sectors in report_sectors.items():
+        sector_id = list(sectors)[-1]
+        translation = translate.compile_translation(sectors, zone_id, sector_id)
+        reports[report] = translation.translate_segments(segments)
+    return reports
+
+
+def _consolidate(reports: Dict[str, pd.DataFrame],
+                 folder: str,
+                 file: str,
+                 retain_cols: List[str],
+                 ) -> pd.DataFrame:
+    """
+    Stacks the reports of one file into the long batch report format.
+    """
+    frames = list()
+    for report, df in reports.items():
+        sector_type, var_col = list(df)[0], list(df)[-1]
+        df = df.rename(columns={sector_type: 'sector', var_col: 'value'})
+        df.insert(0, 'folder', folder)
+        df.insert(1, 'file', file)
+        df.insert(2, 'report', report)
+        df.insert(3, 'sector_type', sector_type)
+        df['variable'] = var_col
+        frames.append(df)
+    cols = BATCH_ID_COLS + list(retain_cols) + BATCH_VALUE_COLS
+    return pd.concat(frames, ignore_index=True).reindex(cols, axis=1)
+
+
+def _write_folder_reports(reports: Dict[str, pd.DataFrame],
+                          folder: str,
+                          file: str,
+                          ) -> None:
+    """
+    Writes each report of one file to <folder>/sector_reports, named
+    <file>_<report>.csv.
+    """
+    out_folder = os.path.join(folder, 'sector_reports')
+    if not os.path.exists(out_folder):
+        fo.create_folder(out_folder)
+
+    for report, df in reports.items():
+        rep_out = file + '_' + report + '.csv'
+        print('exporting %s' % rep_out)
+        df.to_csv(os.path.join(out_folder, rep_out), index=False)
+
+
+def batch_sector_reports(reporters: List[SectorReporter],
+                         ca_report: bool = True,
+                         three_sector_report: bool = False,
+                         ie_sector_report: bool = False,
+                         process_count: int = consts.PROCESS_COUNT,
+                         output_path: str = None,  # PathLike
+                         folder_reports: bool = False,
+                         ) -> pd.DataFrame:
+    """
+    Builds sector reports for the files of many SectorReporters at once.
+
+    Every file of every reporter is processed in the same pool, see
+    SectorReporter.batch_sector_report(). The reporters should have the
+    same zone system and retain_cols, as one consolidated report is made.
+
+    Parameters
+    ----------
+    reporters:
+        The SectorReporters to build reports for the target files of.
+
+    ca_report, three_sector_report, ie_sector_report:
+        Which reports to build, as SectorReporter.sector_report().
+
+    process_count:
+        Number of worker processes, 0 processes files in this process.
+
+    output_path:
+        Path to write the consolidated report to with fo.write_df(). Not
+        written if None.
+
+    folder_reports:
+        Whether to also write each report of each file to its own csv, in
+        a sector_reports folder of the reporter's target_folder.
+
+    Returns
+    -------
+    batch_report:
+        A long dataframe of every report for every file, with columns
+        BATCH_ID_COLS, the retain_cols of the reporters, and
+        BATCH_VALUE_COLS. 'folder' and 'file' give the file each report
+        row was built from.
+    """
+    requested = {
+        'ca_report': ca_report,
+        'three_sector_report': three_sector_report,
+        'ie_sector_report': ie_sector_report,
+    }
+    retain_cols = list()
+    for reporter in reporters:
+        retain_cols += [x for x in reporter.retain_cols if x not in retain_cols]
+
+    kwarg_list = list()
+    sources = list()
+    for reporter in reporters:
+        report_sectors = {k: reporter._report_sectors(k) for k, v in requested.items() if v}
+        for tm in reporter._target_files():
+            kwarg_list.append({
+                'path': os.path.join(reporter.target_folder, tm),
+                'zone_id': reporter.zone_id,
+                'retain_cols': reporter.retain_cols,
+                'report_sectors': report_sectors,
+            })
+            sources.append((reporter.target_folder, tm.replace('.csv', '')))
+
+    frames = list()
+    results = mp.multiprocess_iter(
+        _file_sector_reports,
+        kwargs=kwarg_list,
+        process_count=process_count,
+        in_order=True,
+    )
+    for (folder, file), reports in zip(sources, results):
+        print('Built sector reports for %s' % os.path.join(folder, file))
+        if folder_reports:
+            _write_folder_reports(reports, folder, file)
+        frames.append(_consolidate(reports, folder, file, retain_cols))
+
+    if len(frames) == 0:
+        batch_report = pd.DataFrame(columns=BATCH_ID_COLS + retain_cols + BATCH_VALUE_COLS)
+    else:
+        batch_report = pd.concat(frames, ignore_index=True)
+
+    if output_path is not None:
+        kwargs = {'index': False} if fo.is_csv(output_path) else dict()
+        fo.write_df(batch_report, output_path, **kwargs)
+        print('Written consolidated sector report to %s' % output_path)
+
+    return batch_report
+
+
+def sector_report_tests(n_zones: int = 60, process_count: int = 2) -> None:
+    """
+    Checks batch_sector_reports() builds the same reports as
+    sector_report() for every file of several folders, both in this
+    process and in a pool of process_count, and that the folder_reports
+    csvs hold the same reports.
+    """
+    import shutil
+    import tempfile
+    from land_use.utils import compress
+
+    print("Running sector_report.py tests...")
+    rng = np.random.default_rng(0)
+    zones = ['E020%05d' % i for i in range(n_zones)]
+    sectors = pd.DataFrame({
+        'msoa_zone_id': zones,
+        'ca_sector_2020_zone_id': np.arange(n_zones) // 7 + 1,
+        '3_sector_id': np.digitize(np.arange(n_zones) / n_zones, [0.35, 0.45]) + 1,
+        'ie_id': np.where(np.arange(n_zones) / n_zones < 0.35, 1, 2),
+    })
+
+    def land_use(n_tts, missing_zones=0):
+        lu = pd.MultiIndex.from_product(
+            [zones[missing_zones:], [1, 2], range(1, n_tts + 1)],
+            names=['msoa_zone_id', 'ca', 'tfn_traveller_type']).to_frame(index=False)
+        lu['people'] = rng.random(len(lu)) * 50
+        # Some zero segments, which the reports still keep
+        lu.loc[rng.random(len(lu)) < 0.1, 'people'] = 0
+        return lu
+
+    requested = {'ca_report': True, 'three_sector_report': True, 'ie_sector_report': True}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sectors_path = os.path.join(tmp_dir, 'msoa_sector_correspondence.csv')
+        sectors.to_csv(sectors_path, index=False)
+
+        reporters = list()
+        for i, files in enumerate([['land_use_2018_pop.csv', 'land_use_2030_pop'],
+                                   ['land_use_2040_pop.csv']]):
+            folder = os.path.join(tmp_dir, 'scenario_%d' % i)
+            os.makedirs(folder)
+            for j, file in enumerate(files):
+                lu = land_use(n_tts=5 + j, missing_zones=i * 3)
+                if fo.is_csv(file):
+                    lu.to_csv(os.path.join(folder, file), index=False)
+                else:
+                    compress.write_out(lu, os.path.join(folder, file))
+            reporters.append(SectorReporter(target_folder=folder,
+                                            retain_cols=['ca'],
+                                            model_schema=tmp_dir,
+                                            model_sectors=sectors_path))
+
+        expected = {r.target_folder: r.sector_report(**requested) for r in reporters}
+
+        for pc in [0, process_count]:
+            for reporter in reporters:
+                shutil.rmtree(os.path.join(reporter.target_folder, 'sector_reports'),
+                              ignore_errors=True)
+            batch = batch_sector_reports(reporters,
+                                         process_count=pc,
+                                         folder_reports=True,
+                                         **requested)
+            assert list(batch) == BATCH_ID_COLS + ['ca'] + BATCH_VALUE_COLS
+            assert len(batch.groupby(['folder', 'file', 'report'])) == 3 * 3
+
+            for folder, file_reports in expected.items():
+                for file, reports in file_reports.items():
+                    for report, df in reports.items():
+                        sector_type, var_col = list(df)[0], list(df)[-1]
+                        df = df.reset_index(drop=True)
+
+                        achieved = batch.loc[(batch['folder'] == folder)
+                                             & (batch['file'] == file)
+                                             & (batch['report'] == report)]
+                        assert (achieved['sector_type'] == sector_type).all()
+                        assert (achieved['variable'] == var_col).all()
+                        achieved = achieved.rename(columns={'sector': sector_type,
+                                                            'value': var_col})
+                        pd.testing.assert_frame_equal(
+                            achieved.reindex(list(df), axis=1).reset_index(drop=True),
+                            df,
+                            check_dtype=False)
+
+                        csv_path = os.path.join(folder, 'sector_reports',
+                                                '%s_%s.csv' % (file, report))
+                        pd.testing.assert_frame_equal(pd.read_csv(csv_path), df,
+                                                      check_dtype=False)
+
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    sector_report_tests()
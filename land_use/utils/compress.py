@@ -8,10 +8,17 @@ For further research!
 import bz2
 import _pickle as cPickle
 import pathlib
+import time
 
 from typing import Any
+from typing import List
+from typing import Tuple
 
 # Third party
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 
 # Local imports
@@ -100,3 +107,185 @@ def read_in(path: lu.PathLike) -> Any:
     """
     path = file_ops.maybe_add_suffix(path, consts.COMPRESSION_SUFFIX)  # add the default file extension to the path
     return cPickle.load(bz2.BZ2File(path, 'rb'))
+
+
+def write_parquet(df: pd.DataFrame,
+                  path: lu.PathLike,
+                  sort_by: List[str] = None,
+                  row_group_size: int = consts.PARQUET_ROW_GROUP_SIZE,
+                  compression: str = consts.PARQUET_COMPRESSION,
+                  overwrite_suffix: bool = True,
+                  ) -> pathlib.Path:
+    """
+    Write the given dataframe to disk at path in the columnar parquet format.
+
+    Unlike write_out(), columns are stored and compressed separately,
+    so they can be read back individually and in parallel. The data is
+    split into row groups, each storing the min/max of every column, which
+    read_parquet() uses to skip row groups that cannot match a filter.
+
+    Parameters
+    ----------
+    df:
+        The dataframe to write to disk.
+
+    path:
+        The path to write out to. If no filetype suffix is provided
+        .parquet is added.
+
+    sort_by:
+        Columns to sort df by before writing. Sorting by the columns that
+        will be filtered on, e.g. 'msoa_zone_id', makes the row group
+        statistics tight, and filters on those columns much faster.
+
+    row_group_size:
+        The maximum number of rows in each row group.
+
+    compression:
+        The compression codec to use for each column.
+
+    overwrite_suffix:
+        Whether to overwrite the filetype suffix of the given path to the
+        default parquet suffix or not.
+
+    Returns
+    -------
+    out_path:
+        The output path that df was written to.
+    """
+    # Init
+    if not isinstance(path, pathlib.Path):
+        path = pathlib.Path(path)
+    path = file_ops.maybe_add_suffix(path, consts.PARQUET_SUFFIX, overwrite_suffix)
+
+    if sort_by is not None:
+        df = df.sort_values(sort_by)
+
+    table = pa.Table.from_pandas(df)
+    pq.write_table(
+        table,
+        path,
+        row_group_size=row_group_size,
+        compression=compression,
+    )
+
+    return path
+
+
+def read_parquet(path: lu.PathLike,
+                 columns: List[str] = None,
+                 filters: List[Tuple[str, str, Any]] = None,
+                 ) -> pd.DataFrame:
+    """
+    Reads the parquet file at path, only reading the requested data.
+
+    Parameters
+    ----------
+    path:
+        The full path to the parquet file to read.
+
+    columns:
+        The columns to read in. Any other columns are never read from disk.
+        If None, all columns are read.
+
+    filters:
+        A list of (column, operator, value) tuples. Only rows matching all
+        of the filters are returned. Row groups whose statistics show they
+        cannot match are skipped without being read.
+        Operators can be any of: '==', '!=', '<', '<=', '>', '>=', 'in',
+        'not in'.
+        e.g. [('msoa_zone_id', 'in', [1, 2, 3]), ('ca', '==', 2)]
+
+    Returns
+    -------
+    df:
+        The read in data.
+    """
+    path = file_ops.maybe_add_suffix(path, consts.PARQUET_SUFFIX)
+    table = pq.read_table(path, columns=columns, filters=filters)
+    return table.to_pandas()
+
+
+def parquet_tests(n_rows: int = 2000000) -> None:
+    """
+    Checks dataframes round trip through parquet and pbz2 unchanged,
+    and prints how long each takes to write and read.
+    """
+    import tempfile
+
+    print("Running parquet tests...")
+    rng = np.random.default_rng(42)
+    df = pd.DataFrame({
+        'msoa_zone_id': np.sort(rng.integers(1, 8481, n_rows)),
+        'tfn_traveller_type': rng.integers(1, 761, n_rows),
+        'ca': rng.integers(1, 3, n_rows),
+        'people': rng.random(n_rows) * 10,
+    })
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = pathlib.Path(tmp_dir)
+        timings = dict()
+
+        start = time.perf_counter()
+        pbz2_path = write_out(df, tmp_dir / 'test')
+        timings['pbz2 write'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pbz2_df = read_in(pbz2_path)
+        timings['pbz2 read'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parquet_path = write_parquet(df, tmp_dir / 'test')
+        timings['parquet write'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parquet_df = read_parquet(parquet_path)
+        timings['parquet read'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        subset_df = read_parquet(
+            parquet_path,
+            columns=['msoa_zone_id', 'people'],
+            filters=[('msoa_zone_id', 'in', [1, 2, 3]), ('people', '>', 5)],
+        )
+        timings['parquet filtered read'] = time.perf_counter() - start
+
+        # Round trips should be exact
+        pd.testing.assert_frame_equal(df, pbz2_df)
+        pd.testing.assert_frame_equal(df, parquet_df)
+
+        expected = df.loc[df['msoa_zone_id'].isin([1, 2, 3]) & (df['people'] > 5), ['msoa_zone_id', 'people']]
+        pd.testing.assert_frame_equal(expected.reset_index(drop=True), subset_df)
+
+        # Non-default indexes survive too
+        indexed_df = df.head(1000).set_index(['msoa_zone_id', 'tfn_traveller_type'])
+        pd.testing.assert_frame_equal(
+            indexed_df,
+            read_parquet(write_parquet(indexed_df, tmp_dir / 'indexed')),
+        )
+
+        # read_df() filters and sets the index the same for csvs and parquet
+        small_df = df.head(1000)
+        small_df.to_csv(tmp_dir / 'small.csv', index=False)
+        write_parquet(small_df, tmp_dir / 'small')
+        expected = small_df.loc[small_df['ca'] == 1, ['tfn_traveller_type', 'people']]
+        expected = expected.set_index('tfn_traveller_type')
+        for suffix in ['.csv', consts.PARQUET_SUFFIX]:
+            read_df = file_ops.read_df(
+                tmp_dir / ('small' + suffix),
+                index_col=0,
+                columns=['tfn_traveller_type', 'people'],
+                filters=[('ca', '==', 1)],
+            )
+            pd.testing.assert_frame_equal(expected, read_df, check_index_type=False)
+
+        for name, value in timings.items():
+            print("%s: %.2fs" % (name, value))
+        print("pbz2 size: %.1fMB" % (pbz2_path.stat().st_size / 1e6))
+        print("parquet size: %.1fMB" % (parquet_path.stat().st_size / 1e6))
+
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    parquet_tests()
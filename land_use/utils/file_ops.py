@@ -12,9 +12,14 @@ A collections of utility functions for file operations
 """
 # builtins
 import os
+import hashlib
 import pathlib
+import functools
 
+from typing import Any
+from typing import Dict
 from typing import List
+from typing import Tuple
 
 # Third Party
 import pandas as pd
@@ -25,6 +30,7 @@ from land_use import lu_constants as consts
 from land_use.concurrency import multiprocessing as mp
 from land_use.utils import compress
 from land_use.utils import general as gu
+from land_use.utils import schema
 
 
 def create_folder(folder, ch_dir=False, verbose=True):
@@ -63,6 +69,38 @@ def cast_to_pathlib_path(path: lu.PathLike) -> pathlib.Path:
     return pathlib.Path(path)
 
 
+@functools.lru_cache(maxsize=None)
+def _hash_file(path: str, size: int, mtime: float) -> str:
+    """
+    Hashes the file at path. size and mtime key the in process cache.
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(2 ** 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def hash_file(path: lu.PathLike) -> str:
+    """
+    Returns the sha256 hash of the contents of the file at path.
+
+    Each file is only hashed once per process, unless it changes.
+
+    Parameters
+    ----------
+    path:
+        The path to the file to hash.
+
+    Returns
+    -------
+    hash:
+        The hex digest of the file contents.
+    """
+    stat = os.stat(path)
+    return _hash_file(str(path), stat.st_size, stat.st_mtime)
+
+
 def file_exists(file_path: lu.PathLike) -> bool:
     """
     Checks if a file exists at the given path.
@@ -219,9 +257,49 @@ def is_index_set(df: pd.DataFrame):
     return False
 
 
+_FILTER_OPS = {
+    '==': lambda col, val: col == val,
+    '=': lambda col, val: col == val,
+    '!=': lambda col, val: col != val,
+    '<': lambda col, val: col < val,
+    '<=': lambda col, val: col <= val,
+    '>': lambda col, val: col > val,
+    '>=': lambda col, val: col >= val,
+    'in': lambda col, val: col.isin(val),
+    'not in': lambda col, val: ~col.isin(val),
+}
+
+
+def _filter_df(df: pd.DataFrame,
+               columns: List[str] = None,
+               filters: List[Tuple[str, str, Any]] = None,
+               ) -> pd.DataFrame:
+    """
+    Applies read_df() style columns and filters to an already read in df
+    """
+    if filters is not None:
+        mask = pd.Series(True, index=df.index)
+        for col, op, val in filters:
+            if op not in _FILTER_OPS:
+                raise ValueError(
+                    "Unknown filter operator '%s'. Expected one of: %s"
+                    % (op, list(_FILTER_OPS.keys()))
+                )
+            mask &= _FILTER_OPS[op](df[col], val)
+        df = df[mask]
+
+    if columns is not None:
+        df = df[columns]
+
+    return df
+
+
 def read_df(path: lu.PathLike,
             index_col: int = None,
             find_similar: bool = False,
+            columns: List[str] = None,
+            filters: List[Tuple[str, str, Any]] = None,
+            dtype_schema: Dict[str, schema.ColumnSchema] = None,
             **kwargs,
             ) -> pd.DataFrame:
     """
@@ -235,12 +313,30 @@ def read_df(path: lu.PathLike,
     index_col:
         Will set this column as the index if reading from a compressed
         file, and the index is not already set.
-        If reading from a csv, this is passed straight to pd.read_csv()
+        If reading from a csv, this is passed straight to pd.read_csv(),
+        unless columns or filters are given. Then this column of the
+        filtered df is set as the index, as for compressed files.
 
     find_similar:
         If True and the given file at path cannot be found, files with the
         same name but different extensions will be looked for and read in
-        instead. Will check for: '.csv', '.pbz2'
+        instead. Will check for: '.csv', '.pbz2', '.parquet'
+
+    columns:
+        The columns to return. If reading from a parquet file, only
+        these columns are read from disk. Otherwise the whole file is read,
+        then the columns selected.
+
+    filters:
+        A list of (column, operator, value) tuples. Only rows matching all
+        the filters are returned. If reading from a parquet file, parts of
+        the file that cannot match are never read from disk.
+        See compress.read_parquet() for the valid operators.
+
+    dtype_schema:
+        If given, the columns in dtype_schema are cast to their smallest
+        dtypes once read, and their values validated. Usually
+        schema.LAND_USE_SCHEMA. See schema.optimise_dtypes().
 
     Returns
     -------
@@ -254,12 +350,15 @@ def read_df(path: lu.PathLike,
             raise FileNotFoundError(
                 "No such file or directory: '%s'" % path
             )
-        alt_types = ['.csv', consts.COMPRESSION_SUFFIX]
+        alt_types = ['.csv', consts.COMPRESSION_SUFFIX, consts.PARQUET_SUFFIX]
         path = find_filename(path, alt_types=alt_types)
 
     # Determine how to read in df
-    if pathlib.Path(path).suffix == consts.COMPRESSION_SUFFIX:
-        df = compress.read_in(path)
+    if pathlib.Path(path).suffix in [consts.COMPRESSION_SUFFIX, consts.PARQUET_SUFFIX]:
+        if pathlib.Path(path).suffix == consts.PARQUET_SUFFIX:
+            df = compress.read_parquet(path, columns=columns, filters=filters)
+        else:
+            df = _filter_df(compress.read_in(path), columns=columns, filters=filters)
 
         # Optionally try and set the index
         if index_col is not None and not is_index_set(df):
@@ -271,17 +370,26 @@ def read_df(path: lu.PathLike,
 
         # Make sure no column name is set - this is how pd.read_csv() works
         df.columns.name = None
-        return df
 
     elif pathlib.Path(path).suffix == '.csv':
-        return pd.read_csv(path, index_col=index_col, **kwargs)
+        if columns is None and filters is None:
+            df = pd.read_csv(path, index_col=index_col, **kwargs)
+        else:
+            df = _filter_df(pd.read_csv(path, **kwargs), columns=columns, filters=filters)
+            if index_col is not None and index_col is not False:
+                df = df.set_index(list(df)[index_col] if isinstance(index_col, int) else index_col)
 
     else:
         raise ValueError(
             "Cannot determine the filetype of the given path. Expected "
-            "either '.csv' or '%s'" % consts.COMPRESSION_SUFFIX
+            "either '.csv', '%s' or '%s'"
+            % (consts.COMPRESSION_SUFFIX, consts.PARQUET_SUFFIX)
         )
 
+    if dtype_schema is not None:
+        df = schema.optimise_dtypes(df, dtype_schema)
+    return df
+
 
 def write_df(df: pd.DataFrame, path: lu.PathLike, **kwargs) -> pd.DataFrame:
     """
@@ -310,13 +418,17 @@ def write_df(df: pd.DataFrame, path: lu.PathLike, **kwargs) -> pd.DataFrame:
     if pathlib.Path(path).suffix == consts.COMPRESSION_SUFFIX:
         compress.write_out(df, path)
 
+    elif pathlib.Path(path).suffix == consts.PARQUET_SUFFIX:
+        compress.write_parquet(df, path, **kwargs)
+
     elif pathlib.Path(path).suffix == '.csv':
         df.to_csv(path, **kwargs)
 
     else:
         raise ValueError(
             "Cannot determine the filetype of the given path. Expected "
-            "either '.csv' or '%s'" % consts.COMPRESSION_SUFFIX
+            "either '.csv', '%s' or '%s'"
+            % (consts.COMPRESSION_SUFFIX, consts.PARQUET_SUFFIX)
         )
 
 
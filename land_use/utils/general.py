@@ -1301,7 +1301,7 @@ def get_land_use(
 
 
 def infill_traveller_types(land_use_build: pd.DataFrame,
-                           traveller_type_lookup=consts.TT_INDEX,
+                           traveller_type_lookup=None,
                            attribute_subset=None,
                            left_tt_col='traveller_type',
                            right_tt_col='traveller_type'):
@@ -1317,7 +1317,8 @@ def infill_traveller_types(land_use_build: pd.DataFrame,
         DataFrame containing a NTEM style 88 integer normalised traveller
         type vector
     traveller_type_lookup:
-        vector containing normalised constituent values of traveller type
+        vector containing normalised constituent values of traveller type,
+        TT_INDEX if None
     attribute_subset:
         List or None, which attributes do you want to retain in the lookup
     left_tt_col:
@@ -1333,6 +1334,9 @@ def infill_traveller_types(land_use_build: pd.DataFrame,
         list of Dataframes with descriptions of normalised values
     """
 
+    if traveller_type_lookup is None:
+        traveller_type_lookup = consts.TT_INDEX
+
     # Check traveller type column in both sides
     if left_tt_col not in list(land_use_build):
         print(list(land_use_build))
@@ -1400,7 +1404,7 @@ def normalise_attribute(attribute: pd.DataFrame,
 
 
 def lu_out_report(pop: pd.DataFrame,
-                  pop_var: str,
+                  pop_var: Union[str, List[str]],
                   group_vars: List = None,
                   regions=True):
     """
@@ -1413,7 +1417,8 @@ def lu_out_report(pop: pd.DataFrame,
         Future year population vector
     regions
     group_vars
-    pop_var
+    pop_var:
+        Population column to sum, or a list of them to sum together
     pop
 
     Returns
@@ -1423,20 +1428,20 @@ def lu_out_report(pop: pd.DataFrame,
     """
     # Add region summary
     if regions:
-        msoa_regions = pd.read_csv(consts.MSOA_REGION)
+        msoa_regions = consts.REFERENCES.get('msoa_region')
         pop = pop.merge(msoa_regions,
                               how='left',
                               on='msoa_zone_id')
 
+    pop_vars = [pop_var] if isinstance(pop_var, str) else list(pop_var)
+
     report_cols = list(pop)
     report_cols.remove('msoa_zone_id')
     if group_vars is not None:
-        report_cols = group_vars
-        # Append pop var, just to drop
-        report_cols.append(pop_var)
+        # Append pop vars, just to drop
+        report_cols = list(group_vars) + pop_vars
 
-    group_cols = report_cols.copy()
-    group_cols.remove(pop_var)
+    group_cols = [x for x in report_cols if x not in pop_vars]
 
     report = pop.reindex(report_cols, axis=1).groupby(group_cols).sum().reset_index()
 
@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+"""
+File purpose:
+Native numpy n-dimensional iterative proportional fitting (IPF).
+
+Replaces the repeated pandas groupby/merge passes of
+caf.toolkit.iterative_proportional_fitting.ipf_dataframe() with
+array operations over a dense seed indexed by integer-coded segments.
+ipf_dataframe() in this module is a drop in replacement for the caf.toolkit
+function of the same name.
+"""
+# Builtins
+import time
+import warnings
+
+from typing import List
+from typing import Tuple
+from typing import Sequence
+
+# Third party
+import numpy as np
+import pandas as pd
+
+
+def _rmse(targets: List[np.ndarray], achieved: List[np.ndarray]) -> float:
+    """
+    Root mean squared error across every cell of every marginal
+    """
+    squared_diffs = [((t - a) ** 2).ravel() for t, a in zip(targets, achieved)]
+    return float(np.mean(np.concatenate(squared_diffs)) ** 0.5)
+
+
+def ipf_ndarray(seed_mat: np.ndarray,
+                target_marginals: List[np.ndarray],
+                target_dimensions: List[Sequence[int]],
+                max_iterations: int = 5000,
+                tol: float = 1e-9,
+                min_tol_rate: float = 1e-9,
+                ) -> Tuple[np.ndarray, int, List[float]]:
+    """
+    Adjusts seed_mat towards each of target_marginals using IPF.
+
+    Parameters
+    ----------
+    seed_mat:
+        A dense n-dimensional array of starting values. Each axis is one
+        integer-coded segment, e.g. axis 0 might be zone and axis 1 age.
+
+    target_marginals:
+        A list of arrays. Each array is the target totals of seed_mat when
+        summed down to the axes given in the corresponding
+        target_dimensions. The axes of each marginal must be in the same
+        order as they are listed in target_dimensions.
+
+    target_dimensions:
+        A list of lists of seed_mat axes. One per target_marginal, giving
+        the axes of seed_mat that the marginal is indexed by.
+
+    max_iterations:
+        The maximum number of full passes over all the marginals before
+        giving up.
+
+    tol:
+        The root mean squared error, across all target marginals, at which
+        the fit is considered to have converged.
+
+    min_tol_rate:
+        If the convergence improves by less than this between two
+        iterations, the fit is considered to have stalled and is exited.
+
+    Returns
+    -------
+    fit_mat:
+        seed_mat, adjusted towards target_marginals.
+
+    iter_num:
+        The number of iterations completed.
+
+    convergence:
+        The convergence (RMSE) achieved after each iteration. The last value
+        is the final convergence of fit_mat.
+    """
+    # Validate inputs
+    if len(target_marginals) != len(target_dimensions):
+        raise ValueError(
+            "target_marginals and target_dimensions must be the same length. "
+            "Got %d marginals and %d sets of dimensions."
+            % (len(target_marginals), len(target_dimensions))
+        )
+
+    if np.any(seed_mat < 0):
+        raise ValueError("seed_mat cannot contain negative values.")
+
+    # Reshape the targets so they broadcast directly against fit_mat
+    n_dims = seed_mat.ndim
+    targets = list()
+    bcast_targets = list()
+    sum_axes = list()
+    for marginal, dims in zip(target_marginals, target_dimensions):
+        dims = list(dims)
+        marginal = np.asarray(marginal, dtype=float)
+        if len(set(dims)) != len(dims) or not all(0 <= d < n_dims for d in dims):
+            raise ValueError(
+                "Invalid target dimensions %s for a seed_mat with %d "
+                "dimensions." % (dims, n_dims)
+            )
+
+        expected_shape = tuple(seed_mat.shape[d] for d in dims)
+        if marginal.shape != expected_shape:
+            raise ValueError(
+                "Target marginal for dimensions %s has shape %s, but "
+                "seed_mat expects %s."
+                % (dims, marginal.shape, expected_shape)
+            )
+
+        # Put the marginal axes into seed_mat order
+        marginal = np.transpose(marginal, np.argsort(dims))
+        dims = sorted(dims)
+        bcast_shape = [seed_mat.shape[d] if d in dims else 1 for d in range(n_dims)]
+
+        targets.append(marginal)
+        bcast_targets.append(marginal.reshape(bcast_shape))
+        sum_axes.append(tuple(d for d in range(n_dims) if d not in dims))
+
+    # Run the IPF
+    fit_mat = seed_mat.astype(float, copy=True)
+    convergence = list()
+    iter_num = 0
+
+    if all(x.sum() == 0 for x in targets):
+        warnings.warn("Given target_marginals of 0. Returning all 0's")
+        return np.zeros(seed_mat.shape), iter_num, [np.inf]
+
+    early_exit = False
+    for iter_num in range(1, max_iterations + 1):
+        for target, axes in zip(bcast_targets, sum_axes):
+            achieved = fit_mat.sum(axis=axes, keepdims=True)
+            factors = np.divide(
+                target,
+                achieved,
+                out=np.ones_like(achieved),
+                where=achieved != 0,
+            )
+            fit_mat *= factors
+
+        achieved = [fit_mat.sum(axis=axes) for axes in sum_axes]
+        convergence.append(_rmse(targets, achieved))
+
+        if np.isnan(convergence[-1]):
+            raise ValueError("Convergence became NaN during IPF.")
+
+        if convergence[-1] < tol:
+            early_exit = True
+            break
+
+        if iter_num > 2 and abs(convergence[-2] - convergence[-1]) < min_tol_rate:
+            early_exit = True
+            break
+
+    if not early_exit:
+        warnings.warn(
+            "IPF exited after %d iterations without reaching the set "
+            "tolerance. Final convergence: %s" % (iter_num, convergence[-1])
+        )
+
+    return fit_mat, iter_num, convergence
+
+
+def ipf_dataframe(seed_df: pd.DataFrame,
+                  target_marginals: List[pd.Series],
+                  value_col: str,
+                  max_iterations: int = 5000,
+                  tol: float = 1e-9,
+                  min_tol_rate: float = 1e-9,
+                  ) -> Tuple[pd.DataFrame, int, List[float]]:
+    """
+    Adjusts the value_col of seed_df towards target_marginals using IPF.
+
+    seed_df is converted into a dense array before calling ipf_ndarray().
+    Every column used by a marginal becomes an axis of the array. Any
+    remaining segment columns are collapsed into a single trailing axis of
+    the combinations present in seed_df, keeping the dense array small.
+
+    Parameters
+    ----------
+    seed_df:
+        Long format seed values. Every column other than value_col is
+        treated as a segment column.
+
+    target_marginals:
+        A list of pd.Series of target values. The index names of each
+        Series must be columns of seed_df.
+        e.g. seed_df.groupby(['z', 'a', 'g'])['people'].sum()
+
+    value_col:
+        The column of seed_df containing the values to fit.
+
+    max_iterations:
+        See ipf_ndarray().
+
+    tol:
+        See ipf_ndarray().
+
+    min_tol_rate:
+        See ipf_ndarray().
+
+    Returns
+    -------
+    fit_df:
+        seed_df with value_col adjusted towards target_marginals.
+
+    iter_num:
+        See ipf_ndarray().
+
+    convergence:
+        See ipf_ndarray().
+    """
+    # Init
+    seg_cols = [x for x in list(seed_df) if x != value_col]
+    marginal_cols = list()
+    for marginal in target_marginals:
+        for name in marginal.index.names:
+            if name not in seg_cols:
+                raise ValueError(
+                    "Target marginal is indexed by '%s', which is not a "
+                    "segment column of seed_df." % name
+                )
+            if name not in marginal_cols:
+                marginal_cols.append(name)
+    other_cols = [x for x in seg_cols if x not in marginal_cols]
+
+    # Integer code the segments
+    codes = list()
+    uniques = list()
+    for col in marginal_cols:
+        col_codes, col_uniques = pd.factorize(seed_df[col], sort=True)
+        codes.append(col_codes)
+        uniques.append(pd.Index(col_uniques))
+
+    if len(other_cols) > 0:
+        other_codes = seed_df.groupby(other_cols, sort=False).ngroup().values
+        codes.append(other_codes)
+        uniques.append(pd.RangeIndex(other_codes.max() + 1))
+
+    # Build the dense seed
+    shape = tuple(len(x) for x in uniques)
+    flat_idx = np.ravel_multi_index(tuple(codes), shape)
+    seed_vals = seed_df[value_col].values.astype(float)
+    seed_mat = np.bincount(
+        flat_idx,
+        weights=seed_vals,
+        minlength=int(np.prod(shape)),
+    ).reshape(shape)
+
+    # Build the dense marginals
+    target_arrays = list()
+    target_dimensions = list()
+    for marginal in target_marginals:
+        dims = [marginal_cols.index(x) for x in marginal.index.names]
+        dim_shape = tuple(shape[d] for d in dims)
+
+        if marginal.index.nlevels == 1:
+            levels = [marginal.index]
+        else:
+            levels = [marginal.index.get_level_values(i) for i in range(marginal.index.nlevels)]
+
+        marg_codes = [uniques[d].get_indexer(lvl) for d, lvl in zip(dims, levels)]
+        mask = np.all([c != -1 for c in marg_codes], axis=0)
+        if not mask.all():
+            warnings.warn(
+                "%d cells of the target marginal for %s do not exist in "
+                "seed_df and will be ignored."
+                % ((~mask).sum(), list(marginal.index.names))
+            )
+
+        marg_idx = np.ravel_multi_index(tuple(c[mask] for c in marg_codes), dim_shape)
+        target_arrays.append(np.bincount(
+            marg_idx,
+            weights=marginal.values[mask].astype(float),
+            minlength=int(np.prod(dim_shape)),
+        ).reshape(dim_shape))
+        target_dimensions.append(dims)
+
+    fit_mat, iter_num, convergence = ipf_ndarray(
+        seed_mat=seed_mat,
+        target_marginals=target_arrays,
+        target_dimensions=target_dimensions,
+        max_iterations=max_iterations,
+        tol=tol,
+        min_tol_rate=min_tol_rate,
+    )
+
+    # Map back onto the seed rows. Duplicate rows keep their seed share
+    cell_seed = seed_mat.ravel()[flat_idx]
+    row_share = np.divide(
+        seed_vals,
+        cell_seed,
+        out=np.zeros_like(seed_vals),
+        where=cell_seed != 0,
+    )
+    fit_df = seed_df.copy()
+    fit_df[value_col] = fit_mat.ravel()[flat_idx] * row_share
+
+    return fit_df, iter_num, convergence
+
+
+def _build_test_inputs(n_zones: int = 20,
+                       seed: int = 42,
+                       ) -> Tuple[pd.DataFrame, List[pd.Series]]:
+    """
+    Builds a synthetic district shaped like a 3.2.7 furness input.
+    """
+    rng = np.random.default_rng(seed)
+    segs = {
+        'z': np.arange(1, n_zones + 1),
+        'a': [1, 2, 3],
+        'g': [1, 2, 3],
+        'h': [1, 2, 3, 4, 5],
+        'e': [1, 2, 3, 4, 5],
+        't': [1, 2, 3, 4],
+        's': [1, 2, 3, 4],
+    }
+    seed_df = pd.MultiIndex.from_product(
+        list(segs.values()),
+        names=list(segs.keys()),
+    ).to_frame(index=False)
+    seed_df['LA'] = 1
+    seed_df['e+'] = np.where(seed_df['e'] < 3, seed_df['e'], 5)
+    seed_df['people'] = rng.random(len(seed_df)) * (rng.random(len(seed_df)) > 0.3)
+
+    # Targets are a consistent perturbation of the seed
+    target_df = seed_df.copy()
+    target_df['people'] *= rng.uniform(0.8, 1.2, len(target_df))
+    target_df['people'] *= seed_df['people'].sum() / target_df['people'].sum()
+
+    marginal_dims = [
+        ['z', 'a', 'g'],
+        ['z', 'h'],
+        ['z', 't'],
+        ['LA', 's'],
+        ['LA', 'a', 'g', 'e+'],
+    ]
+    marginals = [target_df.groupby(x)['people'].sum() for x in marginal_dims]
+
+    return seed_df, marginals
+
+
+def ipf_tests(n_zones: int = 20) -> None:
+    """
+    Checks ipf_dataframe() against the caf.toolkit implementation.
+
+    Runs both on the same synthetic district, asserts the results match at
+    the 3.2.7 tolerance and prints the time each took.
+    """
+    from caf.toolkit import iterative_proportional_fitting as caf_ipfn
+
+    print("Running ipfn.py tests...")
+    seed_df, marginals = _build_test_inputs(n_zones)
+    kwargs = {'max_iterations': 5000, 'tol': 1e-9, 'min_tol_rate': 1e-9}
+
+    start = time.perf_counter()
+    caf_df, caf_iters, caf_conv = caf_ipfn.ipf_dataframe(
+        seed_df=seed_df,
+        target_marginals=marginals,
+        value_col='people',
+        show_pbar=False,
+        **kwargs,
+    )
+    caf_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    np_df, np_iters, np_conv = ipf_dataframe(
+        seed_df=seed_df,
+        target_marginals=marginals,
+        value_col='people',
+        **kwargs,
+    )
+    np_time = time.perf_counter() - start
+
+    # Compare on the seed rows
+    seg_cols = [x for x in list(seed_df) if x != 'people']
+    compare = pd.merge(
+        np_df,
+        caf_df,
+        how='left',
+        on=seg_cols,
+        suffixes=('_np', '_caf'),
+    ).fillna(0)
+    assert np.allclose(compare['people_np'], compare['people_caf'], atol=1e-6)
+    for marginal in marginals:
+        achieved = np_df.groupby(marginal.index.names)['people'].sum()
+        assert np.allclose(achieved.reindex(marginal.index).fillna(0), marginal, atol=1e-6)
+
+    print("caf.toolkit: %d iterations, convergence %s, %.3fs"
+          % (caf_iters, caf_conv, caf_time))
+    print("numpy:       %d iterations, convergence %s, %.3fs"
+          % (np_iters, np_conv[-1], np_time))
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    ipf_tests()
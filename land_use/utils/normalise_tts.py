@@ -8,18 +8,21 @@ _standard_group_cols = ['msoa_zone_id', 'area_type', 'tfn_traveller_type']
 
 
 def normalised_to_expanded(land_use_data: pd.DataFrame,
-                           norm_index: pd.DataFrame = consts.TFN_TT_INDEX,
+                           norm_index: pd.DataFrame = None,
                            drop_tt=True,
                            verbose=True) -> pd.DataFrame:
 
     """
     land_use_data: Dataframe of land use data, non-normalised
-    norm_index: Path to a dataframe of normalisation params
+    norm_index: Path to a dataframe of normalisation params, TFN_TT_INDEX if None
     drop_tt: remove traveller_type column
     verbose: echo or no
 
     returns: expanded df
     """
+    if norm_index is None:
+        norm_index = consts.TFN_TT_INDEX
+
     # Get var name
     var_name = list(land_use_data)[-1]
 
@@ -45,16 +48,18 @@ def normalised_to_expanded(land_use_data: pd.DataFrame,
 
 
 def expanded_to_normalised(land_use_data: pd.DataFrame,
-                           norm_index: pd.DataFrame = consts.TFN_TT_INDEX,
+                           norm_index: pd.DataFrame = None,
                            var_col='people',
                            verbose=True) -> pd.DataFrame:
     """
     land_use_data: Dataframe of land use data, non-normalised
-    norm_index: Path to a dataframe of normalisation params
+    norm_index: Path to a dataframe of normalisation params, TFN_TT_INDEX if None
     verbose: echo or no
 
     returns: normalised df
     """
+    if norm_index is None:
+        norm_index = consts.TFN_TT_INDEX
 
     total_before = land_use_data[var_col].sum()
 
@@ -90,7 +95,7 @@ def expanded_to_normalised(land_use_data: pd.DataFrame,
 
 
 def infill_ntem_tt(land_use_build: pd.DataFrame,
-                   traveller_type_lookup=consts.TT_INDEX,
+                   traveller_type_lookup=None,
                    attribute_subset=None,
                    left_tt_col='ntem_traveller_type',
                    right_tt_col='ntem_traveller_type'):
@@ -105,7 +110,8 @@ def infill_ntem_tt(land_use_build: pd.DataFrame,
         DataFrame containing a NTEM style 88 integer normalised traveller
         type vector
     traveller_type_lookup:
-        vector containing normalised constituent values of traveller type
+        vector containing normalised constituent values of traveller type,
+        TT_INDEX if None
     attribute_subset:
         List or None, which attributes do you want to retain in the lookup
     left_tt_col:
@@ -121,6 +127,9 @@ def infill_ntem_tt(land_use_build: pd.DataFrame,
         list of Dataframes with descriptions of normalised values
     """
 
+    if traveller_type_lookup is None:
+        traveller_type_lookup = consts.TT_INDEX
+
     # Check traveller type column in both sides
     if left_tt_col not in list(land_use_build):
         raise ValueError('Traveller type not in land use')
@@ -0,0 +1,542 @@
+# -*- coding: utf-8 -*-
+"""
+File purpose:
+Cached extraction and interpolation of NTEM CTripEnd population.
+
+Each NTEM Access database is read through ODBC once, and its ZoneData
+population stored as a local parquet file keyed by the hash of the database.
+A database is only hashed again when its size or modification time change.
+Every year between the available NTEM years is then interpolated in a single
+vectorised pass and cached too, so a run for any year only reads the rows it
+needs. Once the caches exist, no Access driver is needed.
+"""
+# Builtins
+import os
+import re
+import glob
+import json
+import hashlib
+import pathlib
+
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import Callable
+
+# Third party
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Local imports
+import land_use as lu
+from land_use import file_cache
+from land_use import lu_constants as consts
+from land_use.utils import compress
+from land_use.utils import file_ops
+
+# Columns of ZoneData that are not population by traveller type
+ZONE_DATA_ID_COLS = ['I', 'R', 'B', 'Borough', 'ZoneID', 'ZoneName']
+ZONE_DATA_DROP_COLS = (
+    ['E%02d' % x for x in range(1, 16)]
+    + ['K%02d' % x for x in range(1, 16)]
+)
+
+NTEM_DATABASE_NAME = 'CTripEnd7_%d.accdb'
+NTEM_POP_COLS = ['ZoneID', 'AreaType', 'Borough', 'TravellerType', 'Population']
+
+
+def ntem_interpolation_years(year: int) -> Tuple[int, int]:
+    """
+    Returns the lower and upper NTEM years to interpolate year between.
+
+    NTEM is run in 5-year increments with a base of 2011.
+    """
+    interpolation_years = year % 5
+    lower_year = year - ((interpolation_years - 1) % 5)
+    upper_year = year + ((1 - interpolation_years) % 5)
+    return lower_year, upper_year
+
+
+def read_access_zone_data(database_path: lu.PathLike) -> pd.DataFrame:
+    """
+    Reads the ZoneData table of an NTEM Access database through ODBC.
+
+    Requires pyodbc and the Microsoft Access driver.
+    """
+    import pyodbc
+
+    cnxn = pyodbc.connect('DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};DBQ=' +
+                          '{};'.format(database_path))
+    try:
+        zone_data = pd.read_sql(r"SELECT * FROM ZoneData", cnxn)
+    finally:
+        cnxn.close()
+    return zone_data
+
+
+def zone_data_to_long(zone_data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts a ZoneData table into long population by traveller type.
+
+    Returns a dataframe of NTEM_POP_COLS. ZoneID is the NTEM zone id, 'I' in
+    ZoneData.
+    """
+    zone_pop = zone_data.drop(columns=ZONE_DATA_DROP_COLS, errors='ignore')
+    zone_pop = zone_pop.drop(columns=['Borough', 'ZoneID', 'ZoneName'])
+    zone_pop = zone_pop.rename(columns={'I': 'ZoneID', 'R': 'AreaType', 'B': 'Borough'})
+    zone_pop = pd.melt(
+        zone_pop,
+        id_vars=['ZoneID', 'AreaType', 'Borough'],
+        var_name='TravellerType',
+        value_name='Population',
+    )
+    return zone_pop[NTEM_POP_COLS]
+
+
+def extract_ntem_database(database_path: lu.PathLike,
+                          cache_dir: lu.PathLike,
+                          reader: Callable[[lu.PathLike], pd.DataFrame] = read_access_zone_data,
+                          ) -> pd.DataFrame:
+    """
+    Returns the long population of an NTEM database, extracting it if needed.
+
+    The first time a database is seen its population is written to
+    cache_dir, named by the hash of the database. Later calls read that
+    instead of going through ODBC. See database_hash().
+
+    Parameters
+    ----------
+    database_path:
+        Path to the NTEM Access database.
+
+    cache_dir:
+        Directory to keep the extracted population in.
+
+    reader:
+        Function to read the ZoneData table from database_path. Only called
+        when the database has not been cached.
+
+    Returns
+    -------
+    zone_pop:
+        A dataframe of NTEM_POP_COLS.
+    """
+    database_path = file_ops.cast_to_pathlib_path(database_path)
+    cache_dir = file_ops.cast_to_pathlib_path(cache_dir)
+    cache_path = cache_dir / ('_'.join([database_path.stem, database_hash(database_path, cache_dir)[:16]])
+                              + consts.PARQUET_SUFFIX)
+
+    if cache_path.exists():
+        return compress.read_parquet(cache_path)
+
+    zone_pop = zone_data_to_long(reader(database_path))
+    file_cache.write_atomic(
+        cache_path,
+        lambda tmp_path: compress.write_parquet(zone_pop, tmp_path, overwrite_suffix=False),
+    )
+    return zone_pop
+
+
+def database_hash(database_path: lu.PathLike, cache_dir: lu.PathLike) -> str:
+    """
+    Returns the hash of the contents of an NTEM database.
+
+    Hashing a database means reading all of it, so the hash is kept in
+    cache_dir with the size and modification time of the database. It is
+    only hashed again when those change.
+
+    Parameters
+    ----------
+    database_path:
+        Path to the NTEM Access database.
+
+    cache_dir:
+        Directory to keep the hash in.
+
+    Returns
+    -------
+    hash:
+        The hex digest of the database contents.
+    """
+    database_path = file_ops.cast_to_pathlib_path(database_path)
+    hash_path = file_ops.cast_to_pathlib_path(cache_dir) / (database_path.stem + '_hash.json')
+    stamp = file_cache.source_stamp(database_path)
+
+    try:
+        with open(hash_path, 'r') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        cached = dict()
+    if stamp is not None and cached.get('stamp') == stamp:
+        return cached['hash']
+
+    digest = file_ops.hash_file(database_path)
+
+    def write(tmp_path):
+        with open(tmp_path, 'w') as f:
+            json.dump({'stamp': stamp, 'hash': digest}, f)
+    file_cache.write_atomic(hash_path, write)
+    return digest
+
+
+def find_ntem_databases(ctripend_database_path: lu.PathLike) -> Dict[int, pathlib.Path]:
+    """
+    Returns the NTEM databases in ctripend_database_path, by NTEM year.
+    """
+    databases = dict()
+    pattern = os.path.join(ctripend_database_path, NTEM_DATABASE_NAME.replace('%d', '*'))
+    for path in glob.glob(pattern):
+        match = re.fullmatch(r'CTripEnd7_(\d{4})\.accdb', os.path.basename(path))
+        if match is not None:
+            databases[int(match.group(1))] = pathlib.Path(path)
+    return databases
+
+
+def interpolate_ntem_population(ntem_pop: Dict[int, pd.DataFrame],
+                                years: List[int],
+                                ) -> Tuple[pd.DataFrame, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Interpolates NTEM population for every one of years in one pass.
+
+    Follows the NTEM interpolation used before this engine. For each year
+    the population is linearly interpolated between the NTEM years either
+    side of it. A zone and traveller type is only kept where it exists in
+    both NTEM years with the same area type and borough.
+
+    Parameters
+    ----------
+    ntem_pop:
+        Dictionary of NTEM year to dataframe of NTEM_POP_COLS.
+
+    years:
+        The years to interpolate. The NTEM years either side of every year
+        must be in ntem_pop.
+
+    Returns
+    -------
+    index:
+        A dataframe of ZoneID and TravellerType, one row per row of the
+        returned arrays.
+
+    population:
+        A (zone × traveller type, year) array of interpolated population.
+        Rows that cannot be interpolated for a year are NaN.
+
+    area_type:
+        The area type of each row in each year, matching population.
+
+    borough:
+        The borough of each row in each year, matching population.
+    """
+    # Validate the NTEM years
+    bounds = [ntem_interpolation_years(year) for year in years]
+    missing = sorted({y for pair in bounds for y in pair} - set(ntem_pop.keys()))
+    if len(missing) > 0:
+        raise ValueError(
+            "Cannot interpolate the requested years without NTEM data for "
+            "years: %s" % missing
+        )
+
+    # Align every NTEM year on the same zone and traveller type index
+    ntem_years = sorted(ntem_pop.keys())
+    index = pd.concat(
+        [ntem_pop[y][['ZoneID', 'TravellerType']] for y in ntem_years],
+        ignore_index=True,
+    ).drop_duplicates().sort_values(['ZoneID', 'TravellerType']).reset_index(drop=True)
+    key = pd.MultiIndex.from_frame(index)
+
+    n_rows = len(index)
+    ntem_values = {col: np.full((n_rows, len(ntem_years)), np.nan)
+                   for col in ['Population', 'AreaType', 'Borough']}
+    for i, year in enumerate(ntem_years):
+        df = ntem_pop[year]
+        positions = key.get_indexer(pd.MultiIndex.from_frame(df[['ZoneID', 'TravellerType']]))
+        for col, values in ntem_values.items():
+            values[positions, i] = df[col].values
+
+    # Interpolate every year at once
+    ntem_year_idx = {year: i for i, year in enumerate(ntem_years)}
+    lower_idx = np.array([ntem_year_idx[lower] for lower, _ in bounds])
+    upper_idx = np.array([ntem_year_idx[upper] for _, upper in bounds])
+    growth_years = np.array([year - lower for year, (lower, _) in zip(years, bounds)])
+
+    pop = ntem_values['Population']
+    lower_pop = pop[:, lower_idx]
+    upper_pop = pop[:, upper_idx]
+    population = lower_pop + (upper_pop - lower_pop) / 5 * growth_years
+
+    area_type = ntem_values['AreaType'][:, lower_idx]
+    borough = ntem_values['Borough'][:, lower_idx]
+    matched = (
+        (area_type == ntem_values['AreaType'][:, upper_idx])
+        & (borough == ntem_values['Borough'][:, upper_idx])
+    )
+    population[~matched] = np.nan
+
+    return index, population, area_type, borough
+
+
+def build_ntem_population_cache(ctripend_database_path: lu.PathLike,
+                                cache_dir: lu.PathLike = None,
+                                reader: Callable[[lu.PathLike], pd.DataFrame] = read_access_zone_data,
+                                ) -> pathlib.Path:
+    """
+    Interpolates and caches NTEM population for every year possible.
+
+    Every year between the first and last NTEM database in
+    ctripend_database_path is interpolated. The result is keyed by the
+    hashes of all the databases used, so it is rebuilt if any change.
+
+    Only rows with an interpolated population are written. This is an
+    intentional change from the per-year method this replaced, which also
+    output a row for each zone and traveller type without a match in the
+    lower NTEM year. Those rows had no zone, area type, borough, traveller
+    type or population, so totals are unchanged.
+
+    Parameters
+    ----------
+    ctripend_database_path:
+        The directory containing the NTEM CTripEnd7_{year}.accdb databases.
+
+    cache_dir:
+        Directory to keep the extracted and interpolated population in.
+        Defaults to consts.NTEM_CACHE_FOLDER, a local folder.
+
+    reader:
+        See extract_ntem_database().
+
+    Returns
+    -------
+    cache_path:
+        Path to the cached population of every year. Has columns
+        ['Year'] + NTEM_POP_COLS, with one row group per year.
+    """
+    # Work out which years we can build
+    databases = find_ntem_databases(ctripend_database_path)
+    if len(databases) == 0:
+        raise FileNotFoundError(
+            "Cannot find any NTEM databases in %s" % ctripend_database_path
+        )
+    years = [
+        y for y in range(min(databases), max(databases) + 1)
+        if all(x in databases for x in ntem_interpolation_years(y))
+    ]
+    if len(years) == 0:
+        raise ValueError(
+            "Cannot interpolate any years from the NTEM databases in %s, "
+            "available NTEM years are: %s" % (ctripend_database_path, sorted(databases))
+        )
+
+    if cache_dir is None:
+        cache_dir = consts.NTEM_CACHE_FOLDER
+    cache_dir = file_ops.cast_to_pathlib_path(cache_dir)
+    key = hashlib.sha256(''.join(database_hash(databases[y], cache_dir) for y in sorted(databases)).encode())
+    cache_path = cache_dir / ('_'.join(['ntem_pop', str(years[0]), str(years[-1]), key.hexdigest()[:16]])
+                              + consts.PARQUET_SUFFIX)
+    if cache_path.exists():
+        return cache_path
+
+    ntem_pop = {y: extract_ntem_database(path, cache_dir, reader) for y, path in databases.items()}
+    index, population, area_type, borough = interpolate_ntem_population(ntem_pop, years)
+
+    # Write one row group per year, so single years can be read back cheaply
+    def write(tmp_path):
+        writer = None
+        try:
+            for i, year in enumerate(years):
+                mask = ~np.isnan(population[:, i])
+                year_df = pd.DataFrame({
+                    'Year': np.full(mask.sum(), year),
+                    'ZoneID': index['ZoneID'].values[mask],
+                    'AreaType': area_type[mask, i].astype(int),
+                    'Borough': borough[mask, i].astype(int),
+                    'TravellerType': index['TravellerType'].values[mask],
+                    'Population': population[mask, i],
+                })
+                table = pa.Table.from_pandas(year_df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema, compression=consts.PARQUET_COMPRESSION)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+    file_cache.write_atomic(cache_path, write)
+
+    return cache_path
+
+
+def ntem_pop_for_year(year: int,
+                      ctripend_database_path: lu.PathLike,
+                      cache_dir: lu.PathLike = None,
+                      reader: Callable[[lu.PathLike], pd.DataFrame] = read_access_zone_data,
+                      ) -> pd.DataFrame:
+    """
+    Returns the interpolated NTEM population for year.
+
+    Builds the cache of every year on the first call, see
+    build_ntem_population_cache(). Later calls only read year's rows.
+
+    Returns
+    -------
+    zone_pop:
+        A dataframe of NTEM_POP_COLS.
+    """
+    databases = find_ntem_databases(ctripend_database_path)
+    missing = [y for y in ntem_interpolation_years(year) if y not in databases]
+    if len(databases) > 0 and len(missing) > 0:
+        raise ValueError(
+            "Cannot interpolate NTEM population for %d without NTEM years %s, "
+            "available NTEM years in %s are: %s"
+            % (year, missing, ctripend_database_path, sorted(databases))
+        )
+
+    cache_path = build_ntem_population_cache(ctripend_database_path, cache_dir, reader)
+    zone_pop = compress.read_parquet(
+        cache_path,
+        columns=NTEM_POP_COLS,
+        filters=[('Year', '==', year)],
+    )
+    if len(zone_pop) == 0:
+        raise ValueError(
+            "No NTEM population could be interpolated for %d from the "
+            "databases in %s" % (year, ctripend_database_path)
+        )
+    return zone_pop
+
+
+def _build_test_zone_data(year: int, n_zones: int = 50, n_tts: int = 88) -> pd.DataFrame:
+    """
+    Builds a synthetic ZoneData table for an NTEM year
+    """
+    rng = np.random.default_rng(year)
+    zones = np.arange(1, n_zones + 1)
+    zone_data = pd.DataFrame({
+        'I': zones,
+        'R': (zones % 8) + 1,
+        'B': (zones % 5) + 1,
+        'Borough': ['Borough %d' % x for x in (zones % 5) + 1],
+        'ZoneID': ['E0200%04d' % x for x in zones],
+        'ZoneName': ['Zone %d' % x for x in zones],
+    })
+    # One zone changes area type part way through
+    if year > 2031:
+        zone_data.loc[0, 'R'] = 9
+    pop = pd.DataFrame(
+        rng.random((n_zones, n_tts)) * 100 * (1 + (year - 2011) / 100),
+        columns=[str(tt) for tt in range(1, n_tts + 1)],
+    )
+    dropped = pd.DataFrame(0, index=zone_data.index, columns=ZONE_DATA_DROP_COLS)
+    return pd.concat([zone_data, pop, dropped], axis=1)
+
+
+def _reference_interpolation(lower: pd.DataFrame, upper: pd.DataFrame, year: int) -> pd.DataFrame:
+    """
+    The per-year interpolation this module replaced, for checking against.
+
+    Like it, rows of upper without a match in lower are kept, with every
+    column missing.
+    """
+    lower_year, _ = ntem_interpolation_years(year)
+    lower = zone_data_to_long(lower)
+    upper = zone_data_to_long(upper)
+    keys = ['ZoneID', 'AreaType', 'Borough', 'TravellerType']
+    df = pd.merge(lower, upper, on=keys, how='right', suffixes=('_l', '_u'), indicator=True)
+    df['Population'] = df['Population_l'] + (df['Population_u'] - df['Population_l']) / 5 * (year - lower_year)
+    df.loc[df['_merge'] == 'right_only', keys] = np.nan
+    return df[NTEM_POP_COLS]
+
+
+def ntem_tests() -> None:
+    """
+    Checks the cached, vectorised NTEM interpolation against the per-year
+    method on synthetic databases. No Access driver is needed.
+    """
+    import tempfile
+
+    print("Running ntem.py tests...")
+    ntem_years = list(range(2011, 2062, 5))
+    zone_data = {y: _build_test_zone_data(y) for y in ntem_years}
+    n_reads = list()
+
+    def reader(path):
+        n_reads.append(path)
+        return zone_data[int(pathlib.Path(path).stem.split('_')[-1])]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_dir = pathlib.Path(tmp_dir) / 'databases'
+        cache_dir = pathlib.Path(tmp_dir) / 'cache'
+        db_dir.mkdir()
+        for year in ntem_years:
+            with open(db_dir / (NTEM_DATABASE_NAME % year), 'w') as f:
+                f.write(str(year))
+
+        for year in [2011, 2018, 2021, 2035, 2050, 2061]:
+            lower, upper = ntem_interpolation_years(year)
+            expected = _reference_interpolation(zone_data[lower], zone_data[upper], year)
+            achieved = ntem_pop_for_year(year, db_dir, cache_dir, reader)
+
+            # The only rows left out are the empty ones for unmatched zones
+            empty = expected['Population'].isna()
+            assert expected[empty].isna().all(axis=None)
+            assert empty.any() or year != 2035
+
+            expected = expected[~empty].sort_values(['ZoneID', 'TravellerType']).reset_index(drop=True)
+            achieved = achieved.sort_values(['ZoneID', 'TravellerType']).reset_index(drop=True)
+            pd.testing.assert_frame_equal(expected, achieved, check_dtype=False)
+
+        # Each database should only have been read once
+        assert len(n_reads) == len(ntem_years)
+
+        # Databases are only hashed again once they change
+        hashes = list()
+
+        def counted_hash_file(path):
+            hashes.append(path)
+            return hash_file(path)
+
+        hash_file = file_ops.hash_file
+        file_ops.hash_file = counted_hash_file
+        try:
+            cache_path = build_ntem_population_cache(db_dir, cache_dir, reader)
+            assert len(hashes) == 0
+
+            changed = db_dir / (NTEM_DATABASE_NAME % 2036)
+            with open(changed, 'w') as f:
+                f.write('2036 updated')
+            zone_data[2036] = _build_test_zone_data(2035)
+            assert build_ntem_population_cache(db_dir, cache_dir, reader) != cache_path
+            assert hashes == [changed] and len(n_reads) == len(ntem_years) + 1
+        finally:
+            file_ops.hash_file = hash_file
+        achieved = ntem_pop_for_year(2036, db_dir, cache_dir, reader)
+        assert np.isclose(achieved['Population'].sum(), zone_data_to_long(zone_data[2036])['Population'].sum())
+
+        # Years that can't be interpolated name the NTEM years there are
+        off_grid_dir = pathlib.Path(tmp_dir) / 'off_grid'
+        off_grid_dir.mkdir()
+        with open(off_grid_dir / (NTEM_DATABASE_NAME % 2013), 'w') as f:
+            f.write('2013')
+        for bad_dir, year in [(db_dir, 2065), (off_grid_dir, 2013)]:
+            try:
+                ntem_pop_for_year(year, bad_dir, cache_dir, reader)
+            except ValueError as e:
+                assert str(year) in str(e) and ('2061]' in str(e) or '[2013]' in str(e)), e
+            else:
+                raise AssertionError("Uninterpolatable year %d not caught" % year)
+        try:
+            build_ntem_population_cache(off_grid_dir, cache_dir, reader)
+        except ValueError as e:
+            assert '[2013]' in str(e), e
+        else:
+            raise AssertionError("No interpolatable years not caught")
+
+        # Nothing but the caches is left in cache_dir
+        assert not any(p.suffix == '.tmp' for p in cache_dir.iterdir())
+
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    ntem_tests()
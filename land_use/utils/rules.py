@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+File purpose:
+Rule tables, for classifying the rows of a dataframe with case when
+logic without calling a Python function per row.
+
+A RuleTable is an ordered list of Rules. Each Rule has conditions on the
+columns of a dataframe, and the class given to rows that meet all of
+them. A row is given the class of the first rule it meets, or the
+table's default if it meets none, like an if / elif / else chain.
+classify() builds a mask for each rule from whole columns at once, and
+picks each row's class with np.select.
+
+Conditions compare the same way the equivalent code on a row would, so
+missing values fail every comparison except '!='.
+"""
+# Builtins
+from typing import Any
+from typing import List
+from typing import NamedTuple
+from typing import Sequence
+from typing import Tuple
+
+# Third party
+import numpy as np
+import pandas as pd
+
+_OPERATORS = {
+    '==': lambda col, value: col == value,
+    '!=': lambda col, value: col != value,
+    '<': lambda col, value: col < value,
+    '<=': lambda col, value: col <= value,
+    '>': lambda col, value: col > value,
+    '>=': lambda col, value: col >= value,
+    'in': lambda col, value: col.isin(value),
+    'not in': lambda col, value: ~col.isin(value),
+}
+
+
+class Column(NamedTuple):
+    """
+    A rule's class taken from another column of the row, rather than a
+    constant.
+    """
+    name: str
+
+
+class Rule(NamedTuple):
+    """
+    Gives result to the rows meeting every condition.
+
+    conditions:
+        (column, operator, value) conditions, with operator one of '==',
+        '!=', '<', '<=', '>', '>=', 'in' and 'not in'.
+    result:
+        The class given, either a constant or a Column.
+    """
+    conditions: Sequence[Tuple[str, str, Any]]
+    result: Any
+
+
+class RuleTable:
+    """
+    Classifies rows by the first of rules they meet. See the module
+    docstring.
+    """
+
+    def __init__(self, rules: Sequence[Rule], default: Any):
+        """
+        rules: Sequence[Rule] - rules to check, in order
+        default: Any - class given to rows meeting no rule
+        """
+        for rule in rules:
+            for column, operator, value in rule.conditions:
+                if operator not in _OPERATORS:
+                    raise ValueError(
+                        "Unknown operator '%s' in a condition on %s, operators are: %s"
+                        % (operator, column, list(_OPERATORS))
+                    )
+        self.rules = list(rules)
+        self.default = default
+
+    @property
+    def columns(self) -> List[str]:
+        """
+        The columns the rules need.
+        """
+        columns = list()
+        for rule in self.rules:
+            needed = [c[0] for c in rule.conditions]
+            if isinstance(rule.result, Column):
+                needed.append(rule.result.name)
+            columns += [c for c in needed if c not in columns]
+        return columns
+
+    def masks(self, df: pd.DataFrame) -> List[np.ndarray]:
+        """
+        Returns a mask of the rows of df meeting each rule.
+        """
+        missing = [c for c in self.columns if c not in df.columns]
+        if missing:
+            raise KeyError("Columns needed by the rules are missing: %s" % missing)
+
+        masks = list()
+        for rule in self.rules:
+            mask = np.ones(len(df), dtype=bool)
+            for column, operator, value in rule.conditions:
+                mask &= _OPERATORS[operator](df[column], value).to_numpy(dtype=bool)
+            masks.append(mask)
+        return masks
+
+    def classify(self, df: pd.DataFrame) -> pd.Series:
+        """
+        Returns the class of each row of df, indexed as df.
+        """
+        choices = [df[rule.result.name].to_numpy() if isinstance(rule.result, Column)
+                   else rule.result
+                   for rule in self.rules]
+        classes = np.select(self.masks(df), choices, default=self.default)
+        if classes.dtype.kind == 'U':
+            classes = classes.astype(object)
+        return pd.Series(classes, index=df.index)
+
+
+def rules_tests() -> None:
+    """
+    Checks rule tables classify the same as the if / elif chain they
+    stand for.
+    """
+    print("Running rules.py tests...")
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'count': rng.integers(0, 6, 1000).astype(float),
+        'name': rng.choice(['nan', 'Flat A', 'Unit 2'], 1000),
+        'fallback': rng.integers(1, 4, 1000),
+    })
+    df.loc[::9, 'count'] = np.nan
+
+    def case_when(row):
+        if row['count'] >= 4:
+            return 'many'
+        elif row['count'] > 0 and row['name'] != 'nan':
+            return 'named'
+        elif row['count'] != 0 and row['name'] in ['Unit 2']:
+            return 'unit'
+        return 'other'
+
+    table = RuleTable([
+        Rule([('count', '>=', 4)], 'many'),
+        Rule([('count', '>', 0), ('name', '!=', 'nan')], 'named'),
+        Rule([('count', '!=', 0), ('name', 'in', ['Unit 2'])], 'unit'),
+    ], default='other')
+    pd.testing.assert_series_equal(table.classify(df), df.apply(case_when, axis=1))
+    assert table.columns == ['count', 'name']
+
+    # Classes from another column, and a shuffled index
+    df = df.sample(frac=1, random_state=1)
+    table = RuleTable([Rule([('count', '==', 1)], Column('fallback'))], default=99)
+    expected = df.apply(lambda row: row['fallback'] if row['count'] == 1 else 99, axis=1)
+    pd.testing.assert_series_equal(table.classify(df), expected, check_dtype=False)
+    assert table.columns == ['count', 'fallback']
+
+    for bad in [lambda: RuleTable([Rule([('count', '=>', 1)], 1)], 0),
+                lambda: table.classify(df.drop(columns='fallback'))]:
+        try:
+            bad()
+        except (ValueError, KeyError):
+            pass
+        else:
+            raise AssertionError("Bad rule table not reported")
+
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    rules_tests()
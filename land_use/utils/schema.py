@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+File purpose:
+Schema of the segment and zone columns of land use dataframes, for
+storing them in the smallest dtypes they fit.
+
+Land use frames store segments such as traveller type, age and area type
+as int64, or as strings, so most of a frame is columns of a few small
+values. optimise_dtypes() casts each column named in a schema to the
+smallest integer dtype that holds every value the column is allowed,
+or to a category, and checks every value is allowed. As every frame cast
+with a schema gets the same dtype for the same column, merges between
+them stay cheap integer merges.
+
+Integer columns are used rather than categories wherever the values are
+numbers, as merges between categories with different categories, and
+groupbys of categories, can be slower than the int64 they replace.
+"""
+# Builtins
+from typing import Dict
+from typing import NamedTuple
+from typing import Sequence
+
+# Third party
+import numpy as np
+import pandas as pd
+
+# Local
+from land_use.utils.segment_keys import NORMITS_SEGMENTS
+
+_INT_DTYPES = [np.int8, np.int16, np.int32, np.int64]
+
+
+class ColumnSchema(NamedTuple):
+    """
+    The values a column is allowed.
+
+    values:
+        A range or sequence of the allowed integer values. If None, any
+        values are allowed.
+    categorical:
+        If True, the column is cast to a category, otherwise to the
+        smallest integer dtype that holds values. Columns of strings are
+        always cast to categories.
+    """
+    values: Sequence = None
+    categorical: bool = False
+
+
+def _segment(seg: str) -> ColumnSchema:
+    low, high = NORMITS_SEGMENTS[seg]
+    return ColumnSchema(range(low, high + 1))
+
+
+# Columns of the land use outputs, by both their NorMITs segment name and
+# their long name
+LAND_USE_SCHEMA = {
+    # Zones
+    'msoa_zone_id': _segment('z'),
+    'lsoa_zone_id': _segment('z'),
+    'model_zone_id': _segment('z'),
+    'z': _segment('z'),
+    'msoa11cd': ColumnSchema(categorical=True),
+    'lsoa11cd': ColumnSchema(categorical=True),
+    'lad_code': ColumnSchema(categorical=True),
+    'lad_name': ColumnSchema(categorical=True),
+
+    # Traveller types
+    'tfn_traveller_type': ColumnSchema(range(1, 761)),
+    'tfn_tt': ColumnSchema(range(1, 761)),
+    'ntem_traveller_type': ColumnSchema(range(1, 89)),
+    'ntem_tt': ColumnSchema(range(1, 89)),
+    'traveller_type': ColumnSchema(range(1, 89)),
+
+    # Segments
+    'area_type': ColumnSchema(range(1, 9)),
+    'a': _segment('a'),
+    'age': _segment('a'),
+    'g': _segment('g'),
+    'gender': _segment('g'),
+    'h': _segment('h'),
+    'household_composition': _segment('h'),
+    'e': _segment('e'),
+    'employment_type': _segment('e'),
+    'n': _segment('n'),
+    'ns': _segment('n'),
+    'ns_sec': _segment('n'),
+    's': _segment('s'),
+    # Some outputs use 0 for no soc
+    'soc': ColumnSchema(range(0, 5)),
+    't': _segment('t'),
+    'property_type': ColumnSchema(range(1, 9)),
+    'census_property_type': ColumnSchema(range(1, 9)),
+    'ca': ColumnSchema(range(1, 3)),
+    'cars': ColumnSchema(range(0, 4)),
+}
+
+
+def _int_dtype(values: Sequence) -> np.dtype:
+    """
+    Returns the smallest integer dtype that holds every one of values.
+    """
+    if isinstance(values, range):
+        low, high = min(values[0], values[-1]), max(values[0], values[-1])
+    else:
+        low, high = min(values), max(values)
+    for dtype in _INT_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    raise ValueError("Values %s to %s don't fit in an int64" % (low, high))
+
+
+def _unknown_values(col: pd.Series, values: Sequence) -> np.ndarray:
+    """
+    Returns the values of col that aren't in values, ignoring missing.
+    """
+    col = col.dropna()
+    if isinstance(values, range) and values.step == 1:
+        unknown = col[(col < values.start) | (col >= values.stop) | (col != np.floor(col))]
+    else:
+        unknown = col[~col.isin(values)]
+    return pd.unique(unknown)
+
+
+def memory_usage(df: pd.DataFrame) -> int:
+    """
+    Returns the bytes used by df, including the contents of strings.
+    """
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def optimise_dtypes(df: pd.DataFrame,
+                    schema: Dict[str, ColumnSchema] = None,
+                    validate: bool = True,
+                    verbose: bool = False,
+                    ) -> pd.DataFrame:
+    """
+    Casts the columns of df named in schema to their smallest dtypes.
+
+    Parameters
+    ----------
+    df:
+        The dataframe to cast. Isn't changed, a copy is returned.
+
+    schema:
+        The allowed values of each column. Defaults to LAND_USE_SCHEMA.
+        Columns not in schema are left as they are.
+
+    validate:
+        If True, raises a ValueError if any numeric column has values that
+        aren't allowed by its schema. Otherwise those columns are left as
+        they are.
+
+    verbose:
+        If True, prints the memory used by df before and after.
+
+    Returns
+    -------
+    df:
+        A copy of df with the columns in schema cast. Numeric columns with
+        missing values are validated but not cast, as integer dtypes
+        can't hold them.
+    """
+    schema = LAND_USE_SCHEMA if schema is None else schema
+    if verbose:
+        before = memory_usage(df)
+
+    df = df.copy(deep=False)
+    unknown = dict()
+    for col in [x for x in df.columns if x in schema]:
+        col_schema = schema[col]
+        values = df[col]
+
+        if not pd.api.types.is_numeric_dtype(values) or isinstance(values.dtype, pd.CategoricalDtype):
+            # Strings, or already categories, can't be checked against integers
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                df[col] = values.astype('category')
+            continue
+
+        if col_schema.values is not None:
+            col_unknown = _unknown_values(values, col_schema.values)
+            if len(col_unknown) > 0:
+                # Never cast values that don't fit
+                unknown[col] = col_unknown
+                continue
+
+        if values.isna().any():
+            continue
+        if col_schema.categorical:
+            categories = col_schema.values
+            if categories is None:
+                categories = np.sort(pd.unique(values))
+            df[col] = pd.Categorical(values, categories=categories)
+        elif col_schema.values is not None:
+            df[col] = values.astype(_int_dtype(col_schema.values))
+        else:
+            df[col] = pd.to_numeric(values, downcast='integer')
+
+    if validate and len(unknown) > 0:
+        raise ValueError(
+            "Columns have values not allowed by the schema:\n%s"
+            % '\n'.join('%s: %s' % (k, v[:10]) for k, v in unknown.items())
+        )
+
+    if verbose:
+        after = memory_usage(df)
+        print('Memory used %.1fMB before, %.1fMB after optimising dtypes (%.0f%%)'
+              % (before / 1e6, after / 1e6, 100 * after / max(before, 1)))
+
+    return df
+
+
+def schema_tests() -> None:
+    """
+    Checks frames are cast losslessly, and unknown values are caught.
+    """
+    print("Running schema.py tests...")
+    rng = np.random.default_rng(2018)
+    n = 10000
+    df = pd.DataFrame({
+        'msoa_zone_id': rng.integers(1, 8481, n),
+        'msoa11cd': ['E02%06d' % x for x in rng.integers(1, 500, n)],
+        'area_type': rng.integers(1, 9, n),
+        'tfn_traveller_type': rng.integers(1, 761, n),
+        'gender': rng.integers(1, 4, n).astype(float),
+        'soc': rng.integers(0, 5, n),
+        'other': rng.integers(0, 10 ** 6, n),
+        'people': rng.random(n),
+    })
+
+    optimised = optimise_dtypes(df, verbose=True)
+    assert optimised['msoa_zone_id'].dtype == np.int32
+    assert optimised['area_type'].dtype == np.int8
+    assert optimised['tfn_traveller_type'].dtype == np.int16
+    assert optimised['gender'].dtype == np.int8
+    assert isinstance(optimised['msoa11cd'].dtype, pd.CategoricalDtype)
+    assert optimised['other'].dtype == df['other'].dtype
+    assert memory_usage(optimised) < memory_usage(df) / 2
+    # Lossless, and the input isn't changed
+    pd.testing.assert_frame_equal(optimised.astype(df.dtypes), df)
+    assert df['area_type'].dtype == np.int64
+
+    # Groupbys give the same sums
+    expected = df.groupby(['area_type', 'tfn_traveller_type'])['people'].sum()
+    achieved = optimised.groupby(['area_type', 'tfn_traveller_type'])['people'].sum()
+    pd.testing.assert_series_equal(expected, achieved, check_index_type=False)
+
+    # Missing values are left as floats
+    missing = df.assign(area_type=df['area_type'].where(df.index % 7 > 0))
+    assert optimise_dtypes(missing)['area_type'].dtype == float
+
+    # Unknown values are reported
+    for col, value in [('area_type', 9), ('tfn_traveller_type', 0), ('gender', 1.5)]:
+        bad = df.copy()
+        bad[col] = bad[col].astype(float)
+        bad.loc[3, col] = value
+        try:
+            optimise_dtypes(bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Unknown %s %s not reported" % (col, value))
+        assert optimise_dtypes(bad, validate=False)[col].dtype == float
+
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    schema_tests()
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""
+File purpose:
+Packs segment columns into a single integer key, and unpacks them again.
+
+Segments are packed as the digits of a mixed-radix number, where the radix
+of each segment is the number of values it can take. Keys can be built for
+millions of rows with a few array operations, and joining on them is an
+integer join, instead of formatting every row into a string key with
+'_'.join() and joining on those.
+
+Keys only match between frames encoded with the same segments, in the same
+order, by codecs with the same bounds. Sorting by key sorts by the segments
+in the order given.
+"""
+# Builtins
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import Iterable
+
+# Third party
+import numpy as np
+import pandas as pd
+
+# Inclusive bounds of the values of each NorMITs segment. z is any integer
+# zone ID, so zone systems up to int32 can be encoded.
+NORMITS_SEGMENTS = {
+    'z': (0, 2 ** 31 - 1),
+    'a': (1, 3),
+    'g': (1, 3),
+    'h': (1, 8),
+    'e': (1, 5),
+    't': (1, 4),
+    'n': (1, 5),
+    's': (1, 4),
+}
+
+MAX_KEY = np.iinfo(np.int64).max
+
+
+class SegmentCodec:
+    """
+    Packs segments into int64 keys, see the module docstring.
+    """
+
+    def __init__(self, bounds: Dict[str, Tuple[int, int]] = None):
+        """
+        Parameters
+        ----------
+        bounds:
+            The inclusive minimum and maximum value of each segment the
+            codec can encode. Defaults to NORMITS_SEGMENTS.
+        """
+        bounds = NORMITS_SEGMENTS if bounds is None else bounds
+        self.bounds = dict()
+        for seg, (low, high) in bounds.items():
+            if high < low:
+                raise ValueError(
+                    "Maximum of segment '%s' is less than its minimum: %s < %s"
+                    % (seg, high, low)
+                )
+            self.bounds[seg] = (int(low), int(high))
+
+    def __repr__(self) -> str:
+        return '%s(%s)' % (self.__class__.__name__, self.bounds)
+
+    @classmethod
+    def from_data(cls,
+                  frames: Iterable[pd.DataFrame],
+                  segments: List[str],
+                  ) -> 'SegmentCodec':
+        """
+        Builds a codec bounded by the values of segments found in frames.
+
+        Every frame that will be encoded with the codec should be given, so
+        all of their values are in bounds.
+        """
+        frames = list(frames)
+        bounds = dict()
+        for seg in segments:
+            values = [_as_int(df[seg], seg) for df in frames if len(df) > 0]
+            if len(values) == 0:
+                raise ValueError("No values of segment '%s' to bound" % seg)
+            bounds[seg] = (min(v.min() for v in values), max(v.max() for v in values))
+        return cls(bounds)
+
+    def radices(self, segments: List[str]) -> np.ndarray:
+        """
+        Returns the number of values each of segments can take.
+
+        Raises a ValueError if a segment is unknown, repeated, or the
+        segments together have too many combinations to fit in an int64.
+        """
+        unknown = [x for x in segments if x not in self.bounds]
+        if len(unknown) > 0:
+            raise ValueError(
+                "Unknown segments %s, segments are: %s" % (unknown, list(self.bounds))
+            )
+        if len(set(segments)) != len(segments):
+            raise ValueError("Segments given more than once: %s" % segments)
+
+        radices = np.array([self.bounds[x][1] - self.bounds[x][0] + 1 for x in segments],
+                           dtype=object)
+        if np.prod(radices) - 1 > MAX_KEY:
+            raise ValueError(
+                "Segments %s have too many combinations to pack into an int64" % segments
+            )
+        return radices.astype(np.int64)
+
+    def encode(self,
+               data: pd.DataFrame,
+               segments: List[str],
+               columns: List[str] = None,
+               ) -> np.ndarray:
+        """
+        Packs segments of each row of data into an int64 key.
+
+        Parameters
+        ----------
+        data:
+            The data to encode.
+
+        segments:
+            The segments to pack, in order of significance.
+
+        columns:
+            The columns of data holding each of segments, if they are
+            named differently. Defaults to segments.
+
+        Returns
+        -------
+        keys:
+            An int64 array of a key for each row of data.
+        """
+        columns = segments if columns is None else columns
+        if len(columns) != len(segments):
+            raise ValueError(
+                "Got %d columns for %d segments" % (len(columns), len(segments))
+            )
+
+        radices = self.radices(segments)
+        keys = np.zeros(len(data), dtype=np.int64)
+        for seg, col, radix in zip(segments, columns, radices):
+            low, high = self.bounds[seg]
+            values = _as_int(data[col], col)
+            if len(values) > 0 and (values.min() < low or values.max() > high):
+                raise ValueError(
+                    "Values of column '%s' are outside the bounds of segment '%s': "
+                    "%s to %s" % (col, seg, low, high)
+                )
+            keys *= radix
+            keys += values - low
+        return keys
+
+    def in_bounds(self,
+                  data: pd.DataFrame,
+                  segments: List[str],
+                  columns: List[str] = None,
+                  ) -> np.ndarray:
+        """
+        Returns a boolean array of which rows of data have every segment in
+        bounds, and so can be encoded.
+
+        Rows out of bounds can't match a key from encode(), so dropping them
+        before encoding keeps the rows a merge on string keys would match.
+        Arguments are as encode().
+        """
+        columns = segments if columns is None else columns
+        if len(columns) != len(segments):
+            raise ValueError(
+                "Got %d columns for %d segments" % (len(columns), len(segments))
+            )
+
+        mask = np.ones(len(data), dtype=bool)
+        for seg, col in zip(segments, columns):
+            low, high = self.bounds[seg]
+            values = _as_int(data[col], col)
+            mask &= (values >= low) & (values <= high)
+        return mask
+
+    def decode(self,
+               keys: np.ndarray,
+               segments: List[str],
+               ) -> pd.DataFrame:
+        """
+        Unpacks keys made by encode() back into their segments.
+
+        Returns a dataframe of a column for each of segments, one row for
+        each key.
+        """
+        radices = self.radices(segments)
+        keys = np.asarray(keys, dtype=np.int64)
+        if len(keys) > 0 and (keys.min() < 0 or keys.max() >= np.prod(radices)):
+            raise ValueError("Keys are outside the range of segments %s" % segments)
+
+        decoded = dict()
+        remaining = keys.copy()
+        for seg, radix in zip(reversed(segments), radices[::-1]):
+            remaining, digit = np.divmod(remaining, radix)
+            decoded[seg] = digit + self.bounds[seg][0]
+        return pd.DataFrame({seg: decoded[seg] for seg in segments})
+
+
+NORMITS_CODEC = SegmentCodec()
+
+
+def _as_int(values: pd.Series, name: str) -> np.ndarray:
+    """
+    Returns values as int64, raising a ValueError if any aren't integers.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind in 'iub':
+        return values.astype(np.int64)
+    if values.dtype.kind != 'f':
+        raise ValueError("Column '%s' is not numeric, got dtype %s" % (name, values.dtype))
+    if not np.isfinite(values).all():
+        raise ValueError("Column '%s' has missing values" % name)
+    if (values != np.floor(values)).any():
+        raise ValueError("Column '%s' has non-integer values" % name)
+    return values.astype(np.int64)
+
+
+def merge_on_segments(left: pd.DataFrame,
+                      right: pd.DataFrame,
+                      segments: List[str],
+                      left_on: List[str] = None,
+                      right_on: List[str] = None,
+                      codec: SegmentCodec = NORMITS_CODEC,
+                      **kwargs,
+                      ) -> pd.DataFrame:
+    """
+    Merges left and right on packed segment keys.
+
+    As merging on a key made by joining the segment columns into a string,
+    the segment columns of both sides are kept, with pd.merge() suffixes
+    where names clash, and the key is dropped.
+
+    Parameters
+    ----------
+    left:
+        The left dataframe to merge.
+
+    right:
+        The right dataframe to merge.
+
+    segments:
+        The segments to merge on.
+
+    left_on:
+        The columns of left holding each of segments. Defaults to segments.
+
+    right_on:
+        The columns of right holding each of segments. Defaults to segments.
+
+    codec:
+        The codec to pack segments with.
+
+    kwargs:
+        Any other arguments for pd.merge(), such as how or suffixes.
+
+    Returns
+    -------
+    merged:
+        The merged dataframe.
+    """
+    key = '__segment_key'
+    left_keys = codec.encode(left, segments, left_on)
+    right_keys = codec.encode(right, segments, right_on)
+
+    # Shallow copies, so the key columns are added without copying the data
+    left = left.copy(deep=False)
+    left[key] = left_keys
+    right = right.copy(deep=False)
+    right[key] = right_keys
+    return pd.merge(left, right, on=key, **kwargs).drop(columns=key)
+
+
+def _string_keys(data: pd.DataFrame, columns: List[str]) -> List[str]:
+    """
+    The '_'.join() string keys that packed keys replace, for checking against.
+    """
+    return ['_'.join(str(x) for x in row) for row in zip(*[data[c] for c in columns])]
+
+
+def segment_keys_tests(n_trials: int = 200, seed: int = 2018) -> None:
+    """
+    Checks properties of the codec on random segments and data.
+
+    For random bounds and values, keys must round trip through decode(),
+    be unique exactly where the segments are, sort in the same order as the
+    segments, and merge exactly as string keys do.
+    """
+    print("Running segment_keys.py tests...")
+    rng = np.random.default_rng(seed)
+
+    for _ in range(n_trials):
+        n_segs = rng.integers(1, 6)
+        segments = ['seg%d' % i for i in range(n_segs)]
+        lows = rng.integers(-50, 50, n_segs)
+        highs = lows + rng.integers(0, 20, n_segs)
+        codec = SegmentCodec({s: (lo, hi) for s, lo, hi in zip(segments, lows, highs)})
+
+        n_rows = rng.integers(0, 300)
+        data = pd.DataFrame({s: rng.integers(lo, hi + 1, n_rows)
+                             for s, lo, hi in zip(segments, lows, highs)})
+        keys = codec.encode(data, segments)
+
+        # Round trip
+        pd.testing.assert_frame_equal(codec.decode(keys, segments), data, check_dtype=False)
+        # Unique exactly where the segments are
+        assert len(np.unique(keys)) == len(data.drop_duplicates())
+        # Sorting by key sorts by segments
+        by_key = data.iloc[np.argsort(keys, kind='stable')].reset_index(drop=True)
+        by_segs = data.sort_values(segments, kind='stable').reset_index(drop=True)
+        pd.testing.assert_frame_equal(by_key, by_segs)
+        # Floats of integer values encode the same
+        assert (codec.encode(data.astype(float), segments) == keys).all()
+
+        # Merges the same as string keys
+        other = pd.DataFrame({s: rng.integers(lo, hi + 1, n_rows // 2 + 1)
+                              for s, lo, hi in zip(segments, lows, highs)})
+        other['value'] = rng.random(len(other))
+        expected = pd.merge(data.assign(key=_string_keys(data, segments)),
+                            other.assign(key=_string_keys(other, segments)),
+                            on='key', how='left').drop(columns='key')
+        achieved = merge_on_segments(data, other, segments, codec=codec, how='left')
+        pd.testing.assert_frame_equal(expected, achieved)
+
+    # Differently named columns, with a communal establishment (type 8) row
+    # outside the bounds of t, as in the zonal property counts
+    data = pd.DataFrame({'Zone': [1, 8480, 12, 12], 'census_property_type': [1, 4, 2, 8],
+                         'UPRN': [10, 20, 30, 40]})
+    try:
+        NORMITS_CODEC.encode(data, ['z', 't'], ['Zone', 'census_property_type'])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Out of bounds property type encoded")
+    in_bounds = NORMITS_CODEC.in_bounds(data, ['z', 't'], ['Zone', 'census_property_type'])
+    assert in_bounds.tolist() == [True, True, True, False]
+    data = data[in_bounds]
+    keys = NORMITS_CODEC.encode(data, ['z', 't'], ['Zone', 'census_property_type'])
+    decoded = NORMITS_CODEC.decode(keys, ['z', 't'])
+    assert decoded['z'].tolist() == [1, 8480, 12] and decoded['t'].tolist() == [1, 4, 2]
+
+    # Dropping out of bounds rows merges the same as string keys
+    pop = pd.DataFrame({'z': [1, 12, 12, 12], 't': [1, 2, 3, 4], 'people': [1., 2., 3., 4.]})
+    all_props = pd.DataFrame({'Zone': [1, 8480, 12, 12], 'census_property_type': [1, 4, 2, 8],
+                              'UPRN': [10, 20, 30, 40]})
+    expected = pd.merge(pop.assign(key=_string_keys(pop, ['z', 't'])),
+                        all_props.assign(key=_string_keys(all_props, ['Zone', 'census_property_type'])),
+                        on='key', how='left').drop(columns='key')
+    achieved = merge_on_segments(pop, data, ['z', 't'], right_on=['Zone', 'census_property_type'], how='left')
+    pd.testing.assert_frame_equal(expected, achieved, check_dtype=False)
+
+    # Codecs bounded by data
+    codec = SegmentCodec.from_data([data], ['Zone', 'census_property_type'])
+    assert codec.bounds == {'Zone': (1, 8480), 'census_property_type': (1, 4)}
+
+    # Invalid values are rejected rather than making wrong keys
+    bad_data = [
+        pd.DataFrame({'a': [1, 4]}),
+        pd.DataFrame({'a': [1.0, np.nan]}),
+        pd.DataFrame({'a': [1.5, 2]}),
+        pd.DataFrame({'a': ['1', '2']}),
+    ]
+    for bad in bad_data:
+        try:
+            NORMITS_CODEC.encode(bad, ['a'])
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Invalid values encoded:\n%s" % bad)
+
+    # Too many combinations to pack
+    wide = SegmentCodec({'x%d' % i: (0, 2 ** 20) for i in range(4)})
+    try:
+        wide.radices(list(wide.bounds))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Overflowing segments accepted")
+
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    segment_keys_tests()
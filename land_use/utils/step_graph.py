@@ -0,0 +1,505 @@
+# -*- coding: utf-8 -*-
+"""
+File purpose:
+A content hashed graph of build steps, which only reruns what is stale.
+
+Each step declares the steps it depends on, the files it reads from outside
+of the graph, the parameters it is run with, and the files it writes. The
+fingerprint of a step is the hash of its inputs and parameters together with
+the fingerprints of the steps it depends on, so changing any input marks that
+step, and everything downstream of it, as stale. Fingerprints of completed
+steps are kept in a state file next to the outputs. Steps that do not depend
+on each other are run concurrently.
+"""
+# Builtins
+import os
+import json
+import hashlib
+import logging
+import datetime
+
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Callable
+from typing import Iterable
+
+# Local imports
+import land_use as lu
+from land_use import lu_constants as consts
+from land_use import file_cache
+from land_use.concurrency import multiprocessing as mp
+from land_use.utils import file_ops
+
+
+class BuildStep:
+    """
+    A single step of a build, and everything that decides whether it is stale.
+    """
+
+    def __init__(self,
+                 key: str,
+                 desc: str,
+                 fn: Callable[[Any], Any],
+                 depends_on: Iterable[str] = None,
+                 inputs: Iterable[lu.PathLike] = None,
+                 outputs: Iterable[lu.PathLike] = None,
+                 params: Dict[str, Any] = None,
+                 parallel_safe: bool = True,
+                 ):
+        """
+        Parameters
+        ----------
+        key:
+            The unique name of this step in the graph.
+
+        desc:
+            A description of the step, used in logging.
+
+        fn:
+            The function to run the step. Called with the build object as
+            the only argument. Must be defined at module level so it can be
+            sent to another process.
+
+        depends_on:
+            The keys of the steps whose outputs this step reads.
+
+        inputs:
+            The paths this step reads that are not made by another step.
+            Files are hashed by content. Directories are fingerprinted by the
+            names, sizes and modification times of the files in them.
+
+        outputs:
+            The paths this step writes. If any are missing, or have changed
+            since the step was run, the step is stale.
+
+        params:
+            Any parameters that change the outputs of this step. Must be
+            json serialisable, or convertible with str().
+
+        parallel_safe:
+            Whether this step can be run in a worker process alongside other
+            steps. Steps that start their own processes cannot, as the
+            workers are daemonic.
+        """
+        self.key = key
+        self.desc = desc
+        self.fn = fn
+        self.depends_on = list() if depends_on is None else list(depends_on)
+        self.inputs = list() if inputs is None else [str(x) for x in inputs]
+        self.outputs = list() if outputs is None else [str(x) for x in outputs]
+        self.params = dict() if params is None else params
+        self.parallel_safe = parallel_safe
+
+    def __repr__(self):
+        return "BuildStep(%s)" % self.key
+
+
+def _path_fingerprint(path: str) -> str:
+    """
+    Returns a fingerprint of the file or directory at path.
+    """
+    if os.path.isfile(path):
+        return file_ops.hash_file(path)
+
+    if os.path.isdir(path):
+        # Hashing the contents of whole import directories would take longer
+        # than some of the steps, so stat them instead
+        sha = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                stat = os.stat(file_path)
+                sha.update(('%s|%d|%f\n' % (os.path.relpath(file_path, path),
+                                            stat.st_size,
+                                            stat.st_mtime)).encode())
+        return sha.hexdigest()
+
+    return 'missing'
+
+
+def _run_step(step: BuildStep, obj: Any) -> str:
+    """
+    Runs step on obj. Returns the step key, so results can be matched up.
+    """
+    logging.info('')
+    logging.info('\n' + '=' * 75)
+    print('\n' + '=' * 75)
+    logging.info('Running step %s, %s' % (step.key, step.desc))
+    step.fn(obj)
+    return step.key
+
+
+class StepGraph:
+    """
+    A graph of BuildSteps that tracks which have been run, and with what.
+    """
+
+    def __init__(self,
+                 steps: List[BuildStep],
+                 state_path: lu.PathLike,
+                 ):
+        """
+        Parameters
+        ----------
+        steps:
+            The steps in the graph. Every step a step depends on must also
+            be in steps, and the graph cannot contain any cycles.
+
+        state_path:
+            The path to a json file to keep the fingerprints of completed
+            steps in. Created on the first run.
+        """
+        self.steps = {step.key: step for step in steps}
+        self.state_path = str(state_path)
+
+        if len(self.steps) != len(steps):
+            raise ValueError("Step keys must be unique.")
+
+        for step in steps:
+            missing = [x for x in step.depends_on if x not in self.steps]
+            if len(missing) > 0:
+                raise ValueError(
+                    "Step %s depends on steps that are not in the graph: %s"
+                    % (step.key, missing)
+                )
+
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        """
+        Returns the step keys ordered so every step comes after its
+        dependencies. Ties keep the order the steps were given in.
+        """
+        order = list()
+        remaining = list(self.steps.keys())
+        while len(remaining) > 0:
+            ready = [k for k in remaining
+                     if all(d in order for d in self.steps[k].depends_on)]
+            if len(ready) == 0:
+                raise ValueError("The steps contain a cycle between: %s" % remaining)
+            order += ready
+            remaining = [k for k in remaining if k not in ready]
+        return order
+
+    def _ancestors(self, keys: Iterable[str]) -> List[str]:
+        """
+        Returns keys and every step they depend on, in topological order.
+        """
+        needed = set()
+        to_visit = list(keys)
+        while len(to_visit) > 0:
+            key = to_visit.pop()
+            if key not in self.steps:
+                raise ValueError("%s is not a step in the graph." % key)
+            if key not in needed:
+                needed.add(key)
+                to_visit += self.steps[key].depends_on
+        return [k for k in self.order if k in needed]
+
+    def fingerprints(self, keys: Iterable[str] = None) -> Dict[str, str]:
+        """
+        Returns the current fingerprint of keys, and of the steps they
+        depend on. Defaults to every step.
+        """
+        keys = self.order if keys is None else self._ancestors(keys)
+        fingerprints = dict()
+        for key in keys:
+            step = self.steps[key]
+            content = {
+                'key': key,
+                'params': step.params,
+                'inputs': {p: _path_fingerprint(p) for p in step.inputs},
+                'depends_on': {d: fingerprints[d] for d in step.depends_on},
+            }
+            content = json.dumps(content, sort_keys=True, default=str)
+            fingerprints[key] = hashlib.sha256(content.encode()).hexdigest()
+        return fingerprints
+
+    def _read_state(self) -> Dict[str, Dict[str, str]]:
+        if not os.path.exists(self.state_path):
+            return dict()
+        with open(self.state_path, 'r') as f:
+            return json.load(f)
+
+    def _write_state(self, state: Dict[str, Dict[str, str]]) -> None:
+        # Write to a temp file first so a crash can't leave half a state file
+        def write(tmp_path):
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f, indent=4, sort_keys=True)
+        file_cache.write_atomic(self.state_path, write)
+
+    def stale_steps(self,
+                    targets: Iterable[str] = None,
+                    force: Iterable[str] = None,
+                    ) -> List[str]:
+        """
+        Returns the steps that need running to bring targets up to date.
+
+        A step is stale if it has never been run, its fingerprint has changed
+        since it was last run, any of its outputs are missing or have changed
+        since it was run, it is in force, or any step it depends on is stale.
+
+        Parameters
+        ----------
+        targets:
+            The steps that need to be up to date. Defaults to every step.
+
+        force:
+            Steps to treat as stale regardless of their fingerprint.
+
+        Returns
+        -------
+        stale_steps:
+            The keys of the stale steps, in the order they can be run in.
+        """
+        force = set() if force is None else set(force)
+        keys = self.order if targets is None else self._ancestors(targets)
+        fingerprints = self.fingerprints(keys)
+        state = self._read_state()
+
+        stale = list()
+        for key in keys:
+            step = self.steps[key]
+            if (key in force
+                    or state.get(key, dict()).get('fingerprint') != fingerprints[key]
+                    or not all(os.path.exists(p) for p in step.outputs)
+                    or any(d in stale for d in step.depends_on)
+                    or not self._outputs_unchanged(key, state[key])):
+                stale.append(key)
+        return stale
+
+    def _outputs_unchanged(self, key: str, record: Dict[str, Any]) -> bool:
+        """
+        Whether the outputs of key match the checksums recorded when it was
+        run. Records from before checksums were kept only check existence.
+        """
+        checksums = record.get('outputs', dict())
+        return all(_path_fingerprint(p) == checksums[p]
+                   for p in self.steps[key].outputs if p in checksums)
+
+    def _record_complete(self,
+                         keys: Iterable[str],
+                         fingerprints: Dict[str, str],
+                         ) -> None:
+        """
+        Records keys as completed with fingerprints, and the checksums of
+        their outputs as they are now.
+        """
+        state = self._read_state()
+        for key in keys:
+            state[key] = {
+                'fingerprint': fingerprints[key],
+                'outputs': {p: _path_fingerprint(p) for p in self.steps[key].outputs},
+                'completed': str(datetime.datetime.now()),
+            }
+        self._write_state(state)
+
+    def mark_complete(self, keys: Iterable[str] = None) -> None:
+        """
+        Records keys as up to date with their current fingerprints.
+
+        Used to adopt outputs made outside of the graph, such as by a run
+        from before the state file existed. Only steps with all their
+        outputs in place are marked.
+
+        Parameters
+        ----------
+        keys:
+            The steps to mark as complete. Defaults to every step.
+        """
+        keys = self.order if keys is None else list(keys)
+        fingerprints = self.fingerprints(keys)
+        complete = list()
+        for key in keys:
+            if not all(os.path.exists(p) for p in self.steps[key].outputs):
+                logging.info('Not marking step %s as complete, its outputs are missing' % key)
+                continue
+            complete.append(key)
+        self._record_complete(complete, fingerprints)
+
+    def seed(self, keys: Iterable[str]) -> None:
+        """
+        Marks keys as complete if the graph has never been run, so the
+        first run starts from the steps a run from before the state file
+        existed had got to. Does nothing once there is a state file.
+
+        Parameters
+        ----------
+        keys:
+            The steps already run. Only those with all their outputs in
+            place are marked, see mark_complete().
+        """
+        if os.path.exists(self.state_path):
+            return
+        logging.info('No state file at %s, seeding it with steps: %s'
+                     % (self.state_path, ', '.join(keys)))
+        self.mark_complete(keys)
+
+    def run(self,
+            obj: Any,
+            targets: Iterable[str] = None,
+            force: Iterable[str] = None,
+            process_count: int = consts.PROCESS_COUNT,
+            ) -> List[str]:
+        """
+        Runs every stale step needed to bring targets up to date.
+
+        Stale steps are run in waves. Each wave is every stale step whose
+        dependencies have all been run, and the steps in a wave are run
+        concurrently. Each step is recorded in the state file as soon as it
+        completes, so a failed build picks up where it stopped, even part
+        way through a wave.
+
+        Parameters
+        ----------
+        obj:
+            The build object to pass to every step.
+
+        targets:
+            See stale_steps().
+
+        force:
+            See stale_steps().
+
+        process_count:
+            The number of processes to run a wave of steps in. See
+            concurrency.multiprocess() for how values are treated. Steps are
+            run in this process if there is only one to run.
+
+        Returns
+        -------
+        run_steps:
+            The keys of the steps that were run, in an order they can be run in.
+        """
+        stale = self.stale_steps(targets, force)
+        fingerprints = self.fingerprints(stale)
+        if len(stale) == 0:
+            logging.info('All steps are up to date, nothing to run')
+            return list()
+        logging.info('Steps to run: %s' % ', '.join(stale))
+
+        done = list()
+        while len(done) < len(stale):
+            wave = [k for k in stale if k not in done
+                    and all(d in done or d not in stale for d in self.steps[k].depends_on)]
+            parallel = [k for k in wave if self.steps[k].parallel_safe]
+            serial = [k for k in wave if k not in parallel]
+
+            # Run what we can side by side, then anything that can't be
+            if len(parallel) > 1:
+                logging.info('Running steps %s concurrently' % ', '.join(parallel))
+                completed = mp.multiprocess_iter(
+                    fn=_run_step,
+                    kwargs=[{'step': self.steps[k], 'obj': obj} for k in parallel],
+                    process_count=min(len(parallel), mp.get_process_count(process_count)),
+                )
+                for key in completed:
+                    self._record_complete([key], fingerprints)
+                    done.append(key)
+            else:
+                serial = parallel + serial
+
+            for key in serial:
+                _run_step(self.steps[key], obj)
+                self._record_complete([key], fingerprints)
+                done.append(key)
+
+        return [k for k in stale if k in done]
+
+
+def _test_step(obj, key):
+    with open(os.path.join(obj['folder'], key + '.txt'), 'w') as f:
+        f.write(key)
+    obj['log'].append(key)
+
+
+def _test_step_a(obj):
+    _test_step(obj, 'a')
+
+
+def _test_step_b(obj):
+    _test_step(obj, 'b')
+
+
+def _test_step_c(obj):
+    _test_step(obj, 'c')
+
+
+def step_graph_tests():
+    """
+    Checks that only stale steps are rerun, and downstream steps with them.
+    """
+    import tempfile
+
+    print("Running step_graph.py tests...")
+    with tempfile.TemporaryDirectory() as folder:
+        input_path = os.path.join(folder, 'control.csv')
+        with open(input_path, 'w') as f:
+            f.write('1')
+
+        obj = {'folder': folder, 'log': list()}
+        out = {k: os.path.join(folder, k + '.txt') for k in 'abc'}
+        graph = StepGraph(
+            steps=[
+                BuildStep('c', 'last', _test_step_c, depends_on=['a', 'b'], outputs=[out['c']]),
+                BuildStep('a', 'first', _test_step_a, inputs=[input_path], outputs=[out['a']]),
+                BuildStep('b', 'second', _test_step_b, params={'year': 2018}, outputs=[out['b']]),
+            ],
+            state_path=os.path.join(folder, 'state.json'),
+        )
+
+        # Everything runs the first time, a and b side by side, then nothing
+        assert graph.run(obj, process_count=2) == ['a', 'b', 'c']
+        assert graph.run(obj, process_count=0) == list()
+
+        # Changing an input reruns that step and everything after it
+        with open(input_path, 'w') as f:
+            f.write('2')
+        assert graph.stale_steps() == ['a', 'c']
+
+        # As does a missing output, or asking for it
+        os.remove(out['b'])
+        assert graph.stale_steps(targets=['b']) == ['b']
+        assert graph.stale_steps(force=['c']) == ['a', 'b', 'c']
+        assert graph.run(obj, process_count=0) == ['a', 'b', 'c']
+
+        # Outputs changed since they were made are rerun
+        with open(out['a'], 'w') as f:
+            f.write('truncated')
+        assert graph.stale_steps() == ['a', 'c']
+        assert graph.run(obj, process_count=0) == ['a', 'c']
+
+        # Changed params make a step stale too
+        graph.steps['b'].params['year'] = 2019
+        assert graph.stale_steps() == ['b', 'c']
+        graph.mark_complete()
+        assert graph.stale_steps() == list()
+
+        # Seeding only applies before the first run, and to made outputs
+        seeded = StepGraph(steps=list(graph.steps.values()),
+                           state_path=os.path.join(folder, 'seeded.json'))
+        os.remove(out['b'])
+        seeded.seed(['a', 'b'])
+        assert seeded.stale_steps() == ['b', 'c']
+        assert seeded.run(obj, process_count=0) == ['b', 'c']
+        with open(input_path, 'w') as f:
+            f.write('3')
+        seeded.seed(['a'])
+        assert seeded.stale_steps() == ['a', 'c']
+
+        # Cycles are caught
+        try:
+            StepGraph([BuildStep('a', '', _test_step_a, depends_on=['b']),
+                       BuildStep('b', '', _test_step_b, depends_on=['a'])],
+                      state_path=os.path.join(folder, 'cycle.json'))
+            raise AssertionError("Cycle not caught")
+        except ValueError:
+            pass
+
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    step_graph_tests()
@@ -1,10 +1,196 @@
 """
 Script to translate land use into model zoning systems
+
+Zone correspondences are compiled into sparse matrices of the weight from
+each zone to each model zone, and cached, so a land use vector is
+translated for all of its segments with one sparse matrix product.
 """
+import hashlib
+import collections
+
 from typing import List
 
+import numpy as np
 import pandas as pd
 
+from scipy import sparse
+
+# Number of compiled correspondences to keep
+TRANSLATION_CACHE_SIZE = 32
+
+
+class ZoneTranslation:
+    """
+    A zone correspondence compiled into a sparse matrix.
+
+    The matrix has a row for each zone translated to and a column for each
+    zone translated from, holding the sum of the weights between them.
+    """
+
+    def __init__(self,
+                 trans_df: pd.DataFrame,
+                 join_id: str,
+                 zone_id: str,
+                 weight_col: str = None):
+        """
+        trans_df: pd.DataFrame - long format zone correspondence
+        join_id: str - name of the zone column to translate from
+        zone_id: str - name of the zone column to translate to
+        weight_col: str - name of the weight column, weights are all 1 if None
+        """
+        from_codes, self.from_zones = pd.factorize(trans_df[join_id], sort=True)
+        to_codes, self.to_zones = pd.factorize(trans_df[zone_id], sort=True)
+
+        if weight_col is None:
+            weights = np.ones(len(trans_df))
+            self.weight_dtype = None
+        else:
+            weights = trans_df[weight_col].to_numpy(dtype=float)
+            self.weight_dtype = trans_df[weight_col].dtype
+        # As a join, missing weights give missing values, which sum as 0
+        weights = np.nan_to_num(weights, nan=0.0)
+
+        mask = (from_codes >= 0) & (to_codes >= 0)
+        shape = (len(self.to_zones), len(self.from_zones))
+        coords = (to_codes[mask], from_codes[mask])
+        self.matrix = sparse.csr_matrix((weights[mask], coords), shape=shape)
+        self.pattern = sparse.csr_matrix((np.ones(mask.sum()), coords), shape=shape)
+
+        self.zone_id = zone_id
+
+    def translate(self,
+                  lu_data: pd.DataFrame,
+                  join_id: str,
+                  var_col: str,
+                  group_cols: List[str]) -> pd.DataFrame:
+        """
+        Translates var_col of lu_data, keeping group_cols.
+
+        Returns the same as joining the correspondence to lu_data and
+        summing var_col by zone_id and group_cols, sorted by those columns.
+        Rows of lu_data in zones missing from the correspondence, or with
+        missing group_cols, are dropped.
+        """
+        return self.translate_segments(
+            ZoneSegments(lu_data, join_id, var_col, group_cols))
+
+    def translate_segments(self, segments: 'ZoneSegments') -> pd.DataFrame:
+        """
+        Translates land use data already summed into ZoneSegments, see
+        translate(). The same ZoneSegments can be translated by any number
+        of correspondences, only grouping the data once.
+        """
+        # Line up the land use zones with the columns of the correspondence
+        cols = self.from_zones.get_indexer(segments.zones)
+        keep = cols >= 0
+        matrix = self.matrix[:, cols[keep]]
+        lu_matrix = segments.matrix[keep]
+
+        result = matrix @ lu_matrix
+        result.sort_indices()
+        result = result.tocoo()
+        n_cols = max(segments.n_segments, 1)
+        result_pos = result.row.astype(np.int64) * n_cols + result.col
+
+        if (lu_matrix.data > 0).all() and (matrix.data > 0).all():
+            pattern_pos, translated = result_pos, result.data
+        else:
+            # Products drop entries that sum to 0, but a join keeps them, so
+            # the entries are found from the product of the patterns
+            pattern = self.pattern[:, cols[keep]] @ segments.pattern[keep]
+            pattern.sort_indices()
+            pattern = pattern.tocoo()
+            pattern_pos = pattern.row.astype(np.int64) * n_cols + pattern.col
+            translated = np.zeros(len(pattern_pos))
+            translated[np.searchsorted(pattern_pos, result_pos)] = result.data
+
+        # Sorting by position sorts by zone, then group_cols
+        zone_codes, segment_codes = np.divmod(pattern_pos, n_cols)
+        out = pd.DataFrame({self.zone_id: self.to_zones.take(zone_codes)})
+        group_cols = segments.group_cols
+        if segments.segment_index is not None:
+            segment_values = segments.segment_index.take(segment_codes)
+            if len(group_cols) == 1:
+                out[group_cols[0]] = segment_values
+            else:
+                for i, col in enumerate(group_cols):
+                    out[col] = segment_values.get_level_values(i)
+
+        out_dtype = segments.dtype
+        if self.weight_dtype is not None:
+            out_dtype = np.result_type(out_dtype, self.weight_dtype)
+        out[segments.var_col] = translated.astype(out_dtype)
+
+        return out
+
+
+class ZoneSegments:
+    """
+    Land use data summed into a sparse matrix, with a row for each zone and
+    a column for each combination of the group columns.
+
+    Rows with a missing zone or group column are dropped.
+    """
+
+    def __init__(self,
+                 lu_data: pd.DataFrame,
+                 join_id: str,
+                 var_col: str,
+                 group_cols: List[str]):
+        """
+        lu_data: pd.DataFrame - long format land use data
+        join_id: str - name of the zone column of lu_data
+        var_col: str - name of the variable to sum
+        group_cols: List[str] - names of the columns to keep the segments of
+        """
+        rows, self.zones = pd.factorize(lu_data[join_id], sort=True)
+        if len(group_cols) > 0:
+            grouper = lu_data.groupby(group_cols, sort=True, dropna=True)
+            segments = grouper.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+            self.segment_index = grouper.size().index
+        else:
+            segments = np.zeros(len(lu_data), dtype=np.int64)
+            self.segment_index = None
+        self.n_segments = segments.max() + 1 if len(segments) > 0 else 0
+
+        values = lu_data[var_col].to_numpy(dtype=float)
+        values = np.nan_to_num(values, nan=0.0)
+
+        mask = (rows >= 0) & (segments >= 0)
+        shape = (len(self.zones), self.n_segments)
+        coords = (rows[mask], segments[mask])
+        self.matrix = sparse.csr_matrix((values[mask], coords), shape=shape)
+        self.pattern = sparse.csr_matrix((np.ones(mask.sum()), coords), shape=shape)
+
+        self.var_col = var_col
+        self.group_cols = list(group_cols)
+        self.dtype = lu_data[var_col].dtype
+
+
+_translation_cache = collections.OrderedDict()
+
+
+def compile_translation(trans_df: pd.DataFrame,
+                        join_id: str,
+                        zone_id: str,
+                        weight_col: str = None) -> ZoneTranslation:
+    """
+    Returns trans_df compiled into a ZoneTranslation, cached by its contents.
+    """
+    cols = [join_id, zone_id] + ([] if weight_col is None else [weight_col])
+    hashes = pd.util.hash_pandas_object(trans_df[cols], index=False).to_numpy()
+    key = (hashlib.sha256(hashes.tobytes()).hexdigest(), join_id, zone_id, weight_col)
+
+    if key in _translation_cache:
+        _translation_cache.move_to_end(key)
+        return _translation_cache[key]
+
+    translation = ZoneTranslation(trans_df, join_id, zone_id, weight_col)
+    _translation_cache[key] = translation
+    if len(_translation_cache) > TRANSLATION_CACHE_SIZE:
+        _translation_cache.popitem(last=False)
+    return translation
+
 
 def vector_join_translation(lu_data: pd.DataFrame,
                             trans_df: pd.DataFrame,
@@ -18,6 +204,8 @@ def vector_join_translation(lu_data: pd.DataFrame,
     Method for translating a land use vector to a model zoning system using
     a join method. Will be superceeded by demand objects.
     Assumes many:1 translation ie. MSOA is lowest level of zoning and doesn't split.
+    The join is done as a product with the compiled correspondence, see
+    ZoneTranslation.
 
     lu_data:  pd.DataFrame - long format land use data
     trans_df: pd.DataFrame - long format zone correspondence
@@ -44,6 +232,42 @@ def vector_join_translation(lu_data: pd.DataFrame,
     # Benchmark
     total_before = lu_data[var_col].sum()
 
+    # Retaining columns of the correspondence needs the join, columns in
+    # both are suffixed by the join so aren't retained
+    trans_cols = [x for x in trans_df if x != join_id]
+    if any(x in trans_cols and x not in list(lu_data) for x in retain_cols):
+        return _join_translation(lu_data, trans_df, retain_cols, join_id,
+                                 zone_id, var_col, weight_col, verbose)
+    present_retain_cols = [x for x in retain_cols
+                           if x in list(lu_data) and x not in trans_cols]
+
+    translation = compile_translation(trans_df, join_id, zone_id, weight_col)
+    lu_data = translation.translate(lu_data, join_id, var_col, present_retain_cols)
+
+    total_after = lu_data[var_col].sum()
+
+    if verbose:
+        print('Total before: %d' % total_before)
+        print('Total after: %d' % total_after)
+        print('NOTE: Most modelling systems ignore Scottish Islands and Scilly Isles')
+
+    return lu_data
+
+
+def _join_translation(lu_data: pd.DataFrame,
+                      trans_df: pd.DataFrame,
+                      retain_cols: List,
+                      join_id: str,
+                      zone_id: str,
+                      var_col: str,
+                      weight_col: str = None,
+                      verbose: bool = True):
+    """
+    The merge and groupby translation, for retaining correspondence columns
+    and checking against.
+    """
+    total_before = lu_data[var_col].sum()
+
     lu_data = lu_data.merge(trans_df,
                             how='left',
                             on=join_id)
@@ -72,3 +296,83 @@ def vector_join_translation(lu_data: pd.DataFrame,
         print('NOTE: Most modelling systems ignore Scottish Islands and Scilly Isles')
 
     return lu_data
+
+
+def translate_tests(seed: int = 2018) -> None:
+    """
+    Checks the sparse translation against the join, and that totals are
+    conserved by correspondences whose weights sum to 1 for each zone.
+    """
+    print("Running translate.py tests...")
+    rng = np.random.default_rng(seed)
+
+    n_msoa = 200
+    lu_data = pd.DataFrame({
+        'msoa_zone_id': rng.integers(1, n_msoa + 1, 5000),
+        'a': rng.integers(1, 4, 5000),
+        'g': rng.integers(1, 4, 5000),
+        't': rng.integers(1, 5, 5000),
+        'people': rng.gamma(2, 10, 5000),
+    })
+    # Some rows of 0, which the join keeps
+    lu_data.loc[rng.random(len(lu_data)) < 0.05, 'people'] = 0
+
+    # Each zone split between up to 3 model zones, with weights summing to 1
+    splits = rng.integers(1, 4, n_msoa)
+    trans_df = pd.DataFrame({
+        'msoa_zone_id': np.repeat(np.arange(1, n_msoa + 1), splits),
+        'model_zone_id': rng.integers(1, 60, splits.sum()),
+    })
+    trans_df['msoa_to_model_zone'] = rng.random(len(trans_df))
+    trans_df['msoa_to_model_zone'] /= trans_df.groupby('msoa_zone_id')['msoa_to_model_zone'].transform('sum')
+
+    kwargs = {
+        'join_id': 'msoa_zone_id',
+        'zone_id': 'model_zone_id',
+        'var_col': 'people',
+        'verbose': False,
+    }
+    for retain_cols in [['a', 'g', 't'], ['t'], [], ['t', 'msoa_zone_id'], ['a', 'missing']]:
+        for weight_col in ['msoa_to_model_zone', None]:
+            expected = _join_translation(lu_data, trans_df, retain_cols,
+                                         weight_col=weight_col, **kwargs)
+            achieved = vector_join_translation(lu_data, trans_df, retain_cols,
+                                               weight_col=weight_col, **kwargs)
+            pd.testing.assert_frame_equal(expected, achieved)
+
+        # Totals are conserved
+        achieved = vector_join_translation(lu_data, trans_df, retain_cols,
+                                           weight_col='msoa_to_model_zone', **kwargs)
+        assert np.isclose(achieved['people'].sum(), lu_data['people'].sum())
+
+    # Zones missing from the correspondence are dropped, as the join does
+    partial = trans_df[trans_df['msoa_zone_id'] > 20]
+    expected = _join_translation(lu_data, partial, ['a'], weight_col='msoa_to_model_zone', **kwargs)
+    achieved = vector_join_translation(lu_data, partial, ['a'], weight_col='msoa_to_model_zone', **kwargs)
+    pd.testing.assert_frame_equal(expected, achieved, check_dtype=False)
+
+    # Correspondence columns can still be retained, through the join
+    sectors = trans_df.assign(sector=trans_df['model_zone_id'] % 5)
+    expected = _join_translation(lu_data, sectors, ['sector', 'a'], **kwargs)
+    achieved = vector_join_translation(lu_data, sectors, ['sector', 'a'], **kwargs)
+    pd.testing.assert_frame_equal(expected, achieved)
+
+    # Compiled correspondences are cached by content
+    first = compile_translation(trans_df, 'msoa_zone_id', 'model_zone_id', 'msoa_to_model_zone')
+    second = compile_translation(trans_df.copy(), 'msoa_zone_id', 'model_zone_id', 'msoa_to_model_zone')
+    assert first is second
+    changed = trans_df.assign(msoa_to_model_zone=trans_df['msoa_to_model_zone'] * 2)
+    assert compile_translation(changed, 'msoa_zone_id', 'model_zone_id', 'msoa_to_model_zone') is not first
+
+    # One ZoneSegments translates the same as each translation on its own
+    segments = ZoneSegments(lu_data, 'msoa_zone_id', 'people', ['a', 't'])
+    for zone_id in ['model_zone_id', 'sector']:
+        translation = ZoneTranslation(sectors, 'msoa_zone_id', zone_id)
+        expected = translation.translate(lu_data, 'msoa_zone_id', 'people', ['a', 't'])
+        pd.testing.assert_frame_equal(expected, translation.translate_segments(segments))
+
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    translate_tests()
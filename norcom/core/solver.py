@@ -0,0 +1,821 @@
+# -*- coding: utf-8 -*-
+"""
+NorCOM solver: the prototypical sampling and car ownership calculations of
+NorCOM as importable functions.
+
+Per MSOA, the Daly expression is minimised to find the proportion of each
+prototypical household type that best hits the land use targets, then the
+probability of owning 1+ and 2+|1+ cars is applied to the synthetic
+population built from those proportions.
+
+Everything that does not change between MSOAs (prototypical household
+matrices, cross classification coefficients, person type groupings) is
+built once as arrays in NorcomModel. The Daly expression, its gradient and
+Hessian are then plain matrix products, and MSOAs are solved in chunks over
+a process pool. Results are collected in memory, to be written once.
+"""
+
+import os
+import re
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+from scipy.optimize import minimize
+from scipy.optimize import Bounds
+
+# Patterns catching the columns of each categorical model variable
+AGE_PATTERN = 'HRP_Age_Banded_*'
+NSSEC_PATTERN = 'HRP_NSSec_B03ID_*'
+HHSTRUCT_PATTERN = 'NorCOM_hh_struct_*'
+PERSON_TYPE_PATTERN = 'PT*'
+POPDENS_NAME = 'HHoldPopDensity_B01ID_%d'
+POPDENS_BANDS = list(range(1, 15))
+
+# Model type: (parameter column, zonal asc column, synthetic target,
+# modelled result name)
+CAR_MODELS = {
+    1: ('value_p1_plus', 'P1_Zonal_ASC', 'HasCarVanMc', 'pcar_1plus_modelled'),
+    2: ('value_p2_plus', 'P2_Zonal_ASC', 'Has2CarVanMc', 'pcar_2plus_modelled'),
+}
+
+# Traveller type labels, in the order the car probabilities are reported
+CAR_LABELS = ['1plus', '0', '2plus', '1']
+
+
+def build_targets(lu_population: pd.DataFrame,
+                  lu_conversion: pd.DataFrame,
+                  lu_property: pd.DataFrame,
+                  lu_prob_occupied: pd.DataFrame
+                  ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Builds the household and person type targets per MSOA from land use
+    outputs.
+
+    Parameters
+    ----------
+    lu_population:
+        Household population by msoa11cd and land use traveller type.
+
+    lu_conversion:
+        Lookup from land use traveller types to NorCOM person types.
+
+    lu_property:
+        Classified residential properties by ZoneID.
+
+    lu_prob_occupied:
+        Probability a dwelling is filled, by msoaZoneID.
+
+    Returns
+    -------
+    targets:
+        Number of households with 1 and 2+ adults and number of each person
+        type, by ZoneID.
+
+    lu_population:
+        lu_population with the NorCOM person types joined on.
+    """
+    # Convert traveller type to NorCOM person type
+    lu_population = pd.merge(lu_population, lu_conversion,
+                             left_on='TravellerType', right_on='lu_TravellerType')
+
+    # Number of each target person type in each msoa
+    person_type_targets = lu_population.groupby(
+        ['msoa11cd', 'NorCOM_person_type']).agg({'pop_aj': 'sum'})
+    person_type_targets = person_type_targets.unstack(level=1)
+    person_type_targets.columns = person_type_targets.columns.get_level_values(1)
+    person_type_targets = person_type_targets.reset_index()
+
+    # Number of households is properties * probability dwelling filled
+    sum_uprn = lu_property.groupby(['ZoneID']).agg({'UPRN': 'sum'}).reset_index()
+    sum_uprn = pd.merge(sum_uprn, lu_prob_occupied,
+                        left_on='ZoneID', right_on='msoaZoneID')
+    sum_uprn['number_hh'] = sum_uprn.UPRN * sum_uprn.Prob_DwellsFilled
+
+    # The population of adults in one adult households is the same as the
+    # number of one adult households
+    lu_population_adults = lu_population.loc[lu_population.Gender != 'Children']
+    one_adult_households = lu_population_adults.groupby(
+        ['msoa11cd', 'Household_size']).agg({'pop_aj': 'sum'}).reset_index()
+    one_adult_households = one_adult_households.loc[
+        one_adult_households.Household_size == '1 Adult']
+    one_adult_households = one_adult_households.drop(columns=['Household_size'])
+    one_adult_households = one_adult_households.rename(
+        columns={'pop_aj': 'NorCOM_hh_adults_1'})
+
+    target_households = pd.merge(one_adult_households, sum_uprn,
+                                 right_on='ZoneID', left_on='msoa11cd')
+
+    # Households with 2+ adults are all households less 1 adult households
+    target_households['NorCOM_hh_adults_2'] = (target_households.number_hh
+                                               - target_households.NorCOM_hh_adults_1)
+    target_households = target_households[
+        ['msoa11cd', 'NorCOM_hh_adults_1', 'NorCOM_hh_adults_2']]
+
+    targets = pd.merge(target_households, person_type_targets, on='msoa11cd')
+    targets = targets.rename(columns={'msoa11cd': 'ZoneID'})
+    targets['Total_hh'] = targets.NorCOM_hh_adults_1 + targets.NorCOM_hh_adults_2
+
+    return targets, lu_population
+
+
+def get_population_density_banding(msoa_pop_density: np.ndarray) -> np.ndarray:
+    """
+    Returns the numerical banding (between 1 and 14) for population density
+    in persons per hectare.
+    """
+    msoa_pop_density = np.asarray(msoa_pop_density, dtype=float)
+    return np.select(
+        [msoa_pop_density < 1.0,
+         msoa_pop_density < 50,
+         msoa_pop_density < 60,
+         msoa_pop_density < 75],
+        [1,
+         np.floor(2 + (msoa_pop_density / 5)),
+         12,
+         13],
+        default=14).astype(int)
+
+
+class NorcomModel:
+    """
+    NorCOM inputs held as arrays, ready to solve MSOAs with.
+
+    Parameters
+    ----------
+    targets:
+        Targets by ZoneID, as returned by build_targets().
+
+    prototypical_hh:
+        Prototypical household data from NTS, one row per household type.
+
+    ps_weights:
+        Weight of each target_var in the Daly expression.
+
+    model_params:
+        Estimated logit model parameters by model_var.
+
+    car_costs:
+        Running and purchase cost indices by Year.
+
+    zonal_ascs:
+        Zone specific constants by msoa.
+
+    msoa_inputs:
+        Model zones (MSOA11CD) and their 'Area (hectares)'.
+
+    model_year:
+        Year to take car costs for.
+    """
+
+    def __init__(self,
+                 targets: pd.DataFrame,
+                 prototypical_hh: pd.DataFrame,
+                 ps_weights: pd.DataFrame,
+                 model_params: pd.DataFrame,
+                 car_costs: pd.DataFrame,
+                 zonal_ascs: pd.DataFrame,
+                 msoa_inputs: pd.DataFrame,
+                 model_year: int):
+
+        self.person_type_cols = [x for x in targets.columns
+                                 if re.match(PERSON_TYPE_PATTERN, x)]
+
+        # Target vars are the target columns with a weight, in target order
+        weights = ps_weights.drop_duplicates('target_var').set_index('target_var')['weight']
+        target_cols = [x for x in targets.columns if x not in ['ZoneID', 'ZoneName']]
+        self.target_vars = [x for x in target_cols if x in weights.index]
+        self.weights = weights.reindex(self.target_vars).to_numpy(dtype=float)
+
+        # Prototypical household matrices, household type by ...
+        self.f_k = prototypical_hh['observed_prop_f_k'].to_numpy(dtype=float)
+        self.target_matrix = prototypical_hh[self.target_vars].to_numpy(dtype=float)
+        self.person_types = prototypical_hh[self.person_type_cols].to_numpy(dtype=float)
+        self.synthetic_targets = {
+            k: prototypical_hh[v[2]].to_numpy(dtype=float) for k, v in CAR_MODELS.items()}
+
+        # Daly expression Hessian is constant
+        self.hess = 2 * (np.eye(len(self.f_k))
+                         + (self.target_matrix * self.weights) @ self.target_matrix.T)
+
+        # Group household types by number of adults, dropping 0 adults
+        n_adults = prototypical_hh['HHoldNumAdults_int'].astype(int).to_numpy()
+        self.adult_groups = np.unique(n_adults[n_adults != 0])
+        self.adult_group_matrix = (
+            n_adults[np.newaxis, :] == self.adult_groups[:, np.newaxis]).astype(float)
+
+        # Cross classification columns and coefficients, by density band
+        params = model_params.set_index('model_var')
+        colnames = list(model_params.model_var)
+        cross_class = [(a, n, h)
+                       for a in [x for x in colnames if re.match(AGE_PATTERN, x)]
+                       for n in [x for x in colnames if re.match(NSSEC_PATTERN, x)]
+                       for h in [x for x in colnames if re.match(HHSTRUCT_PATTERN, x)]]
+
+        rci = car_costs.loc[car_costs.Year == model_year, 'Running_Cost_Index'].values[0]
+        pci = car_costs.loc[car_costs.Year == model_year, 'Purchase_Cost_Index'].values[0]
+
+        self.cross_class = dict()
+        self.coefficients = {k: dict() for k in CAR_MODELS}
+        for band in POPDENS_BANDS:
+            p_name = POPDENS_NAME % band
+            if p_name not in params.index:
+                continue
+            cols = ['_&_'.join([a, n, h, p_name]) for a, n, h in cross_class]
+            if not set(cols).issubset(prototypical_hh.columns):
+                continue
+            self.cross_class[band] = prototypical_hh[cols].to_numpy(dtype=float)
+
+            for model_type, (param_col, _, _, _) in CAR_MODELS.items():
+                coeffs = params[param_col]
+                cat_coeffs = np.array([coeffs[a] + coeffs[n] + coeffs[h] + coeffs[p_name]
+                                       for a, n, h in cross_class])
+                self.coefficients[model_type][band] = (
+                    cat_coeffs + coeffs['intercept']
+                    + pci * coeffs['Purchase_Cost_Index']
+                    + rci * coeffs['Running_Cost_Index'])
+
+        # Zonal values, in target order
+        self.zones = targets['ZoneID'].to_numpy()
+        self.no_hh = (targets['NorCOM_hh_adults_1']
+                      + targets['NorCOM_hh_adults_2']).to_numpy(dtype=float)
+        self.target_values = (targets[self.target_vars].to_numpy(dtype=float)
+                              / self.no_hh[:, np.newaxis])
+
+        area = msoa_inputs.drop_duplicates('MSOA11CD').set_index(
+            'MSOA11CD')['Area (hectares)'].reindex(self.zones).to_numpy(dtype=float)
+        population = targets[self.person_type_cols].sum(axis=1).to_numpy(dtype=float)
+        self.density_bands = get_population_density_banding(population / area)
+
+        ascs = zonal_ascs.drop_duplicates('msoa').set_index('msoa')
+        self.ascs = {k: ascs[v[1]].reindex(self.zones).to_numpy(dtype=float)
+                     for k, v in CAR_MODELS.items()}
+
+        self._zone_index = pd.Index(self.zones)
+
+    def daly_expression(self,
+                        phi_k: np.ndarray,
+                        target_values: np.ndarray) -> float:
+        """
+        Calculates the value of Q, the Daly expression, for phi_k
+
+        Q is the sum of squared differences between the observed (f_k) and
+        estimated (phi_k) prototypical household proportions, plus the
+        weighted sum of squared differences between the estimated value of
+        each target var per household and its target.
+        """
+        difference = self.target_matrix.T @ phi_k - target_values
+        return ((self.f_k - phi_k) ** 2).sum() + (difference * difference * self.weights).sum()
+
+    def daly_gradient(self,
+                      phi_k: np.ndarray,
+                      target_values: np.ndarray) -> np.ndarray:
+        """
+        Gradient of daly_expression() with respect to phi_k
+        """
+        difference = self.target_matrix.T @ phi_k - target_values
+        return 2 * (phi_k - self.f_k) + 2 * self.target_matrix @ (self.weights * difference)
+
+    def daly_hessian(self, *args) -> np.ndarray:
+        """
+        Hessian of daly_expression(), which is the same for any phi_k
+        """
+        return self.hess
+
+    def solve_proportions(self,
+                          zone_idx: int):
+        """
+        Finds the proportion of each prototypical household type that
+        minimises the Daly expression for one zone.
+
+        Returns
+        -------
+        res:
+            The scipy.optimize.minimize result, res.x being the proportions.
+        """
+        # Proportions between 0 and 1, summing to 1
+        n_types = len(self.f_k)
+        bounds = Bounds(lb=0, ub=1)
+        args = (self.target_values[zone_idx],)
+
+        # Q is a convex quadratic, so with exact derivatives SLSQP gets
+        # there in a few iterations
+        res = minimize(self.daly_expression,
+                       self.f_k,
+                       args=args,
+                       method='SLSQP',
+                       jac=self.daly_gradient,
+                       bounds=bounds,
+                       constraints={'type': 'eq',
+                                    'fun': lambda x: np.sum(x) - 1,
+                                    'jac': lambda x: np.ones(n_types)},
+                       options={'ftol': 1e-12, 'maxiter': 500})
+        if res.success:
+            return res
+
+        # Fall back on the interior point method
+        return minimize(self.daly_expression,
+                        self.f_k,
+                        args=args,
+                        method='trust-constr',
+                        jac=self.daly_gradient,
+                        hess=self.daly_hessian,
+                        options={'verbose': 0},
+                        bounds=bounds,
+                        constraints={'type': 'eq',
+                                     'fun': lambda x: np.sum(x) - 1,
+                                     'jac': lambda x: np.ones((1, n_types)),
+                                     'hess': lambda x, v: np.zeros((n_types, n_types))})
+
+    def car_probabilities(self,
+                          zone_idx: int,
+                          model_type: int) -> np.ndarray:
+        """
+        Probability of owning 1+ (model_type 1) or 2+ given 1+ (model_type 2)
+        cars, by cross classification, for one zone.
+        """
+        band = self.density_bands[zone_idx]
+        exponent = np.exp(-(self.coefficients[model_type][band]
+                            + self.ascs[model_type][zone_idx]))
+        return 1 / (1 + exponent)
+
+    def solve_zone(self,
+                   zone_idx: int) -> Tuple[dict, np.ndarray]:
+        """
+        Runs prototypical sampling and car ownership for one zone.
+
+        Returns
+        -------
+        result:
+            Modelled and synthetic pcar for each model type, Q and the
+            estimated household proportions.
+
+        traveller_types:
+            Array of number of people by car label, number of adults and
+            person type.
+        """
+        res = self.solve_proportions(zone_idx)
+        phi_k = res.x
+        no_hh = self.no_hh[zone_idx]
+        est_hh = phi_k * no_hh
+
+        # Number of people in each cross classification, per household type
+        synthetic_data = self.cross_class[self.density_bands[zone_idx]] * est_hh[:, np.newaxis]
+
+        result = {'Q': res.fun, 'estimated_props': phi_k}
+        probs = dict()
+        for model_type, (_, _, target_name, r_name) in CAR_MODELS.items():
+            probs[model_type] = self.car_probabilities(zone_idx, model_type)
+            result[r_name] = (synthetic_data @ probs[model_type]).sum() / no_hh
+            result[target_name] = (self.synthetic_targets[model_type] * est_hh).sum() / no_hh
+
+        probs_2plus = probs[1] * probs[2]
+        label_probs = np.stack([probs[1],
+                                1 - probs[1],
+                                probs[2],
+                                probs[1] - probs_2plus])
+
+        # Modelled cars per household type, then people by number of adults
+        modelled_cars = label_probs @ synthetic_data.T
+        traveller_types = np.einsum('gk,lk,kp->lgp',
+                                    self.adult_group_matrix,
+                                    modelled_cars,
+                                    self.person_types)
+
+        return result, traveller_types
+
+    def solve(self,
+              zones: List[str] = None,
+              process_count: int = -2,
+              chunk_size: int = 50
+              ) -> Tuple[Dict[int, pd.DataFrame], pd.DataFrame]:
+        """
+        Solves zones, in chunks over a process pool.
+
+        Parameters
+        ----------
+        zones:
+            Zones to solve, defaults to all the zones in the targets.
+
+        process_count:
+            Number of processes to use. Negative numbers are taken away
+            from the number of CPUs. 0 solves in this process.
+
+        chunk_size:
+            Number of zones to send to a process at a time.
+
+        Returns
+        -------
+        pcar_results:
+            Results by model type, as NorcomModel.pcar_frame().
+
+        traveller_types:
+            Modelled people by car label, number of adults, person type
+            and msoa11cd.
+        """
+        if zones is None:
+            zone_idx = np.arange(len(self.zones))
+        else:
+            zone_idx = self._zone_index.get_indexer(zones)
+            if (zone_idx < 0).any():
+                missing = np.asarray(zones)[zone_idx < 0]
+                raise ValueError('No targets for zones %s' % list(missing[:5]))
+
+        if process_count < 0:
+            process_count = max(os.cpu_count() + process_count, 0)
+
+        chunks = [zone_idx[i:i + chunk_size]
+                  for i in range(0, len(zone_idx), chunk_size)]
+
+        if process_count == 0 or len(chunks) == 1:
+            chunk_results = [_solve_chunk(self, c) for c in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=process_count) as executor:
+                chunk_results = list(executor.map(_solve_chunk,
+                                                  [self] * len(chunks),
+                                                  chunks))
+
+        results = [r for chunk in chunk_results for r in chunk[0]]
+        traveller_types = np.concatenate([chunk[1] for chunk in chunk_results])
+        zones = self.zones[zone_idx]
+
+        return self.pcar_frames(zones, results), self.traveller_type_frame(zones, traveller_types)
+
+    def pcar_frames(self,
+                    zones: np.ndarray,
+                    results: List[dict]) -> Dict[int, pd.DataFrame]:
+        """
+        Organises solve_zone() results into a frame per model type.
+        """
+        pcar = dict()
+        for model_type, (_, _, target_name, r_name) in CAR_MODELS.items():
+            pcar[model_type] = pd.DataFrame({
+                'msoa': zones,
+                r_name: [r[r_name] for r in results],
+                'Q': [r['Q'] for r in results],
+                'estimated_props': [r['estimated_props'] for r in results],
+                target_name: [r[target_name] for r in results],
+            })
+        return pcar
+
+    def traveller_type_frame(self,
+                             zones: np.ndarray,
+                             traveller_types: np.ndarray) -> pd.DataFrame:
+        """
+        Flattens solve_zone() traveller types to a long frame. Rows are
+        ordered by zone, car label, person type then number of adults.
+        """
+        n_zones, n_labels, n_groups, n_pt = traveller_types.shape
+        return pd.DataFrame({
+            'HHoldNumAdults_int': np.tile(self.adult_groups, n_zones * n_labels * n_pt),
+            'PersonType': np.tile(np.repeat(self.person_type_cols, n_groups),
+                                  n_zones * n_labels),
+            'value': traveller_types.transpose(0, 1, 3, 2).ravel(),
+            'cars': np.tile(np.repeat(CAR_LABELS, n_pt * n_groups), n_zones),
+            'msoa11cd': np.repeat(zones, n_labels * n_pt * n_groups),
+        })
+
+
+def _solve_chunk(model: NorcomModel,
+                 zone_idx: np.ndarray) -> Tuple[List[dict], np.ndarray]:
+    """
+    Solves a chunk of zones, for NorcomModel.solve()
+    """
+    results = list()
+    traveller_types = list()
+    for idx in zone_idx:
+        result, tts = model.solve_zone(idx)
+        results.append(result)
+        traveller_types.append(tts)
+    return results, np.stack(traveller_types)
+
+
+def apportion_traveller_types(tt: pd.DataFrame,
+                              lu_conversion: pd.DataFrame,
+                              lu_population: pd.DataFrame) -> pd.DataFrame:
+    """
+    Apportions land use population to NorCOM traveller types.
+
+    Parameters
+    ----------
+    tt:
+        Modelled traveller types, as returned by NorcomModel.solve().
+
+    lu_conversion:
+        Lookup from land use traveller types to NorCOM traveller types.
+
+    lu_population:
+        Land use population with NorCOM person types, as returned by
+        build_targets().
+
+    Returns
+    -------
+    tt_both:
+        tt joined to land use traveller types, with the land use
+        population apportioned to each in NorCOM_result.
+    """
+    tt = tt.copy()
+    tt['NorCOM_TravellerType_desc'] = (tt['PersonType'].astype(str) + '_'
+                                       + tt['HHoldNumAdults_int'].astype(str)
+                                       + '_' + tt['cars'].astype(str))
+    tt['NorCOM_PopType_desc'] = (tt['PersonType'].astype(str) + '_'
+                                 + tt['HHoldNumAdults_int'].astype(str))
+
+    # Map traveller type from land use and drop where there's no match
+    tt = pd.merge(tt, lu_conversion, on=['NorCOM_TravellerType_desc', 'NorCOM_PopType_desc'])
+
+    # Proportions from NorCOM to apportion LU population
+    ttg = tt.groupby(['msoa11cd', 'NorCOM_PopType_desc']).agg({'value': 'sum'}).reset_index()
+    ttg = ttg.rename(columns={'value': 'NorCOM_PopType_summed'})
+    tt = pd.merge(tt, ttg, on=['msoa11cd', 'NorCOM_PopType_desc'])
+
+    lu_tt_pop_totals = lu_population.groupby(
+        ['msoa11cd', 'NorCOM_PopType_desc']).agg({'pop_aj': 'sum'}).reset_index()
+
+    tt_both = pd.merge(tt, lu_tt_pop_totals, on=['msoa11cd', 'NorCOM_PopType_desc'])
+    tt_both['NorCOM_result'] = tt_both.pop_aj * (tt_both.value / tt_both.NorCOM_PopType_summed)
+
+    return tt_both
+
+
+def _build_test_inputs(n_zones: int = 50,
+                       seed: int = 0) -> dict:
+    """
+    Builds a synthetic set of NorCOM inputs for solver_tests()
+    """
+    rng = np.random.default_rng(seed)
+    zones = ['E020%05d' % i for i in range(n_zones)]
+    person_types = ['PT%02d' % i for i in range(1, 5)]
+    ages = ['HRP_Age_Banded_%d' % i for i in (1, 2)]
+    nssecs = ['HRP_NSSec_B03ID_%d' % i for i in (1, 2, 3)]
+    hhstructs = ['NorCOM_hh_struct_%d' % i for i in (1, 2)]
+    n_hh_types = 20
+
+    # Prototypical households
+    n_adults = np.arange(n_hh_types) % 4
+    prototypical_hh = pd.DataFrame({
+        'observed_prop_f_k': rng.dirichlet(np.ones(n_hh_types)),
+        'HHoldNumAdults_int': n_adults,
+        'NorCOM_hh_adults_1': (n_adults == 1).astype(float),
+        'NorCOM_hh_adults_2': (n_adults >= 2).astype(float),
+        'HasCarVanMc': rng.random(n_hh_types),
+        'Has2CarVanMc': rng.random(n_hh_types) * 0.5,
+    })
+    for pt in person_types:
+        prototypical_hh[pt] = rng.random(n_hh_types) * 0.9
+    cross_class = {'_&_'.join([a, n, h, POPDENS_NAME % b]): rng.random(n_hh_types)
+                   for a in ages for n in nssecs for h in hhstructs for b in POPDENS_BANDS}
+    prototypical_hh = pd.concat([prototypical_hh, pd.DataFrame(cross_class)], axis=1)
+
+    target_vars = ['NorCOM_hh_adults_1', 'NorCOM_hh_adults_2'] + person_types
+    ps_weights = pd.DataFrame({'target_var': target_vars,
+                               'weight': rng.random(len(target_vars)) * 5})
+
+    model_vars = (['intercept', 'Purchase_Cost_Index', 'Running_Cost_Index']
+                  + ages + nssecs + hhstructs
+                  + [POPDENS_NAME % b for b in POPDENS_BANDS])
+    model_params = pd.DataFrame({'model_var': model_vars,
+                                 'value_p1_plus': rng.normal(0, 0.5, len(model_vars)),
+                                 'value_p2_plus': rng.normal(0, 0.5, len(model_vars))})
+    car_costs = pd.DataFrame({'Year': [2018, 2019],
+                              'Running_Cost_Index': [1.0, 1.1],
+                              'Purchase_Cost_Index': [1.0, 0.9]})
+    zonal_ascs = pd.DataFrame({'msoa': zones,
+                               'P1_Zonal_ASC': rng.normal(0, 0.3, n_zones),
+                               'P2_Zonal_ASC': rng.normal(0, 0.3, n_zones)})
+    # Spread areas so all density bands come up
+    msoa_inputs = pd.DataFrame({'MSOA11CD': zones,
+                                'Area (hectares)': 10 ** rng.uniform(1.5, 4, n_zones)})
+
+    # Land use traveller types and their NorCOM equivalents
+    lu_tts = pd.MultiIndex.from_product(
+        [person_types, [1, 2], ['0', '1', '2plus']],
+        names=['NorCOM_person_type', 'adults', 'cars']).to_frame(index=False)
+    lu_tts['lu_TravellerType'] = np.arange(1, len(lu_tts) + 1)
+    lu_tts['NorCOM_PopType_desc'] = (lu_tts['NorCOM_person_type'] + '_'
+                                     + lu_tts['adults'].astype(str))
+    lu_tts['NorCOM_TravellerType_desc'] = (lu_tts['NorCOM_PopType_desc'] + '_'
+                                           + lu_tts['cars'])
+    lu_conversion = lu_tts[['lu_TravellerType', 'NorCOM_person_type',
+                            'NorCOM_TravellerType_desc', 'NorCOM_PopType_desc']]
+
+    lu_population = pd.MultiIndex.from_product(
+        [zones, lu_tts['lu_TravellerType']],
+        names=['msoa11cd', 'TravellerType']).to_frame(index=False)
+    lu_population = lu_population.merge(
+        lu_tts[['lu_TravellerType', 'NorCOM_person_type', 'adults']],
+        left_on='TravellerType', right_on='lu_TravellerType')
+    lu_population['Gender'] = np.where(
+        lu_population['NorCOM_person_type'] == person_types[-1], 'Children', 'Male')
+    lu_population['Household_size'] = np.where(
+        lu_population['adults'] == 1, '1 Adult', '2+ Adults')
+    lu_population['pop_aj'] = rng.random(len(lu_population)) * np.where(
+        lu_population['adults'] == 1, 150, 1000)
+    lu_population = lu_population[['msoa11cd', 'TravellerType', 'Gender',
+                                   'Household_size', 'pop_aj']]
+
+    lu_property = pd.DataFrame({'ZoneID': np.repeat(zones, 2),
+                                'UPRN': rng.uniform(1500, 2500, 2 * n_zones)})
+    lu_prob_occupied = pd.DataFrame({'msoaZoneID': zones,
+                                     'Prob_DwellsFilled': rng.uniform(0.9, 1, n_zones)})
+
+    return {
+        'prototypical_hh': prototypical_hh,
+        'ps_weights': ps_weights,
+        'model_params': model_params,
+        'car_costs': car_costs,
+        'zonal_ascs': zonal_ascs,
+        'msoa_inputs': msoa_inputs,
+        'lu_population': lu_population,
+        'lu_conversion': lu_conversion,
+        'lu_property': lu_property,
+        'lu_prob_occupied': lu_prob_occupied,
+    }
+
+
+def _reference_zone(msoa: str,
+                    targets: pd.DataFrame,
+                    inputs: dict,
+                    model_year: int) -> Tuple[dict, pd.DataFrame]:
+    """
+    The original per MSOA NorCOM loop: pandas lookups, finite difference
+    Jacobian and SR1 Hessian. Used to check NorcomModel against.
+    """
+    import warnings
+    from scipy.optimize import SR1
+
+    prototypical_hh = inputs['prototypical_hh']
+    model_params = inputs['model_params']
+    car_costs = inputs['car_costs']
+    colnames = model_params.model_var
+    age_list = [x for x in colnames if re.match(AGE_PATTERN, x)]
+    nssec_list = [x for x in colnames if re.match(NSSEC_PATTERN, x)]
+    hhstruct_list = [x for x in colnames if re.match(HHSTRUCT_PATTERN, x)]
+    person_type_cols = [x for x in targets.columns if re.match(PERSON_TYPE_PATTERN, x)]
+    rci = car_costs.loc[car_costs.Year == model_year, 'Running_Cost_Index'].values[0]
+    pci = car_costs.loc[car_costs.Year == model_year, 'Purchase_Cost_Index'].values[0]
+
+    def param(var, col):
+        return model_params.loc[model_params.model_var == var, col].values[0]
+
+    # Target array
+    targets_msoa = targets.loc[targets.ZoneID == msoa, :]
+    target_array = targets_msoa.T.reset_index()
+    target_array.columns = ['target_var', 'value']
+    target_array = target_array[~target_array['target_var'].isin(['ZoneID', 'ZoneName'])]
+    target_no_hh = (targets_msoa['NorCOM_hh_adults_1'].values[0]
+                    + targets_msoa['NorCOM_hh_adults_2'].values[0])
+    target_array['value_per_hh'] = target_array['value'] / target_no_hh
+    target_array = pd.merge(target_array, inputs['ps_weights'], how='inner', on='target_var')
+    weighting = target_array.weight
+    f_k = np.array(prototypical_hh.observed_prop_f_k)
+
+    def daly_expression(phi_k):
+        estimate_list = [(phi_k * prototypical_hh[t]).sum() for t in target_array.target_var]
+        difference = estimate_list - target_array.value_per_hh
+        return ((f_k - phi_k) ** 2).sum() + (difference * difference * weighting).sum()
+
+    with warnings.catch_warnings():
+        # SR1 warns on steps that don't change the finite difference gradient
+        warnings.simplefilter('ignore', UserWarning)
+        res = minimize(daly_expression, f_k, method='trust-constr', jac='2-point', hess=SR1(),
+                       options={'verbose': 0},
+                       bounds=Bounds(lb=0, ub=1),
+                       constraints={'type': 'eq', 'fun': lambda x: np.sum(x) - 1})
+
+    # Zone specific values
+    msoa_area = inputs['msoa_inputs'].loc[
+        inputs['msoa_inputs'].MSOA11CD == msoa, 'Area (hectares)'].values[0]
+    msoa_pop_density = targets_msoa[person_type_cols].sum(axis=1).values[0] / msoa_area
+    p_name = POPDENS_NAME % get_population_density_banding(msoa_pop_density)
+
+    est_hh = pd.DataFrame(data=(res.x * target_no_hh), columns=['est_hh'])
+    cross_class_vars = ['_&_'.join([a, n, h, p_name])
+                        for a in age_list for n in nssec_list for h in hhstruct_list]
+    synthetic_data = prototypical_hh[cross_class_vars].multiply(est_hh['est_hh'], axis='index')
+
+    def calculate_traveller_types(probs, label):
+        modelled_cars_per_hh_type = synthetic_data.mul(probs).sum(axis=1)
+        number_hh_per_type = target_no_hh * res.x
+        multiplier = (modelled_cars_per_hh_type / number_hh_per_type) * number_hh_per_type
+        person_types_total = prototypical_hh[person_type_cols].multiply(multiplier, axis=0)
+        person_types_total['HHoldNumAdults_int'] = prototypical_hh['HHoldNumAdults_int'].astype(int)
+        summed = person_types_total.groupby(['HHoldNumAdults_int']).sum().reset_index()
+        summed = summed.loc[summed.HHoldNumAdults_int != 0]
+        tts = summed.melt(id_vars=['HHoldNumAdults_int'], value_vars=person_type_cols)
+        tts = tts.rename(columns={'variable': 'PersonType'})
+        tts['cars'] = label
+        tts['msoa11cd'] = msoa
+        return tts
+
+    result = {'Q': res.fun, 'estimated_props': res.x, 'converged': res.status != 0}
+    probs = dict()
+    for model_type, (param_col, asc_name, target_name, r_name) in CAR_MODELS.items():
+        intercept = param('intercept', param_col)
+        asc = inputs['zonal_ascs'].loc[inputs['zonal_ascs'].msoa == msoa, asc_name].values[0]
+        probs[model_type] = synthetic_data.copy()
+        for c in cross_class_vars:
+            a, n, h, p = c.split('_&_')
+            exponent = np.exp(-(param(a, param_col) + param(n, param_col)
+                                + param(h, param_col) + param(p, param_col) + intercept))
+            exponent = exponent * np.exp(-((pci * param('Purchase_Cost_Index', param_col))
+                                           + (rci * param('Running_Cost_Index', param_col))
+                                           + asc))
+            probs[model_type][c] = 1 / (1 + exponent)
+        result[r_name] = synthetic_data.mul(probs[model_type]).sum(axis=1).sum() / target_no_hh
+        result[target_name] = (prototypical_hh[target_name]
+                               .multiply(est_hh['est_hh'], axis='index').sum() / target_no_hh)
+
+    probs_0 = 1 - probs[1]
+    probs_2plus = probs[1] * probs[2]
+    tt = pd.concat([calculate_traveller_types(probs[1], '1plus'),
+                    calculate_traveller_types(probs_0, '0'),
+                    calculate_traveller_types(probs[2], '2plus'),
+                    calculate_traveller_types(1 - probs_0 - probs_2plus, '1')])
+
+    return result, tt
+
+
+def solver_tests(n_zones: int = 50) -> None:
+    """
+    Checks NorcomModel against the original per MSOA loop on a synthetic
+    fixture, and prints how long each takes.
+    """
+    print("Running NorCOM solver tests...")
+    model_year = 2018
+    inputs = _build_test_inputs(n_zones)
+    targets, lu_population = build_targets(inputs['lu_population'],
+                                           inputs['lu_conversion'],
+                                           inputs['lu_property'],
+                                           inputs['lu_prob_occupied'])
+    zones = list(inputs['msoa_inputs']['MSOA11CD'])
+
+    start = time.perf_counter()
+    ref_results = list()
+    ref_tt = list()
+    for msoa in zones:
+        result, tt = _reference_zone(msoa, targets, inputs, model_year)
+        ref_results.append(result)
+        ref_tt.append(tt)
+    ref_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model = NorcomModel(targets=targets,
+                        prototypical_hh=inputs['prototypical_hh'],
+                        ps_weights=inputs['ps_weights'],
+                        model_params=inputs['model_params'],
+                        car_costs=inputs['car_costs'],
+                        zonal_ascs=inputs['zonal_ascs'],
+                        msoa_inputs=inputs['msoa_inputs'],
+                        model_year=model_year)
+    pcar_results, tt = model.solve(zones, process_count=0, chunk_size=10)
+    tt_both = apportion_traveller_types(tt, inputs['lu_conversion'], lu_population)
+    new_time = time.perf_counter() - start
+
+    # The original solver can run out of iterations before it converges.
+    # The Daly expression is strictly convex, so where it does converge
+    # both should find the same minimum, and elsewhere the new one should
+    # be no worse
+    converged = np.array([r['converged'] for r in ref_results])
+    ref_pcar = model.pcar_frames(np.array(zones), ref_results)
+    for model_type, (_, _, target_name, r_name) in CAR_MODELS.items():
+        new, ref = pcar_results[model_type], ref_pcar[model_type]
+        assert (new['Q'] <= ref['Q'] + 1e-6).all()
+        for col in [r_name, target_name, 'Q']:
+            np.testing.assert_allclose(new[col][converged], ref[col][converged],
+                                       rtol=1e-2)
+        np.testing.assert_allclose(np.stack(new['estimated_props'][converged]),
+                                   np.stack(ref['estimated_props'][converged]),
+                                   atol=5e-3)
+
+    # Traveller types for household types the minimum leaves near zero
+    # are poorly determined, so compare them on the scale of the zone
+    ref_tt = pd.concat(ref_tt, ignore_index=True)
+    new_tt = tt.loc[tt['msoa11cd'].isin(np.array(zones)[converged])]
+    ref_tt = ref_tt.loc[ref_tt['msoa11cd'].isin(np.array(zones)[converged])]
+    pd.testing.assert_frame_equal(new_tt[list(ref_tt)].drop(columns='value').reset_index(drop=True),
+                                  ref_tt.drop(columns='value').reset_index(drop=True),
+                                  check_dtype=False)
+    np.testing.assert_allclose(new_tt['value'], ref_tt['value'],
+                               rtol=1e-2, atol=1e-2 * ref_tt['value'].abs().max())
+
+    # All land use population is apportioned
+    apportioned = tt_both.groupby(['msoa11cd', 'NorCOM_PopType_desc']).agg(
+        {'NorCOM_result': 'sum', 'pop_aj': 'first'})
+    np.testing.assert_allclose(apportioned['NorCOM_result'], apportioned['pop_aj'])
+
+    print('%d zones (%d converged in the original): original loop %.2fs, '
+          'solver %.2fs (%.1fx)'
+          % (len(zones), converged.sum(), ref_time, new_time, ref_time / new_time))
+    print("Done!")
+
+
+if __name__ == '__main__':
+    solver_tests()
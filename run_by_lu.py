@@ -31,14 +31,13 @@ def main():
 
     lu_run = by_lu.BaseYearLandUse(iteration=iteration, base_year=base_year)
 
-    lu_run.state['3.2.1 Read in core property data'] = 1
-    lu_run.state['3.2.2 Filled property adjustment'] = 1
-    lu_run.state['3.2.3 Household occupancy adjustment'] = 1
-    lu_run.state['3.2.4 Property type mapping'] = 1
-    lu_run.state['3.2.5 Adjust Base Year population according to Base Year MYPE'] = 1
-    lu_run.state['3.2.6 Expand NTEM population to full dimensions'] = 1
-    lu_run.state['3.2.7 Furness household population according to control values'] = 1
-    lu_run.state['3.2.8 Combine HHR with CER to form total population'] = 0
+    # Only steps whose inputs have changed since they were last run are rerun.
+    # Steps can be rerun regardless by passing their keys as force, e.g.
+    # lu_run.build_by_pop(force=['3.2.7'])
+    # Steps already run for this iteration before step tracking. Only used
+    # when there is no state file yet, and only for steps whose outputs exist.
+    lu_run.pop_steps.seed(['3.2.1', '3.2.2', '3.2.3', '3.2.4', '3.2.5 MYE', '3.2.5',
+                           '3.2.6', '3.2.7'])
 
 
     if run_pop:
@@ -30,12 +30,20 @@ if __name__ == '__main__':
     balance_demographics = True
 
     for scenario in scenarios:
-        for fy in future_years:
 
-            print(scenario, fy)
+        # Define run preferences
+        if scenario == 'NTEM':
+            adjust_area_type = False
+        else:
+            adjust_area_type = True
+        ca_growth_method = 'factor'
+
+        if pop:
+            # All future years for a scenario in one pass
+            print(scenario, future_years)
 
             fym = fylu.FutureYearLandUse(
-                future_year=fy,
+                future_year=future_years[0],
                 scenario_name=scenario,
                 iteration=fy_iter,
                 base_resi_land_use_path=base_land_use,
@@ -44,26 +52,32 @@ if __name__ == '__main__':
 
             print(fym.in_paths)
 
-            # Define run preferences
-            if scenario == 'NTEM':
-                adjust_area_type = False
-            else:
-                adjust_area_type = True
-            ca_growth_method = 'factor'
-            adjust_soc = False
-
-            if pop:
-                fym.build_fy_pop(
-                    balance_demographics=balance_demographics,
-                    adjust_ca=True,
-                    ca_growth_method=ca_growth_method,
-                    adjust_soc=adjust_soc,
-                    adjust_area_type=adjust_area_type,
-                    reports=True,
-                    normalise=True,
-                    export=export
-                    )
-            if emp:
+            fym.build_fy_pop_years(
+                future_years,
+                balance_demographics=balance_demographics,
+                adjust_ca=True,
+                ca_growth_method=ca_growth_method,
+                adjust_area_type=adjust_area_type,
+                reports=True,
+                normalise=True,
+                export=export
+                )
+
+        if emp:
+            for fy in future_years:
+
+                print(scenario, fy)
+
+                fym = fylu.FutureYearLandUse(
+                    future_year=fy,
+                    scenario_name=scenario,
+                    iteration=fy_iter,
+                    base_resi_land_use_path=base_land_use,
+                    base_non_resi_land_use_path=consts.NON_RESI_LAND_USE_MSOA,
+                    sub_for_defaults=False)
+
+                print(fym.in_paths)
+
                 fym.build_fy_emp(
                     export=export
                     )
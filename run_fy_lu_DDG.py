@@ -8,6 +8,13 @@ def main():
     run_pop = True
     run_emp = False
     run_full = True
+    # Set to True to align all years of each scenario at once, into one
+    # output per scenario, rather than a file per year
+    run_all_years = False
+    # Set to True to also write the audits of every year with run_all_years
+    all_year_audits = False
+    # Set to False to rebuild every year, even those already built
+    resume = True
     iteration = 'iter4q'
     # 'CAS Regional Scenario',
     scenarios = ['CAS High', 'CAS Low', 'Nov 21 central']
@@ -28,19 +35,19 @@ def main():
             ntem_run.build_fy_pop_ntem()
 
     if run_pop:
-        if run_full:
+        if run_all_years:
             for scenario in scenarios:
-                if scenario == 'CAS Regional Scenario':
-                    CAS_scen = 'CASReg'
-                elif scenario == 'CAS High':
-                    CAS_scen = 'CASHi'
-                elif scenario == 'CAS Low':
-                    CAS_scen = 'CASLo'
-                else:
-                    CAS_scen = 'Central'
-                for fy in future_years:
-                    fy_run = fylu.FutureYearLandUse(iteration=iteration, future_year=fy, scenario_name=scenario, CAS_scen=CAS_scen)
-                    fy_run.build_fy_pop_DDG()
+                fy_run = fylu.FutureYearLandUse(iteration=iteration,
+                                                scenario_name=scenario,
+                                                CAS_scen=fylu.CAS_SCENARIOS[scenario])
+                fy_run.build_fy_pop_DDG_all_years(future_years, audits=all_year_audits)
+        elif run_full:
+            # Skips the years already built with the same inputs, so a failed
+            # run can be restarted as is
+            fylu.build_fy_pop_DDG_years(iteration=iteration,
+                                        scenarios=scenarios,
+                                        future_years=future_years,
+                                        resume=resume)
         else:
             for fy in future_years:
 
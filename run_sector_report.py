@@ -32,30 +32,17 @@ if __name__ == '__main__':
                 if path not in folder_list:
                     folder_list.append(path)
 
-    for folder in folder_list:
-
-        print('Building sector reports for %s' % folder)
-        report = sr.SectorReporter(target_folder=folder,
-                                   retain_cols=['ca'])
-
-        out = report.sector_report(ca_report=True,
-                                   three_sector_report=False,
-                                   ie_sector_report=False,
-                                   north_report=False)
-
-        out_folder = os.path.join(folder, 'sector_reports')
-        if not os.path.exists(out_folder):
-            fo.create_folder(out_folder)
-        
-        for lu_out, reps in out.items():
-            print('.')
-            print('unpacking reports for %s' % lu_out)
-            for sub_r, dat in reps.items():
-                rep_out = lu_out + '_' + sub_r + '.csv'
-                print('.')
-                print('exporting %s' % rep_out)
-                out_path = os.path.join(out_folder, rep_out)
-                dat.to_csv(out_path, index=False)
-
-
-
+    reporters = [sr.SectorReporter(target_folder=folder, retain_cols=['ca'])
+                 for folder in folder_list]
+
+    if not os.path.exists(out_folder):
+        fo.create_folder(out_folder)
+
+    # Every report of every folder, read once each and consolidated into one file,
+    # as well as written to the sector_reports folder of each folder
+    out = sr.batch_sector_reports(reporters,
+                                  ca_report=True,
+                                  three_sector_report=False,
+                                  ie_sector_report=False,
+                                  output_path=os.path.join(out_folder, 'sector_reports.csv'),
+                                  folder_reports=True)